@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised when the server is saturated and a request should be retried later."""
+
+    def __init__(
+        self, message: str, *, retry_after_s: float, details: dict[str, Any]
+    ) -> None:
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+        self.details = details
+
+
+@dataclass
+class AdmissionTicket:
+    queue_wait_ms: float
+    queue_depth: int
+    estimated_tokens: int
+    slots: int = 1
+    released: bool = False
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "queue_wait_ms": round(self.queue_wait_ms, 3),
+            "queue_depth": self.queue_depth,
+            "estimated_tokens": self.estimated_tokens,
+        }
+
+
+class AdmissionController:
+    """Bounds the generation work a server accepts.
+
+    A request is admitted immediately while fewer than `max_in_flight` requests
+    are running and their estimated prompt tokens fit in `token_budget`.
+    Otherwise it waits in a FIFO queue of at most `max_queue_depth` entries;
+    once the queue is full, new requests are rejected straight away so callers
+    can back off instead of adding to everyone's latency. A request whose
+    estimate alone exceeds the budget is still admitted when nothing else is
+    running, so it cannot starve. A batch can hold several slots at once;
+    it asks for no more than `max_in_flight` of them.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: int | None = None,
+        max_queue_depth: int = 64,
+        token_budget: int | None = None,
+        retry_after_s: float = 1.0,
+    ) -> None:
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if max_queue_depth < 0:
+            raise ValueError("max_queue_depth must not be negative")
+        self._max_in_flight = max_in_flight
+        self._max_queue_depth = max_queue_depth
+        self._token_budget = token_budget
+        self._retry_after_s = retry_after_s
+        self._in_flight = 0
+        self._tokens_in_flight = 0
+        self._waiters: deque[tuple[int, int, asyncio.Future[None]]] = deque()
+        self._admitted = 0
+        self._rejected = 0
+
+    @property
+    def token_budget(self) -> int | None:
+        return self._token_budget
+
+    def _has_capacity(self, tokens: int, slots: int = 1) -> bool:
+        if (
+            self._max_in_flight is not None
+            and self._in_flight + slots > self._max_in_flight
+        ):
+            return False
+        if self._token_budget is None or self._in_flight == 0:
+            return True
+        return self._tokens_in_flight + tokens <= self._token_budget
+
+    def _start(self, tokens: int, slots: int = 1) -> None:
+        self._in_flight += slots
+        self._tokens_in_flight += tokens
+        self._admitted += 1
+
+    def _wake_waiters(self) -> None:
+        # Strict FIFO: a large request at the head is not overtaken by smaller
+        # ones behind it.
+        while self._waiters:
+            tokens, slots, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._has_capacity(tokens, slots):
+                return
+            self._waiters.popleft()
+            self._start(tokens, slots)
+            future.set_result(None)
+
+    def _reject(self) -> AdmissionRejected:
+        self._rejected += 1
+        return AdmissionRejected(
+            "server is saturated; retry later",
+            retry_after_s=self._retry_after_s,
+            details=self.stats(),
+        )
+
+    def check(self) -> None:
+        """Raise `AdmissionRejected` now if `acquire` would turn away any request.
+
+        Lets callers skip the work of estimating a request's tokens when the
+        queue is already full.
+        """
+        if len(self._waiters) >= self._max_queue_depth and (
+            self._waiters or not self._has_capacity(0)
+        ):
+            raise self._reject()
+
+    async def acquire(
+        self, estimated_tokens: int = 0, slots: int = 1
+    ) -> AdmissionTicket:
+        """Wait for `slots` slots, or raise `AdmissionRejected` if the queue is full."""
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        if self._max_in_flight is not None:
+            slots = min(slots, self._max_in_flight)
+        started = time.perf_counter()
+        queue_depth = len(self._waiters)
+        if not self._waiters and self._has_capacity(estimated_tokens, slots):
+            self._start(estimated_tokens, slots)
+        elif len(self._waiters) >= self._max_queue_depth:
+            raise self._reject()
+        else:
+            future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            self._waiters.append((estimated_tokens, slots, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Admitted just as the caller gave up; hand the slot back.
+                    self._finish(estimated_tokens, slots)
+                else:
+                    future.cancel()
+                    self._wake_waiters()
+                raise
+        return AdmissionTicket(
+            queue_wait_ms=(time.perf_counter() - started) * 1000,
+            queue_depth=queue_depth,
+            estimated_tokens=estimated_tokens,
+            slots=slots,
+        )
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Return a ticket's slot; releasing the same ticket twice is a no-op."""
+        if ticket.released:
+            return
+        ticket.released = True
+        self._finish(ticket.estimated_tokens, ticket.slots)
+
+    def _finish(self, tokens: int, slots: int = 1) -> None:
+        self._in_flight -= slots
+        self._tokens_in_flight -= tokens
+        self._wake_waiters()
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self._retry_after_s)))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self._max_in_flight,
+            "queued": sum(1 for *_, future in self._waiters if not future.done()),
+            "max_queue_depth": self._max_queue_depth,
+            "tokens_in_flight": self._tokens_in_flight,
+            "token_budget": self._token_budget,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+        }
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import gc
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .runtime import ServerConfig
+
+# ServerConfig fields that change how a generation agent is constructed. Fields
+# such as run_id, topk, or include_trace only affect how an agent is used, so
+# they deliberately do not split the pool.
+AGENT_KEY_FIELDS = (
+    "model",
+    "prompt_mode",
+    "use_azure_openai",
+    "use_openrouter",
+    "context_size",
+    "num_gpus",
+    "max_output_tokens",
+    "num_few_shot_examples",
+    "include_reasoning",
+    "reasoning_effort",
+)
+
+
+def agent_key(config: ServerConfig) -> tuple[Hashable, ...]:
+    return tuple(
+        (field_name, str(getattr(config, field_name)))
+        for field_name in AGENT_KEY_FIELDS
+    )
+
+
+def _process_memory_mb() -> float:
+    """Best-effort resident memory (plus CUDA allocations) of this process."""
+    memory_mb = 0.0
+    statm_path = Path("/proc/self/statm")
+    if statm_path.exists():
+        try:
+            resident_pages = int(statm_path.read_text().split()[1])
+        except (OSError, IndexError, ValueError):
+            resident_pages = 0
+        memory_mb += resident_pages * 4096 / (1024 * 1024)
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        memory_mb += torch.cuda.memory_allocated() / (1024 * 1024)
+    return memory_mb
+
+
+def _release_agents(agents: list[Any]) -> None:
+    if not agents:
+        return
+    agents.clear()
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+@dataclass
+class _PoolEntry:
+    agent: Any
+    memory_mb: float
+    config: ServerConfig
+
+
+class AgentPool:
+    """LRU pool of warm generation agents keyed by the effective server config.
+
+    Building an agent creates provider clients and a post-processor (which loads
+    spaCy), and for local models a vLLM engine, so the server keeps recently
+    used agents alive across requests. The pool is bounded both by entry count
+    and, optionally, by the memory measured while each agent was built. An
+    optional `can_evict` predicate protects agents that must stay loaded, such
+    as models that are still serving requests.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[ServerConfig], Any],
+        *,
+        max_agents: int = 4,
+        memory_budget_mb: float | None = None,
+        memory_probe: Callable[[], float] = _process_memory_mb,
+        can_evict: Callable[[ServerConfig], bool] | None = None,
+    ) -> None:
+        if max_agents < 1:
+            raise ValueError("max_agents must be at least 1")
+        self._factory = factory
+        self._max_agents = max_agents
+        self._memory_budget_mb = memory_budget_mb
+        self._memory_probe = memory_probe
+        self._can_evict = can_evict
+        self._entries: OrderedDict[tuple[Hashable, ...], _PoolEntry] = OrderedDict()
+        self._build_locks: dict[tuple[Hashable, ...], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, config: ServerConfig) -> Any:
+        key = agent_key(config)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                # Agents that were protected when the pool last grew may have
+                # become evictable since.
+                evicted = self._evict_over_budget() if self._over_budget() else []
+            else:
+                build_lock = self._build_locks.setdefault(key, threading.Lock())
+        if entry is not None:
+            _release_agents(evicted)
+            return entry.agent
+        # Build outside the pool lock so hits on other keys are never blocked by
+        # a slow model load; the per-key lock keeps concurrent misses on the
+        # same key from building the agent twice.
+        with build_lock:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    return entry.agent
+                self._misses += 1
+            memory_before = self._memory_probe()
+            agent = self._factory(config)
+            memory_mb = max(0.0, self._memory_probe() - memory_before)
+            with self._lock:
+                self._entries[key] = _PoolEntry(
+                    agent=agent, memory_mb=memory_mb, config=config
+                )
+                evicted = self._evict_over_budget()
+                self._build_locks.pop(key, None)
+        _release_agents(evicted)
+        return agent
+
+    def peek(self, config: ServerConfig) -> Any | None:
+        """The agent for `config` if it is already built, without building it."""
+        with self._lock:
+            entry = self._entries.get(agent_key(config))
+        return entry.agent if entry is not None else None
+
+    def _lookup(self, key: tuple[Hashable, ...]) -> _PoolEntry | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return entry
+
+    def _total_memory_mb(self) -> float:
+        return sum(entry.memory_mb for entry in self._entries.values())
+
+    def _evict_over_budget(self) -> list[Any]:
+        evicted: list[Any] = []
+        # The most recently inserted agent is always kept, even when it alone
+        # exceeds the memory budget, so the request that built it can proceed.
+        # Protected agents are skipped, so the pool may stay over its limits.
+        candidates = [
+            key
+            for key, entry in list(self._entries.items())[:-1]
+            if self._can_evict is None or self._can_evict(entry.config)
+        ]
+        for key in candidates:
+            if not self._over_budget():
+                break
+            entry = self._entries.pop(key)
+            evicted.append(entry.agent)
+            self._evictions += 1
+        return evicted
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self._max_agents or (
+            self._memory_budget_mb is not None
+            and self._total_memory_mb() > self._memory_budget_mb
+        )
+
+    def loaded_models(self) -> set[str]:
+        with self._lock:
+            return {entry.config.model for entry in self._entries.values()}
+
+    def clear(self) -> None:
+        with self._lock:
+            agents = [entry.agent for entry in self._entries.values()]
+            self._entries.clear()
+        _release_agents(agents)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_agents": self._max_agents,
+                "memory_mb": round(self._total_memory_mb(), 1),
+                "memory_budget_mb": self._memory_budget_mb,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
@@ -1,12 +1,39 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import time
+from collections.abc import Awaitable, Callable
+
+from fastapi import FastAPI, Request, Response
+
+from ragnarok.metrics import HTTP_LATENCY, HTTP_REQUESTS
 
 from .routes import build_router
 from .runtime import ServerConfig
 
 
+def _route_label(request: Request) -> str:
+    # Label by route template rather than raw path to keep cardinality bounded.
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
 def create_app(server_config: ServerConfig) -> FastAPI:
     app = FastAPI(title="ragnarok", version="0.0.1")
     app.include_router(build_router(server_config))
+
+    @app.middleware("http")
+    async def record_request_metrics(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        started = time.perf_counter()
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            route = _route_label(request)
+            HTTP_REQUESTS.inc(route=route, status=status)
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+
     return app
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from dataclasses import dataclass
+from typing import Any
+
+from ragnarok.data import Request, Result
+from ragnarok.generate.llm import shuffle_request_candidates
+from ragnarok.generate.offload import run_cpu_bound
+from ragnarok.metrics import stage_timer
+
+
+def supports_micro_batching(agent: Any) -> bool:
+    return callable(getattr(agent, "run_llm_batched", None))
+
+
+@dataclass
+class _PendingPrompt:
+    prompt: Any
+    future: asyncio.Future[tuple[Any, Any]]
+    # The request and topk the prompt was rendered from, so the agent can
+    # render it again shorter if the engine rejects it.
+    source: tuple[Request, int] | None = None
+
+
+class MicroBatchScheduler:
+    """Coalesces concurrent prompts for one agent into `run_llm_batched` calls.
+
+    The first queued prompt opens a collection window of `max_wait_ms`; every
+    prompt that arrives before the window closes (up to `max_batch_size`) is
+    dispatched with it as a single engine call and the results are fanned back
+    out to the waiting callers. Batches run one at a time, so prompts that
+    arrive while the engine is busy simply form the next, larger batch.
+    """
+
+    def __init__(
+        self,
+        agent: Any,
+        *,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        logging: bool = False,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        # Hold the agent weakly so an agent evicted from the pool can be freed
+        # even though its (idle) scheduler is still registered.
+        self._agent_ref = weakref.ref(agent)
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max(0.0, max_wait_ms) / 1000
+        self._logging = logging
+        self._queue: asyncio.Queue[_PendingPrompt] = asyncio.Queue()
+        self._worker: asyncio.Task[None] | None = None
+        self._batches = 0
+        self._prompts = 0
+        self._largest_batch = 0
+
+    async def submit(
+        self, prompt: Any, source: tuple[Request, int] | None = None
+    ) -> tuple[Any, Any]:
+        future: asyncio.Future[tuple[Any, Any]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._queue.put_nowait(
+            _PendingPrompt(prompt=prompt, future=future, source=source)
+        )
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._drain())
+        return await future
+
+    async def _collect(self) -> list[_PendingPrompt]:
+        batch = [self._queue.get_nowait()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_wait_s
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except TimeoutError:
+                break
+        while len(batch) < self._max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _drain(self) -> None:
+        try:
+            while not self._queue.empty():
+                await self._dispatch(await self._collect())
+        finally:
+            self._worker = None
+
+    async def _dispatch(self, batch: list[_PendingPrompt]) -> None:
+        pending = [item for item in batch if not item.future.done()]
+        if not pending:
+            return
+        self._batches += 1
+        self._prompts += len(pending)
+        self._largest_batch = max(self._largest_batch, len(pending))
+        agent = self._agent_ref()
+        try:
+            if agent is None:
+                raise RuntimeError("micro-batched agent is no longer available")
+            with stage_timer("run_llm"):
+                outputs = await asyncio.to_thread(
+                    agent.run_llm_batched,
+                    [item.prompt for item in pending],
+                    self._logging,
+                    sources=[item.source for item in pending],
+                )
+        except Exception as error:  # noqa: BLE001
+            for item in pending:
+                if not item.future.done():
+                    item.future.set_exception(error)
+            return
+        for item, output in zip(pending, outputs, strict=True):
+            if not item.future.done():
+                item.future.set_result(output)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "batches": self._batches,
+            "prompts": self._prompts,
+            "largest_batch": self._largest_batch,
+            "mean_batch_size": self._prompts / self._batches if self._batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+
+class MicroBatchRegistry:
+    """One `MicroBatchScheduler` per live agent, created on first use."""
+
+    def __init__(
+        self,
+        *,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+    ) -> None:
+        self._max_batch_size = max_batch_size
+        self._max_wait_ms = max_wait_ms
+        self._schedulers: weakref.WeakKeyDictionary[Any, MicroBatchScheduler] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def scheduler_for(
+        self, agent: Any, *, logging: bool = False
+    ) -> MicroBatchScheduler:
+        scheduler = self._schedulers.get(agent)
+        if scheduler is None:
+            scheduler = MicroBatchScheduler(
+                agent,
+                max_batch_size=self._max_batch_size,
+                max_wait_ms=self._max_wait_ms,
+                logging=logging,
+            )
+            self._schedulers[agent] = scheduler
+        return scheduler
+
+    def stats(self) -> dict[str, Any]:
+        schedulers = list(self._schedulers.values())
+        batches = sum(scheduler.stats()["batches"] for scheduler in schedulers)
+        prompts = sum(scheduler.stats()["prompts"] for scheduler in schedulers)
+        return {
+            "schedulers": len(schedulers),
+            "max_batch_size": self._max_batch_size,
+            "max_wait_ms": self._max_wait_ms,
+            "batches": batches,
+            "prompts": prompts,
+            "mean_batch_size": prompts / batches if batches else 0.0,
+        }
+
+
+async def answer_micro_batched(
+    agent: Any,
+    scheduler: MicroBatchScheduler,
+    request: Request,
+    *,
+    topk: int,
+    shuffle_candidates: bool = False,
+) -> Result:
+    if shuffle_candidates:
+        shuffle_request_candidates(request, topk)
+    with stage_timer("create_prompt"):
+        # Reuses the prompt rendered for admission, when there was one.
+        render = getattr(agent, "render_prompt", agent.create_prompt)
+        prompt, _input_token_count = await run_cpu_bound(render, request, topk)
+    answer, rag_exec_summary = await scheduler.submit(prompt, (request, topk))
+    result: Result = agent.build_result(request, topk, answer, rag_exec_summary)
+    return result
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from ragnarok.data import Request, Result
+from ragnarok.generate.llm import shuffle_request_candidates
+from ragnarok.generate.offload import run_cpu_bound
+from ragnarok.metrics import REGISTRY, stage_timer
+
+COALESCED_REQUESTS = REGISTRY.counter(
+    "ragnarok_coalesced_requests_total",
+    "Generate requests answered by another identical in-flight request.",
+)
+
+
+def supports_coalescing(agent: Any) -> bool:
+    """Whether an agent exposes the prompt-level hooks coalescing needs."""
+    return all(
+        callable(getattr(agent, name, None))
+        for name in ("create_prompt", "async_run_llm", "build_result")
+    )
+
+
+def coalescing_key(
+    agent_config: tuple[Hashable, ...],
+    request: Request,
+    topk: int,
+    prompt: Any,
+) -> str:
+    """Stable hash of everything that determines a request's `Result`.
+
+    The rendered prompt already covers the query, passage text, and prompt
+    mode; the agent configuration and the cited docids are added because they
+    change the result without necessarily changing the prompt.
+    """
+    material = {
+        "agent": agent_config,
+        "topk": topk,
+        "docids": [candidate.docid for candidate in request.candidates[:topk]],
+        "prompt": prompt,
+    }
+    encoded = json.dumps(material, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task[Any]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key.
+
+    The first caller for a key starts the call; callers that arrive while it is
+    running wait for the same outcome instead of starting their own. Every
+    caller receives its own deep copy of the outcome, so results can be
+    post-processed independently. The call is cancelled only once every
+    caller waiting on it has gone away.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(
+        self, key: str, call: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        """Return `call()`'s outcome and whether it was shared with a leader."""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+            COALESCED_REQUESTS.inc()
+        flight.waiters += 1
+        try:
+            outcome = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+        return copy.deepcopy(outcome), shared
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict[str, Any]:
+        total = self._leaders + self._coalesced
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self._leaders,
+            "coalesced": self._coalesced,
+            "coalesced_rate": self._coalesced / total if total else 0.0,
+        }
+
+
+async def answer_coalesced(
+    agent: Any,
+    flights: SingleFlight,
+    request: Request,
+    *,
+    agent_config: tuple[Hashable, ...],
+    topk: int,
+    shuffle_candidates: bool = False,
+    logging: bool = False,
+    run_prompt: Callable[[Any], Awaitable[Any]] | None = None,
+) -> tuple[Result, bool]:
+    """Answer one request, sharing the model call with identical requests.
+
+    `run_prompt` defaults to the agent's `async_run_llm`; the micro-batching
+    path passes its scheduler instead so shared prompts are batched once.
+    """
+    if shuffle_candidates:
+        shuffle_request_candidates(request, topk)
+    with stage_timer("create_prompt"):
+        # Reuses the prompt rendered for admission, when there was one.
+        render = getattr(agent, "render_prompt", agent.create_prompt)
+        prompt, _input_token_count = await run_cpu_bound(render, request, topk)
+
+    async def call() -> Any:
+        if run_prompt is not None:
+            return await run_prompt(prompt)
+        with stage_timer("run_llm"):
+            return await agent.async_run_llm(prompt, logging)
+
+    key = coalescing_key(agent_config, request, topk, prompt)
+    (answer, rag_exec_summary), shared = await flights.do(key, call)
+    result: Result = agent.build_result(request, topk, answer, rag_exec_summary)
+    return result, shared
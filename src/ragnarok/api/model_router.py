@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields, replace
+from typing import TYPE_CHECKING, Any
+
+from ragnarok.cli.operations import generation_backend
+
+if TYPE_CHECKING:
+    from .runtime import ServerConfig
+
+# ServerConfig fields a hosted model may pin for itself.
+_MODEL_CONFIG_FIELDS = (
+    "prompt_mode",
+    "use_azure_openai",
+    "use_openrouter",
+    "context_size",
+    "num_gpus",
+    "max_output_tokens",
+    "num_few_shot_examples",
+    "include_reasoning",
+    "reasoning_effort",
+    "vllm_batched",
+)
+_BOOL_FIELDS = {
+    "use_azure_openai",
+    "use_openrouter",
+    "include_reasoning",
+    "vllm_batched",
+    "preload",
+}
+_INT_FIELDS = {
+    "context_size",
+    "num_gpus",
+    "max_output_tokens",
+    "num_few_shot_examples",
+    "max_concurrency",
+}
+
+
+@dataclass(frozen=True)
+class HostedModel:
+    """A model served by `ragnarok serve`, with its own settings and limits.
+
+    Settings left as `None` fall back to the server-wide configuration.
+    """
+
+    model: str
+    prompt_mode: str | None = None
+    use_azure_openai: bool | None = None
+    use_openrouter: bool | None = None
+    context_size: int | None = None
+    num_gpus: int | None = None
+    max_output_tokens: int | None = None
+    num_few_shot_examples: int | None = None
+    include_reasoning: bool | None = None
+    reasoning_effort: str | None = None
+    vllm_batched: bool | None = None
+    max_concurrency: int | None = None
+    preload: bool = False
+
+    @property
+    def backend(self) -> str:
+        return generation_backend(self.model)
+
+    @property
+    def is_local(self) -> bool:
+        return self.backend == "os_llm"
+
+    def apply(self, config: ServerConfig) -> ServerConfig:
+        pinned = {
+            field_name: getattr(self, field_name)
+            for field_name in _MODEL_CONFIG_FIELDS
+            if getattr(self, field_name) is not None
+        }
+        return replace(config, model=self.model, **pinned)
+
+
+def _parse_flag(key: str, value: str) -> bool:
+    lowered = value.lower()
+    if lowered in {"1", "true", "yes"}:
+        return True
+    if lowered in {"0", "false", "no"}:
+        return False
+    raise ValueError(f"{key} must be true or false, got {value!r}")
+
+
+def parse_hosted_model(spec: str) -> HostedModel:
+    """Parse `MODEL[,key=value...]`, e.g. `gpt-4o,max_concurrency=8,preload`."""
+    name, *options = [part.strip() for part in spec.split(",")]
+    if not name:
+        raise ValueError(f"hosted model spec is missing a model name: {spec!r}")
+    known = {field.name for field in fields(HostedModel)} - {"model"}
+    values: dict[str, Any] = {}
+    for option in options:
+        key, separator, value = option.partition("=")
+        key = key.strip().replace("-", "_")
+        if key not in known:
+            raise ValueError(
+                f"unsupported hosted model option {key!r} in {spec!r}; "
+                f"expected one of: {', '.join(sorted(known))}"
+            )
+        if not separator:
+            if key not in _BOOL_FIELDS:
+                raise ValueError(f"hosted model option {key!r} needs a value")
+            values[key] = True
+        elif key in _BOOL_FIELDS:
+            values[key] = _parse_flag(key, value.strip())
+        elif key in _INT_FIELDS:
+            try:
+                values[key] = int(value)
+            except ValueError as error:
+                raise ValueError(
+                    f"{key} must be an integer, got {value.strip()!r}"
+                ) from error
+        else:
+            values[key] = value.strip()
+    if values.get("max_concurrency") is not None and values["max_concurrency"] < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    return HostedModel(model=name, **values)
+
+
+def hosted_models(config: ServerConfig) -> dict[str, HostedModel]:
+    """The configured models by name, plus the server's default model."""
+    models = {hosted.model: hosted for hosted in config.models}
+    models.setdefault(config.model, HostedModel(model=config.model))
+    return models
+
+
+def resolve_model_config(
+    config: ServerConfig, overrides: dict[str, Any]
+) -> ServerConfig:
+    """Apply the requested model's pinned settings, then request overrides.
+
+    When no models are configured, any model may be requested and an override
+    simply builds a new agent. Once models are configured, requests are
+    restricted to them plus the server's default model.
+    """
+    model = overrides.get("model", config.model)
+    hosted = hosted_models(config).get(model)
+    if hosted is None:
+        if config.models:
+            raise ValueError(
+                f"model {model!r} is not hosted by this server; "
+                f"available: {', '.join(hosted_models(config))}"
+            )
+        return replace(config, **overrides) if overrides else config
+    return replace(hosted.apply(config), **overrides)
+
+
+class ModelRouter:
+    """Tracks per-model concurrency for the models a server hosts.
+
+    Each hosted model's `max_concurrency` bounds how many of its generations
+    run at once, and the in-flight counts tell the agent pool which local
+    models are idle and may be unloaded.
+    """
+
+    def __init__(self, config: ServerConfig) -> None:
+        models = [hosted.model for hosted in config.models]
+        duplicates = sorted({model for model in models if models.count(model) > 1})
+        if duplicates:
+            raise ValueError(f"models configured twice: {', '.join(duplicates)}")
+        self._models = hosted_models(config)
+        self._restricted = bool(config.models)
+        self._slots: dict[str, asyncio.Semaphore] = {}
+        self._in_flight: dict[str, int] = dict.fromkeys(self._models, 0)
+
+    @property
+    def models(self) -> list[HostedModel]:
+        return list(self._models.values())
+
+    def preload_configs(self, config: ServerConfig) -> list[ServerConfig]:
+        return [hosted.apply(config) for hosted in self.models if hosted.preload]
+
+    def warm_up_configs(self, config: ServerConfig) -> list[ServerConfig]:
+        """Configs whose agents are built during warm-up.
+
+        Local models not marked `preload` are skipped, so warm-up never loads
+        every local model onto the GPU at once.
+        """
+        return [
+            hosted.apply(config)
+            for hosted in self.models
+            if hosted.preload or not hosted.is_local
+        ]
+
+    def is_idle(self, model: str) -> bool:
+        return self._in_flight.get(model, 0) == 0
+
+    def can_unload(self, config: ServerConfig) -> bool:
+        """Whether the agent pool may evict the agent built for `config`.
+
+        Hosted remote models are cheap to keep and stay pinned; local models
+        and non-hosted agents may be unloaded once no request is using them.
+        """
+        hosted = self._models.get(config.model)
+        if self._restricted and hosted is not None and not hosted.is_local:
+            return False
+        return self.is_idle(config.model)
+
+    @asynccontextmanager
+    async def slot(self, model: str) -> AsyncIterator[None]:
+        """Hold one of `model`'s concurrency slots for the duration of a call."""
+        hosted = self._models.get(model)
+        limit = hosted.max_concurrency if hosted is not None else None
+        semaphore: asyncio.Semaphore | None = None
+        if limit is not None:
+            semaphore = self._slots.setdefault(model, asyncio.Semaphore(limit))
+            await semaphore.acquire()
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_flight[model] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    def describe(self, loaded_models: set[str]) -> list[dict[str, Any]]:
+        return [
+            {
+                "model": hosted.model,
+                "backend": hosted.backend,
+                "max_concurrency": hosted.max_concurrency,
+                "in_flight": self._in_flight.get(hosted.model, 0),
+                "preload": hosted.preload,
+                "loaded": hosted.model in loaded_models,
+            }
+            for hosted in self.models
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hosted": len(self._models),
+            "in_flight": sum(self._in_flight.values()),
+        }
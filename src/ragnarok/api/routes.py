@@ -1,35 +1,206 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
+from ragnarok.generate.offload import LoopLagMonitor
+from ragnarok.metrics import REGISTRY
+
+from .admission import AdmissionRejected
+from .agent_pool import AgentPool
 from .runtime import (
     ServerConfig,
-    run_generate_request,
+    acquire_admission,
+    acquire_batch_admission,
+    async_run_generate_request,
+    async_stream_generate,
+    async_stream_generate_batch,
+    build_admission_controller,
+    build_agent_pool,
+    build_micro_batch_registry,
+    build_model_router,
+    build_single_flight,
+    overloaded_error_response,
+    parse_batch_payloads,
+    preload_models,
+    prepare_stream_request,
+    release_after_stream,
     runtime_error_response,
+    stream_in_model_slot,
     validation_error_response,
 )
+from .warmup import Readiness, warm_up_server
+
+
+def build_router(
+    config: ServerConfig, *, agent_pool: AgentPool | None = None
+) -> APIRouter:
+    models = build_model_router(config)
+    pool = (
+        agent_pool
+        if agent_pool is not None
+        else build_agent_pool(config, models=models)
+    )
 
+    readiness = Readiness()
+    loop_lag = LoopLagMonitor()
 
-def build_router(config: ServerConfig) -> APIRouter:
-    router = APIRouter()
+    @asynccontextmanager
+    async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+        async with loop_lag:
+            if not config.warm_up:
+                readiness.start()
+                await preload_models(config, agent_pool=pool, models=models)
+                readiness.finish()
+                yield
+                return
+            # Warm up in the background so liveness probes answer while /readyz
+            # keeps traffic away until the slow loads are done.
+            warm_up = asyncio.create_task(
+                warm_up_server(
+                    config, agent_pool=pool, models=models, readiness=readiness
+                )
+            )
+            try:
+                yield
+            finally:
+                warm_up.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await warm_up
+
+    router = APIRouter(lifespan=lifespan)
+    micro_batches = build_micro_batch_registry(config)
+    admission = build_admission_controller(config)
+    flights = build_single_flight(config)
+
+    def overloaded(error: AdmissionRejected) -> JSONResponse:
+        return JSONResponse(
+            overloaded_error_response(error).to_envelope(),
+            status_code=429,
+            headers={"Retry-After": admission.retry_after_header()},
+        )
 
     @router.get("/healthz")
     def healthz() -> dict[str, str]:
         return {"status": "ok"}
 
+    @router.get("/readyz")
+    def readyz() -> JSONResponse:
+        return JSONResponse(
+            readiness.snapshot(), status_code=200 if readiness.ready else 503
+        )
+
+    @router.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> PlainTextResponse:
+        body = REGISTRY.render(
+            extra_stats={
+                "ragnarok_agent_pool": pool.stats(),
+                "ragnarok_admission": admission.stats(),
+                "ragnarok_micro_batch": micro_batches.stats(),
+                "ragnarok_models": models.stats(),
+                "ragnarok_coalescing": flights.stats() if flights else {},
+                "ragnarok_event_loop": loop_lag.stats(),
+            }
+        )
+        return PlainTextResponse(
+            body, media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    @router.get("/v1/models")
+    def list_models() -> dict[str, Any]:
+        return {"models": models.describe(pool.loaded_models())}
+
     @router.post("/v1/generate")
-    def generate(payload: dict[str, Any]) -> JSONResponse:
+    async def generate(payload: dict[str, Any]) -> JSONResponse:
         try:
-            response = run_generate_request(payload, config=config)
+            response = await async_run_generate_request(
+                payload,
+                config=config,
+                agent_pool=pool,
+                micro_batches=micro_batches,
+                admission=admission,
+                models=models,
+                flights=flights,
+            )
             return JSONResponse(response.to_envelope())
+        except AdmissionRejected as error:
+            return overloaded(error)
+        except (TypeError, ValueError, KeyError) as error:
+            response = validation_error_response(str(error))
+            return JSONResponse(response.to_envelope(), status_code=400)
+        except Exception as error:  # noqa: BLE001
+            response = runtime_error_response(error)
+            return JSONResponse(response.to_envelope(), status_code=500)
+
+    @router.post("/v1/generate/batch", response_model=None)
+    async def generate_batch(request: Request) -> StreamingResponse | JSONResponse:
+        body = (await request.body()).decode("utf-8", errors="replace")
+        try:
+            payloads = parse_batch_payloads(body)
+        except ValueError as error:
+            response = validation_error_response(str(error))
+            return JSONResponse(response.to_envelope(), status_code=400)
+        try:
+            ticket = await acquire_batch_admission(
+                payloads, config=config, admission=admission, agent_pool=pool
+            )
+        except AdmissionRejected as error:
+            return overloaded(error)
+        lines = async_stream_generate_batch(payloads, config=config, agent_pool=pool)
+        return StreamingResponse(
+            release_after_stream(
+                stream_in_model_slot(
+                    (line + "\n" async for line in lines),
+                    models=models,
+                    config=config,
+                ),
+                admission=admission,
+                ticket=ticket,
+            ),
+            media_type="application/x-ndjson",
+            # Also release if the client disconnects before streaming starts.
+            background=BackgroundTask(admission.release, ticket),
+        )
+
+    @router.post("/v1/generate/stream", response_model=None)
+    async def generate_stream(
+        payload: dict[str, Any],
+    ) -> StreamingResponse | JSONResponse:
+        try:
+            effective_config, request = prepare_stream_request(payload, config=config)
+            ticket = await acquire_admission(
+                payload,
+                config=effective_config,
+                admission=admission,
+                agent_pool=pool,
+            )
+        except AdmissionRejected as error:
+            return overloaded(error)
         except (TypeError, ValueError, KeyError) as error:
             response = validation_error_response(str(error))
             return JSONResponse(response.to_envelope(), status_code=400)
         except Exception as error:  # noqa: BLE001
             response = runtime_error_response(error)
             return JSONResponse(response.to_envelope(), status_code=500)
+        events = async_stream_generate(
+            request, config=effective_config, agent_pool=pool
+        )
+        return StreamingResponse(
+            release_after_stream(
+                stream_in_model_slot(events, models=models, config=effective_config),
+                admission=admission,
+                ticket=ticket,
+            ),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(admission.release, ticket),
+        )
 
     return router
@@ -2,7 +2,11 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-from dataclasses import asdict, dataclass, replace
+import json
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, nullcontext
+from dataclasses import dataclass, field
+from functools import partial
 from typing import Any
 
 from ragnarok.cli.adapters import make_data_artifact
@@ -11,9 +15,26 @@ from ragnarok.cli.normalize import (
     normalize_direct_generate_input,
     unwrap_direct_generate_payload,
 )
-from ragnarok.cli.operations import async_run_request_generation, run_request_generation
+from ragnarok.cli.operations import (
+    async_run_request_generation,
+    create_generation_agent,
+    run_request_generation,
+)
 from ragnarok.cli.responses import CommandResponse
 from ragnarok.cli.spec import EXIT_CODES
+from ragnarok.generate.offload import run_cpu_bound
+from ragnarok.generate.token_counter import approximate_token_count
+
+from .admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from .agent_pool import AgentPool, agent_key
+from .batching import (
+    MicroBatchRegistry,
+    MicroBatchScheduler,
+    answer_micro_batched,
+    supports_micro_batching,
+)
+from .coalescing import SingleFlight, answer_coalesced, supports_coalescing
+from .model_router import HostedModel, ModelRouter, resolve_model_config
 
 
 @dataclass(frozen=True)
@@ -41,6 +62,28 @@ class ServerConfig:
     reasoning_effort: str | None = None
     log_level: int = 0
     quiet: bool = False
+    agent_pool_size: int = 4
+    agent_pool_memory_mb: float | None = None
+    micro_batch_size: int = 16
+    micro_batch_wait_ms: float = 10.0
+    max_in_flight: int | None = 32
+    max_queue_depth: int = 64
+    token_budget: int | None = None
+    retry_after_s: float = 1.0
+    coalesce_requests: bool = True
+    warm_up: bool = False
+    rpm_limit: int | None = None
+    tpm_limit: int | None = None
+    max_concurrency_per_key: int | None = None
+    max_retries: int = 7
+    retry_deadline_s: float = 300.0
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry_s: float = 30.0
+    http2: bool = False
+    hedge_percentile: float | None = None
+    hedge_max_ratio: float = 0.05
+    models: tuple[HostedModel, ...] = field(default_factory=tuple)
 
 
 _OVERRIDABLE_FIELDS = {
@@ -90,6 +133,17 @@ def _base_args(config: ServerConfig) -> argparse.Namespace:
         include_trace=config.include_trace,
         redact_prompts=config.redact_prompts,
         reasoning_effort=config.reasoning_effort,
+        rpm_limit=config.rpm_limit,
+        tpm_limit=config.tpm_limit,
+        max_concurrency_per_key=config.max_concurrency_per_key,
+        max_retries=config.max_retries,
+        retry_deadline=config.retry_deadline_s,
+        http_max_connections=config.http_max_connections,
+        http_max_keepalive=config.http_max_keepalive,
+        http_keepalive_expiry=config.http_keepalive_expiry_s,
+        http2=config.http2,
+        hedge_percentile=config.hedge_percentile,
+        hedge_max_ratio=config.hedge_max_ratio,
         log_level=config.log_level,
         quiet=config.quiet,
         output="json",
@@ -143,19 +197,175 @@ def _merge_config_with_payload(
     config: ServerConfig,
 ) -> ServerConfig:
     overrides = _extract_override_payload(payload)
-    if not overrides:
-        return config
-    effective_values = asdict(config)
-    effective_values.update(overrides)
-    return replace(config, **effective_values)
+    return resolve_model_config(config, overrides)
 
 
-def execute_direct_generate(
+def _build_pooled_agent(config: ServerConfig) -> Any:
+    return create_generation_agent(_base_args(config))
+
+
+def build_agent_pool(
+    config: ServerConfig, *, models: ModelRouter | None = None
+) -> AgentPool:
+    return AgentPool(
+        _build_pooled_agent,
+        # Every hosted model keeps a warm agent, however small the pool size.
+        max_agents=max(config.agent_pool_size, len(config.models)),
+        memory_budget_mb=config.agent_pool_memory_mb,
+        can_evict=models.can_unload if models is not None else None,
+    )
+
+
+def build_single_flight(config: ServerConfig) -> SingleFlight | None:
+    return SingleFlight() if config.coalesce_requests else None
+
+
+def build_model_router(config: ServerConfig) -> ModelRouter:
+    return ModelRouter(config)
+
+
+def model_slot(
+    models: ModelRouter | None, config: ServerConfig
+) -> AbstractAsyncContextManager[None]:
+    return models.slot(config.model) if models is not None else nullcontext()
+
+
+async def preload_models(
+    config: ServerConfig, *, agent_pool: AgentPool, models: ModelRouter
+) -> list[str]:
+    """Build the agents of every hosted model marked `preload`."""
+    loaded = []
+    for effective_config in models.preload_configs(config):
+        await asyncio.to_thread(agent_pool.get, effective_config)
+        loaded.append(effective_config.model)
+    return loaded
+
+
+def build_micro_batch_registry(config: ServerConfig) -> MicroBatchRegistry:
+    return MicroBatchRegistry(
+        max_batch_size=config.micro_batch_size,
+        max_wait_ms=config.micro_batch_wait_ms,
+    )
+
+
+def build_admission_controller(config: ServerConfig) -> AdmissionController:
+    return AdmissionController(
+        max_in_flight=config.max_in_flight,
+        max_queue_depth=config.max_queue_depth,
+        token_budget=config.token_budget,
+        retry_after_s=config.retry_after_s,
+    )
+
+
+async def estimate_prompt_tokens(
     payload: dict[str, Any],
     *,
-    args: argparse.Namespace,
-) -> CommandResponse:
+    config: ServerConfig,
+    agent_pool: AgentPool,
+) -> int:
+    """Count the prompt tokens a direct request will send.
+
+    With a loaded agent the prompt is rendered once and kept for the
+    generation that follows. A request for an agent that is not loaded yet
+    is sized from its text instead, so admission never builds an agent or
+    loads a model.
+    """
     request = normalize_direct_generate_input(payload)
+    topk = min((config.topk or [20])[-1], len(request.candidates))
+    agent = agent_pool.peek(config)
+    if agent is None:
+        text = "\n".join(
+            [request.query.text]
+            + [
+                " ".join(str(value) for value in candidate.doc.values())
+                for candidate in request.candidates[:topk]
+            ]
+        )
+        return approximate_token_count(text)
+    render = getattr(agent, "prerender_prompt", agent.create_prompt)
+    _prompt, input_token_count = await run_cpu_bound(render, request, topk)
+    return int(input_token_count)
+
+
+async def acquire_admission(
+    payload: dict[str, Any] | None,
+    *,
+    config: ServerConfig,
+    admission: AdmissionController,
+    agent_pool: AgentPool | None,
+) -> AdmissionTicket:
+    """Estimate a request's prompt tokens if a budget needs them, then admit it."""
+    estimated_tokens = 0
+    # Token estimates cost a prompt render, so they are only computed when a
+    # budget actually uses them, and not for a request a full queue rejects.
+    if (
+        payload is not None
+        and admission.token_budget is not None
+        and agent_pool is not None
+    ):
+        admission.check()
+        estimated_tokens = await estimate_prompt_tokens(
+            payload, config=config, agent_pool=agent_pool
+        )
+    return await admission.acquire(estimated_tokens)
+
+
+async def acquire_batch_admission(
+    payloads: list[Any],
+    *,
+    config: ServerConfig,
+    admission: AdmissionController,
+    agent_pool: AgentPool | None,
+) -> AdmissionTicket:
+    """Admit a batch as the generations it will run at once.
+
+    The batch holds one slot per concurrent generation and, under a token
+    budget, the summed estimates of its valid lines. Lines that fail to
+    normalize cost nothing; the batch stream reports them in place.
+    """
+    estimated_tokens = 0
+    if admission.token_budget is not None and agent_pool is not None:
+        admission.check()
+        for payload in payloads:
+            if not isinstance(payload, dict) or payload.get("overrides"):
+                continue
+            try:
+                estimated_tokens += await estimate_prompt_tokens(
+                    payload, config=config, agent_pool=agent_pool
+                )
+            except (TypeError, ValueError, KeyError):
+                continue
+    slots = max(1, min(len(payloads), config.max_concurrency))
+    return await admission.acquire(estimated_tokens, slots=slots)
+
+
+async def release_after_stream(
+    chunks: AsyncIterator[str],
+    *,
+    admission: AdmissionController,
+    ticket: AdmissionTicket,
+) -> AsyncIterator[str]:
+    """Hold an admission slot for as long as a streamed response is running."""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        admission.release(ticket)
+
+
+async def stream_in_model_slot(
+    chunks: AsyncIterator[str],
+    *,
+    models: ModelRouter | None,
+    config: ServerConfig,
+) -> AsyncIterator[str]:
+    """Hold the model's concurrency slot for as long as a stream is running."""
+    async with model_slot(models, config):
+        async for chunk in chunks:
+            yield chunk
+
+
+def _direct_generate_response(args: argparse.Namespace) -> CommandResponse:
     response = CommandResponse(command="generate")
     response.validation = {"valid": True, "record_count": 1}
     response.inputs = {"source": "direct"}
@@ -165,6 +375,16 @@ def execute_direct_generate(
         "model": args.model,
         "prompt_mode": getattr(args.prompt_mode, "value", args.prompt_mode),
     }
+    return response
+
+
+def execute_direct_generate(
+    payload: dict[str, Any],
+    *,
+    args: argparse.Namespace,
+) -> CommandResponse:
+    request = normalize_direct_generate_input(payload)
+    response = _direct_generate_response(args)
     logger = setup_logging(args.log_level, quiet=getattr(args, "quiet", False))
     if args.execution_mode == "async":
         records, metrics = asyncio.run(
@@ -177,13 +397,409 @@ def execute_direct_generate(
     return response
 
 
+async def async_execute_direct_generate(
+    payload: dict[str, Any],
+    *,
+    args: argparse.Namespace,
+) -> CommandResponse:
+    """Run one direct request on the caller's event loop.
+
+    Unlike `execute_direct_generate`, this never starts a nested event loop, so
+    async provider clients owned by a long-lived agent stay bound to the
+    server loop and are reused across requests.
+    """
+    request = normalize_direct_generate_input(payload)
+    response = _direct_generate_response(args)
+    logger = setup_logging(args.log_level, quiet=getattr(args, "quiet", False))
+    records, metrics = await async_run_request_generation([request], args, logger)
+    response.metrics = metrics
+    response.artifacts.append(make_data_artifact("generation-results", records))
+    return response
+
+
 def run_generate_request(
     payload: dict[str, Any],
     *,
     config: ServerConfig,
+    agent_pool: AgentPool | None = None,
 ) -> CommandResponse:
     effective_config = _merge_config_with_payload(payload, config=config)
-    return execute_direct_generate(payload, args=_base_args(effective_config))
+    args = _base_args(effective_config)
+    if agent_pool is None:
+        return execute_direct_generate(payload, args=args)
+    args.agent_factory = partial(agent_pool.get, effective_config)
+    response = execute_direct_generate(payload, args=args)
+    response.metrics["agent_pool"] = agent_pool.stats()
+    return response
+
+
+async def async_execute_micro_batched_generate(
+    payload: dict[str, Any],
+    *,
+    args: argparse.Namespace,
+    agent: Any,
+    micro_batches: MicroBatchRegistry,
+) -> CommandResponse:
+    """Run one direct request through the agent's shared micro-batch scheduler."""
+    from ragnarok.data import result_to_dict
+
+    request = normalize_direct_generate_input(payload)
+    response = _direct_generate_response(args)
+    response.resolved["micro_batched"] = True
+    scheduler = micro_batches.scheduler_for(agent, logging=args.print_prompts_responses)
+    result = await answer_micro_batched(
+        agent,
+        scheduler,
+        request,
+        topk=min(args.topk[-1], len(request.candidates)),
+        shuffle_candidates=args.shuffle_candidates,
+    )
+    records = [
+        result_to_dict(
+            result,
+            args.run_id,
+            include_trace=args.include_trace,
+            redact_prompts=args.redact_prompts,
+        )
+    ]
+    response.metrics = {
+        "generated_records": len(records),
+        "micro_batch": micro_batches.stats(),
+    }
+    response.artifacts.append(make_data_artifact("generation-results", records))
+    return response
+
+
+async def async_execute_coalesced_generate(
+    payload: dict[str, Any],
+    *,
+    args: argparse.Namespace,
+    config: ServerConfig,
+    agent: Any,
+    flights: SingleFlight,
+    scheduler: MicroBatchScheduler | None = None,
+) -> CommandResponse:
+    """Run one direct request, sharing its model call with identical requests."""
+    from ragnarok.data import result_to_dict
+
+    request = normalize_direct_generate_input(payload)
+    response = _direct_generate_response(args)
+    result, shared = await answer_coalesced(
+        agent,
+        flights,
+        request,
+        agent_config=agent_key(config),
+        topk=min(args.topk[-1], len(request.candidates)),
+        shuffle_candidates=args.shuffle_candidates,
+        logging=args.print_prompts_responses,
+        run_prompt=scheduler.submit if scheduler is not None else None,
+    )
+    response.resolved["coalesced"] = shared
+    if scheduler is not None:
+        response.resolved["micro_batched"] = True
+    records = [
+        result_to_dict(
+            result,
+            args.run_id,
+            include_trace=args.include_trace,
+            redact_prompts=args.redact_prompts,
+        )
+    ]
+    response.metrics = {
+        "generated_records": len(records),
+        "coalescing": flights.stats(),
+    }
+    response.artifacts.append(make_data_artifact("generation-results", records))
+    return response
+
+
+async def async_run_generate_request(
+    payload: dict[str, Any],
+    *,
+    config: ServerConfig,
+    agent_pool: AgentPool | None = None,
+    micro_batches: MicroBatchRegistry | None = None,
+    admission: AdmissionController | None = None,
+    models: ModelRouter | None = None,
+    flights: SingleFlight | None = None,
+) -> CommandResponse:
+    effective_config = _merge_config_with_payload(payload, config=config)
+    if admission is None:
+        async with model_slot(models, effective_config):
+            return await _async_generate(
+                payload,
+                config=config,
+                effective_config=effective_config,
+                agent_pool=agent_pool,
+                micro_batches=micro_batches,
+                flights=flights,
+            )
+    ticket = await acquire_admission(
+        payload,
+        config=effective_config,
+        admission=admission,
+        agent_pool=agent_pool,
+    )
+    try:
+        async with model_slot(models, effective_config):
+            response = await _async_generate(
+                payload,
+                config=config,
+                effective_config=effective_config,
+                agent_pool=agent_pool,
+                micro_batches=micro_batches,
+                flights=flights,
+            )
+    finally:
+        admission.release(ticket)
+    response.metrics["admission"] = ticket.metrics()
+    return response
+
+
+async def _async_generate(
+    payload: dict[str, Any],
+    *,
+    config: ServerConfig,
+    effective_config: ServerConfig,
+    agent_pool: AgentPool | None,
+    micro_batches: MicroBatchRegistry | None,
+    flights: SingleFlight | None = None,
+) -> CommandResponse:
+    if (
+        agent_pool is not None
+        and micro_batches is not None
+        and effective_config.vllm_batched
+    ):
+        agent = await asyncio.to_thread(agent_pool.get, effective_config)
+        if supports_micro_batching(agent):
+            if flights is not None:
+                args = _base_args(effective_config)
+                response = await async_execute_coalesced_generate(
+                    payload,
+                    args=args,
+                    config=effective_config,
+                    agent=agent,
+                    flights=flights,
+                    scheduler=micro_batches.scheduler_for(
+                        agent, logging=args.print_prompts_responses
+                    ),
+                )
+                response.metrics["micro_batch"] = micro_batches.stats()
+                response.metrics["agent_pool"] = agent_pool.stats()
+                return response
+            response = await async_execute_micro_batched_generate(
+                payload,
+                args=_base_args(effective_config),
+                agent=agent,
+                micro_batches=micro_batches,
+            )
+            response.metrics["agent_pool"] = agent_pool.stats()
+            return response
+    if effective_config.execution_mode != "async":
+        # Sync backends block, so keep them off the event loop.
+        return await asyncio.to_thread(
+            run_generate_request,
+            payload,
+            config=config,
+            agent_pool=agent_pool,
+        )
+    args = _base_args(effective_config)
+    if agent_pool is None:
+        return await async_execute_direct_generate(payload, args=args)
+    # Agent construction can load models, so it also runs off the loop; the
+    # resulting agent (and its async clients) is then shared by every request.
+    agent = await asyncio.to_thread(agent_pool.get, effective_config)
+    if flights is not None and supports_coalescing(agent):
+        response = await async_execute_coalesced_generate(
+            payload,
+            args=args,
+            config=effective_config,
+            agent=agent,
+            flights=flights,
+        )
+    else:
+        args.agent_factory = lambda: agent
+        response = await async_execute_direct_generate(payload, args=args)
+    response.metrics["agent_pool"] = agent_pool.stats()
+    return response
+
+
+def parse_batch_payloads(body: str) -> list[Any]:
+    """Split an NDJSON batch body into per-line payloads.
+
+    Lines that are not valid JSON are kept as their `ValueError` so the stream
+    can report them in place without failing the rest of the batch.
+    """
+    payloads: list[Any] = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            payloads.append(json.loads(line))
+        except json.JSONDecodeError as error:
+            payloads.append(ValueError(f"invalid JSON line: {error}"))
+    if not payloads:
+        raise ValueError("batch body must contain at least one JSON request line")
+    return payloads
+
+
+def _batch_error_line(index: int, status: str, error: Exception) -> str:
+    return json.dumps(
+        {
+            "index": index,
+            "status": status,
+            "error": {
+                "code": status,
+                "message": str(error),
+                "retryable": False,
+            },
+        }
+    )
+
+
+async def async_stream_generate_batch(
+    payloads: list[Any],
+    *,
+    config: ServerConfig,
+    agent_pool: AgentPool | None = None,
+) -> AsyncIterator[str]:
+    """Answer a batch of direct requests, yielding one NDJSON line per request.
+
+    Lines are emitted in completion order and carry the request's position in
+    the batch as `index`. Requests always go through the agent's async path,
+    bounded by the configured `max_concurrency`, so the first line is ready
+    after a single generation rather than after the whole batch.
+    """
+    from ragnarok.data import result_to_dict
+    from ragnarok.generate.generator import RAG
+
+    requests: list[Any] = []
+    positions: list[int] = []
+    for index, payload in enumerate(payloads):
+        try:
+            if isinstance(payload, Exception):
+                raise payload
+            if not isinstance(payload, dict):
+                raise ValueError("each batch line must be a JSON object")
+            if payload.get("overrides"):
+                raise ValueError(
+                    "per-line overrides are not supported by the batch endpoint"
+                )
+            requests.append(normalize_direct_generate_input(payload))
+        except (TypeError, ValueError, KeyError) as error:
+            yield _batch_error_line(index, "validation_error", error)
+            continue
+        positions.append(index)
+    if not requests:
+        return
+
+    args = _base_args(config)
+    try:
+        if agent_pool is not None:
+            agent = await asyncio.to_thread(agent_pool.get, config)
+        else:
+            agent = await asyncio.to_thread(create_generation_agent, args)
+    except Exception as error:  # noqa: BLE001
+        for index in positions:
+            yield _batch_error_line(index, "runtime_error", error)
+        return
+
+    rag = RAG(agent=agent, run_id=args.run_id)
+    async for request_index, outcome in rag.async_answer_stream(
+        requests,
+        topk=args.topk[-1],
+        shuffle_candidates=args.shuffle_candidates,
+        logging=args.print_prompts_responses,
+        vllm=args.vllm_batched,
+        max_concurrency=args.max_concurrency,
+        return_exceptions=True,
+    ):
+        index = positions[request_index]
+        if isinstance(outcome, Exception):
+            yield _batch_error_line(index, "runtime_error", outcome)
+            continue
+        record = result_to_dict(
+            outcome,
+            args.run_id,
+            include_trace=args.include_trace,
+            redact_prompts=args.redact_prompts,
+        )
+        yield json.dumps({"index": index, "status": "success", "record": record})
+
+
+def _sse_event(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def prepare_stream_request(
+    payload: dict[str, Any], *, config: ServerConfig
+) -> tuple[ServerConfig, Any]:
+    """Validate a streaming request up front so bad input still gets a 400."""
+    effective_config = _merge_config_with_payload(payload, config=config)
+    return effective_config, normalize_direct_generate_input(payload)
+
+
+async def async_stream_generate(
+    request: Any,
+    *,
+    config: ServerConfig,
+    agent_pool: AgentPool | None = None,
+) -> AsyncIterator[str]:
+    """Answer one direct request as a sequence of Server-Sent Events.
+
+    `delta` events carry raw model text as it arrives and `sentence` events
+    carry each finished sentence with the docids it cites. The stream ends with
+    a `done` event holding the `result_to_dict` record and its execution trace,
+    or an `error` event if generation fails part-way.
+    """
+    from ragnarok.data import result_to_dict
+
+    args = _base_args(config)
+    topk = min(args.topk[-1], len(request.candidates))
+    sentence_count = 0
+    try:
+        if agent_pool is not None:
+            agent = await asyncio.to_thread(agent_pool.get, config)
+        else:
+            agent = await asyncio.to_thread(create_generation_agent, args)
+        async for event in agent.async_answer_stream(
+            request,
+            topk,
+            shuffle_candidates=args.shuffle_candidates,
+            logging=args.print_prompts_responses,
+        ):
+            if event.event == "delta":
+                yield _sse_event("delta", {"text": event.data})
+            elif event.event == "sentence":
+                # Final citations are renumbered against the cited references
+                # only, so partial sentences name their sources by docid.
+                references = [
+                    request.candidates[citation].docid
+                    for citation in event.data.citations[:3]
+                    if 0 <= citation < topk
+                ]
+                yield _sse_event(
+                    "sentence",
+                    {
+                        "index": sentence_count,
+                        "text": event.data.text,
+                        "references": references,
+                    },
+                )
+                sentence_count += 1
+            elif event.event == "done":
+                record = result_to_dict(
+                    event.data,
+                    args.run_id,
+                    include_trace=True,
+                    redact_prompts=args.redact_prompts,
+                )
+                yield _sse_event("done", record)
+    except Exception as error:  # noqa: BLE001
+        yield _sse_event(
+            "error",
+            {"code": "runtime_error", "message": str(error), "retryable": False},
+        )
 
 
 def validation_error_response(
@@ -206,6 +822,22 @@ def validation_error_response(
     )
 
 
+def overloaded_error_response(error: AdmissionRejected) -> CommandResponse:
+    return CommandResponse(
+        command="generate",
+        status="runtime_error",
+        exit_code=EXIT_CODES["runtime_error"],
+        errors=[
+            {
+                "code": "overloaded",
+                "message": str(error),
+                "details": {"retry_after_s": error.retry_after_s, **error.details},
+                "retryable": True,
+            }
+        ],
+    )
+
+
 def runtime_error_response(error: Exception) -> CommandResponse:
     return CommandResponse(
         command="generate",
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from .agent_pool import AgentPool
+from .model_router import ModelRouter
+
+if TYPE_CHECKING:
+    from .runtime import ServerConfig
+
+
+class Readiness:
+    """Tracks whether a server has finished warming up.
+
+    The state moves from `starting` to `warming` and then to either `ready` or
+    `failed`; each completed warm-up step is recorded with its duration so a
+    slow start can be diagnosed from `/readyz`.
+    """
+
+    def __init__(self) -> None:
+        self.status = "starting"
+        self.error: str | None = None
+        self.steps: list[dict[str, Any]] = []
+        self._started: float | None = None
+        self._finished: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def start(self) -> None:
+        self.status = "warming"
+        self._started = time.perf_counter()
+
+    def record(self, step: str, seconds: float) -> None:
+        self.steps.append({"step": step, "seconds": round(seconds, 3)})
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self._finished = time.perf_counter()
+        if error is None:
+            self.status = "ready"
+        else:
+            self.status = "failed"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def snapshot(self) -> dict[str, Any]:
+        elapsed = None
+        if self._started is not None:
+            end = self._finished if self._finished is not None else time.perf_counter()
+            elapsed = round(end - self._started, 3)
+        snapshot: dict[str, Any] = {
+            "status": self.status,
+            "warm_up_seconds": elapsed,
+            "steps": list(self.steps),
+        }
+        if self.error is not None:
+            snapshot["error"] = self.error
+        return snapshot
+
+
+async def _timed_in_thread(
+    readiness: Readiness, step: str, work: Callable[..., Any], *args: Any
+) -> Any:
+    started = time.perf_counter()
+    outcome = await asyncio.to_thread(work, *args)
+    readiness.record(step, time.perf_counter() - started)
+    return outcome
+
+
+def _parse_templates() -> int:
+    from ragnarok.prompts.template_loader import list_templates
+
+    return len(list_templates())
+
+
+async def warm_up_server(
+    config: ServerConfig,
+    *,
+    agent_pool: AgentPool,
+    models: ModelRouter,
+    readiness: Readiness,
+) -> None:
+    """Load everything the first request would otherwise pay for.
+
+    Parses every YAML prompt template, builds the agents of the hosted models,
+    and pushes a synthetic request through each agent's `warm_up` so tokenizer
+    encodings and the post-processor's sentence splitter are loaded. Blocking
+    work runs in worker threads, so the server keeps answering `/healthz` and
+    `/readyz` meanwhile. Failures are recorded on `readiness` rather than
+    raised, leaving the server up but unready.
+    """
+    readiness.start()
+    try:
+        await _timed_in_thread(readiness, "templates", _parse_templates)
+        for effective_config in models.warm_up_configs(config):
+            model = effective_config.model
+            agent = await _timed_in_thread(
+                readiness, f"agent:{model}", agent_pool.get, effective_config
+            )
+            warm_up = getattr(agent, "warm_up", None)
+            if callable(warm_up):
+                await _timed_in_thread(readiness, f"prompt:{model}", warm_up)
+    except Exception as error:  # noqa: BLE001
+        readiness.finish(error)
+        return
+    readiness.finish()
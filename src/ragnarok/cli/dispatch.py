@@ -7,6 +7,7 @@ import sys
 from pathlib import Path
 from typing import Any, cast
 
+from ragnarok.api.model_router import parse_hosted_model
 from ragnarok.api.runtime import ServerConfig, execute_direct_generate
 
 from .adapters import make_data_artifact, make_file_artifact
@@ -23,8 +24,10 @@ from .normalize import normalize_direct_generate_input
 from .operations import (
     async_run_request_generation,
     convert_generate_records_to_requests,
+    generation_backend,
     load_request_records,
     parse_retrieval_methods,
+    run_batch_api_generation,
     run_convert_trec25,
     run_dataset_generation,
     run_request_generation,
@@ -144,10 +147,25 @@ def resolve_model_name(args: argparse.Namespace) -> str:
     )
 
 
+def ensure_http2_available(args: argparse.Namespace, *, command: str) -> None:
+    from ragnarok.generate.http_pool import http2_available
+
+    if getattr(args, "http2", False) and not http2_available():
+        raise CLIError(
+            "--http2 requires the h2 package; install `httpx[http2]`",
+            exit_code=EXIT_CODES["missing_resource"],
+            status="validation_error",
+            error_code="missing_http2_dependencies",
+            command=command,
+            details={"missing_dependencies": ["h2"]},
+        )
+
+
 def run_generate_command(args: argparse.Namespace) -> CommandResponse:
     from ragnarok.generate.llm import PromptMode
 
     model_name = resolve_model_name(args)
+    ensure_http2_available(args, command="generate")
     args.prompt_mode = PromptMode(args.prompt_mode)
     if args.dataset is None and args.retrieval_method is None:
         args.retrieval_method = [parse_retrieval_methods("bm25")[0]]
@@ -175,10 +193,38 @@ def run_generate_command(args: argparse.Namespace) -> CommandResponse:
         },
     )
 
+    if args.execution_mode == "batch":
+        if args.input_file is None:
+            raise CLIError(
+                "--execution-mode batch requires --input-file",
+                exit_code=EXIT_CODES["invalid_arguments"],
+                status="validation_error",
+                error_code="unsupported_execution_mode",
+                command="generate",
+            )
+        if generation_backend(model_name) != "openai":
+            raise CLIError(
+                "--execution-mode batch requires an OpenAI-compatible model",
+                exit_code=EXIT_CODES["invalid_arguments"],
+                status="validation_error",
+                error_code="unsupported_execution_mode",
+                command="generate",
+            )
+
+    if args.execution_mode == "thread" and generation_backend(model_name) == "os_llm":
+        raise CLIError(
+            "--execution-mode thread requires an API-backed model; use "
+            "--vllm-batched for local models",
+            exit_code=EXIT_CODES["invalid_arguments"],
+            status="validation_error",
+            error_code="unsupported_execution_mode",
+            command="generate",
+        )
+
     if args.dataset is not None:
-        if args.execution_mode == "async":
+        if args.execution_mode in ("async", "thread"):
             raise CLIError(
-                "--execution-mode async is not yet supported with --dataset",
+                f"--execution-mode {args.execution_mode} is not yet supported with --dataset",
                 exit_code=EXIT_CODES["invalid_arguments"],
                 status="validation_error",
                 error_code="unsupported_execution_mode",
@@ -220,6 +266,8 @@ def run_generate_command(args: argparse.Namespace) -> CommandResponse:
             records, metrics = asyncio.run(
                 async_run_request_generation(requests, args, logger)
             )
+        elif args.execution_mode == "batch":
+            records, metrics = run_batch_api_generation(requests, args, logger)
         else:
             records, metrics = run_request_generation(requests, args, logger)
         if args.output == "json":
@@ -265,6 +313,20 @@ def run_serve_command(args: argparse.Namespace) -> CommandResponse:
             command="serve",
             details={"missing_dependencies": ["fastapi", "uvicorn"]},
         ) from error
+    ensure_http2_available(args, command="serve")
+
+    try:
+        models = tuple(
+            parse_hosted_model(spec) for spec in getattr(args, "serve_models", [])
+        )
+    except ValueError as error:
+        raise CLIError(
+            str(error),
+            exit_code=EXIT_CODES["invalid_arguments"],
+            status="validation_error",
+            error_code="invalid_serve_model",
+            command="serve",
+        ) from error
 
     app = create_app(
         ServerConfig(
@@ -291,6 +353,28 @@ def run_serve_command(args: argparse.Namespace) -> CommandResponse:
             reasoning_effort=args.reasoning_effort,
             log_level=args.log_level,
             quiet=getattr(args, "quiet", False),
+            agent_pool_size=args.agent_pool_size,
+            agent_pool_memory_mb=args.agent_pool_memory_mb,
+            micro_batch_size=args.micro_batch_size,
+            micro_batch_wait_ms=args.micro_batch_wait_ms,
+            max_in_flight=args.max_in_flight,
+            max_queue_depth=args.max_queue_depth,
+            token_budget=args.token_budget,
+            retry_after_s=args.retry_after,
+            coalesce_requests=getattr(args, "coalesce_requests", True),
+            warm_up=getattr(args, "warm_up", False),
+            rpm_limit=getattr(args, "rpm_limit", None),
+            tpm_limit=getattr(args, "tpm_limit", None),
+            max_concurrency_per_key=getattr(args, "max_concurrency_per_key", None),
+            max_retries=getattr(args, "max_retries", 7),
+            retry_deadline_s=getattr(args, "retry_deadline", 300.0),
+            http_max_connections=getattr(args, "http_max_connections", 100),
+            http_max_keepalive=getattr(args, "http_max_keepalive", 20),
+            http_keepalive_expiry_s=getattr(args, "http_keepalive_expiry", 30.0),
+            http2=getattr(args, "http2", False),
+            hedge_percentile=getattr(args, "hedge_percentile", None),
+            hedge_max_ratio=getattr(args, "hedge_max_ratio", 0.05),
+            models=models,
         )
     )
     uvicorn.run(app, host=args.host, port=args.port)
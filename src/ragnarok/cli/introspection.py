@@ -70,7 +70,15 @@ COMMAND_DESCRIPTIONS: dict[str, dict[str, Any]] = {
                 '-H "content-type: application/json" --data-binary @- | jq'
             ),
         ],
-        "routes": ["GET /healthz", "POST /v1/generate"],
+        "routes": [
+            "GET /healthz",
+            "GET /readyz",
+            "GET /metrics",
+            "GET /v1/models",
+            "POST /v1/generate",
+            "POST /v1/generate/batch",
+            "POST /v1/generate/stream",
+        ],
     },
     "validate": {
         "summary": "Validate generate requests or TREC output artifacts without running models.",
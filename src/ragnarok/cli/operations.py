@@ -5,6 +5,7 @@ import importlib.util
 import io
 import logging
 import sys
+import time
 from typing import Any, Protocol
 
 from tqdm import tqdm
@@ -45,6 +46,13 @@ def parse_topk(value: str) -> list[int]:
         raise ValueError(f"Invalid comma-separated list of integers: {value}") from exc
 
 
+def parse_fraction(value: str) -> float:
+    fraction = float(value)
+    if not 0.0 < fraction < 1.0:
+        raise ValueError(f"Expected a fraction between 0 and 1, got {value}")
+    return fraction
+
+
 def parse_retrieval_methods(value: str) -> list[Any]:
     from ragnarok.retrieve_and_rerank.retriever import RetrievalMethod
 
@@ -64,6 +72,53 @@ def detect_device() -> str:
     return "cuda" if torch.cuda.is_available() else "cpu"
 
 
+def generation_backend(model_name: str) -> str:
+    """Name the backend `create_generation_agent` picks for a model identifier."""
+    if "command-r" in model_name:
+        return "cohere"
+    if any(name in model_name.lower() for name in ("llama", "mistral", "qwen")):
+        return "os_llm"
+    return "openai"
+
+
+def build_retry_policy(args: GenerationArgs) -> Any:
+    from ragnarok.generate.retry import RetryPolicy
+
+    return RetryPolicy(
+        max_attempts=getattr(args, "max_retries", 7) + 1,
+        deadline_s=getattr(args, "retry_deadline", 300.0),
+    )
+
+
+def build_http_pool_config(args: GenerationArgs) -> Any:
+    from ragnarok.generate.http_pool import HTTPPoolConfig
+
+    return HTTPPoolConfig(
+        max_connections=getattr(args, "http_max_connections", 100),
+        max_keepalive_connections=getattr(args, "http_max_keepalive", 20),
+        keepalive_expiry_s=getattr(args, "http_keepalive_expiry", 30.0),
+        http2=getattr(args, "http2", False),
+    )
+
+
+def build_hedge_policy(args: GenerationArgs) -> Any:
+    percentile = getattr(args, "hedge_percentile", None)
+    if percentile is None:
+        return None
+    from ragnarok.generate.hedging import HedgePolicy
+
+    return HedgePolicy(
+        percentile=percentile,
+        max_hedge_ratio=getattr(args, "hedge_max_ratio", 0.05),
+    )
+
+
+def build_failure_policy(args: GenerationArgs) -> Any:
+    from ragnarok.generate.failures import FailurePolicy
+
+    return FailurePolicy(max_retries=getattr(args, "max_request_retries", 2))
+
+
 def create_generation_agent(args: GenerationArgs) -> Any:
     from ragnarok.generate.llm import PromptMode
 
@@ -73,8 +128,8 @@ def create_generation_agent(args: GenerationArgs) -> Any:
         else PromptMode(args.prompt_mode)
     )
     model_name = args.model_path
-    lowered_model_name = model_name.lower()
-    if "command-r" in model_name:
+    backend = generation_backend(model_name)
+    if backend == "cohere":
         from ragnarok.generate.cohere import Cohere
 
         return Cohere(
@@ -83,8 +138,9 @@ def create_generation_agent(args: GenerationArgs) -> Any:
             prompt_mode=prompt_mode,
             max_output_tokens=args.max_output_tokens,
             num_few_shot_examples=args.num_few_shot_examples,
+            retry_policy=build_retry_policy(args),
         )
-    if any(name in lowered_model_name for name in ("llama", "mistral", "qwen")):
+    if backend == "os_llm":
         from ragnarok.generate.os_llm import OSLLM
 
         return OSLLM(
@@ -102,6 +158,7 @@ def create_generation_agent(args: GenerationArgs) -> Any:
     # This keeps the backend selection flexible for providers such as OpenRouter.
     from ragnarok.generate.api_keys import get_openai_compatible_args
     from ragnarok.generate.gpt import SafeOpenai
+    from ragnarok.generate.rate_limiter import get_rate_limiter
 
     return SafeOpenai(
         model=model_name,
@@ -111,6 +168,13 @@ def create_generation_agent(args: GenerationArgs) -> Any:
         num_few_shot_examples=args.num_few_shot_examples,
         store_reasoning=args.include_reasoning,
         reasoning_effort=args.reasoning_effort,
+        rate_limiter=get_rate_limiter(
+            getattr(args, "rpm_limit", None), getattr(args, "tpm_limit", None)
+        ),
+        max_concurrency_per_key=getattr(args, "max_concurrency_per_key", None),
+        retry_policy=build_retry_policy(args),
+        http_pool=build_http_pool_config(args),
+        hedge_policy=build_hedge_policy(args),
         **get_openai_compatible_args(
             model_name,
             args.use_azure_openai,
@@ -152,28 +216,119 @@ def _write_results_if_requested(results: list[Any], args: GenerationArgs) -> Non
         write_results_jsonl(results, args.output_file, args.run_id)
 
 
+def _usage_summary(results: list[Any], elapsed_s: float) -> dict[str, Any]:
+    from ragnarok.generate.usage import summarize_usage
+
+    return summarize_usage(
+        (getattr(result, "rag_exec_summary", None) for result in results), elapsed_s
+    )
+
+
 def _build_rag(args: GenerationArgs) -> Any:
     from ragnarok.generate.generator import RAG
 
-    agent = create_generation_agent(args)
+    # Long-lived callers such as `ragnarok serve` inject a factory that hands
+    # out warm agents instead of constructing a new one for every request.
+    agent_factory = getattr(args, "agent_factory", None)
+    agent = (
+        agent_factory() if agent_factory is not None else create_generation_agent(args)
+    )
     return RAG(agent=agent, run_id=args.run_id)
 
 
+def _isolates_failures(args: GenerationArgs) -> bool:
+    # Request files may hold thousands of requests; one failure must not
+    # discard the rest. Single direct and served requests, and dataset runs
+    # (one retrieved query), still raise.
+    return getattr(args, "input_file", None) is not None
+
+
+def _settle_failures(
+    batch: Any, requests: list[Any], args: GenerationArgs, logger: logging.Logger
+) -> dict[str, Any]:
+    from ragnarok.generate.failures import dead_letter_records, write_dead_letters
+
+    if batch.failures and not batch.succeeded():
+        error = batch.failures[0].error
+        raise error if error is not None else RuntimeError(batch.failures[0].message)
+    summary: dict[str, Any] = {**batch.stats(), "dead_letter_file": None}
+    if not batch.failures:
+        return summary
+    path = getattr(args, "dead_letter_file", None)
+    if path is None and args.output_file is not None:
+        path = f"{args.output_file}.failed.jsonl"
+    if path is None:
+        # Without an output file the results are returned inline, and so
+        # are the requests that failed.
+        summary["dead_letters"] = dead_letter_records(requests, batch.failures)
+        logger.warning(
+            "%d of %d request(s) failed; see metrics.failures.dead_letters",
+            len(batch.failures),
+            len(requests),
+        )
+        return summary
+    write_dead_letters(path, requests, batch.failures)
+    summary["dead_letter_file"] = path
+    logger.warning(
+        "%d of %d request(s) failed; wrote them to %s",
+        len(batch.failures),
+        len(requests),
+        path,
+    )
+    return summary
+
+
 def run_request_generation(
     requests: list[Any], args: GenerationArgs, logger: logging.Logger
 ) -> tuple[list[dict[str, Any]], dict[str, Any]]:
     rag = _build_rag(args)
-    logger.info("Generating %d request(s)", len(requests))
-    results = rag.answer_batch(
-        requests,
-        topk=args.topk[-1],
-        shuffle_candidates=args.shuffle_candidates,
-        logging=args.print_prompts_responses,
-        vllm=args.vllm_batched,
+    max_workers = (
+        getattr(args, "max_concurrency", 8)
+        if getattr(args, "execution_mode", "sync") == "thread"
+        else None
     )
+    if max_workers is None:
+        logger.info("Generating %d request(s)", len(requests))
+    else:
+        logger.info(
+            "Generating %d request(s) with thread execution (max_concurrency=%d)",
+            len(requests),
+            max_workers,
+        )
+
+    def answer_many(batch: list[Any], return_exceptions: bool = False) -> list[Any]:
+        results: list[Any] = rag.answer_batch(
+            batch,
+            topk=args.topk[-1],
+            shuffle_candidates=args.shuffle_candidates,
+            logging=args.print_prompts_responses,
+            vllm=args.vllm_batched,
+            max_workers=max_workers,
+            return_exceptions=return_exceptions,
+        )
+        return results
+
+    started = time.perf_counter()
+    failures = None
+    if _isolates_failures(args):
+        from ragnarok.generate.failures import answer_isolated
+
+        isolated = answer_isolated(
+            lambda batch: answer_many(batch, return_exceptions=True),
+            requests,
+            build_failure_policy(args),
+        )
+        failures = _settle_failures(isolated, requests, args, logger)
+        results = isolated.succeeded()
+    else:
+        results = answer_many(requests)
+    usage = _usage_summary(results, time.perf_counter() - started)
     serialized = _serialize_results(results, args)
     _write_results_if_requested(results, args)
-    return serialized, {"generated_records": len(serialized)}
+    metrics: dict[str, Any] = {"generated_records": len(serialized), "usage": usage}
+    if failures is not None:
+        metrics["failures"] = failures
+    return serialized, metrics
 
 
 async def async_run_request_generation(
@@ -185,17 +340,99 @@ async def async_run_request_generation(
         len(requests),
         getattr(args, "max_concurrency", 8),
     )
-    results = await rag.async_answer_batch(
-        requests,
-        topk=args.topk[-1],
-        shuffle_candidates=args.shuffle_candidates,
-        logging=args.print_prompts_responses,
-        vllm=args.vllm_batched,
-        max_concurrency=getattr(args, "max_concurrency", 8),
-    )
+    from ragnarok.generate.offload import LoopLagMonitor
+
+    async def answer_many(
+        batch: list[Any], return_exceptions: bool = False
+    ) -> list[Any]:
+        results: list[Any] = await rag.async_answer_batch(
+            batch,
+            topk=args.topk[-1],
+            shuffle_candidates=args.shuffle_candidates,
+            logging=args.print_prompts_responses,
+            vllm=args.vllm_batched,
+            max_concurrency=getattr(args, "max_concurrency", 8),
+            return_exceptions=return_exceptions,
+        )
+        return results
+
+    started = time.perf_counter()
+    failures = None
+    async with LoopLagMonitor() as loop_lag:
+        if _isolates_failures(args):
+            from ragnarok.generate.failures import async_answer_isolated
+
+            isolated = await async_answer_isolated(
+                lambda batch: answer_many(batch, return_exceptions=True),
+                requests,
+                build_failure_policy(args),
+            )
+            failures = _settle_failures(isolated, requests, args, logger)
+            results = isolated.succeeded()
+        else:
+            results = await answer_many(requests)
+    usage = _usage_summary(results, time.perf_counter() - started)
     serialized = _serialize_results(results, args)
     _write_results_if_requested(results, args)
-    return serialized, {"generated_records": len(serialized)}
+    metrics: dict[str, Any] = {
+        "generated_records": len(serialized),
+        "usage": usage,
+        "event_loop": loop_lag.stats(),
+    }
+    if failures is not None:
+        metrics["failures"] = failures
+    if getattr(args, "hedge_percentile", None) is not None:
+        from ragnarok.generate.hedging import hedging_stats
+
+        metrics["hedging"] = hedging_stats()
+    return serialized, metrics
+
+
+def run_batch_api_generation(
+    requests: list[Any], args: GenerationArgs, logger: logging.Logger
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    from ragnarok.generate.batch_api import BatchAPIClient, BatchRunner
+
+    agent = create_generation_agent(args)
+    api_key, api_base = agent.batch_api_credentials()
+    state_file = getattr(args, "batch_state_file", None) or (
+        f"{args.output_file or args.run_id}.batch.json"
+    )
+    runner = BatchRunner(
+        agent,
+        BatchAPIClient(
+            api_key,
+            getattr(args, "batch_api_base", None) or api_base,
+            retry_policy=build_retry_policy(args),
+        ),
+        state_file,
+        model=args.model_path,
+        poll_interval_s=getattr(args, "batch_poll_interval", 30.0),
+        completion_window=getattr(args, "batch_completion_window", "24h"),
+        logger=logger,
+    )
+    logger.info(
+        "Generating %d request(s) through the Batch API (state file: %s)",
+        len(requests),
+        state_file,
+    )
+    started = time.perf_counter()
+    outcome = runner.run(
+        requests, topk=args.topk[-1], shuffle_candidates=args.shuffle_candidates
+    )
+    usage = _usage_summary(outcome.results, time.perf_counter() - started)
+    serialized = _serialize_results(outcome.results, args)
+    _write_results_if_requested(outcome.results, args)
+    return serialized, {
+        "generated_records": len(serialized),
+        "usage": usage,
+        "batch": {
+            "batch_id": outcome.batch_id,
+            "status": outcome.status,
+            "state_file": state_file,
+            "failed_requests": outcome.failed,
+        },
+    }
 
 
 def run_dataset_generation(
@@ -6,7 +6,7 @@ from typing import Any, cast
 
 from .errors import CLIArgumentParser
 from .introspection import COMMAND_DESCRIPTIONS, SCHEMAS
-from .operations import parse_retrieval_methods, parse_topk
+from .operations import parse_fraction, parse_retrieval_methods, parse_topk
 
 _shtab: Any | None
 try:
@@ -21,6 +21,7 @@ def _add_shared_runtime_generation_options(
     parser: argparse.ArgumentParser,
     *,
     topk_default: list[int],
+    execution_modes: list[str],
 ) -> None:
     parser.add_argument(
         "--model",
@@ -96,7 +97,7 @@ def _add_shared_runtime_generation_options(
     )
     parser.add_argument(
         "--execution-mode",
-        choices=["sync", "async"],
+        choices=execution_modes,
         default="sync",
         help="Execution mode for direct JSON input or batch JSONL input.",
     )
@@ -104,7 +105,72 @@ def _add_shared_runtime_generation_options(
         "--max-concurrency",
         type=int,
         default=8,
-        help="Maximum concurrent requests for async generation.",
+        help="Maximum concurrent requests for async and thread generation.",
+    )
+    parser.add_argument(
+        "--rpm-limit",
+        type=int,
+        help="Client-side requests-per-minute limit per API key and model for OpenAI-compatible backends.",
+    )
+    parser.add_argument(
+        "--tpm-limit",
+        type=int,
+        help="Client-side tokens-per-minute limit per API key and model; reserves prompt plus max output tokens per call.",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=7,
+        help="Retries per provider call after the first attempt, with exponential backoff and jitter.",
+    )
+    parser.add_argument(
+        "--retry-deadline",
+        type=float,
+        default=300.0,
+        help="Seconds after which a provider call stops retrying and fails.",
+    )
+    parser.add_argument(
+        "--max-concurrency-per-key",
+        type=int,
+        help="Maximum in-flight calls per API key when several OpenAI-compatible keys are configured.",
+    )
+    parser.add_argument(
+        "--http-max-connections",
+        type=int,
+        default=100,
+        help="Connections in the shared HTTP pool per OpenAI-compatible origin.",
+    )
+    parser.add_argument(
+        "--http-max-keepalive",
+        type=int,
+        default=20,
+        help="Idle keep-alive connections kept in the shared HTTP pool per origin.",
+    )
+    parser.add_argument(
+        "--http-keepalive-expiry",
+        type=float,
+        default=30.0,
+        help="Seconds an idle pooled connection is kept open.",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=parse_fraction,
+        help=(
+            "Hedge async OpenAI-compatible calls: once a call outlasts this "
+            "percentile of recent latency (e.g. 0.95), send a duplicate on "
+            "another key and keep the first reply."
+        ),
+    )
+    parser.add_argument(
+        "--hedge-max-ratio",
+        type=parse_fraction,
+        default=0.05,
+        help="Maximum fraction of calls that may be hedged.",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Use HTTP/2 for OpenAI-compatible calls (requires the h2 package).",
     )
     parser.add_argument(
         "--include-reasoning",
@@ -209,7 +275,11 @@ def build_parser() -> CLIArgumentParser:
         type=str,
         help="Direct JSON request in the shared query-candidate schema.",
     )
-    _add_shared_runtime_generation_options(generate_parser, topk_default=[100, 20])
+    _add_shared_runtime_generation_options(
+        generate_parser,
+        topk_default=[100, 20],
+        execution_modes=["sync", "thread", "async", "batch"],
+    )
     generate_parser.add_argument(
         "--retrieval-method",
         type=parse_retrieval_methods,
@@ -226,6 +296,39 @@ def build_parser() -> CLIArgumentParser:
         type=str,
         help="Output JSONL path for batch or dataset generation.",
     )
+    generate_parser.add_argument(
+        "--max-request-retries",
+        type=int,
+        default=2,
+        help="Extra passes over --input-file requests that failed with a retryable error; dataset and direct requests fail on the first error.",
+    )
+    generate_parser.add_argument(
+        "--dead-letter-file",
+        type=str,
+        help="JSONL file for --input-file requests that still fail; defaults to <output-file>.failed.jsonl, or inline in metrics.failures without --output-file.",
+    )
+    generate_parser.add_argument(
+        "--batch-state-file",
+        type=str,
+        help="Resumable state file for --execution-mode batch; defaults to <output-file>.batch.json.",
+    )
+    generate_parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=30.0,
+        help="Seconds between Batch API status checks.",
+    )
+    generate_parser.add_argument(
+        "--batch-completion-window",
+        type=str,
+        default="24h",
+        help="Completion window requested for Batch API jobs.",
+    )
+    generate_parser.add_argument(
+        "--batch-api-base",
+        type=str,
+        help="Base URL of the Files and Batches endpoints; defaults to the model's OpenAI-compatible base URL.",
+    )
     generate_parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -267,7 +370,82 @@ def build_parser() -> CLIArgumentParser:
     )
     serve_parser.add_argument("--host", type=str, default="0.0.0.0")
     serve_parser.add_argument("--port", type=int, default=8083)
-    _add_shared_runtime_generation_options(serve_parser, topk_default=[20])
+    _add_shared_runtime_generation_options(
+        serve_parser, topk_default=[20], execution_modes=["sync", "async"]
+    )
+    serve_parser.add_argument(
+        "--serve-model",
+        dest="serve_models",
+        action="append",
+        default=[],
+        metavar="MODEL[,KEY=VALUE...]",
+        help=(
+            "Host an additional model, optionally pinning settings such as "
+            "prompt_mode, context_size, num_gpus, max_concurrency, or preload. "
+            "Repeat for each model; requests select one with overrides.model."
+        ),
+    )
+    serve_parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help=(
+            "Build agents, parse prompt templates, and run a synthetic prompt in "
+            "the background at startup; GET /readyz answers 503 until done."
+        ),
+    )
+    serve_parser.add_argument(
+        "--agent-pool-size",
+        type=int,
+        default=4,
+        help="Maximum number of warm generation agents kept alive across requests.",
+    )
+    serve_parser.add_argument(
+        "--agent-pool-memory-mb",
+        type=float,
+        help="Evict least-recently-used agents once their measured memory exceeds this budget.",
+    )
+    serve_parser.add_argument(
+        "--micro-batch-size",
+        type=int,
+        default=16,
+        help="Maximum concurrent requests merged into one vLLM batch when --vllm-batched is set.",
+    )
+    serve_parser.add_argument(
+        "--micro-batch-wait-ms",
+        type=float,
+        default=10.0,
+        help="How long the first queued request waits for others to join its vLLM batch.",
+    )
+    serve_parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=32,
+        help="Maximum generation requests running at once; extra requests queue.",
+    )
+    serve_parser.add_argument(
+        "--max-queue-depth",
+        type=int,
+        default=64,
+        help="Maximum queued requests before the server answers 429 Too Many Requests.",
+    )
+    serve_parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=None,
+        help="Maximum estimated prompt tokens across running requests.",
+    )
+    serve_parser.add_argument(
+        "--no-request-coalescing",
+        dest="coalesce_requests",
+        action="store_false",
+        help="Send identical concurrent requests to the model separately instead of sharing one call.",
+    )
+    serve_parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1.0,
+        help="Seconds advertised in the Retry-After header of 429 responses.",
+    )
 
     validate_parser = subparsers.add_parser(
         "validate",
@@ -36,6 +36,16 @@ class RAGExecInfo:
     output_token_count: int
     reasoning: str | None = None
     candidates: list[Candidate] = field(default_factory=list)
+    # Token usage as reported by the provider ("provider") or counted with
+    # the local tokenizer ("estimated"), and the cost of the call in USD.
+    reasoning_token_count: int | None = None
+    cached_token_count: int | None = None
+    cost_usd: float | None = None
+    usage_source: str = "estimated"
+    generation_seconds: float | None = None
+    # Set when the engine only answered after passages were cut from the
+    # prompt, so citations may point at passages the model never saw.
+    prompt_truncated: bool = False
 
 
 @dataclass
@@ -86,12 +96,19 @@ def result_to_dict(
         reasoning = result.rag_exec_summary.reasoning
     if reasoning:
         record["reasoning_traces"] = [reasoning]
+    if result.rag_exec_summary is not None and result.rag_exec_summary.prompt_truncated:
+        record["prompt_truncated"] = True
     if include_trace and result.rag_exec_summary is not None:
         record["trace"] = {
             "prompt": None if redact_prompts else result.rag_exec_summary.prompt,
             "response": result.rag_exec_summary.response,
             "input_token_count": result.rag_exec_summary.input_token_count,
             "output_token_count": result.rag_exec_summary.output_token_count,
+            "reasoning_token_count": result.rag_exec_summary.reasoning_token_count,
+            "cached_token_count": result.rag_exec_summary.cached_token_count,
+            "cost_usd": result.rag_exec_summary.cost_usd,
+            "usage_source": result.rag_exec_summary.usage_source,
+            "prompt_truncated": result.rag_exec_summary.prompt_truncated,
         }
     return record
 
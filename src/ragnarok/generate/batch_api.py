@@ -0,0 +1,372 @@
+"""Offline generation through the OpenAI Batch API.
+
+`BatchRunner` renders every request with the agent's `create_prompt`, writes
+the request bodies to a Batch-API JSONL file, uploads it, creates a batch,
+polls it until it finishes, and maps the output lines back through the
+agent's post-processor into `Result`s. Progress is kept in a JSON state file
+next to the input and output JSONL, so an interrupted run resumes the batch
+it already submitted instead of paying for it a second time.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import requests
+
+from ragnarok.data import Request, Result
+from ragnarok.generate.llm import shuffle_request_candidates
+from ragnarok.generate.retry import RetryPolicy, call_with_retry
+
+DEFAULT_BATCH_API_BASE = "https://api.openai.com/v1"
+TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+# Batch jobs are billed at half the synchronous list price.
+BATCH_PRICE_MULTIPLIER = 0.5
+
+
+class BatchAPIError(RuntimeError):
+    """A Files/Batches call failed, or a batch ended without output."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        response: requests.Response | None = None,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class BatchAPIClient:
+    """Calls the Files and Batches endpoints of an OpenAI-compatible API.
+
+    Failed calls go through `call_with_retry`, so 429s and server errors are
+    retried and 4xx client errors surface immediately.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str | None = None,
+        *,
+        session: requests.Session | None = None,
+        timeout_s: float = 60.0,
+        retry_policy: RetryPolicy | None = None,
+    ) -> None:
+        self._base_url = (base_url or DEFAULT_BATCH_API_BASE).rstrip("/")
+        self._session = session or requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {api_key}"
+        self._timeout_s = timeout_s
+        self._retry_policy = retry_policy or RetryPolicy()
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        def attempt() -> requests.Response:
+            response = self._session.request(
+                method, f"{self._base_url}{path}", timeout=self._timeout_s, **kwargs
+            )
+            if response.status_code >= 400:
+                raise BatchAPIError(
+                    f"{method} {path} failed with {response.status_code}: "
+                    f"{response.text[:500]}",
+                    status_code=response.status_code,
+                    response=response,
+                )
+            return response
+
+        return call_with_retry(attempt, policy=self._retry_policy)
+
+    def upload_file(self, path: Path) -> str:
+        response = self._request(
+            "POST",
+            "/files",
+            data={"purpose": "batch"},
+            files={"file": (path.name, path.read_bytes(), "application/jsonl")},
+        )
+        return str(response.json()["id"])
+
+    def create_batch(
+        self, input_file_id: str, endpoint: str, completion_window: str
+    ) -> dict[str, Any]:
+        response = self._request(
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": input_file_id,
+                "endpoint": endpoint,
+                "completion_window": completion_window,
+            },
+        )
+        return dict(response.json())
+
+    def retrieve_batch(self, batch_id: str) -> dict[str, Any]:
+        return dict(self._request("GET", f"/batches/{batch_id}").json())
+
+    def download_file(self, file_id: str) -> str:
+        return self._request("GET", f"/files/{file_id}/content").text
+
+
+@dataclass
+class BatchState:
+    """What a run has submitted so far; persisted after every step."""
+
+    fingerprint: str
+    input_file_id: str | None = None
+    batch_id: str | None = None
+    status: str | None = None
+    output_file_id: str | None = None
+    error_file_id: str | None = None
+    candidate_order: dict[str, list[str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "BatchState | None":
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as handle:
+            return cls(**json.load(handle))
+
+    def save(self, path: Path) -> None:
+        temporary = path.with_name(f"{path.name}.tmp")
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump(asdict(self), handle, indent=2)
+        os.replace(temporary, path)
+
+    def update(self, batch: dict[str, Any]) -> None:
+        self.batch_id = batch["id"]
+        self.status = batch.get("status")
+        self.output_file_id = batch.get("output_file_id")
+        self.error_file_id = batch.get("error_file_id")
+
+
+@dataclass
+class BatchOutcome:
+    results: list[Result]
+    failed: list[str]
+    batch_id: str
+    status: str
+
+
+def _write_text(path: Path, text: str) -> None:
+    temporary = path.with_name(f"{path.name}.tmp")
+    temporary.write_text(text, encoding="utf-8")
+    os.replace(temporary, path)
+
+
+def _prompt_from_body(body: dict[str, Any]) -> list[dict[str, str]]:
+    """Recover the chat messages from a chat-completions or responses body."""
+    if "messages" in body:
+        return list(body["messages"])
+    return [
+        {"role": item["role"], "content": item["content"][0]["text"]}
+        for item in body["input"]
+    ]
+
+
+def _read_jsonl(path: Path) -> list[dict[str, Any]]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+class BatchRunner:
+    """Answers requests with one Batch-API job, resuming from `state_path`.
+
+    The rendered input, the downloaded output, and any error file are kept
+    next to the state file as `<state>.input.jsonl`, `<state>.output.jsonl`,
+    and `<state>.errors.jsonl`. Requests without a successful output line are
+    reported in `BatchOutcome.failed` by their custom id.
+    """
+
+    def __init__(
+        self,
+        agent: Any,
+        client: BatchAPIClient,
+        state_path: str | Path,
+        *,
+        model: str,
+        poll_interval_s: float = 30.0,
+        completion_window: str = "24h",
+        sleep: Callable[[float], Any] = time.sleep,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._agent = agent
+        self._client = client
+        self._state_path = Path(state_path)
+        self._model = model
+        self._poll_interval_s = poll_interval_s
+        self._completion_window = completion_window
+        self._sleep = sleep
+        self._logger = logger or logging.getLogger(__name__)
+
+    def _sibling(self, suffix: str) -> Path:
+        return self._state_path.with_name(f"{self._state_path.name}{suffix}")
+
+    @property
+    def input_path(self) -> Path:
+        return self._sibling(".input.jsonl")
+
+    @property
+    def output_path(self) -> Path:
+        return self._sibling(".output.jsonl")
+
+    @property
+    def errors_path(self) -> Path:
+        return self._sibling(".errors.jsonl")
+
+    def _fingerprint(self, custom_ids: list[str], topk: int) -> str:
+        payload = json.dumps([self._model, topk, self._agent.batch_endpoint()])
+        digest = hashlib.sha256(payload.encode("utf-8"))
+        for custom_id in custom_ids:
+            digest.update(custom_id.encode("utf-8") + b"\n")
+        return digest.hexdigest()
+
+    def _load_state(self, fingerprint: str) -> BatchState:
+        state = BatchState.load(self._state_path)
+        if state is None:
+            return BatchState(fingerprint=fingerprint)
+        if state.fingerprint != fingerprint:
+            raise ValueError(
+                f"Batch state file {self._state_path} belongs to a different run; "
+                "remove it or choose another state file"
+            )
+        return state
+
+    def _write_input(
+        self,
+        requests: list[Request],
+        custom_ids: list[str],
+        topk: int,
+        shuffle_candidates: bool,
+        state: BatchState,
+    ) -> None:
+        lines = []
+        for custom_id, request in zip(custom_ids, requests, strict=True):
+            request_topk = min(topk, len(request.candidates))
+            if shuffle_candidates:
+                shuffle_request_candidates(request, request_topk)
+                state.candidate_order[custom_id] = [
+                    candidate.docid for candidate in request.candidates[:request_topk]
+                ]
+            prompt, _ = self._agent.create_prompt(request, request_topk)
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": self._agent.batch_endpoint(),
+                "body": self._agent.batch_request_body(prompt),
+            }
+            lines.append(json.dumps(line, ensure_ascii=False) + "\n")
+        _write_text(self.input_path, "".join(lines))
+
+    def _submit(
+        self,
+        requests: list[Request],
+        custom_ids: list[str],
+        topk: int,
+        shuffle_candidates: bool,
+        state: BatchState,
+    ) -> None:
+        if state.input_file_id is None:
+            self._write_input(requests, custom_ids, topk, shuffle_candidates, state)
+            state.input_file_id = self._client.upload_file(self.input_path)
+            state.save(self._state_path)
+        batch = self._client.create_batch(
+            state.input_file_id,
+            self._agent.batch_endpoint(),
+            self._completion_window,
+        )
+        state.update(batch)
+        state.save(self._state_path)
+        self._logger.info(
+            "Submitted batch %s (%d requests)", batch["id"], len(requests)
+        )
+
+    def _wait(self, state: BatchState) -> None:
+        assert state.batch_id is not None
+        while True:
+            batch = self._client.retrieve_batch(state.batch_id)
+            state.update(batch)
+            state.save(self._state_path)
+            self._logger.info(
+                "Batch %s is %s %s",
+                state.batch_id,
+                state.status,
+                batch.get("request_counts") or "",
+            )
+            if state.status in TERMINAL_STATUSES:
+                return
+            self._sleep(self._poll_interval_s)
+
+    def _download(self, file_id: str | None, path: Path) -> list[dict[str, Any]]:
+        if file_id is None:
+            return []
+        if not path.exists():
+            _write_text(path, self._client.download_file(file_id))
+        return _read_jsonl(path)
+
+    def run(
+        self,
+        requests: list[Request],
+        topk: int,
+        shuffle_candidates: bool = False,
+    ) -> BatchOutcome:
+        custom_ids = [
+            f"{index}-{request.query.qid}" for index, request in enumerate(requests)
+        ]
+        state = self._load_state(self._fingerprint(custom_ids, topk))
+        if state.batch_id is None:
+            self._submit(requests, custom_ids, topk, shuffle_candidates, state)
+        if state.status not in TERMINAL_STATUSES:
+            self._wait(state)
+        assert state.batch_id is not None and state.status is not None
+        if state.status == "failed":
+            raise BatchAPIError(f"Batch {state.batch_id} failed")
+
+        prompts = {
+            line["custom_id"]: _prompt_from_body(line["body"])
+            for line in _read_jsonl(self.input_path)
+        }
+        outputs = {
+            line["custom_id"]: line
+            for line in self._download(state.output_file_id, self.output_path)
+        }
+        errors = {
+            line["custom_id"]: line
+            for line in self._download(state.error_file_id, self.errors_path)
+        }
+        results: list[Result] = []
+        failed: list[str] = []
+        for custom_id, request in zip(custom_ids, requests, strict=True):
+            response = (outputs.get(custom_id) or {}).get("response") or {}
+            if response.get("status_code") != 200:
+                failure = errors.get(custom_id) or outputs.get(custom_id) or {}
+                self._logger.warning(
+                    "Batch request %s failed: %s",
+                    custom_id,
+                    failure.get("error") or response.get("body") or "no output",
+                )
+                failed.append(custom_id)
+                continue
+            request_topk = min(topk, len(request.candidates))
+            order = state.candidate_order.get(custom_id)
+            if order is not None:
+                ranked = request.candidates[:request_topk]
+                ranked.sort(key=lambda candidate: order.index(candidate.docid))
+                request.candidates[:request_topk] = ranked
+            answer, rag_exec_summary = self._agent.parse_batch_response(
+                prompts[custom_id], response["body"]
+            )
+            if getattr(rag_exec_summary, "cost_usd", None) is not None:
+                rag_exec_summary.cost_usd *= BATCH_PRICE_MULTIPLIER
+            results.append(
+                self._agent.build_result(
+                    request, request_topk, answer, rag_exec_summary
+                )
+            )
+        return BatchOutcome(
+            results=results, failed=failed, batch_id=state.batch_id, status=state.status
+        )
@@ -1,13 +1,28 @@
-import time
+import sys
 from typing import Any
 
 import cohere
-from ftfy import fix_text
 
 from ragnarok.data import RAGExecInfo, Request
 from ragnarok.generate.api_keys import get_cohere_api_key
 from ragnarok.generate.llm import LLM, PromptMode
+from ragnarok.generate.passages import get_passage_normalizer, passage_text
 from ragnarok.generate.post_processor import CoherePostProcessor
+from ragnarok.generate.retry import (
+    ErrorKind,
+    RetryPolicy,
+    call_with_retry,
+    classify_error,
+    get_circuit_breaker,
+)
+from ragnarok.generate.token_counter import get_token_counter
+from ragnarok.generate.usage import (
+    COHERE_PRICING,
+    ModelPricing,
+    account_usage,
+    cohere_usage,
+    find_pricing,
+)
 
 
 class Cohere(LLM):
@@ -19,6 +34,7 @@ class Cohere(LLM):
         max_output_tokens: int = 1500,
         num_few_shot_examples: int = 0,
         key: str = get_cohere_api_key(),
+        retry_policy: RetryPolicy | None = None,
     ) -> None:
         """
         Creates instance of the Cohere class, to deal with Cohere Command R models.
@@ -33,6 +49,7 @@ class Cohere(LLM):
         the integration of example-based learning to improve model performance. Defaults to 0, indicating no few-shot examples
         by default.
         - key (str, optional): The Cohere API key, defaults to the value of the COHERE_API_KEY environment variable.
+        - retry_policy (RetryPolicy, optional): Attempts, deadline, and backoff for retrying failed calls.
 
         Raises:
         - ValueError: If an unsupported prompt mode is provided or if no Cohere API key / invalid key is supplied.
@@ -46,6 +63,9 @@ class Cohere(LLM):
         )
         self._client = cohere.Client(key)
         self._post_processor = CoherePostProcessor()
+        self._token_counter = get_token_counter(model)
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._circuit_breaker = get_circuit_breaker(f"cohere:{model}")
         self._preamble = (
             "## Task And Context\n"
             "You assist healthcare professionals in answering biomedical questions. "
@@ -74,94 +94,93 @@ class Cohere(LLM):
         if logging:
             print(f"Query: {query}")
             print(f"Top K Docs: {top_k_docs}")
-        while True:
+
+        def attempt() -> Any:
             try:
-                response = self._client.chat(
+                return self._client.chat(
                     model=self._model,
                     preamble=self._preamble,
                     message=query,
                     documents=top_k_docs,
                 )
-                break
             except Exception as e:
                 print(str(e))
-                if "blocked output" in str(e):
-                    answers = []
-                    rag_exec_info = RAGExecInfo(
-                        prompt=prompt[0],
-                        response="Blocked output",
-                        input_token_count=len(query.split())
-                        + sum([len(doc["snippet"].split()) for doc in top_k_docs]),
-                        output_token_count=0,
-                        candidates=top_k_docs,
-                    )
-                    return answers, rag_exec_info
-                time.sleep(60)
+                raise
+
+        try:
+            response = call_with_retry(
+                attempt, policy=self._retry_policy, breaker=self._circuit_breaker
+            )
+        except Exception as e:
+            if classify_error(e) is not ErrorKind.FILTERED:
+                raise
+            answers = []
+            rag_exec_info = RAGExecInfo(
+                prompt=prompt[0],
+                response="Blocked output",
+                input_token_count=self.get_num_tokens(prompt),
+                output_token_count=0,
+                candidates=top_k_docs,
+            )
+            return answers, account_usage(rag_exec_info, None, self.pricing())
         answers, rag_exec_response = self._post_processor(response)
         if logging:
             print(f"Answers: {answers}")
         rag_exec_info = RAGExecInfo(
             prompt=prompt[0],
             response=rag_exec_response,
-            input_token_count=len(query.split())
-            + sum([len(doc["snippet"].split()) for doc in top_k_docs]),
-            output_token_count=sum([len(ans.text) for ans in answers]),
+            input_token_count=self.get_num_tokens(prompt),
+            output_token_count=self._token_counter.count_text(
+                getattr(response, "text", "") or ""
+            ),
             candidates=top_k_docs,
         )
-
-        return answers, rag_exec_info
+        usage = cohere_usage(getattr(response, "meta", None))
+        return answers, account_usage(rag_exec_info, usage, self.pricing())
 
     def create_prompt(
         self, request: Request, topk: int
     ) -> tuple[list[dict[str, Any]], int]:
         query = request.query.text
-        max_length = (self._context_size - 200) // topk
         self._prompt_mode = PromptMode.COHERE
-        while True:
+        contents = [
+            self.convert_doc_to_prompt_content(candidate.doc, sys.maxsize)
+            for candidate in request.candidates[:topk]
+        ]
+
+        def render(snippets: list[str]) -> list[dict[str, Any]]:
             context = [
-                self.convert_doc_to_prompt_content(candidate.doc, max_length)
-                for candidate in request.candidates[:topk]
+                {**content, "snippet": snippet}
+                for content, snippet in zip(contents, snippets, strict=True)
             ]
-            if self._prompt_mode == PromptMode.COHERE:
-                messages = [{"query": query, "context": context}]
-            num_tokens = self.get_num_tokens(messages)
-            if num_tokens <= self.max_tokens() - self.num_output_tokens():
-                break
-            else:
-                max_length -= max(
-                    1,
-                    (num_tokens - self.max_tokens() + self.num_output_tokens())
-                    // (topk * 4),
-                )
-        return messages, self.get_num_tokens(messages)
+            return [{"query": query, "context": context}]
+
+        return self.fit_passages(
+            [content["snippet"] for content in contents], render, self._token_counter
+        )
 
     def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
-        """Returns the number of tokens used by a list of messages in prompt."""
-        # TODO(ronak): Add support
-        return -1
+        """Returns the number of tokens used by a list of messages in prompt.
+
+        Cohere does not ship a local tokenizer, so this is the tiktoken (or
+        approximate) count of the query and snippets.
+        """
+        return self._token_counter.count(prompt)
+
+    def pricing(self) -> ModelPricing | None:
+        return find_pricing(self._model, COHERE_PRICING)
 
     def cost_per_1k_token(self, input_token: bool) -> float:
-        # TODO(ronak): Add support
-        return -1
+        pricing = self.pricing()
+        if pricing is None:
+            return -1
+        return (pricing.input if input_token else pricing.output) / 1000
 
     def convert_doc_to_prompt_content(
         self, doc: dict[str, Any], max_length: int
     ) -> str:
-        if "text" in doc:
-            content = doc["text"]
-        elif "segment" in doc:
-            content = doc["segment"]
-        elif "contents" in doc:
-            content = doc["contents"]
-        else:
-            content = doc["passage"]
-        content = {"snippet": content}
+        normalize = get_passage_normalizer()
+        content = {"snippet": normalize(passage_text(doc)).truncate(max_length)}
         if "title" in doc:
-            content["title"] = doc["title"]
-        for key in content:
-            content[key] = content[key].strip()
-            content[key] = fix_text(content[key])
-            content[key] = content[key].replace("\n", " ")
-            content[key] = " ".join(content[key].split()[: int(max_length)])
-            content[key] = self._replace_number(content[key])
+            content["title"] = normalize(doc["title"]).truncate(max_length)
         return content
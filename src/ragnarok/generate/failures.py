@@ -0,0 +1,295 @@
+"""Per-request failure isolation for batch generation.
+
+A batch of thousands of requests should not be thrown away because one of
+them hit a filtered response or an exhausted retry budget. The answer paths
+accept `return_exceptions=True` and hand back the exception in place of
+that request's result. Here, each exception becomes a `RequestFailure`
+record. Requests whose error may pass on another attempt go to a bounded
+retry queue that gets another pass, after a backoff, once the batch is done.
+Requests that still fail are written to a dead-letter JSONL file that can be
+fed back in as `--input-file`. Engines that answer a whole batch in one call use
+`bisect_failures` to find the requests that broke it.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from ragnarok.data import Request, Result
+from ragnarok.generate.retry import CircuitOpenError, ErrorKind, classify_error
+from ragnarok.metrics import REGISTRY
+
+REQUEST_FAILURES = REGISTRY.counter(
+    "ragnarok_request_failures_total",
+    "Requests that failed in batch generation, by error kind and outcome.",
+    labels=("kind", "outcome"),
+)
+
+BATCH_SPLITS = REGISTRY.counter(
+    "ragnarok_batch_splits_total",
+    "Failed batch engine calls that were split in half to find the failing prompts.",
+)
+
+Outcome = Result | BaseException
+
+
+@dataclass
+class RequestFailure:
+    """A request that raised instead of producing a result."""
+
+    index: int
+    qid: str | None
+    error_type: str
+    message: str
+    kind: str
+    retryable: bool
+    attempts: int = 1
+    error: BaseException | None = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_exception(
+        cls, index: int, request: Request, error: BaseException, attempts: int = 1
+    ) -> "RequestFailure":
+        kind = classify_error(error)
+        return cls(
+            index=index,
+            qid=request.query.qid,
+            error_type=type(error).__name__,
+            message=str(error),
+            kind=kind.value,
+            retryable=kind is ErrorKind.RETRYABLE,
+            attempts=attempts,
+            error=error,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "index": self.index,
+            "qid": self.qid,
+            "error_type": self.error_type,
+            "message": self.message,
+            "kind": self.kind,
+            "retryable": self.retryable,
+            "attempts": self.attempts,
+        }
+
+
+@dataclass(frozen=True)
+class FailurePolicy:
+    """How failed requests are retried before they are dead-lettered.
+
+    Retryable failures get up to `max_retries` more passes. At most
+    `max_queue_size` requests are queued for a pass; the overflow is
+    dead-lettered right away rather than holding up the run. Passes are
+    `backoff_s` apart, growing by `multiplier` up to `max_backoff_s`, and
+    never sooner than an open circuit breaker would let a call through.
+    """
+
+    max_retries: int = 2
+    max_queue_size: int = 1000
+    backoff_s: float = 1.0
+    multiplier: float = 2.0
+    max_backoff_s: float = 60.0
+
+    def delay(self, retry_pass: int, errors: list[Exception]) -> float:
+        """Seconds to wait before the `retry_pass`-th retry pass (1-based)."""
+        delay = min(
+            self.max_backoff_s, self.backoff_s * self.multiplier ** (retry_pass - 1)
+        )
+        for error in errors:
+            if isinstance(error, CircuitOpenError):
+                delay = max(delay, error.retry_after_s, error.reset_timeout_s)
+        return delay
+
+
+@dataclass
+class IsolatedBatch:
+    """Results of a batch in request order, with `None` for the failed ones."""
+
+    results: list[Result | None]
+    failures: list[RequestFailure]
+    retried: int = 0
+    recovered: int = 0
+
+    def succeeded(self) -> list[Result]:
+        return [result for result in self.results if result is not None]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "failed": len(self.failures),
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "retryable": sum(failure.retryable for failure in self.failures),
+        }
+
+
+class _RetryQueue:
+    """Sorts one pass's outcomes into results, retries and dead letters."""
+
+    def __init__(self, requests: list[Request], policy: FailurePolicy) -> None:
+        self.requests = requests
+        self.policy = policy
+        self.batch = IsolatedBatch(results=[None] * len(requests), failures=[])
+        self.attempts = [0] * len(requests)
+        self.pending = list(range(len(requests)))
+        self.passes = 0
+        self.retry_errors: list[Exception] = []
+
+    def settle(self, outcomes: list[Outcome]) -> None:
+        retry: list[int] = []
+        self.retry_errors = []
+        for index, outcome in zip(self.pending, outcomes, strict=True):
+            self.attempts[index] += 1
+            if not isinstance(outcome, BaseException):
+                self.batch.results[index] = outcome
+                if self.attempts[index] > 1:
+                    self.batch.recovered += 1
+                continue
+            if not isinstance(outcome, Exception):
+                raise outcome
+            failure = RequestFailure.from_exception(
+                index, self.requests[index], outcome, self.attempts[index]
+            )
+            if (
+                failure.retryable
+                and failure.attempts <= self.policy.max_retries
+                and len(retry) < self.policy.max_queue_size
+            ):
+                REQUEST_FAILURES.inc(kind=failure.kind, outcome="retried")
+                retry.append(index)
+                self.retry_errors.append(outcome)
+            else:
+                REQUEST_FAILURES.inc(kind=failure.kind, outcome="dead_letter")
+                self.batch.failures.append(failure)
+        self.batch.retried += len(retry)
+        self.pending = retry
+        self.passes += 1
+
+    def backoff(self) -> float:
+        return self.policy.delay(self.passes, self.retry_errors)
+
+    def next_batch(self) -> list[Request]:
+        return [self.requests[index] for index in self.pending]
+
+
+def answer_isolated(
+    answer_many: Callable[[list[Request]], list[Outcome]],
+    requests: list[Request],
+    policy: FailurePolicy | None = None,
+    sleep: Callable[[float], Any] = time.sleep,
+) -> IsolatedBatch:
+    """Answer `requests`, retrying and recording failures per request.
+
+    `answer_many` answers a list of requests with `return_exceptions=True`
+    semantics, returning each request's result or exception in order.
+    """
+    queue = _RetryQueue(requests, policy or FailurePolicy())
+    while queue.pending:
+        if queue.passes:
+            sleep(queue.backoff())
+        queue.settle(answer_many(queue.next_batch()))
+    queue.batch.failures.sort(key=lambda failure: failure.index)
+    return queue.batch
+
+
+async def async_answer_isolated(
+    answer_many: Callable[[list[Request]], Awaitable[list[Outcome]]],
+    requests: list[Request],
+    policy: FailurePolicy | None = None,
+) -> IsolatedBatch:
+    """Awaitable `answer_isolated` for async `answer_many` callables."""
+    queue = _RetryQueue(requests, policy or FailurePolicy())
+    while queue.pending:
+        if queue.passes:
+            await asyncio.sleep(queue.backoff())
+        queue.settle(await answer_many(queue.next_batch()))
+    queue.batch.failures.sort(key=lambda failure: failure.index)
+    return queue.batch
+
+
+def dead_letter_records(
+    requests: list[Request], failures: list[RequestFailure]
+) -> list[dict[str, Any]]:
+    """Each failed request as a request record with its error under `error`."""
+    records = []
+    for failure in failures:
+        record = asdict(requests[failure.index])
+        record["error"] = failure.to_dict()
+        records.append(record)
+    return records
+
+
+def write_dead_letters(
+    path: str | Path, requests: list[Request], failures: list[RequestFailure]
+) -> None:
+    """Write each failed request with its error as one JSONL record."""
+    output = Path(path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as handle:
+        for record in dead_letter_records(requests, failures):
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def bisect_failures[T, R](
+    run: Callable[[list[T]], list[R]],
+    items: list[T],
+    on_failure: Callable[[T, Exception], R | Exception] | None = None,
+    is_batch_failure: Callable[[Exception], bool] | None = None,
+) -> list[R | Exception]:
+    """Run `items` as one batch, splitting it in halves when it fails.
+
+    Each half of a failed batch is retried on its own, so `k` bad items
+    among `n` cost O(k log n) extra calls instead of the whole batch. An
+    item that fails in a batch of one is handed to `on_failure`, which may
+    retry it another way, and is otherwise returned as its exception.
+
+    Splitting stops when both halves fail too, or when `is_batch_failure`
+    says the error is not about any one item (say, the engine died): every
+    item of that batch then gets the error, so a batch that cannot run at
+    all costs three calls rather than one per item.
+    """
+    if not items:
+        return []
+    try:
+        return list(run(items))
+    except Exception as error:
+        return _bisect(run, items, error, on_failure, is_batch_failure)
+
+
+def _bisect[T, R](
+    run: Callable[[list[T]], list[R]],
+    items: list[T],
+    error: Exception,
+    on_failure: Callable[[T, Exception], R | Exception] | None,
+    is_batch_failure: Callable[[Exception], bool] | None,
+) -> list[R | Exception]:
+    if len(items) == 1:
+        return [on_failure(items[0], error) if on_failure else error]
+    if is_batch_failure is not None and is_batch_failure(error):
+        return [error] * len(items)
+    BATCH_SPLITS.inc()
+    middle = len(items) // 2
+    halves = (items[:middle], items[middle:])
+    outcomes: list[list[R] | Exception] = []
+    for half in halves:
+        try:
+            outcomes.append(list(run(half)))
+        except Exception as half_error:
+            outcomes.append(half_error)
+    if all(isinstance(outcome, Exception) for outcome in outcomes):
+        return [
+            outcome
+            for half, outcome in zip(halves, outcomes, strict=True)
+            for _ in half
+        ]
+    results: list[R | Exception] = []
+    for half, outcome in zip(halves, outcomes, strict=True):
+        if isinstance(outcome, Exception):
+            results.extend(_bisect(run, half, outcome, on_failure, is_batch_failure))
+        else:
+            results.extend(outcome)
+    return results
@@ -1,6 +1,9 @@
 import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
+from typing import cast
 
 from tqdm import tqdm
 
@@ -20,7 +23,9 @@ class RAG:
         shuffle_candidates: bool = False,
         logging: bool = False,
         vllm: bool = False,
-    ) -> list[Result]:
+        max_workers: int | None = None,
+        return_exceptions: bool = False,
+    ) -> list[Result] | list[Result | Exception]:
         """
         Generates a list of attributed answers using the Ragnarok agent.
 
@@ -30,31 +35,100 @@ class RAG:
             shuffle_candidates (bool, optional): Whether to shuffle candidates before answering. Defaults to False.
             logging (bool, optional): Enables logging of the answering process. Defaults to False.
             vllm (bool, optional): Enables VLLM mode. Defaults to False.
+            max_workers (int | None, optional): Answer up to this many requests at once from a
+                thread pool. The agent must be safe to call from several threads, as the
+                OpenAI-compatible and Cohere agents are. Defaults to None (one at a time).
+            return_exceptions (bool, optional): Put a failed request's exception in its place in
+                the returned list instead of raising it, so the other requests still complete.
+                Defaults to False.
 
         Returns:
-            List[Result]: A list containing the attributed answers.
+            List[Result]: A list containing the attributed answers, in the order of `requests`.
         """
+        results: list[Result | Exception]
         if vllm:
-            results = self._agent.answer_batch(
+            # The agent bisects a failed vLLM batch down to the failing
+            # requests; only those come back as exceptions.
+            isolation = {"return_exceptions": True} if return_exceptions else {}
+            results = list(
+                self._agent.answer_batch(
+                    requests,
+                    topk,
+                    shuffle_candidates=shuffle_candidates,
+                    logging=logging,
+                    vllm=vllm,
+                    **isolation,
+                )
+            )
+        elif max_workers is not None and max_workers > 1 and len(requests) > 1:
+            results = self._threaded_answer_batch(
                 requests,
                 topk,
-                shuffle_candidates=shuffle_candidates,
-                logging=logging,
-                vllm=vllm,
+                shuffle_candidates,
+                logging,
+                max_workers,
+                return_exceptions,
             )
         else:
             results = []
             request_iterable = tqdm(requests) if len(requests) > 1 else requests
             for request in request_iterable:
-                result = self._agent.answer_batch(
-                    [request],
-                    topk=min(topk, len(request.candidates)),
-                    shuffle_candidates=shuffle_candidates,
-                    logging=logging,
-                )
-                results.append(result[0])
+                try:
+                    result = self._agent.answer_batch(
+                        [request],
+                        topk=min(topk, len(request.candidates)),
+                        shuffle_candidates=shuffle_candidates,
+                        logging=logging,
+                    )[0]
+                except Exception as error:
+                    if not return_exceptions:
+                        raise
+                    results.append(error)
+                    continue
+                results.append(result)
         return results
 
+    def _threaded_answer_batch(
+        self,
+        requests: list[Request],
+        topk: int,
+        shuffle_candidates: bool,
+        logging: bool,
+        max_workers: int,
+        return_exceptions: bool,
+    ) -> list[Result | Exception]:
+        def answer_one(request: Request) -> Result:
+            return self._agent.answer_batch(
+                [request],
+                topk=min(topk, len(request.candidates)),
+                shuffle_candidates=shuffle_candidates,
+                logging=logging,
+            )[0]
+
+        results: list[Result | Exception | None] = [None] * len(requests)
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(requests)),
+            thread_name_prefix="ragnarok-answer",
+        ) as executor:
+            futures = {
+                executor.submit(answer_one, request): index
+                for index, request in enumerate(requests)
+            }
+            try:
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    error = future.exception()
+                    if error is not None and not return_exceptions:
+                        raise error
+                    results[futures[future]] = (
+                        error if isinstance(error, Exception) else future.result()
+                    )
+            except BaseException:
+                # Don't start the queued requests once one has failed.
+                for future in futures:
+                    future.cancel()
+                raise
+        return cast(list[Result | Exception], results)
+
     def answer(
         self,
         request: Request,
@@ -104,8 +178,10 @@ class RAG:
         logging: bool = False,
         vllm: bool = False,
         max_concurrency: int = 8,
-    ) -> list[Result]:
+        return_exceptions: bool = False,
+    ) -> list[Result] | list[Result | Exception]:
         if vllm:
+            isolation = {"return_exceptions": True} if return_exceptions else {}
             return await self._agent.async_answer_batch(
                 requests,
                 topk,
@@ -113,20 +189,105 @@ class RAG:
                 logging=logging,
                 vllm=vllm,
                 max_concurrency=max_concurrency,
+                **isolation,
             )
 
         semaphore = asyncio.Semaphore(max(1, max_concurrency))
 
-        async def answer_one(request: Request) -> Result:
+        async def answer_one(request: Request) -> Result | Exception:
             async with semaphore:
-                return await self._agent.async_answer(
-                    request,
-                    topk=min(topk, len(request.candidates)),
+                try:
+                    return await self._agent.async_answer(
+                        request,
+                        topk=min(topk, len(request.candidates)),
+                        shuffle_candidates=shuffle_candidates,
+                        logging=logging,
+                    )
+                except Exception as error:
+                    if not return_exceptions:
+                        raise
+                    return error
+
+        return await asyncio.gather(*(answer_one(request) for request in requests))
+
+    async def async_answer_stream(
+        self,
+        requests: list[Request],
+        topk: int = 20,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+        vllm: bool = False,
+        max_concurrency: int = 8,
+        return_exceptions: bool = False,
+    ) -> AsyncIterator[tuple[int, Result | Exception]]:
+        """
+        Generates attributed answers and yields each one as soon as it completes.
+
+        Args:
+            requests (List[Request]): The list of requests. Each request has a query and a candidates list.
+            topk (int, optional): The end rank for processing. Defaults to 20.
+            shuffle_candidates (bool, optional): Whether to shuffle candidates before answering. Defaults to False.
+            logging (bool, optional): Enables logging of the answering process. Defaults to False.
+            vllm (bool, optional): Enables VLLM mode. The whole batch is then generated in
+                one engine call, so results are yielded together once it finishes. Defaults to False.
+            max_concurrency (int, optional): The maximum number of in-flight requests. Defaults to 8.
+            return_exceptions (bool, optional): Yield a failed request's exception instead of
+                raising it, so the remaining requests keep running. Defaults to False.
+
+        Yields:
+            Tuple[int, Result | Exception]: The index of the request in `requests` and its result,
+            in completion order.
+        """
+        if vllm:
+            try:
+                results = await self.async_answer_batch(
+                    requests,
+                    topk,
                     shuffle_candidates=shuffle_candidates,
                     logging=logging,
+                    vllm=vllm,
+                    max_concurrency=max_concurrency,
                 )
+            except Exception as error:
+                if not return_exceptions:
+                    raise
+                for index in range(len(requests)):
+                    yield index, error
+                return
+            for index, result in enumerate(results):
+                yield index, result
+            return
 
-        return await asyncio.gather(*(answer_one(request) for request in requests))
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def answer_one(
+            index: int, request: Request
+        ) -> tuple[int, Result | Exception]:
+            async with semaphore:
+                try:
+                    result = await self._agent.async_answer(
+                        request,
+                        topk=min(topk, len(request.candidates)),
+                        shuffle_candidates=shuffle_candidates,
+                        logging=logging,
+                    )
+                except Exception as error:
+                    if not return_exceptions:
+                        raise
+                    return index, error
+                return index, result
+
+        tasks = [
+            asyncio.ensure_future(answer_one(index, request))
+            for index, request in enumerate(requests)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding generations if the consumer goes away early.
+            for task in tasks:
+                task.cancel()
 
     async def async_answer(
         self,
@@ -1,15 +1,53 @@
-import asyncio
-import time
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import AsyncExitStack
+from dataclasses import replace
 from enum import Enum
+from types import SimpleNamespace
 from typing import Any
 
 import openai
 import tiktoken
 
 from ragnarok.data import RAGExecInfo, Request
-from ragnarok.generate.llm import LLM, SUPPORTED_TEMPLATE_PROMPT_MODES, PromptMode
+from ragnarok.generate.hedging import HedgePolicy, get_hedger
+from ragnarok.generate.http_pool import (
+    HTTPPoolConfig,
+    get_async_http_client,
+    get_http_client,
+)
+from ragnarok.generate.key_pool import KeyPool, KeySlot, quarantine_seconds
+from ragnarok.generate.llm import (
+    LLM,
+    SUPPORTED_TEMPLATE_PROMPT_MODES,
+    PromptMode,
+    StreamDelta,
+)
+from ragnarok.generate.offload import run_cpu_bound
 from ragnarok.generate.post_processor import GPTPostProcessor
+from ragnarok.generate.rate_limiter import RateLimiter, rate_limit_penalty
+from ragnarok.generate.retry import (
+    ErrorKind,
+    RetryPolicy,
+    async_call_with_retry,
+    call_with_retry,
+    classify_error,
+    get_circuit_breaker,
+)
 from ragnarok.generate.templates.ragnarok_templates import RagnarokTemplates
+from ragnarok.generate.token_counter import get_token_counter
+from ragnarok.generate.usage import (
+    OPENAI_PRICING,
+    ModelPricing,
+    TokenUsage,
+    account_usage,
+    find_pricing,
+    openai_usage,
+)
+from ragnarok.metrics import KEY_ROTATIONS
+
+_PROMPT_TOKEN_CACHE_SIZE = 1024
 
 
 class SafeOpenai(LLM):
@@ -37,6 +75,11 @@ class SafeOpenai(LLM):
         api_type: str = None,
         api_base: str = None,
         api_version: str = None,
+        rate_limiter: RateLimiter | None = None,
+        max_concurrency_per_key: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        http_pool: HTTPPoolConfig | None = None,
+        hedge_policy: HedgePolicy | None = None,
     ) -> None:
         """
         Creates instance of the SafeOpenai class, a specialized version of RankLLM designed for safely handling OpenAI API calls with
@@ -52,17 +95,27 @@ class SafeOpenai(LLM):
         the integration of example-based learning to improve model performance. Defaults to 0, indicating no few-shot examples
         by default.
         - keys (Union[List[str], str], optional): A list of OpenAI API keys or a single OpenAI API key.
-        - key_start_id (int, optional): The starting index for the OpenAI API key cycle.
+        - key_start_id (int, optional): The key that receives the first call when all keys are idle.
         - proxy (str, optional): The proxy configuration for OpenAI API calls.
         - api_type (str, optional): The type of API service, if using Azure AI as the backend.
         - api_base (str, optional): The base URL for the API, applicable when using Azure AI.
         - api_version (str, optional): The API version, necessary for Azure AI integration.
+        - rate_limiter (RateLimiter, optional): Shared RPM/TPM limiter; each call first reserves its prompt tokens plus
+        `max_output_tokens` for the current key and model.
+        - max_concurrency_per_key (int, optional): Maximum in-flight calls per API key. Defaults to no per-key limit.
+        - retry_policy (RetryPolicy, optional): Attempts, deadline, and backoff for retrying failed calls. `Retry-After`
+        is honored through the key quarantine, so the policy's own backoff ignores it.
+        - http_pool (HTTPPoolConfig, optional): Connection-pool settings. The clients of every key and every instance
+        that talk to the same origin share one keep-alive pool per setting. Defaults to `HTTPPoolConfig()`.
+        - hedge_policy (HedgePolicy, optional): Hedge async calls that outlast a percentile of recent latency with a
+        duplicate call on another key, keeping the first reply. Defaults to no hedging.
 
         Raises:
         - ValueError: If an unsupported prompt mode is provided or if no OpenAI API keys / invalid OpenAI API keys are supplied.
 
         Note:
-        - This class supports cycling between multiple OpenAI API keys to distribute quota usage or handle rate limiting.
+        - Calls are dispatched to the least-loaded of several OpenAI API keys; a key that is rate-limited or out of
+        quota is quarantined for a while and its retries go to the other keys.
         - Azure AI integration is depends on the presence of `api_type`, `api_base`, and `api_version`.
         """
         super().__init__(
@@ -83,9 +136,8 @@ class SafeOpenai(LLM):
             )
 
         self._keys = keys
-        self._cur_key_id = key_start_id or 0
-        self._cur_key_id = self._cur_key_id % len(self._keys)
         self._post_processor = GPTPostProcessor()
+        self._token_counter = get_token_counter(model, tiktoken)
         if (
             reasoning_effort is not None
             and reasoning_effort not in self.SUPPORTED_REASONING_EFFORTS
@@ -99,13 +151,28 @@ class SafeOpenai(LLM):
         self._api_type = api_type
         self._api_base = api_base
         self._api_version = api_version
-        self._async_client = None
-        self._async_client_key_id = None
-        self._sync_client = None
-        self._sync_client_key_id = None
-        self._async_key_lock = asyncio.Lock()
+        self._key_pool = KeyPool(
+            self._keys,
+            max_concurrency_per_key=max_concurrency_per_key,
+            start=key_start_id or 0,
+        )
+        self._rate_limiter = rate_limiter
+        self._retry_policy = replace(
+            retry_policy or RetryPolicy(), honor_retry_after=False
+        )
+        self._circuit_breaker = get_circuit_breaker(
+            f"openai:{api_base or 'default'}:{model}"
+        )
+        self._http_pool = http_pool or HTTPPoolConfig()
+        self._hedger = (
+            get_hedger(f"openai:{api_base or 'default'}:{model}", hedge_policy)
+            if hedge_policy is not None
+            else None
+        )
+        self._prompt_tokens: OrderedDict[int, tuple[Any, int]] = OrderedDict()
+        self._prompt_tokens_lock = threading.Lock()
+        self._sync_clients_lock = threading.Lock()
         openai.proxy = proxy
-        openai.api_key = self._keys[self._cur_key_id]
         self.use_azure_ai = False
 
         if all([api_type, api_base, api_version]):
@@ -187,29 +254,29 @@ class SafeOpenai(LLM):
                 api_key=api_key,
                 api_version=self._api_version,
                 azure_endpoint=self._api_base,
+                http_client=get_http_client(self._api_base, self._http_pool),
             )
         client_cls = getattr(openai, "OpenAI", None)
         if client_cls is None:
             from openai import OpenAI
 
             client_cls = OpenAI
-        client_kwargs: dict[str, Any] = {"api_key": api_key}
+        client_kwargs: dict[str, Any] = {
+            "api_key": api_key,
+            "http_client": get_http_client(self._api_base, self._http_pool),
+        }
         if self._api_base:
             client_kwargs["base_url"] = self._api_base
         return client_cls(**client_kwargs)
 
-    def _get_sync_client(self) -> Any:
-        if self._sync_client is None or self._sync_client_key_id != self._cur_key_id:
-            self._sync_client = self._create_sync_client(self._cur_key_id)
-            self._sync_client_key_id = self._cur_key_id
-        return self._sync_client
-
-    def _rotate_sync_key(self) -> Any:
-        self._cur_key_id = (self._cur_key_id + 1) % len(self._keys)
-        openai.api_key = self._keys[self._cur_key_id]
-        self._sync_client = self._create_sync_client(self._cur_key_id)
-        self._sync_client_key_id = self._cur_key_id
-        return self._sync_client
+    def _get_sync_client(self, key: KeySlot) -> Any:
+        # Sync calls may come from several threads (`--execution-mode thread`);
+        # create each key's client once. The client itself is thread-safe.
+        if key.sync_client is None:
+            with self._sync_clients_lock:
+                if key.sync_client is None:
+                    key.sync_client = self._create_sync_client(key.index)
+        return key.sync_client
 
     def _create_async_client(self, key_id: int) -> Any:
         api_key = self._keys[key_id]
@@ -223,86 +290,208 @@ class SafeOpenai(LLM):
                 api_key=api_key,
                 api_version=self._api_version,
                 azure_endpoint=self._api_base,
+                http_client=get_async_http_client(self._api_base, self._http_pool),
             )
         client_cls = getattr(openai, "AsyncOpenAI", None)
         if client_cls is None:
             from openai import AsyncOpenAI
 
             client_cls = AsyncOpenAI
-        client_kwargs: dict[str, Any] = {"api_key": api_key}
+        client_kwargs: dict[str, Any] = {
+            "api_key": api_key,
+            "http_client": get_async_http_client(self._api_base, self._http_pool),
+        }
         if self._api_base:
             client_kwargs["base_url"] = self._api_base
         return client_cls(**client_kwargs)
 
-    async def _get_async_client(self) -> Any:
-        async with self._async_key_lock:
-            if (
-                self._async_client is None
-                or self._async_client_key_id != self._cur_key_id
-            ):
-                self._async_client = self._create_async_client(self._cur_key_id)
-                self._async_client_key_id = self._cur_key_id
-            return self._async_client
-
-    async def _rotate_async_key(self) -> Any:
-        async with self._async_key_lock:
-            self._cur_key_id = (self._cur_key_id + 1) % len(self._keys)
-            openai.api_key = self._keys[self._cur_key_id]
-            self._async_client = self._create_async_client(self._cur_key_id)
-            self._async_client_key_id = self._cur_key_id
-            return self._async_client
+    def _get_async_client(self, key: KeySlot) -> Any:
+        if key.async_client is None:
+            key.async_client = self._create_async_client(key.index)
+        return key.async_client
+
+    def _on_key_error(
+        self, key: KeySlot, reservation: tuple[str, str] | None, error: Exception
+    ) -> None:
+        """Bench a rate-limited key so the retry is dispatched to another one."""
+        print(str(error))
+        KEY_ROTATIONS.inc()
+        self._penalize_rate_limit(reservation, error)
+        seconds = quarantine_seconds(error)
+        if seconds is not None:
+            self._key_pool.quarantine(key, seconds)
+
+    def key_stats(self) -> list[dict[str, Any]]:
+        return self._key_pool.stats()
+
+    def _remember_prompt_tokens(self, prompt: Any, num_tokens: int) -> None:
+        with self._prompt_tokens_lock:
+            self._prompt_tokens[id(prompt)] = (prompt, num_tokens)
+            self._prompt_tokens.move_to_end(id(prompt))
+            while len(self._prompt_tokens) > _PROMPT_TOKEN_CACHE_SIZE:
+                self._prompt_tokens.popitem(last=False)
+
+    def _rate_limit_tokens(self, prompt: str | list[dict[str, str]]) -> int:
+        """Tokens to reserve for one call: the prompt plus the output budget.
+
+        Prompts built by `create_prompt` reuse the count it already computed;
+        the entry holds the prompt itself so a recycled `id` never matches.
+        """
+        with self._prompt_tokens_lock:
+            entry = self._prompt_tokens.get(id(prompt))
+        if entry is not None and entry[0] is prompt:
+            num_tokens = entry[1]
+        else:
+            num_tokens = self.get_num_tokens(prompt)
+        return num_tokens + self.num_output_tokens()
+
+    def _settle_rate_limit(
+        self, reservation: tuple[str, str] | None, reserved: int, response: Any
+    ) -> None:
+        if self._rate_limiter is None or reservation is None:
+            return
+        usage = getattr(response, "usage", None)
+        self._rate_limiter.settle(
+            *reservation, reserved, getattr(usage, "total_tokens", None)
+        )
+
+    def _refund_rate_limit(
+        self, reservation: tuple[str, str] | None, reserved: int
+    ) -> None:
+        """Give back a whole reservation, e.g. for a call that was cancelled."""
+        if self._rate_limiter is None or reservation is None:
+            return
+        self._rate_limiter.settle(*reservation, reserved, 0)
+
+    def _penalize_rate_limit(
+        self, reservation: tuple[str, str] | None, error: Exception
+    ) -> None:
+        if self._rate_limiter is None or reservation is None:
+            return
+        penalty = rate_limit_penalty(error)
+        if penalty is not None:
+            self._rate_limiter.penalize(*reservation, penalty)
+
+    def _acquire_rate_limit(
+        self, key: KeySlot, tokens: int | None
+    ) -> tuple[str, str] | None:
+        if self._rate_limiter is None or tokens is None:
+            return None
+        reservation = (key.fingerprint, self._model)
+        self._rate_limiter.acquire(*reservation, tokens)
+        return reservation
+
+    async def _async_acquire_rate_limit(
+        self, key: KeySlot, tokens: int | None
+    ) -> tuple[str, str] | None:
+        if self._rate_limiter is None or tokens is None:
+            return None
+        reservation = (key.fingerprint, self._model)
+        await self._rate_limiter.async_acquire(*reservation, tokens)
+        return reservation
 
     class CompletionMode(Enum):
         UNSPECIFIED = 0
         CHAT = 1
         TEXT = 2
 
+    def _error_marker(self, error: Exception) -> str | None:
+        """The sentinel string returned for errors that retrying cannot fix."""
+        kind = classify_error(error)
+        if kind is ErrorKind.CONTEXT_LENGTH:
+            print("reduce_length")
+            return "ERROR::reduce_length"
+        if kind is ErrorKind.FILTERED:
+            print("The response was filtered")
+            return "ERROR::The response was filtered"
+        return None
+
+    def _with_retry(self, attempt: Callable[[], Any]) -> Any:
+        try:
+            return call_with_retry(
+                attempt, policy=self._retry_policy, breaker=self._circuit_breaker
+            )
+        except Exception as e:
+            marker = self._error_marker(e)
+            if marker is None:
+                raise
+            return marker
+
+    def _hedged(
+        self, attempt: Callable[[], Awaitable[Any]]
+    ) -> Callable[[], Awaitable[Any]]:
+        """`attempt`, duplicated on another key when it outlasts the hedge delay."""
+        hedger = self._hedger
+        if hedger is None:
+            return attempt
+        return lambda: hedger.run(attempt)
+
+    async def _with_async_retry(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await async_call_with_retry(
+                attempt, policy=self._retry_policy, breaker=self._circuit_breaker
+            )
+        except Exception as e:
+            marker = self._error_marker(e)
+            if marker is None:
+                raise
+            return marker
+
     def _call_completion(
         self,
         *args,
         completion_mode: CompletionMode,
         reduce_length=False,
+        rate_limit_tokens: int | None = None,
         **kwargs,
     ) -> Any:
-        while True:
-            try:
-                if completion_mode == self.CompletionMode.CHAT:
-                    completion = openai.chat.completions.create(
-                        *args, **kwargs, timeout=30
-                    )
-                elif completion_mode == self.CompletionMode.TEXT:
-                    completion = openai.Completion.create(*args, **kwargs)
-                else:
-                    raise ValueError(f"Unsupported completion mode: {completion_mode}")
-                break
-            except Exception as e:
-                print(str(e))
-                if "This model's maximum context length is" in str(e):
-                    print("reduce_length")
-                    return "ERROR::reduce_length"
-                if "The response was filtered" in str(e):
-                    print("The response was filtered")
-                    return "ERROR::The response was filtered"
-                self._cur_key_id = (self._cur_key_id + 1) % len(self._keys)
-                openai.api_key = self._keys[self._cur_key_id]
-                time.sleep(0.1)
-        return completion
-
-    def _call_responses(self, **kwargs: Any) -> Any:
-        while True:
-            try:
-                client = self._get_sync_client()
-                return client.responses.create(**kwargs)
-            except Exception as e:
-                print(str(e))
-                if "This model's maximum context length is" in str(e):
-                    print("reduce_length")
-                    return "ERROR::reduce_length"
-                if "The response was filtered" in str(e):
-                    print("The response was filtered")
-                    return "ERROR::The response was filtered"
-                self._rotate_sync_key()
-                time.sleep(0.1)
+        def attempt() -> Any:
+            with self._key_pool.lease() as key:
+                client = self._get_sync_client(key)
+                reservation = None
+                try:
+                    reservation = self._acquire_rate_limit(key, rate_limit_tokens)
+                    if completion_mode == self.CompletionMode.CHAT:
+                        completion = client.chat.completions.create(
+                            *args, **kwargs, timeout=30
+                        )
+                    elif completion_mode == self.CompletionMode.TEXT:
+                        completion = client.completions.create(*args, **kwargs)
+                    else:
+                        raise ValueError(
+                            f"Unsupported completion mode: {completion_mode}"
+                        )
+                except Exception as e:
+                    self._on_key_error(key, reservation, e)
+                    raise
+                except BaseException:
+                    self._refund_rate_limit(reservation, rate_limit_tokens or 0)
+                    raise
+                self._settle_rate_limit(reservation, rate_limit_tokens or 0, completion)
+                return completion
+
+        return self._with_retry(attempt)
+
+    def _call_responses(
+        self, rate_limit_tokens: int | None = None, **kwargs: Any
+    ) -> Any:
+        def attempt() -> Any:
+            with self._key_pool.lease() as key:
+                client = self._get_sync_client(key)
+                reservation = None
+                try:
+                    reservation = self._acquire_rate_limit(key, rate_limit_tokens)
+                    response = client.responses.create(**kwargs)
+                except Exception as e:
+                    self._on_key_error(key, reservation, e)
+                    raise
+                except BaseException:
+                    self._refund_rate_limit(reservation, rate_limit_tokens or 0)
+                    raise
+                self._settle_rate_limit(reservation, rate_limit_tokens or 0, response)
+                return response
+
+        return self._with_retry(attempt)
 
     def run_llm(
         self,
@@ -318,8 +507,12 @@ class SafeOpenai(LLM):
             "completion_mode": SafeOpenai.CompletionMode.CHAT,
             "model": self._model,
         }
+        completion_params["rate_limit_tokens"] = self._rate_limit_tokens(prompt)
         if self._uses_responses_reasoning_api():
-            response = self._call_responses(**self._build_responses_params(prompt))
+            response = self._call_responses(
+                rate_limit_tokens=completion_params["rate_limit_tokens"],
+                **self._build_responses_params(prompt),
+            )
             response_text = self._extract_text_from_responses_output(response)
             reasoning = self._extract_reasoning_from_responses_output(
                 response,
@@ -333,62 +526,112 @@ class SafeOpenai(LLM):
             message = response.choices[0].message
             response_text = message.content or ""
             reasoning = self._extract_reasoning_from_message(message)
-        tagged_reasoning, cleaned_response = self._extract_reasoning_from_text(
-            response_text
+        return self.finalize_streamed_response(
+            prompt,
+            response_text,
+            reasoning,
+            logging,
+            usage=openai_usage(getattr(response, "usage", None)),
         )
-        if reasoning is None:
-            reasoning = tagged_reasoning
-        try:
-            tiktoken.get_encoding(self._model)
-        except Exception:
-            tiktoken.get_encoding("cl100k_base")
-        if logging:
-            print(f"Response: {cleaned_response}")
-        answers, rag_exec_response = self._post_processor(cleaned_response)
-        if logging:
-            print(f"Answers: {answers}")
-        rag_exec_info = RAGExecInfo(
-            prompt=prompt,
-            response=rag_exec_response,
-            input_token_count=self.get_num_tokens(prompt),
-            output_token_count=sum([len(ans.text) for ans in answers]),
-            reasoning=reasoning,
-            candidates=[],
-        )
-        if logging:
-            print(f"RAG Exec Info: {rag_exec_info}")
-        return answers, rag_exec_info
 
     async def _call_completion_async(
         self,
         *args,
         completion_mode: CompletionMode,
         reduce_length=False,
+        rate_limit_tokens: int | None = None,
         **kwargs,
     ) -> Any:
-        while True:
-            try:
-                client = await self._get_async_client()
-                if completion_mode == self.CompletionMode.CHAT:
-                    completion = await client.chat.completions.create(
-                        *args, **kwargs, timeout=30
+        async def attempt() -> Any:
+            async with self._key_pool.async_lease() as key:
+                client = self._get_async_client(key)
+                reservation = None
+                try:
+                    reservation = await self._async_acquire_rate_limit(
+                        key, rate_limit_tokens
                     )
-                elif completion_mode == self.CompletionMode.TEXT:
-                    completion = await client.completions.create(*args, **kwargs)
+                    if completion_mode == self.CompletionMode.CHAT:
+                        completion = await client.chat.completions.create(
+                            *args, **kwargs, timeout=30
+                        )
+                    elif completion_mode == self.CompletionMode.TEXT:
+                        completion = await client.completions.create(*args, **kwargs)
+                    else:
+                        raise ValueError(
+                            f"Unsupported completion mode: {completion_mode}"
+                        )
+                except Exception as e:
+                    self._on_key_error(key, reservation, e)
+                    raise
+                except BaseException:
+                    # A cancelled call, such as the losing hedge, reports no
+                    # usage; hand its whole reservation back.
+                    self._refund_rate_limit(reservation, rate_limit_tokens or 0)
+                    raise
+                self._settle_rate_limit(reservation, rate_limit_tokens or 0, completion)
+                return completion
+
+        return await self._with_async_retry(self._hedged(attempt))
+
+    async def _open_stream_async(
+        self, rate_limit_tokens: int | None = None, **kwargs: Any
+    ) -> Any:
+        """Start a streamed chat completion, retrying until its headers arrive.
+
+        Returns the stream with the key lease (held by an `AsyncExitStack`)
+        and the rate-limit reservation, both of which stay open until the
+        caller has read the stream to the end. A stream returns as soon as
+        its headers arrive, so there is no straggler to hedge.
+        """
+
+        async def attempt() -> Any:
+            lease = AsyncExitStack()
+            key = await lease.enter_async_context(self._key_pool.async_lease())
+            reservation = None
+            try:
+                reservation = await self._async_acquire_rate_limit(
+                    key, rate_limit_tokens
+                )
+                client = self._get_async_client(key)
+                stream = await client.chat.completions.create(
+                    **kwargs,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=30,
+                )
+            except BaseException as e:
+                if isinstance(e, Exception):
+                    self._on_key_error(key, reservation, e)
                 else:
-                    raise ValueError(f"Unsupported completion mode: {completion_mode}")
-                break
-            except Exception as e:
-                print(str(e))
-                if "This model's maximum context length is" in str(e):
-                    print("reduce_length")
-                    return "ERROR::reduce_length"
-                if "The response was filtered" in str(e):
-                    print("The response was filtered")
-                    return "ERROR::The response was filtered"
-                await self._rotate_async_key()
-                await asyncio.sleep(0.1)
-        return completion
+                    self._refund_rate_limit(reservation, rate_limit_tokens or 0)
+                await lease.aclose()
+                raise
+            return stream, lease, reservation
+
+        return await self._with_async_retry(attempt)
+
+    async def _call_responses_async(
+        self, rate_limit_tokens: int | None = None, **kwargs: Any
+    ) -> Any:
+        async def attempt() -> Any:
+            async with self._key_pool.async_lease() as key:
+                client = self._get_async_client(key)
+                reservation = None
+                try:
+                    reservation = await self._async_acquire_rate_limit(
+                        key, rate_limit_tokens
+                    )
+                    response = await client.responses.create(**kwargs)
+                except Exception as e:
+                    self._on_key_error(key, reservation, e)
+                    raise
+                except BaseException:
+                    self._refund_rate_limit(reservation, rate_limit_tokens or 0)
+                    raise
+                self._settle_rate_limit(reservation, rate_limit_tokens or 0, response)
+                return response
+
+        return await self._with_async_retry(self._hedged(attempt))
 
     async def async_run_llm(
         self,
@@ -404,10 +647,11 @@ class SafeOpenai(LLM):
             "completion_mode": SafeOpenai.CompletionMode.CHAT,
             "model": self._model,
         }
+        completion_params["rate_limit_tokens"] = self._rate_limit_tokens(prompt)
         if self._uses_responses_reasoning_api():
-            client = await self._get_async_client()
-            response = await client.responses.create(
-                **self._build_responses_params(prompt)
+            response = await self._call_responses_async(
+                rate_limit_tokens=completion_params["rate_limit_tokens"],
+                **self._build_responses_params(prompt),
             )
             response_text = self._extract_text_from_responses_output(response)
             reasoning = self._extract_reasoning_from_responses_output(
@@ -422,15 +666,29 @@ class SafeOpenai(LLM):
             message = response.choices[0].message
             response_text = message.content or ""
             reasoning = self._extract_reasoning_from_message(message)
+        # Sentence splitting is CPU-bound; keep it off the event loop.
+        return await run_cpu_bound(
+            self.finalize_streamed_response,
+            prompt,
+            response_text,
+            reasoning,
+            logging,
+            usage=openai_usage(getattr(response, "usage", None)),
+        )
+
+    def finalize_streamed_response(
+        self,
+        prompt: str | list[dict[str, str]],
+        response_text: str,
+        reasoning: str | None = None,
+        logging: bool = False,
+        usage: TokenUsage | None = None,
+    ) -> tuple[str, RAGExecInfo]:
         tagged_reasoning, cleaned_response = self._extract_reasoning_from_text(
             response_text
         )
         if reasoning is None:
             reasoning = tagged_reasoning
-        try:
-            tiktoken.get_encoding(self._model)
-        except Exception:
-            tiktoken.get_encoding("cl100k_base")
         if logging:
             print(f"Response: {cleaned_response}")
         answers, rag_exec_response = self._post_processor(cleaned_response)
@@ -440,38 +698,138 @@ class SafeOpenai(LLM):
             prompt=prompt,
             response=rag_exec_response,
             input_token_count=self.get_num_tokens(prompt),
-            output_token_count=sum([len(ans.text) for ans in answers]),
+            output_token_count=self._token_counter.count_text(response_text),
             reasoning=reasoning,
             candidates=[],
         )
+        account_usage(rag_exec_info, usage, self.pricing())
         if logging:
             print(f"RAG Exec Info: {rag_exec_info}")
         return answers, rag_exec_info
 
+    def batch_api_credentials(self) -> tuple[str, str | None]:
+        """The API key and base URL that Batch-API jobs are submitted with."""
+        if self.use_azure_ai:
+            raise ValueError(
+                "Batch execution supports OpenAI-compatible /v1 endpoints, not Azure"
+            )
+        return self._keys[0], self._api_base
+
+    def batch_endpoint(self) -> str:
+        """The Batch-API endpoint that `batch_request_body` bodies target."""
+        if self._uses_responses_reasoning_api():
+            return "/v1/responses"
+        return "/v1/chat/completions"
+
+    def batch_request_body(self, prompt: list[dict[str, str]]) -> dict[str, Any]:
+        """The request body `run_llm` would send for `prompt`, as plain JSON."""
+        if self._uses_responses_reasoning_api():
+            body = self._build_responses_params(prompt)
+            body.pop("timeout", None)
+            return body
+        body = {
+            "model": self._model,
+            "messages": self._normalize_messages(prompt),
+            "temperature": 0.1,
+        }
+        reasoning_params = self._build_reasoning_params()
+        # The SDK merges `extra_body` into the request JSON; do the same here.
+        body.update(reasoning_params.pop("extra_body", {}))
+        body.update(reasoning_params)
+        return body
+
+    def parse_batch_response(
+        self, prompt: list[dict[str, str]], body: dict[str, Any]
+    ) -> tuple[str, RAGExecInfo]:
+        """Post-processes one Batch-API response body like `run_llm` would."""
+        if self._uses_responses_reasoning_api():
+            response = SimpleNamespace(**body)
+            response_text = self._extract_text_from_responses_output(response)
+            reasoning = self._extract_reasoning_from_responses_output(response)
+        else:
+            message = body["choices"][0]["message"]
+            response_text = message.get("content") or ""
+            reasoning = self._extract_reasoning_from_message(message)
+        return self.finalize_streamed_response(
+            prompt, response_text, reasoning, usage=openai_usage(body.get("usage"))
+        )
+
+    def supports_streaming(self) -> bool:
+        return not self._uses_responses_reasoning_api()
+
+    async def async_stream_llm(
+        self,
+        prompt: str | list[dict[str, str]],
+        logging: bool = False,
+    ) -> AsyncIterator[StreamDelta]:
+        if logging:
+            print(f"Prompt: {prompt}")
+        rate_limit_tokens = self._rate_limit_tokens(prompt)
+        opened = await self._open_stream_async(
+            rate_limit_tokens=rate_limit_tokens,
+            messages=self._normalize_messages(prompt),
+            temperature=0.1,
+            model=self._model,
+            **self._build_reasoning_params(),
+        )
+        if isinstance(opened, str):
+            raise RuntimeError(opened)
+        stream, lease, reservation = opened
+        usage = None
+        try:
+            async for chunk in stream:
+                # With `include_usage`, the last chunk carries the usage of
+                # the whole call and no choices.
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                reasoning = self._extract_reasoning_from_delta(delta)
+                yield StreamDelta(text=delta.content or "", reasoning=reasoning or "")
+            yield StreamDelta(usage=openai_usage(usage))
+        finally:
+            # Also reached when the consumer goes away mid-stream; closing
+            # stops the upstream generation instead of letting it run on.
+            try:
+                close = getattr(stream, "close", None) or stream.aclose
+                await close()
+            finally:
+                self._settle_rate_limit(
+                    reservation, rate_limit_tokens, SimpleNamespace(usage=usage)
+                )
+                await lease.aclose()
+
+    def _extract_reasoning_from_delta(self, delta: Any) -> str | None:
+        if not self._store_reasoning or delta is None:
+            return None
+        for attribute in ("reasoning", "reasoning_content"):
+            value = getattr(delta, attribute, None)
+            if value:
+                return str(value)
+        model_extra = getattr(delta, "model_extra", None)
+        if isinstance(model_extra, dict):
+            for attribute in ("reasoning", "reasoning_content"):
+                if model_extra.get(attribute):
+                    return str(model_extra[attribute])
+        return None
+
     def create_prompt(
         self, request: Request, topk: int
     ) -> tuple[list[dict[str, str]], int]:
         query = request.query.text
-        max_length = (self._context_size - 200) // topk
-        while True:
-            context = self.build_ranked_context(request, topk, max_length)
-            if self.supports_template_prompt_mode(self._prompt_mode):
-                ragnarok_template = RagnarokTemplates(self._prompt_mode)
-                messages = ragnarok_template(query, context, "gpt")
-            else:
-                raise ValueError(
-                    f"Unsupported prompt mode: {self._prompt_mode}, expected one of CHATQA or RAGNAROK_V..."
-                )
-            num_tokens = self.get_num_tokens(messages)
-            if num_tokens <= self.max_tokens() - self.num_output_tokens():
-                break
-            else:
-                max_length -= max(
-                    1,
-                    (num_tokens - self.max_tokens() + self.num_output_tokens())
-                    // (topk * 4),
-                )
-        return messages, self.get_num_tokens(messages)
+        if not self.supports_template_prompt_mode(self._prompt_mode):
+            raise ValueError(
+                f"Unsupported prompt mode: {self._prompt_mode}, expected one of CHATQA or RAGNAROK_V..."
+            )
+        ragnarok_template = RagnarokTemplates(self._prompt_mode)
+        messages, num_tokens = self.fit_ranked_context(
+            request,
+            topk,
+            lambda context: ragnarok_template(query, context, "gpt"),
+            self._token_counter,
+        )
+        self._remember_prompt_tokens(messages, num_tokens)
+        return messages, num_tokens
 
     def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
         """Returns the number of tokens used by a list of messages in prompt."""
@@ -486,31 +844,19 @@ class SafeOpenai(LLM):
         else:
             tokens_per_message, tokens_per_name = 0, 0
 
-        try:
-            encoding = tiktoken.get_encoding(self._model)
-        except Exception:
-            encoding = tiktoken.get_encoding("cl100k_base")
-
-        num_tokens = 0
-        if isinstance(prompt, list):
-            for message in prompt:
-                num_tokens += tokens_per_message
-                for key, value in message.items():
-                    num_tokens += len(encoding.encode(value))
-                    if key == "name":
-                        num_tokens += tokens_per_name
-        else:
-            num_tokens += len(encoding.encode(prompt))
+        num_tokens = self._token_counter.count(
+            prompt,
+            tokens_per_message=tokens_per_message,
+            tokens_per_name=tokens_per_name,
+        )
         num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
         return num_tokens
 
+    def pricing(self) -> ModelPricing | None:
+        return find_pricing(self._model, OPENAI_PRICING)
+
     def cost_per_1k_token(self, input_token: bool) -> float:
-        # Brought in from https://openai.com/pricing on 2023-07-30
-        cost_dict = {
-            ("gpt-3.5", 4096): 0.0015 if input_token else 0.002,
-            ("gpt-3.5", 16384): 0.003 if input_token else 0.004,
-            ("gpt-4", 8192): 0.03 if input_token else 0.06,
-            ("gpt-4", 32768): 0.06 if input_token else 0.12,
-        }
-        model_key = "gpt-3.5" if "gpt-3" in self._model else "gpt-4"
-        return cost_dict[(model_key, self._context_size)]
+        pricing = self.pricing()
+        if pricing is None:
+            return -1
+        return (pricing.input if input_token else pricing.output) / 1000
@@ -0,0 +1,175 @@
+"""Hedged provider calls to cut tail latency.
+
+A `Hedger` remembers how long recent calls to one backend took. When a call
+is still running after the configured percentile of those latencies, a
+duplicate is started (through the key pool it usually lands on another
+key), the first successful reply is used, and the other call is cancelled.
+Hedges are capped at a fraction of all calls, so a slow backend costs at most
+that much extra traffic.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from ragnarok.metrics import REGISTRY
+
+HEDGEABLE_CALLS = REGISTRY.counter(
+    "ragnarok_llm_hedgeable_calls_total",
+    "Provider calls made with hedging enabled.",
+    labels=("backend",),
+)
+HEDGED_CALLS = REGISTRY.counter(
+    "ragnarok_llm_hedged_calls_total",
+    "Hedged provider calls by which request answered first.",
+    labels=("backend", "winner"),
+)
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """When to send a duplicate request, and how many duplicates to allow.
+
+    A hedge is sent once a call has run longer than `percentile` of the last
+    `window` successful calls (but at least `min_delay_s`), after
+    `min_samples` calls have been observed, while hedges stay under
+    `max_hedge_ratio` of all calls.
+    """
+
+    percentile: float = 0.95
+    max_hedge_ratio: float = 0.05
+    min_samples: int = 20
+    min_delay_s: float = 0.05
+    window: int = 512
+
+    def __post_init__(self) -> None:
+        if not 0.0 < self.percentile < 1.0:
+            raise ValueError("hedge percentile must be between 0 and 1")
+        if not 0.0 <= self.max_hedge_ratio <= 1.0:
+            raise ValueError("hedge ratio must be between 0 and 1")
+
+
+class Hedger:
+    """Tracks one backend's latencies and runs calls with a hedge."""
+
+    def __init__(
+        self,
+        name: str,
+        policy: HedgePolicy,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.policy = policy
+        self._clock = clock
+        self._latencies: deque[float] = deque(maxlen=policy.window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency_s: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_s)
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            if len(self._latencies) < self.policy.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(
+            len(ordered) - 1, math.ceil(self.policy.percentile * len(ordered)) - 1
+        )
+        return max(self.policy.min_delay_s, ordered[index])
+
+    def _reserve_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.policy.max_hedge_ratio * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    async def _timed[T](self, call: Callable[[], Awaitable[T]]) -> T:
+        started = self._clock()
+        result = await call()
+        self.observe(self._clock() - started)
+        return result
+
+    async def run[T](self, call: Callable[[], Awaitable[T]]) -> T:
+        """Await `call()`, hedging it with a second `call()` if it runs long."""
+        with self._lock:
+            self.calls += 1
+        HEDGEABLE_CALLS.inc(backend=self.name)
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._timed(call))
+        if delay is None:
+            return await primary
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._reserve_hedge():
+                return await primary
+            hedge = asyncio.ensure_future(self._timed(call))
+        except BaseException:
+            primary.cancel()
+            raise
+        return await self._first_success(primary, hedge)
+
+    async def _first_success[T](
+        self, primary: "asyncio.Future[T]", hedge: "asyncio.Future[T]"
+    ) -> T:
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        winner = "hedge" if task is hedge else "primary"
+                        if task is hedge:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        HEDGED_CALLS.inc(backend=self.name, winner=winner)
+                        return task.result()
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+        # Both calls failed: surface the original call's error.
+        HEDGED_CALLS.inc(backend=self.name, winner="none")
+        return primary.result()
+
+    def stats(self) -> dict[str, float | int | None]:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": self.hedges / self.calls if self.calls else 0.0,
+                "hedge_delay_s": delay,
+            }
+
+
+_hedgers: dict[tuple[str, HedgePolicy], Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name: str, policy: HedgePolicy) -> Hedger:
+    """Return the process-wide hedger for a backend and policy."""
+    with _hedgers_lock:
+        hedger = _hedgers.get((name, policy))
+        if hedger is None:
+            hedger = _hedgers[(name, policy)] = Hedger(name, policy)
+        return hedger
+
+
+def hedging_stats() -> dict[str, dict[str, float | int | None]]:
+    """`Hedger.stats()` of every backend with hedging enabled, by name."""
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.name: hedger.stats() for hedger in hedgers}
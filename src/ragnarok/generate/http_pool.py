@@ -0,0 +1,114 @@
+"""Process-wide HTTP connection pools for OpenAI-compatible clients.
+
+Every `SafeOpenai` instance creates one SDK client per API key, and `ragnarok
+serve` builds a new agent per hosted model and pool slot. Without a shared
+transport each of those clients opens its own TCP and TLS connections, so a
+fresh agent or a key rotation pays the full handshake again. Here, clients
+with the same pool settings that talk to the same origin share one
+`httpx.Client` (or, per event loop, one `httpx.AsyncClient`) and its
+keep-alive connections; the API key travels in the request headers, so the
+pool is safe to share across keys.
+"""
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+@dataclass(frozen=True)
+class HTTPPoolConfig:
+    """Connection-pool settings shared by all clients of one origin."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry_s: float = 30.0
+    http2: bool = False
+
+
+def http2_available() -> bool:
+    """Whether the `h2` package that httpx needs for HTTP/2 is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _origin(base_url: str | None) -> str:
+    parts = urlsplit(base_url or DEFAULT_BASE_URL)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _client_kwargs(config: HTTPPoolConfig) -> dict[str, Any]:
+    import httpx
+
+    if config.http2 and not http2_available():
+        raise ImportError(
+            "HTTP/2 needs the h2 package; install it with `pip install 'httpx[http2]'`"
+        )
+    return {
+        "limits": httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry_s,
+        ),
+        "http2": config.http2,
+        # The OpenAI SDK sets its own per-request timeouts; match its client
+        # defaults otherwise.
+        "follow_redirects": True,
+    }
+
+
+_PoolKey = tuple[str, HTTPPoolConfig]
+
+_sync_clients: dict[_PoolKey, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[_PoolKey, Any]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_http_client(base_url: str | None, config: HTTPPoolConfig | None = None) -> Any:
+    """Return the shared `httpx.Client` for the origin of `base_url`."""
+    key = (_origin(base_url), config or HTTPPoolConfig())
+    with _clients_lock:
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            import httpx
+
+            client = _sync_clients[key] = httpx.Client(**_client_kwargs(key[1]))
+        return client
+
+
+def get_async_http_client(
+    base_url: str | None, config: HTTPPoolConfig | None = None
+) -> Any:
+    """Return the shared `httpx.AsyncClient` for `base_url` on the running loop.
+
+    Async connections belong to the event loop that opened them, so each loop
+    gets its own pool; pools of loops that have been garbage collected go
+    with them.
+    """
+    key = (_origin(base_url), config or HTTPPoolConfig())
+    try:
+        loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    import httpx
+
+    if loop is None:
+        return httpx.AsyncClient(**_client_kwargs(key[1]))
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = clients[key] = httpx.AsyncClient(**_client_kwargs(key[1]))
+        return client
+
+
+def http_pool_stats() -> dict[str, int]:
+    with _clients_lock:
+        return {
+            "sync_pools": len(_sync_clients),
+            "async_pools": sum(len(clients) for clients in _async_clients.values()),
+        }
@@ -0,0 +1,161 @@
+"""Concurrent dispatch across several API keys of one provider.
+
+Each key gets its own clients, an in-flight count, and a health state, so
+calls run on all keys in parallel instead of using extra keys only as a
+failover chain. A key that hits a rate limit or quota error is quarantined
+for a while and calls go to the remaining keys meanwhile.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any
+
+from ragnarok.generate.rate_limiter import key_fingerprint, rate_limit_penalty
+
+QUOTA_QUARANTINE_S = 60.0
+
+
+def quarantine_seconds(error: BaseException) -> float | None:
+    """How long to bench a key after `error`, or None to keep using it."""
+    if "quota" in str(error).lower():
+        return max(QUOTA_QUARANTINE_S, rate_limit_penalty(error) or 0.0)
+    return rate_limit_penalty(error)
+
+
+@dataclass(eq=False)
+class KeySlot:
+    index: int
+    api_key: str
+    fingerprint: str
+    in_flight: int = 0
+    requests: int = 0
+    quarantines: int = 0
+    quarantined_until: float = 0.0
+    sync_client: Any = None
+    async_client: Any = None
+
+
+class KeyPool:
+    """Leases the least-loaded healthy key for each provider call.
+
+    A key is eligible while it is not quarantined and, when
+    `max_concurrency_per_key` is set, has a free slot. Ties go round-robin so
+    sequential calls also spread across keys. When no key is eligible,
+    `lease` blocks and `async_lease` awaits until a call finishes or the
+    first quarantine expires.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        *,
+        max_concurrency_per_key: int | None = None,
+        start: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not keys:
+            raise ValueError("KeyPool needs at least one key")
+        if max_concurrency_per_key is not None and max_concurrency_per_key < 1:
+            raise ValueError("max_concurrency_per_key must be at least 1")
+        self.slots = [
+            KeySlot(index=index, api_key=key, fingerprint=key_fingerprint(key))
+            for index, key in enumerate(keys)
+        ]
+        self._max_concurrency = max_concurrency_per_key
+        self._next = start % len(keys)
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._async_waiters: set[asyncio.Future[None]] = set()
+
+    def _take_locked(self) -> tuple[KeySlot | None, float | None]:
+        """Claim a slot, or return how long to wait before trying again."""
+        now = self._clock()
+        ordered = self.slots[self._next :] + self.slots[: self._next]
+        healthy = [slot for slot in ordered if slot.quarantined_until <= now]
+        available = [
+            slot
+            for slot in healthy
+            if self._max_concurrency is None or slot.in_flight < self._max_concurrency
+        ]
+        if available:
+            slot = min(available, key=lambda candidate: candidate.in_flight)
+            slot.in_flight += 1
+            slot.requests += 1
+            self._next = (slot.index + 1) % len(self.slots)
+            return slot, None
+        if healthy:
+            return None, None
+        return None, min(slot.quarantined_until for slot in self.slots) - now
+
+    def _release(self, slot: KeySlot) -> None:
+        with self._condition:
+            slot.in_flight -= 1
+            self._condition.notify_all()
+            waiters = list(self._async_waiters)
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    @contextmanager
+    def lease(self) -> Iterator[KeySlot]:
+        with self._condition:
+            while True:
+                slot, wait = self._take_locked()
+                if slot is not None:
+                    break
+                self._condition.wait(timeout=wait)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    @asynccontextmanager
+    async def async_lease(self) -> AsyncIterator[KeySlot]:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                slot, wait = self._take_locked()
+                if slot is not None:
+                    break
+                waiter: asyncio.Future[None] = loop.create_future()
+                self._async_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=wait)
+            except TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def quarantine(self, slot: KeySlot, seconds: float) -> None:
+        with self._condition:
+            slot.quarantines += 1
+            slot.quarantined_until = max(
+                slot.quarantined_until, self._clock() + seconds
+            )
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = self._clock()
+        with self._condition:
+            return [
+                {
+                    "key": slot.fingerprint,
+                    "in_flight": slot.in_flight,
+                    "requests": slot.requests,
+                    "quarantines": slot.quarantines,
+                    "healthy": slot.quarantined_until <= now,
+                }
+                for slot in self.slots
+            ]
+
+
+def _wake(waiter: asyncio.Future[None]) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
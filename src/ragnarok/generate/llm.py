@@ -1,13 +1,49 @@
 import asyncio
+import hashlib
+import json
+import logging as _logging
 import random
 import re
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
 from enum import Enum
 from typing import Any
 
 from ftfy import fix_text
 
-from ragnarok.data import Request, Result, remove_unused_references
+from ragnarok.data import (
+    Candidate,
+    Query,
+    RAGExecInfo,
+    Request,
+    Result,
+    remove_unused_references,
+)
+from ragnarok.generate.offload import run_cpu_bound
+from ragnarok.generate.passages import get_passage_normalizer, replace_number
+from ragnarok.generate.token_counter import TokenCounter
+from ragnarok.generate.usage import ModelPricing, TokenUsage
+from ragnarok.metrics import record_token_usage, stage_timer
+
+_LOGGER = _logging.getLogger(__name__)
+_PRERENDERED_PROMPTS = 256
+
+
+def _prompt_key(request: Request, topk: int) -> str:
+    """Hash of everything in a request that `create_prompt` can read."""
+    material = [
+        topk,
+        request.query.text,
+        request.query.qid,
+        [(candidate.docid, candidate.doc) for candidate in request.candidates],
+    ]
+    encoded = json.dumps(material, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
 
 
 class PromptMode(Enum):
@@ -38,6 +74,56 @@ SUPPORTED_TEMPLATE_PROMPT_MODES = (
 )
 
 
+def shuffle_request_candidates(request: Request, topk: int) -> None:
+    """Randomly shuffles the first topk candidates of a request in place."""
+    request.candidates[:topk] = random.sample(
+        request.candidates[:topk],
+        len(request.candidates[:topk]),
+    )
+
+
+def allocate_token_budget(lengths: list[int], budget: int) -> int:
+    """The largest per-passage cap with `sum(min(length, cap)) <= budget`.
+
+    Passages shorter than the cap are kept whole, and the tokens they leave
+    unused are shared by the longer ones.
+    """
+    if budget <= 0:
+        return 0
+    remaining = budget
+    ordered = sorted(lengths)
+    for index, length in enumerate(ordered):
+        share = remaining // (len(ordered) - index)
+        if length > share:
+            return share
+        remaining -= length
+    return ordered[-1] if ordered else 0
+
+
+@dataclass
+class StreamDelta:
+    """A chunk of streamed model output, split into answer text and reasoning."""
+
+    text: str = ""
+    reasoning: str = ""
+    # Provider-reported usage of the whole call, sent with the last delta.
+    usage: TokenUsage | None = None
+
+
+@dataclass
+class GenerationEvent:
+    """
+    One step of a streamed answer.
+
+    `delta` events carry raw model text, `sentence` events carry a finalized
+    `CitedSentence` whose citations index the prompt candidates, and the last
+    event is always `done` with the assembled `Result`.
+    """
+
+    event: str
+    data: Any
+
+
 class LLM(ABC):
     def __init__(
         self,
@@ -54,6 +140,8 @@ class LLM(ABC):
         self._num_few_shot_examples = num_few_shot_examples
         self._output_token_estimate = max_output_tokens
         self._store_reasoning = store_reasoning
+        self._prerendered: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._prerendered_lock = threading.Lock()
 
     def max_tokens(self) -> int:
         """
@@ -96,6 +184,36 @@ class LLM(ABC):
         """
         pass
 
+    def prerender_prompt(
+        self, request: Request, topk: int
+    ) -> tuple[str | list[dict[str, str]], int]:
+        """
+        Renders a request's prompt ahead of answering it, e.g. to size it for admission control.
+
+        The prompt is kept until `render_prompt` is called for an identical request, so it is
+        only rendered once.
+        """
+        rendered = self.create_prompt(request, topk)
+        key = _prompt_key(request, topk)
+        with self._prerendered_lock:
+            self._prerendered[key] = rendered
+            while len(self._prerendered) > _PRERENDERED_PROMPTS:
+                self._prerendered.popitem(last=False)
+        return rendered
+
+    def render_prompt(
+        self, request: Request, topk: int
+    ) -> tuple[str | list[dict[str, str]], int]:
+        """
+        Returns `create_prompt(request, topk)`, reusing the prompt `prerender_prompt` built for it.
+        """
+        if self._prerendered:
+            with self._prerendered_lock:
+                rendered = self._prerendered.pop(_prompt_key(request, topk), None)
+            if rendered is not None:
+                return rendered
+        return self.create_prompt(request, topk)
+
     @abstractmethod
     def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
         """
@@ -122,6 +240,15 @@ class LLM(ABC):
         """
         pass
 
+    def pricing(self) -> ModelPricing | None:
+        """
+        List prices for the target model, used to cost each call.
+
+        Returns:
+            Optional[ModelPricing]: The prices, or None when they are unknown.
+        """
+        return None
+
     def answer(
         self,
         request: Request,
@@ -155,7 +282,8 @@ class LLM(ABC):
         shuffle_candidates: bool = False,
         logging: bool = False,
         vllm: bool = False,
-    ) -> list[Result]:
+        return_exceptions: bool = False,
+    ) -> list[Result] | list[Result | Exception]:
         """
         Answer a list of requests using the target language model.
 
@@ -165,56 +293,100 @@ class LLM(ABC):
             shuffle_candidates (bool, optional): Flag to shuffle candidates before processing. Defaults to False.
             logging (bool, optional): Flag to enable logging of operations. Defaults to False.
             vllm (bool, optional): Flag to enable VLLM mode. Defaults to False.
+            return_exceptions (bool, optional): Put a failed request's exception in its place in the
+                returned list instead of raising it. Defaults to False.
 
         Returns:
             List[Result]: The list of results after answering the requests.
         """
-        initial_results = []
-        results = []
-        for request in requests:
-            if shuffle_candidates:
-                # First randomly shuffle rerank_result in first topk ranks
-                request.candidates[:topk] = random.sample(
-                    request.candidates[:topk],
-                    len(request.candidates[:topk]),
-                )
+        results: list[Result | Exception] = []
+        if shuffle_candidates:
+            for request in requests:
+                shuffle_request_candidates(request, topk)
         if vllm:
-            prompt_input_token_count_list = self.create_prompt_batched(requests, topk)
+            with stage_timer("create_prompt"):
+                prompt_input_token_count_list = self.create_prompt_batched(
+                    requests, topk
+                )
             prompts = [prompt for prompt, _ in prompt_input_token_count_list]
-            answer_rag_exec_info_list = self.run_llm_batched(prompts, logging)
-            answers = [answer for answer, _ in answer_rag_exec_info_list]
-            rag_exec_summary = [
-                rag_exec_info for _, rag_exec_info in answer_rag_exec_info_list
-            ]
-            for request, answer, rag_exec_info in zip(
-                requests, answers, rag_exec_summary, strict=True
-            ):
+            sources = [(request, topk) for request in requests]
+            with stage_timer("run_llm") as timing:
+                answer_rag_exec_info_list = self.run_llm_batched(
+                    prompts,
+                    logging,
+                    return_exceptions=return_exceptions,
+                    sources=sources,
+                )
+            for request, item in zip(requests, answer_rag_exec_info_list, strict=True):
+                if isinstance(item, Exception):
+                    results.append(item)
+                    continue
+                answer, rag_exec_info = item
+                if rag_exec_info.prompt_truncated:
+                    _LOGGER.warning(
+                        "query %s was answered from a shortened prompt that "
+                        "left out its lowest-ranked passages",
+                        request.query.qid,
+                    )
+                # Every prompt in the batch completes when the batch does.
+                rag_exec_info.generation_seconds = timing.elapsed
                 result = Result(
                     query=request.query,
                     references=[cand.docid for cand in request.candidates[:topk]],
                     answer=answer,
                     rag_exec_summary=rag_exec_info,
                 )
-                initial_results.append(result)
+                record_token_usage(self._model, rag_exec_info)
+                results.append(remove_unused_references(result))
         else:
             for request in requests:
-                prompt, input_token_count = self.create_prompt(request, topk)
-                answer, rag_exec_summary = self.run_llm(prompt, logging)
-                rag_exec_summary.candidates = [
-                    candidate.__dict__ for candidate in request.candidates[:topk]
-                ]
-                result = Result(
-                    query=request.query,
-                    references=[cand.docid for cand in request.candidates[:topk]],
-                    answer=answer,
-                    rag_exec_summary=rag_exec_summary,
+                try:
+                    with stage_timer("create_prompt"):
+                        prompt, input_token_count = self.render_prompt(request, topk)
+                    with stage_timer("run_llm") as timing:
+                        answer, rag_exec_summary = self.run_llm(prompt, logging)
+                except Exception as error:
+                    if not return_exceptions:
+                        raise
+                    results.append(error)
+                    continue
+                rag_exec_summary.generation_seconds = timing.elapsed
+                results.append(
+                    self.build_result(request, topk, answer, rag_exec_summary)
                 )
-                initial_results.append(result)
-        for result in initial_results:
-            cleaned_result = remove_unused_references(result)
-            results.append(cleaned_result)
         return results
 
+    def build_result(
+        self,
+        request: Request,
+        topk: int,
+        answer: Any,
+        rag_exec_summary: Any,
+    ) -> Result:
+        """
+        Assembles the cleaned result for a request from one model answer.
+
+        Args:
+            request (Request): The request that was answered.
+            topk (int): The topk ranks that were included in the prompt.
+            answer (Any): The cited sentences returned by `run_llm`.
+            rag_exec_summary (Any): The execution info returned by `run_llm`.
+
+        Returns:
+            Result: The result with unused references removed.
+        """
+        rag_exec_summary.candidates = [
+            candidate.__dict__ for candidate in request.candidates[:topk]
+        ]
+        record_token_usage(self._model, rag_exec_summary)
+        result = Result(
+            query=request.query,
+            references=[cand.docid for cand in request.candidates[:topk]],
+            answer=answer,
+            rag_exec_summary=rag_exec_summary,
+        )
+        return remove_unused_references(result)
+
     async def async_run_llm(
         self, prompt: str | list[dict[str, Any]], logging: bool = False
     ) -> tuple[Any, int]:
@@ -236,6 +408,113 @@ class LLM(ABC):
             )
         )[0]
 
+    def supports_streaming(self) -> bool:
+        """Whether `async_stream_llm` yields tokens as they are generated."""
+        return False
+
+    def async_stream_llm(
+        self, prompt: str | list[dict[str, Any]], logging: bool = False
+    ) -> AsyncIterator[StreamDelta]:
+        """
+        Streams the raw model response for a prompt.
+
+        Backends that support streaming override this, usually as an async generator,
+        together with `supports_streaming` and `finalize_streamed_response`; callers only
+        stream when `supports_streaming` is true.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support streaming generation"
+        )
+
+    def finalize_streamed_response(
+        self,
+        prompt: str | list[dict[str, Any]],
+        response_text: str,
+        reasoning: str | None = None,
+        logging: bool = False,
+        usage: TokenUsage | None = None,
+    ) -> tuple[Any, RAGExecInfo]:
+        """
+        Post-processes a fully streamed response like `run_llm` would.
+
+        `usage` is the provider-reported token usage of the call, when known.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support streaming generation"
+        )
+
+    async def async_answer_stream(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> AsyncIterator[GenerationEvent]:
+        """
+        Answers a request while streaming partial text and finished sentences.
+
+        Backends without token streaming answer in one call and then replay
+        the sentences, so callers can rely on the same event sequence.
+
+        Args:
+            request (Request): The request to answer.
+            topk (int): The topk ranks to include in the prompt.
+            shuffle_candidates (bool, optional): Whether to shuffle candidates before answering. Defaults to False.
+            logging (bool, optional): Enables logging of the answering process. Defaults to False.
+
+        Yields:
+            GenerationEvent: `delta` and `sentence` events, then one `done` event.
+        """
+        if shuffle_candidates:
+            shuffle_request_candidates(request, topk)
+        with stage_timer("create_prompt"):
+            prompt, _input_token_count = await run_cpu_bound(
+                self.render_prompt, request, topk
+            )
+        if not self.supports_streaming():
+            with stage_timer("run_llm") as timing:
+                answer, rag_exec_summary = await self.async_run_llm(prompt, logging)
+            rag_exec_summary.generation_seconds = timing.elapsed
+            for sentence in answer:
+                yield GenerationEvent("delta", sentence.text + " ")
+                yield GenerationEvent("sentence", sentence)
+            yield GenerationEvent(
+                "done", self.build_result(request, topk, answer, rag_exec_summary)
+            )
+            return
+
+        from ragnarok.generate.post_processor import StreamingCitationParser
+
+        parser = StreamingCitationParser()
+        started = time.perf_counter()
+        text_parts: list[str] = []
+        reasoning_parts: list[str] = []
+        usage: TokenUsage | None = None
+        async for delta in self.async_stream_llm(prompt, logging):
+            usage = delta.usage or usage
+            if delta.reasoning:
+                reasoning_parts.append(delta.reasoning)
+            if not delta.text:
+                continue
+            text_parts.append(delta.text)
+            yield GenerationEvent("delta", delta.text)
+            for sentence in parser.feed(delta.text):
+                yield GenerationEvent("sentence", sentence)
+        for sentence in parser.flush():
+            yield GenerationEvent("sentence", sentence)
+        answer, rag_exec_summary = await run_cpu_bound(
+            self.finalize_streamed_response,
+            prompt,
+            "".join(text_parts),
+            "".join(reasoning_parts) or None,
+            logging,
+            usage=usage,
+        )
+        rag_exec_summary.generation_seconds = time.perf_counter() - started
+        yield GenerationEvent(
+            "done", self.build_result(request, topk, answer, rag_exec_summary)
+        )
+
     async def async_answer_batch(
         self,
         requests: list[Request],
@@ -244,7 +523,14 @@ class LLM(ABC):
         logging: bool = False,
         vllm: bool = False,
         max_concurrency: int = 8,
-    ) -> list[Result]:
+        return_exceptions: bool = False,
+    ) -> list[Result] | list[Result | Exception]:
+        """
+        Answers requests concurrently on the event loop.
+
+        With `return_exceptions`, a failed request's exception takes its place
+        in the returned list instead of cancelling the rest of the batch.
+        """
         if vllm:
             return await asyncio.to_thread(
                 self.answer_batch,
@@ -253,34 +539,64 @@ class LLM(ABC):
                 shuffle_candidates,
                 logging,
                 vllm,
+                return_exceptions,
             )
 
         if shuffle_candidates:
             for request in requests:
-                request.candidates[:topk] = random.sample(
-                    request.candidates[:topk],
-                    len(request.candidates[:topk]),
-                )
+                shuffle_request_candidates(request, topk)
 
         semaphore = asyncio.Semaphore(max(1, max_concurrency))
 
         async def answer_one(request: Request) -> Result:
             async with semaphore:
-                prompt, _input_token_count = self.create_prompt(request, topk)
-                answer, rag_exec_summary = await self.async_run_llm(prompt, logging)
-                rag_exec_summary.candidates = [
-                    candidate.__dict__ for candidate in request.candidates[:topk]
-                ]
-                result = Result(
-                    query=request.query,
-                    references=[cand.docid for cand in request.candidates[:topk]],
-                    answer=answer,
-                    rag_exec_summary=rag_exec_summary,
-                )
-                return remove_unused_references(result)
+                # Tokenizing and rendering would stall every other request's
+                # I/O if it ran on the event loop.
+                with stage_timer("create_prompt"):
+                    prompt, _input_token_count = await run_cpu_bound(
+                        self.render_prompt, request, topk
+                    )
+                with stage_timer("run_llm") as timing:
+                    answer, rag_exec_summary = await self.async_run_llm(prompt, logging)
+                rag_exec_summary.generation_seconds = timing.elapsed
+                return self.build_result(request, topk, answer, rag_exec_summary)
+
+        if return_exceptions:
+
+            async def answer_isolated(request: Request) -> Result | Exception:
+                try:
+                    return await answer_one(request)
+                except Exception as error:
+                    return error
+
+            return await asyncio.gather(
+                *(answer_isolated(request) for request in requests)
+            )
 
         return await asyncio.gather(*(answer_one(request) for request in requests))
 
+    def warm_up(self) -> None:
+        """
+        Exercises prompt construction and sentence tokenization once so that
+        lazily loaded resources (tokenizer encodings, spaCy pipelines) are
+        ready before the first real request.
+        """
+        request = Request(
+            query=Query(text="What is the capital of France?", qid="warm-up"),
+            candidates=[
+                Candidate(
+                    docid="warm-up",
+                    score=1.0,
+                    doc={"segment": "Paris is the capital of France."},
+                )
+            ],
+        )
+        self.create_prompt(request, topk=1)
+        post_processor = getattr(self, "_post_processor", None)
+        tokenizer = getattr(post_processor, "tokenizer", None)
+        if tokenizer is not None:
+            tokenizer.tokenize("Paris is the capital of France. It is old.")
+
     def num_output_tokens(self) -> int:
         return self._output_token_estimate
 
@@ -410,7 +726,7 @@ class LLM(ABC):
         return reasoning, fix_text(cleaned_response)
 
     def _replace_number(self, s: str) -> str:
-        return re.sub(r"\[(\d+)\]", r"(\1)", s)
+        return replace_number(s)
 
     def supports_template_prompt_mode(self, prompt_mode: PromptMode) -> bool:
         return prompt_mode in SUPPORTED_TEMPLATE_PROMPT_MODES
@@ -418,21 +734,68 @@ class LLM(ABC):
     def convert_doc_to_prompt_content(
         self, doc: dict[str, Any], max_length: int
     ) -> str:
-        if "text" in doc:
-            content = doc["text"]
-        elif "segment" in doc:
-            content = doc["segment"]
-        elif "contents" in doc:
-            content = doc["contents"]
-        else:
-            content = doc["passage"]
-        if "title" in doc and doc["title"]:
-            content = "Title: " + doc["title"] + " " + "Content: " + content
-        content = content.strip()
-        content = fix_text(content)
-        content = content.replace("\n", " ")
-        content = " ".join(content.split()[: int(max_length)])
-        return self._replace_number(content)
+        return get_passage_normalizer().document(doc).truncate(max_length)
+
+    def fit_passages[P](
+        self,
+        passages: list[str],
+        render: Callable[[list[str]], P],
+        token_counter: TokenCounter,
+        limit: int | None = None,
+    ) -> tuple[P, int]:
+        """
+        Truncates passages so the rendered prompt fits the context window.
+
+        Each passage is tokenized once and the template overhead is measured
+        once by rendering empty passages; the remaining budget is split with
+        `allocate_token_budget` and passages are cut at token offsets. The
+        prompt is rendered and counted once more to confirm the fit, and the
+        budget is only tightened again if that count still runs over. `limit`
+        replaces the context window's prompt budget when given.
+
+        Returns:
+            Tuple[P, int]: The rendered prompt and its token count.
+        """
+        if limit is None:
+            limit = self.max_tokens() - self.num_output_tokens()
+        budget = limit - self.get_num_tokens(render([""] * len(passages)))
+        lengths = [token_counter.count_text(passage) for passage in passages]
+        while True:
+            cap = allocate_token_budget(lengths, budget)
+            prompt = render(
+                [
+                    passage if length <= cap else token_counter.truncate(passage, cap)
+                    for passage, length in zip(passages, lengths, strict=True)
+                ]
+            )
+            num_tokens = self.get_num_tokens(prompt)
+            if num_tokens <= limit or cap == 0:
+                return prompt, num_tokens
+            budget -= num_tokens - limit
+
+    def fit_ranked_context[P](
+        self,
+        request: Request,
+        topk: int,
+        render: Callable[[list[str]], P],
+        token_counter: TokenCounter,
+        limit: int | None = None,
+    ) -> tuple[P, int]:
+        """`fit_passages` over the first topk candidates as `[rank] content` lines."""
+        passages = [
+            self.convert_doc_to_prompt_content(candidate.doc, sys.maxsize)
+            for candidate in request.candidates[:topk]
+        ]
+
+        def render_ranked(contents: list[str]) -> P:
+            return render(
+                [
+                    f"[{rank}] {content}"
+                    for rank, content in enumerate(contents, start=1)
+                ]
+            )
+
+        return self.fit_passages(passages, render_ranked, token_counter, limit)
 
     def build_ranked_context(
         self,
@@ -443,5 +806,5 @@ class LLM(ABC):
         context = []
         for rank, candidate in enumerate(request.candidates[:topk], start=1):
             content = self.convert_doc_to_prompt_content(candidate.doc, max_length)
-            context.append(f"[{rank}] {self._replace_number(content)}")
+            context.append(f"[{rank}] {content}")
         return context
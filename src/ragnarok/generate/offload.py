@@ -0,0 +1,127 @@
+"""Keep CPU-bound generation work off the event loop.
+
+Building a prompt (tokenizing, `fix_text`, template rendering) and
+post-processing an answer (sentence splitting) hold the CPU for milliseconds
+per request. On the event loop that time stalls the network I/O of every
+other in-flight request, so the async paths hand that work to one bounded,
+process-wide thread pool. `LoopLagMonitor` measures how long the loop was
+blocked regardless.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from types import TracebackType
+
+from ragnarok.metrics import REGISTRY
+
+LOOP_LAG = REGISTRY.histogram(
+    "ragnarok_event_loop_lag_seconds",
+    "How late the event loop ran a scheduled wake-up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+_cpu_executor: ThreadPoolExecutor | None = None
+_cpu_executor_lock = threading.Lock()
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool for prompt building and post-processing."""
+    global _cpu_executor
+    with _cpu_executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = ThreadPoolExecutor(
+                max_workers=max(2, os.cpu_count() or 1),
+                thread_name_prefix="ragnarok-cpu",
+            )
+        return _cpu_executor
+
+
+async def run_cpu_bound[**P, T](
+    func: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs
+) -> T:
+    """Await `func(*args, **kwargs)` run on the CPU pool, like `asyncio.to_thread`."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_cpu_executor(), call)
+
+
+class LoopLagMonitor:
+    """Measures how late the running event loop wakes a sleeping task.
+
+    Every `interval_s` the monitor schedules a wake-up; any delay past it is
+    time the loop spent running something else without yielding. Lags above
+    `threshold_s` count as stalls, and their sum is reported as `blocked_s`.
+    """
+
+    def __init__(
+        self,
+        interval_s: float = 0.05,
+        threshold_s: float = 0.01,
+        *,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        self.interval_s = interval_s
+        self.threshold_s = threshold_s
+        self._clock = clock
+        self._task: asyncio.Task[None] | None = None
+        self.samples = 0
+        self.stalls = 0
+        self.blocked_s = 0.0
+        self.max_lag_s = 0.0
+        self._total_lag_s = 0.0
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    async def _watch(self) -> None:
+        while True:
+            due = self._clock() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            self.record(max(0.0, self._clock() - due))
+
+    def record(self, lag_s: float) -> None:
+        self.samples += 1
+        self._total_lag_s += lag_s
+        self.max_lag_s = max(self.max_lag_s, lag_s)
+        if lag_s > self.threshold_s:
+            self.stalls += 1
+            self.blocked_s += lag_s
+        LOOP_LAG.observe(lag_s)
+
+    def stats(self) -> dict[str, float | int]:
+        return {
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "blocked_s": self.blocked_s,
+            "max_lag_s": self.max_lag_s,
+            "mean_lag_s": self._total_lag_s / self.samples if self.samples else 0.0,
+        }
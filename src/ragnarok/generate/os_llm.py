@@ -1,5 +1,8 @@
 import os
+import sys
+from collections.abc import Callable
 from concurrent.futures import ThreadPoolExecutor
+from typing import Any
 
 import torch
 from fastchat.model import load_model
@@ -13,9 +16,52 @@ except Exception:
 from transformers.generation import GenerationConfig
 
 from ragnarok.data import RAGExecInfo, Request
+from ragnarok.generate.failures import bisect_failures
 from ragnarok.generate.llm import LLM, SUPPORTED_TEMPLATE_PROMPT_MODES, PromptMode
 from ragnarok.generate.post_processor import GPTPostProcessor
 from ragnarok.generate.templates.ragnarok_templates import RagnarokTemplates
+from ragnarok.generate.token_counter import TokenCounter
+from ragnarok.generate.usage import TokenUsage, account_usage
+from ragnarok.metrics import REGISTRY
+
+VLLM_PROMPT_FAILURES = REGISTRY.counter(
+    "ragnarok_vllm_prompt_failures_total",
+    "Prompts vLLM failed on in a batch of one, by whether truncating them helped.",
+    labels=("outcome",),
+)
+
+# A prompt vLLM rejects on its own is re-fitted once to this share of its tokens.
+_TRUNCATION_RATIO = 0.75
+
+
+_ENGINE_FAILURE_MARKERS = (
+    "out of memory",
+    "cuda error",
+    "engine dead",
+    "enginedead",
+    "engine is dead",
+)
+
+
+class PromptRejectedError(ValueError):
+    """vLLM failed on a prompt on its own, even after truncating it."""
+
+
+def _is_engine_failure(error: Exception) -> bool:
+    """Whether `error` broke the whole vLLM engine rather than one prompt."""
+    if isinstance(error, MemoryError) or "OutOfMemory" in type(error).__name__:
+        return True
+    message = f"{type(error).__name__}: {error}".lower()
+    return any(marker in message for marker in _ENGINE_FAILURE_MARKERS)
+
+
+def _vllm_usage(output: Any) -> TokenUsage | None:
+    """Token counts of one vLLM `RequestOutput`, from its token ids."""
+    prompt_token_ids = getattr(output, "prompt_token_ids", None)
+    token_ids = getattr(output.outputs[0], "token_ids", None)
+    if prompt_token_ids is None or token_ids is None:
+        return None
+    return TokenUsage(len(prompt_token_ids), len(token_ids))
 
 
 class OSLLM(LLM):
@@ -85,119 +131,236 @@ class OSLLM(LLM):
                 ignore_patterns=ignore_patterns,
             )
             self._tokenizer = self._llm.get_tokenizer()
+            self._uses_vllm = True
         except Exception:
             self._llm, self._tokenizer = load_model(
                 model, device=device, num_gpus=num_gpus
             )
+            self._uses_vllm = False
         self._post_processor = GPTPostProcessor()
+        self._token_counter = TokenCounter(
+            lambda text: len(self._tokenizer.encode(text, add_special_tokens=False)),
+            lambda text, max_tokens: self._tokenizer.decode(
+                self._tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            ),
+            per_line=False,
+        )
+        self._num_special_tokens = len(self._tokenizer.encode(""))
+        self._chat_prompt_fillers: dict[
+            PromptMode, Callable[[str, list[str]], str]
+        ] = {}
         if num_few_shot_examples > 0:
             # TODO(ronak): Add support for few-shot examples
             pass
 
     def run_llm_batched(
-        self, prompts: list[str], logging: bool = False, vllm: bool = True
-    ) -> list[tuple[str, int]]:
+        self,
+        prompts: list[str],
+        logging: bool = False,
+        vllm: bool = True,
+        return_exceptions: bool = False,
+        sources: list[tuple[Request, int] | None] | None = None,
+    ) -> list[Any]:
+        """
+        Generates and post-processes answers for a batch of prompts in one vLLM call.
+
+        When the call fails, the batch is bisected to isolate the failing prompts. Each
+        of those whose request and topk are given in `sources` is re-rendered once into a
+        shorter prompt, dropping its lowest-ranked passages; the rest are rejected with a
+        `PromptRejectedError`. Answers to shortened prompts are marked with
+        `RAGExecInfo.prompt_truncated`. Engine failures (out of memory, a dead engine), or a split
+        whose halves both fail, fail the whole batch without further calls. With `return_exceptions` that error takes the prompt's
+        place in the returned list; without it the batch raises `RuntimeError`.
+        """
         if logging:
             for i, prompt in enumerate(prompts):
                 print(f"Prompt {i}: {prompt}")
-        try:
-            sampling_params = SamplingParams(
-                temperature=0.0,
-                max_tokens=self._output_token_estimate,
-                min_tokens=200,
+        sampling_params = SamplingParams(
+            temperature=0.0,
+            max_tokens=self._output_token_estimate,
+            min_tokens=200,
+        )
+
+        def generate(batch: list[str]) -> list[tuple[str, Any]]:
+            return list(
+                zip(batch, self._llm.generate(batch, sampling_params), strict=True)
             )
-            outputs = self._llm.generate(prompts, sampling_params)
-            raw_responses = [output.outputs[0].text for output in outputs]
-            print("Cleaning responses")
-            reasoning_and_responses = [
-                self._extract_reasoning_from_text(response)
-                for response in raw_responses
-            ]
-            reasonings = [reasoning for reasoning, _ in reasoning_and_responses]
-            responses = [
-                cleaned_response for _, cleaned_response in reasoning_and_responses
-            ]
-            if logging:
-                for response in responses:
-                    print(f"Response: {response}")
-            answer_rag_exec_info_list = []
-            for prompt, response, reasoning in zip(
-                prompts, responses, reasonings, strict=True
-            ):
-                answer, rag_exec_response = self._post_processor(response)
-                rag_exec_info = RAGExecInfo(
-                    prompt=prompt,
-                    response=rag_exec_response,
-                    input_token_count=self.get_num_tokens(prompt),
-                    output_token_count=sum([len(ans.text) for ans in answer]),
-                    reasoning=reasoning,
-                    candidates=[],
+
+        def generate_indices(indices: list[int]) -> list[tuple[str, Any]]:
+            return generate([prompts[index] for index in indices])
+
+        generated = bisect_failures(
+            generate_indices,
+            list(range(len(prompts))),
+            lambda index, error: self._retry_truncated(
+                generate,
+                prompts[index],
+                error,
+                sources[index] if sources is not None else None,
+            ),
+            is_batch_failure=_is_engine_failure,
+        )
+        answer_rag_exec_info_list: list[Any] = []
+        for prompt, item in zip(prompts, generated, strict=True):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                sent_prompt, output = item
+                answer, rag_exec_info = self._answer_from_output(
+                    sent_prompt, output, logging
                 )
+                rag_exec_info.prompt_truncated = sent_prompt is not prompt
                 answer_rag_exec_info_list.append((answer, rag_exec_info))
+            except Exception as exc:
+                if not return_exceptions:
+                    raise RuntimeError("Failed run_llm_batched") from exc
+                answer_rag_exec_info_list.append(exc)
+        return answer_rag_exec_info_list
+
+    def _retry_truncated(
+        self,
+        generate: Callable[[list[str]], list[tuple[str, Any]]],
+        prompt: str,
+        error: Exception,
+        source: tuple[Request, int] | None,
+    ) -> tuple[str, Any] | Exception:
+        if _is_engine_failure(error):
+            return error
+        num_tokens = self.get_num_tokens(prompt)
+        if source is not None:
+            request, topk = source
+            shorter = self._refit_prompt(
+                request, topk, int(num_tokens * _TRUNCATION_RATIO)
+            )
+            if shorter is not None:
+                try:
+                    output = generate([shorter])[0]
+                except Exception:
+                    pass
+                else:
+                    VLLM_PROMPT_FAILURES.inc(outcome="truncated")
+                    return output
+        VLLM_PROMPT_FAILURES.inc(outcome="rejected")
+        rejected = PromptRejectedError(
+            f"vLLM failed on a {num_tokens}-token prompt: {error}"
+        )
+        rejected.__cause__ = error
+        return rejected
 
-            return answer_rag_exec_info_list
-        except Exception as exc:
-            raise RuntimeError("Failed run_llm_batched") from exc
+    def _refit_prompt(self, request: Request, topk: int, limit: int) -> str | None:
+        """
+        Renders the request's prompt again within `limit` tokens.
+
+        Whole passages are dropped from the bottom of the ranking until the
+        rest fit, so the template and the citation numbers stay intact; the
+        top passage is truncated only if it does not fit on its own. Returns
+        None when even that does not fit.
+        """
+        query = request.query.text
+        fill = self._chat_prompt_filler()
+        contents = [
+            self.convert_doc_to_prompt_content(candidate.doc, sys.maxsize)
+            for candidate in request.candidates[:topk]
+        ]
+        lengths = [
+            self._token_counter.count_text(f"[{rank}] {content}")
+            for rank, content in enumerate(contents, start=1)
+        ]
+        overhead = self.get_num_tokens(fill(query, [""] * len(contents)))
+        keep = len(contents)
+        while keep > 1 and overhead + sum(lengths[:keep]) > limit:
+            keep -= 1
+        prompt, num_tokens = self.fit_ranked_context(
+            request,
+            keep,
+            lambda context: fill(query, context),
+            self._token_counter,
+            limit,
+        )
+        return prompt if num_tokens <= limit else None
+
+    def _answer_from_output(
+        self, prompt: str, output: Any, logging: bool = False
+    ) -> tuple[Any, RAGExecInfo]:
+        reasoning, response = self._extract_reasoning_from_text(output.outputs[0].text)
+        if logging:
+            print(f"Response: {response}")
+        answer, rag_exec_response = self._post_processor(response)
+        rag_exec_info = RAGExecInfo(
+            prompt=prompt,
+            response=rag_exec_response,
+            input_token_count=self.get_num_tokens(prompt),
+            output_token_count=self._token_counter.count_text(output.outputs[0].text),
+            reasoning=reasoning,
+            candidates=[],
+        )
+        account_usage(rag_exec_info, _vllm_usage(output), self.pricing())
+        return answer, rag_exec_info
 
     def run_llm(
         self, prompt: str, logging: bool = False, vllm: bool = True
     ) -> tuple[str, int]:
         if logging:
             print(f"Prompt: {prompt}")
-        try:
-            answer_rag_exec_info_list = self.run_llm_batched([prompt], logging, vllm)
-            answer, rag_exec_info = answer_rag_exec_info_list[0]
+        if self._uses_vllm:
+            answer, rag_exec_info = self.run_llm_batched([prompt], logging, vllm)[0]
             return answer, rag_exec_info
-        except Exception:
-            tokenized_inputs = self._tokenizer(prompt, return_tensors="pt")
-            inputs = {
-                k: torch.tensor(v).to(self._device) for k, v in tokenized_inputs.items()
-            }
-            gen_cfg = GenerationConfig.from_model_config(self._llm.config)
-            gen_cfg.max_new_tokens = self.num_output_tokens()
-            # gen_cfg.temperature = 0
-            gen_cfg.do_sample = False
-            output_ids = self._llm.generate(**inputs, generation_config=gen_cfg)
-
-            if self._llm.config.is_encoder_decoder:
-                output_ids = output_ids[0]
-            else:
-                output_ids = output_ids[0][len(inputs["input_ids"][0]) :]
-            outputs = self._tokenizer.decode(
-                output_ids,
-                skip_special_tokens=True,
-                spaces_between_special_tokens=False,
-            )
-            return outputs, output_ids.size(0)
+        tokenized_inputs = self._tokenizer(prompt, return_tensors="pt")
+        inputs = {
+            k: torch.tensor(v).to(self._device) for k, v in tokenized_inputs.items()
+        }
+        gen_cfg = GenerationConfig.from_model_config(self._llm.config)
+        gen_cfg.max_new_tokens = self.num_output_tokens()
+        # gen_cfg.temperature = 0
+        gen_cfg.do_sample = False
+        output_ids = self._llm.generate(**inputs, generation_config=gen_cfg)
+
+        if self._llm.config.is_encoder_decoder:
+            output_ids = output_ids[0]
+        else:
+            output_ids = output_ids[0][len(inputs["input_ids"][0]) :]
+        outputs = self._tokenizer.decode(
+            output_ids,
+            skip_special_tokens=True,
+            spaces_between_special_tokens=False,
+        )
+        return outputs, output_ids.size(0)
 
     def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
         query = request.query.text
-        max_length = (self._context_size - 400) // topk
-        while True:
-            context = self.build_ranked_context(request, topk, max_length)
-            if self.supports_template_prompt_mode(self._prompt_mode):
-                ragnarok_template = RagnarokTemplates(self._prompt_mode)
-                messages = ragnarok_template(query, context, self._name)
-                prompt = self._tokenizer.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True,
-                    enable_thinking=True,
-                )
-            else:
-                raise ValueError(
-                    f"unsupported prompt mode for GPT models: {self._prompt_mode}, expected one of {PromptMode.CHATQA}, {PromptMode.RAGNAROK_V2}, {PromptMode.RAGNAROK_V3}, {PromptMode.RAGNAROK_V4}, {PromptMode.RAGNAROK_V4_NO_CITE}."
-                )
-            num_tokens = self.get_num_tokens(prompt)
-            if num_tokens <= self.max_tokens() - self.num_output_tokens():
-                break
+        if not self.supports_template_prompt_mode(self._prompt_mode):
+            raise ValueError(
+                f"unsupported prompt mode for GPT models: {self._prompt_mode}, expected one of {PromptMode.CHATQA}, {PromptMode.RAGNAROK_V2}, {PromptMode.RAGNAROK_V3}, {PromptMode.RAGNAROK_V4}, {PromptMode.RAGNAROK_V4_NO_CITE}."
+            )
+        fill = self._chat_prompt_filler()
+        return self.fit_ranked_context(
+            request, topk, lambda context: fill(query, context), self._token_counter
+        )
+
+    def _format_chat(self, prompt: Any) -> str:
+        return self._tokenizer.apply_chat_template(
+            prompt,
+            tokenize=False,
+            add_generation_prompt=True,
+            enable_thinking=True,
+        )
+
+    def _chat_prompt_filler(self) -> Callable[[str, list[str]], str]:
+        # The chat template is applied once per prompt mode; later prompts
+        # splice the query and passages into the formatted scaffold.
+        fill = self._chat_prompt_fillers.get(self._prompt_mode)
+        if fill is None:
+            compiled = RagnarokTemplates(self._prompt_mode).compiled(self._name)
+            if compiled.system_message is None:
+
+                def format_single_string(query: str, context: list[str]) -> str:
+                    return self._format_chat(compiled.fill(query, context))
+
+                fill = format_single_string
             else:
-                max_length -= max(
-                    1,
-                    (num_tokens - self.max_tokens() + self.num_output_tokens())
-                    // (topk * 4),
-                )
-        return prompt, self.get_num_tokens(prompt)
+                fill = compiled.compile_chat_template(self._format_chat)
+            self._chat_prompt_fillers[self._prompt_mode] = fill
+        return fill
 
     def create_prompt_batched(
         self,
@@ -228,7 +391,7 @@ class OSLLM(LLM):
             for batch in chunks(requests, batch_size):
                 completed_prompts = list(
                     executor.map(
-                        lambda request: self.create_prompt(request, topk),
+                        lambda request: self.render_prompt(request, topk),
                         batch,
                     )
                 )
@@ -237,7 +400,7 @@ class OSLLM(LLM):
         return all_completed_prompts
 
     def get_num_tokens(self, prompt: str) -> int:
-        return len(self._tokenizer.encode(prompt))
+        return self._num_special_tokens + self._token_counter.count_text(prompt)
 
     def cost_per_1k_token(self, input_token: bool) -> float:
         return 0
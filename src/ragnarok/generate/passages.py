@@ -0,0 +1,96 @@
+"""Candidate text normalized once and shared by every prompt builder.
+
+Prompt builders clean passage text the same way: `fix_text`, collapse
+whitespace (newlines included) to single spaces, and escape bracketed
+numbers such as `[3]` to `(3)` so they cannot be mistaken for citations.
+The result only depends on the raw text, so it is computed once per distinct
+passage and kept in an LRU keyed by a content hash. Fitting loops, repeated
+renders, and every request that shares a candidate reuse the cleaned,
+pre-split words.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from ftfy import fix_text
+
+_CACHE_SIZE = 65536
+_BRACKETED_NUMBER = re.compile(r"\[(\d+)\]")
+
+
+def replace_number(text: str) -> str:
+    """Rewrite `[n]` as `(n)`, leaving citation markers to the prompt."""
+    return _BRACKETED_NUMBER.sub(r"(\1)", text)
+
+
+def passage_text(doc: dict[str, Any]) -> str:
+    """The raw passage of a candidate document, without its title."""
+    if "text" in doc:
+        return doc["text"]
+    if "segment" in doc:
+        return doc["segment"]
+    if "contents" in doc:
+        return doc["contents"]
+    return doc["passage"]
+
+
+@dataclass(frozen=True)
+class NormalizedText:
+    """Fixed, single-line, number-escaped text and its words."""
+
+    text: str
+    words: tuple[str, ...]
+
+    def truncate(self, max_words: int) -> str:
+        if max_words >= len(self.words):
+            return self.text
+        return " ".join(self.words[: int(max_words)])
+
+
+class PassageNormalizer:
+    """Normalizes text with an LRU of results keyed by a content hash."""
+
+    def __init__(self, cache_size: int = _CACHE_SIZE) -> None:
+        self._cache_size = cache_size
+        self._normalized: OrderedDict[bytes, NormalizedText] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, text: str) -> NormalizedText:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            normalized = self._normalized.get(key)
+            if normalized is not None:
+                self._normalized.move_to_end(key)
+                self.hits += 1
+                return normalized
+        # `[n]` never spans whitespace, so escaping before the split matches
+        # escaping each truncated passage.
+        words = tuple(replace_number(fix_text(text.strip())).split())
+        normalized = NormalizedText(" ".join(words), words)
+        with self._lock:
+            self.misses += 1
+            self._normalized[key] = normalized
+            if len(self._normalized) > self._cache_size:
+                self._normalized.popitem(last=False)
+        return normalized
+
+    def document(self, doc: dict[str, Any]) -> NormalizedText:
+        """The passage of `doc`, prefixed with its title when it has one."""
+        content = passage_text(doc)
+        if "title" in doc and doc["title"]:
+            content = "Title: " + doc["title"] + " " + "Content: " + content
+        return self(content)
+
+
+_normalizer = PassageNormalizer()
+
+
+def get_passage_normalizer() -> PassageNormalizer:
+    """Return the process-wide passage normalizer."""
+    return _normalizer
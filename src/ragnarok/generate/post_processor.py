@@ -4,6 +4,7 @@ from importlib import import_module
 from typing import Any
 
 from ragnarok.data import CitedSentence
+from ragnarok.metrics import stage_timer
 
 
 class RegexTokenizer:
@@ -130,6 +131,10 @@ class CoherePostProcessor:
         return citations
 
     def __call__(self, response) -> tuple[list[CitedSentence], dict[str, Any]]:
+        with stage_timer("post_process"):
+            return self._process(response)
+
+    def _process(self, response) -> tuple[list[CitedSentence], dict[str, Any]]:
         text_output = response.text
         if not response.citations:
             citations = []
@@ -155,6 +160,56 @@ class CoherePostProcessor:
         return answers, rag_exec_response
 
 
+def find_sentence_citations(
+    sentence: str, citation_range: list[int] | None = None
+) -> tuple[str, list[int]]:
+    # Regex pattern to find citations
+    citation_range = list(range(50)) if citation_range is None else citation_range
+    pattern = re.compile(r"\[\d+\](?:,? ?)")
+
+    # Find all citations
+    citations = pattern.findall(sentence)
+    if citations:
+        # Remove citations from text
+        sentence = pattern.sub("", sentence).strip()
+
+        # Extract indices from citations
+        indices = [
+            int(re.search(r"\d+", citation).group()) - 1 for citation in citations
+        ]
+        citations = [index for index in indices if index in citation_range]
+    else:
+        matches = re.findall(r"\[[^\]]*\]", sentence)
+        if not matches:
+            return sentence, []
+        citations = []
+        for match in matches:
+            citation = match[1:-1]
+            try:
+                if "," in citation:
+                    flag = False
+                    for cit in citation.split(","):
+                        cit = int(cit) - 1
+                        if cit in citation_range:
+                            flag = True
+                            citations.append(int(cit))
+                    if flag:
+                        sentence = sentence.replace(match, "")
+                else:
+                    citation = int(citation) - 1
+                    if citation in citation_range:
+                        citations.append(citation)
+                        sentence = sentence.replace(match, "")
+            except Exception:
+                print(f"Not a valid citation: {match}")
+
+    sentence = re.sub(" +", " ", sentence)
+    if len(sentence) > 3:
+        if sentence[-2] == " ":
+            sentence = sentence[:-2] + sentence[-1]
+    return sentence, citations
+
+
 class GPTPostProcessor:
     def __init__(self, tokenizer="spacy") -> None:
         self.tokenizer = self._build_tokenizer(tokenizer)
@@ -170,53 +225,13 @@ class GPTPostProcessor:
     def _find_sentence_citations(
         self, sentence: str, citation_range: list[int] | None = None
     ) -> tuple[str, list[int]]:
-        # Regex pattern to find citations
-        citation_range = list(range(50)) if citation_range is None else citation_range
-        pattern = re.compile(r"\[\d+\](?:,? ?)")
-
-        # Find all citations
-        citations = pattern.findall(sentence)
-        if citations:
-            # Remove citations from text
-            sentence = pattern.sub("", sentence).strip()
-
-            # Extract indices from citations
-            indices = [
-                int(re.search(r"\d+", citation).group()) - 1 for citation in citations
-            ]
-            citations = [index for index in indices if index in citation_range]
-        else:
-            matches = re.findall(r"\[[^\]]*\]", sentence)
-            if not matches:
-                return sentence, []
-            citations = []
-            for match in matches:
-                citation = match[1:-1]
-                try:
-                    if "," in citation:
-                        flag = False
-                        for cit in citation.split(","):
-                            cit = int(cit) - 1
-                            if cit in citation_range:
-                                flag = True
-                                citations.append(int(cit))
-                        if flag:
-                            sentence = sentence.replace(match, "")
-                    else:
-                        citation = int(citation) - 1
-                        if citation in citation_range:
-                            citations.append(citation)
-                            sentence = sentence.replace(match, "")
-                except Exception:
-                    print(f"Not a valid citation: {match}")
-
-        sentence = re.sub(" +", " ", sentence)
-        if len(sentence) > 3:
-            if sentence[-2] == " ":
-                sentence = sentence[:-2] + sentence[-1]
-        return sentence, citations
+        return find_sentence_citations(sentence, citation_range)
 
     def __call__(self, response) -> list[dict[str, Any]]:
+        with stage_timer("post_process"):
+            return self._process(response)
+
+    def _process(self, response) -> list[dict[str, Any]]:
         text_output = response
         # Remove all \nNote: and \nReferences: from the text
         text_output = re.sub(r"\nNote:.*", "", text_output)
@@ -233,3 +248,112 @@ class GPTPostProcessor:
         rag_exec_response = {"text": response, "citations": citation_range}
 
         return answers, rag_exec_response
+
+
+class StreamingCitationParser:
+    """
+    Incrementally splits streamed model text into cited sentences.
+
+    A sentence is emitted once its closing punctuation (plus any trailing
+    `[n]` citations) is followed by the start of the next sentence or line, so
+    each returned `CitedSentence` is final. Leading `<think>` blocks and
+    `Note:`/`References:` lines are skipped, as in `GPTPostProcessor`.
+    """
+
+    _SENTENCE_END = re.compile(
+        r"[.!?](?:\s*\[[^\]]*\])*(?=\s+[^\s\[])|\n(?=\s*[^\s\[])"
+    )
+    _SKIPPED_LINE_PREFIXES = ("Note:", "References:")
+
+    def __init__(self, citation_range: list[int] | None = None) -> None:
+        self._citation_range = (
+            list(range(50)) if citation_range is None else citation_range
+        )
+        self._buffer = ""
+        self._in_reasoning = False
+        self._at_line_start = False
+
+    def feed(self, text: str) -> list[CitedSentence]:
+        """
+        Add a chunk of streamed text.
+        Args:
+            text: str: the next chunk of model output
+
+        Returns:
+            List[CitedSentence]: sentences completed by this chunk
+        """
+        self._buffer += text
+        return self._drain(final=False)
+
+    def flush(self) -> list[CitedSentence]:
+        """
+        Finish the stream and return whatever sentence is still open.
+        Returns:
+            List[CitedSentence]: the remaining sentences
+        """
+        sentences = self._drain(final=True)
+        self._buffer = ""
+        return sentences
+
+    def _skip_reasoning(self) -> bool:
+        if not self._in_reasoning:
+            stripped = self._buffer.lstrip()
+            if stripped and "<think>".startswith(stripped):
+                return False
+            if not stripped.startswith("<think>"):
+                return True
+            self._in_reasoning = True
+        end = self._buffer.find("</think>")
+        if end < 0:
+            return False
+        self._buffer = self._buffer[end + len("</think>") :]
+        self._in_reasoning = False
+        return self._skip_reasoning()
+
+    def _skip_line(self, *, final: bool) -> bool | None:
+        """Drops a skipped line at the buffer start; None means wait for more."""
+        if not self._at_line_start:
+            return False
+        if any(self._buffer.startswith(p) for p in self._SKIPPED_LINE_PREFIXES):
+            end = self._buffer.find("\n")
+            if end < 0:
+                if not final:
+                    return None
+                self._buffer = ""
+                return True
+            self._buffer = self._buffer[end + 1 :]
+            return True
+        if not final and any(
+            prefix.startswith(self._buffer) for prefix in self._SKIPPED_LINE_PREFIXES
+        ):
+            return None
+        return False
+
+    def _drain(self, *, final: bool) -> list[CitedSentence]:
+        if not self._skip_reasoning():
+            return []
+        sentences = []
+        while True:
+            skipped = self._skip_line(final=final)
+            if skipped is None:
+                return sentences
+            if skipped:
+                continue
+            match = self._SENTENCE_END.search(self._buffer)
+            if match is None:
+                break
+            sentence = self._buffer[: match.end()]
+            self._buffer = self._buffer[match.end() :]
+            self._at_line_start = sentence.endswith("\n")
+            sentences.extend(self._cite(sentence))
+        if final:
+            sentences.extend(self._cite(self._buffer))
+            self._buffer = ""
+        return sentences
+
+    def _cite(self, sentence: str) -> list[CitedSentence]:
+        sentence = " ".join(sentence.split())
+        if not re.search("[a-zA-Z]", sentence):
+            return []
+        text, citations = find_sentence_citations(sentence, self._citation_range)
+        return [CitedSentence(text=text, citations=citations)]
@@ -0,0 +1,208 @@
+"""Client-side request and token rate limiting for provider APIs.
+
+Providers such as OpenAI enforce requests-per-minute (RPM) and
+tokens-per-minute (TPM) limits per API key and model. Reserving capacity
+before each call keeps throughput just under those limits instead of
+repeatedly tripping them and retrying through bursts of 429 errors.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from ragnarok.generate.retry import retry_after_seconds
+from ragnarok.metrics import REGISTRY
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "ragnarok_rate_limit_wait_seconds",
+    "Time a provider call waited for rate-limit capacity.",
+    labels=("model",),
+)
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Short stable identifier for an API key that never exposes the key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def rate_limit_penalty(error: BaseException, default: float = 1.0) -> float | None:
+    """Seconds to pause a key after `error`, or None if it was not a 429.
+
+    Honors a numeric `Retry-After` header when the provider sent one.
+    """
+    message = str(error).lower()
+    if getattr(error, "status_code", None) != 429 and not (
+        "rate limit" in message or "429" in message
+    ):
+        return None
+    requested = retry_after_seconds(error)
+    return default if requested is None else requested
+
+
+class TokenBucket:
+    """A bucket holding up to `capacity` units that refills continuously."""
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if capacity <= 0 or refill_per_second <= 0:
+            raise ValueError("capacity and refill rate must be positive")
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._clock = clock
+        self._level = capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._updated)
+        self._level = min(self.capacity, self._level + elapsed * self.refill_per_second)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now).
+
+        Amounts larger than the bucket are capped at its capacity, so an
+        oversized request waits for a full bucket rather than forever.
+        """
+        now = self._clock()
+        self._refill(now)
+        blocked = max(0.0, self._blocked_until - now)
+        missing = min(amount, self.capacity) - self._level
+        if missing <= 0:
+            return blocked
+        return max(blocked, missing / self.refill_per_second)
+
+    def take(self, amount: float) -> None:
+        self._level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self._level = min(self.capacity, self._level + amount)
+
+    def block_for(self, seconds: float) -> None:
+        """Refuse all capacity for `seconds`, e.g. after the provider said 429."""
+        now = self._clock()
+        self._refill(now)
+        self._level = min(self._level, 0.0)
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+@dataclass(frozen=True)
+class RateLimits:
+    requests_per_minute: int | None = None
+    tokens_per_minute: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+
+class RateLimiter:
+    """RPM/TPM buckets for every (API key, model) pair.
+
+    `acquire` and `async_acquire` block until one request and `tokens` tokens
+    fit in both buckets of the pair and then reserve them together, so a
+    reservation never holds one limit while waiting on the other. After a
+    call, `settle` returns reserved tokens the provider did not bill, and
+    `penalize` pauses a pair that the provider rate-limited anyway.
+    """
+
+    def __init__(
+        self,
+        limits: RateLimits,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.limits = limits
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[str, str], list[tuple[str, TokenBucket]]] = {}
+
+    def _pair(self, key: str, model: str) -> list[tuple[str, TokenBucket]]:
+        pair = self._buckets.get((key, model))
+        if pair is None:
+            pair = []
+            if self.limits.requests_per_minute:
+                rpm = self.limits.requests_per_minute
+                pair.append(("requests", TokenBucket(rpm, rpm / 60, self._clock)))
+            if self.limits.tokens_per_minute:
+                tpm = self.limits.tokens_per_minute
+                pair.append(("tokens", TokenBucket(tpm, tpm / 60, self._clock)))
+            self._buckets[(key, model)] = pair
+        return pair
+
+    def _try_reserve(self, key: str, model: str, tokens: int) -> float:
+        with self._lock:
+            pair = self._pair(key, model)
+            amounts = {"requests": 1, "tokens": tokens}
+            wait = max(
+                (bucket.wait_time(amounts[kind]) for kind, bucket in pair),
+                default=0.0,
+            )
+            if wait <= 0:
+                for kind, bucket in pair:
+                    bucket.take(amounts[kind])
+            return wait
+
+    def acquire(self, key: str, model: str, tokens: int) -> float:
+        """Block until the reservation fits; returns the seconds waited."""
+        waited = 0.0
+        while (wait := self._try_reserve(key, model, tokens)) > 0:
+            self._sleep(wait)
+            waited += wait
+        RATE_LIMIT_WAIT.observe(waited, model=model)
+        return waited
+
+    async def async_acquire(self, key: str, model: str, tokens: int) -> float:
+        waited = 0.0
+        while (wait := self._try_reserve(key, model, tokens)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        RATE_LIMIT_WAIT.observe(waited, model=model)
+        return waited
+
+    def settle(self, key: str, model: str, reserved: int, used: int | None) -> None:
+        """Refund the part of a token reservation the provider did not use."""
+        if used is None or used >= reserved:
+            return
+        with self._lock:
+            for kind, bucket in self._pair(key, model):
+                if kind == "tokens":
+                    bucket.give_back(reserved - used)
+
+    def penalize(self, key: str, model: str, seconds: float) -> None:
+        with self._lock:
+            for _kind, bucket in self._pair(key, model):
+                bucket.block_for(seconds)
+
+
+_shared_limiters: dict[RateLimits, RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    requests_per_minute: int | None = None,
+    tokens_per_minute: int | None = None,
+) -> RateLimiter | None:
+    """Return the process-wide limiter for these limits, or None if unlimited.
+
+    Agents built with the same limits share buckets, so several agents for
+    one key and model (for example with different prompt modes) still stay
+    within the provider's limit together.
+    """
+    limits = RateLimits(requests_per_minute, tokens_per_minute)
+    if not limits.enabled:
+        return None
+    with _shared_lock:
+        limiter = _shared_limiters.get(limits)
+        if limiter is None:
+            limiter = _shared_limiters[limits] = RateLimiter(limits)
+        return limiter
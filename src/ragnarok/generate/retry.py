@@ -0,0 +1,364 @@
+"""Shared retry policy and circuit breaker for provider calls.
+
+Every remote backend retries through `call_with_retry` or
+`async_call_with_retry`: errors are classified, retryable ones are retried
+with exponential backoff and full jitter (or the provider's `Retry-After`),
+and each request stops once it runs out of attempts or passes its deadline.
+A circuit breaker per backend stops calling a backend that keeps failing
+with server, connection or timeout errors; while it is open, requests wait
+for its probe instead of piling more calls onto the backend. Rate limits are
+not outages and are left to the key pool and the backoff.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any
+
+from ragnarok.metrics import REGISTRY, record_retry
+
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "ragnarok_llm_circuit_rejections_total",
+    "Provider calls rejected because the backend's circuit was open.",
+    labels=("backend",),
+)
+
+_CONTEXT_LENGTH_MARKERS = (
+    "maximum context length",
+    "context_length_exceeded",
+)
+_FILTERED_MARKERS = ("the response was filtered", "blocked output")
+_FATAL_MARKERS = (
+    "invalid api key",
+    "incorrect api key",
+    "invalid_api_key",
+    "model_not_found",
+    "does not exist",
+)
+_FATAL_STATUS_CODES = {400, 401, 403, 404, 422}
+_RATE_LIMIT_MARKERS = ("rate limit", "429", "quota")
+_OUTAGE_MARKERS = (
+    "timeout",
+    "timed out",
+    "connection",
+    "server error",
+    "bad gateway",
+    "service unavailable",
+    "overloaded",
+)
+_OUTAGE_ERROR_NAMES = ("Timeout", "Connection", "InternalServer", "Unavailable")
+
+
+class ErrorKind(Enum):
+    RETRYABLE = "retryable"
+    FATAL = "fatal"
+    CONTEXT_LENGTH = "context_length"
+    FILTERED = "filtered"
+
+
+def classify_error(error: BaseException) -> ErrorKind:
+    """Decide whether retrying `error` can help.
+
+    Prompts that exceed the context window and filtered responses fail the
+    same way on every attempt and are reported to the caller; authentication,
+    permission, not-found and malformed-request errors are fatal. Everything
+    else, including rate limits, timeouts, connection and server errors, and
+    errors the provider did not describe, is retried.
+    """
+    message = str(error).lower()
+    if any(marker in message for marker in _CONTEXT_LENGTH_MARKERS):
+        return ErrorKind.CONTEXT_LENGTH
+    if any(marker in message for marker in _FILTERED_MARKERS):
+        return ErrorKind.FILTERED
+    if isinstance(error, (TypeError, ValueError, NotImplementedError)):
+        return ErrorKind.FATAL
+    if getattr(error, "status_code", None) in _FATAL_STATUS_CODES:
+        return ErrorKind.FATAL
+    if any(marker in message for marker in _FATAL_MARKERS):
+        return ErrorKind.FATAL
+    return ErrorKind.RETRYABLE
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Whether `error` says the backend itself is down, not just busy.
+
+    Only server (5xx), connection and timeout errors count against a circuit
+    breaker. Rate-limit and quota errors come from a healthy backend and are
+    handled by the key quarantine and the backoff instead.
+    """
+    message = str(error).lower()
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429 or any(marker in message for marker in _RATE_LIMIT_MARKERS):
+        return False
+    if isinstance(status_code, int):
+        return status_code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    name = type(error).__name__
+    return any(part in name for part in _OUTAGE_ERROR_NAMES) or any(
+        marker in message for marker in _OUTAGE_MARKERS
+    )
+
+
+def _answered_by_backend(error: BaseException) -> bool:
+    """Whether `error` wraps a response the backend actually sent."""
+    return (
+        getattr(error, "status_code", None) is not None
+        or getattr(error, "response", None) is not None
+    )
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """The delay a provider asked for in `Retry-After`/`retry-after-ms`, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        if headers.get("retry-after") is not None:
+            return max(0.0, float(headers["retry-after"]))
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how long one request may retry a provider call.
+
+    `max_attempts` counts the first call; `deadline_s` bounds the time from
+    the first attempt to the start of the last one. Delays grow by
+    `multiplier` from `base_delay_s` up to `max_delay_s`, and `jitter` is the
+    randomized fraction of each delay (1.0 is full jitter).
+    """
+
+    max_attempts: int = 8
+    deadline_s: float | None = 300.0
+    base_delay_s: float = 0.5
+    max_delay_s: float = 60.0
+    multiplier: float = 2.0
+    jitter: float = 1.0
+    honor_retry_after: bool = True
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """Seconds to wait before retrying after the `attempt`-th failure (0-based)."""
+        if self.honor_retry_after:
+            requested = retry_after_seconds(error)
+            if requested is not None:
+                return min(requested, self.max_delay_s)
+        ceiling = min(self.max_delay_s, self.base_delay_s * self.multiplier**attempt)
+        return ceiling * (1 - self.jitter * random.random())
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a backend whose circuit breaker is open.
+
+    `retry_after_s` is how long until the breaker lets a probe through, or 0
+    while another caller's probe is in flight; `reset_timeout_s` is how long
+    the breaker stays open each time it opens.
+    """
+
+    def __init__(
+        self, message: str, retry_after_s: float = 0.0, reset_timeout_s: float = 0.0
+    ) -> None:
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+        self.reset_timeout_s = reset_timeout_s
+
+
+class CircuitBreaker:
+    """Stops calling a backend after `failure_threshold` consecutive failures.
+
+    While open, calls raise `CircuitOpenError`. After `reset_timeout_s` one
+    probe call is let through (half-open): success closes the circuit,
+    failure opens it again for another timeout, and a probe that ends without
+    either (cancelled, or rate limited) frees the slot for the next caller.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or self._clock() - self._opened_at >= self.reset_timeout_s:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """Admit a call or raise `CircuitOpenError`; returns True for the probe."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.reset_timeout_s - self._clock()
+            if not self._probing and remaining <= 0:
+                self._probing = True
+                return True
+            failures = self._failures
+        CIRCUIT_REJECTIONS.inc(backend=self.name)
+        raise CircuitOpenError(
+            f"circuit open for {self.name} after {failures} consecutive failures",
+            retry_after_s=max(0.0, remaining),
+            reset_timeout_s=self.reset_timeout_s,
+        )
+
+    def release_probe(self) -> None:
+        """Let another caller probe after a probe that proved nothing."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if the circuit is open afterwards."""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._probing = False
+            return self._opened_at is not None
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide breaker for a backend, creating it on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def _next_delay(
+    policy: RetryPolicy,
+    attempt: int,
+    error: Exception,
+    elapsed: float,
+    breaker: CircuitBreaker | None,
+    probe: bool = False,
+) -> float:
+    """Account for a failed attempt and return the backoff, or re-raise."""
+    if isinstance(error, CircuitOpenError):
+        # Wait for the breaker's probe rather than failing fast while the
+        # request still has budget left.
+        delay = max(error.retry_after_s, policy.delay(attempt, error))
+    elif classify_error(error) is not ErrorKind.RETRYABLE:
+        if breaker is not None:
+            if _answered_by_backend(error):
+                # The backend answered; the request itself was the problem.
+                breaker.record_success()
+            elif probe:
+                # A local error says nothing about the backend's health.
+                breaker.release_probe()
+        raise error
+    else:
+        if breaker is not None:
+            if is_backend_failure(error):
+                breaker.record_failure()
+            elif probe:
+                breaker.release_probe()
+        delay = policy.delay(attempt, error)
+    if attempt + 1 >= policy.max_attempts:
+        raise error
+    if policy.deadline_s is not None and elapsed + delay > policy.deadline_s:
+        raise error
+    record_retry(error)
+    return delay
+
+
+def call_with_retry[T](
+    call: Callable[[], T],
+    *,
+    policy: RetryPolicy,
+    breaker: CircuitBreaker | None = None,
+    sleep: Callable[[float], Any] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> T:
+    """Run `call` until it succeeds, fails for good, or exhausts `policy`.
+
+    Non-retryable errors and the last retryable error propagate unchanged, so
+    callers keep handling provider exceptions as before.
+    """
+    started = clock()
+    attempt = 0
+    while True:
+        probe = False
+        try:
+            if breaker is not None:
+                probe = breaker.before_call()
+            result = call()
+        except Exception as error:
+            elapsed = clock() - started
+            sleep(_next_delay(policy, attempt, error, elapsed, breaker, probe))
+            attempt += 1
+            continue
+        except BaseException:
+            if probe and breaker is not None:
+                breaker.release_probe()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def async_call_with_retry[T](
+    call: Callable[[], Awaitable[T]],
+    *,
+    policy: RetryPolicy,
+    breaker: CircuitBreaker | None = None,
+    sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> T:
+    """Await `call` until it succeeds, fails for good, or exhausts `policy`.
+
+    The async counterpart of `call_with_retry`; backoff waits with `sleep`
+    so the event loop keeps serving other requests.
+    """
+    started = clock()
+    attempt = 0
+    while True:
+        probe = False
+        try:
+            if breaker is not None:
+                probe = breaker.before_call()
+            result = await call()
+        except Exception as error:
+            elapsed = clock() - started
+            delay = _next_delay(policy, attempt, error, elapsed, breaker, probe)
+            await sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            # A cancelled probe must not leave the breaker half-open forever.
+            if probe and breaker is not None:
+                breaker.release_probe()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
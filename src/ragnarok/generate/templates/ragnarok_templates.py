@@ -1,3 +1,6 @@
+import functools
+import re
+from collections.abc import Callable
 from dataclasses import dataclass
 from typing import Any
 
@@ -56,6 +59,202 @@ _NO_CITE_MODES = {
 }
 
 
+# Private-use sentinels that mark where the query and documents are spliced
+# into a compiled layout.
+_QUERY_SLOT = "\ue000query\ue000"
+_CONTEXT_SLOT = "\ue000context\ue000"
+_SLOTS = re.compile(f"({_QUERY_SLOT}|{_CONTEXT_SLOT})")
+
+
+@functools.lru_cache(maxsize=8192)
+def _fix_segment(text: str) -> str:
+    # ftfy fixes text line by line, so fixing the query and each document on
+    # its own matches fixing the assembled prompt, and repeated documents
+    # (the same candidate across prompt-fitting renders) are fixed once.
+    return fix_text(text)
+
+
+@functools.cache
+def _instructions_by_mode() -> dict[PromptMode, str]:
+    return {
+        PromptMode(mode): get_template(template_name).instruction
+        for mode, template_name in _MODE_TO_TEMPLATE.items()
+    }
+
+
+def model_family(model: str) -> str:
+    """The prompt layout a model gets: `chat`, `chatqa`, or `open`."""
+    if RagnarokTemplates._uses_chat_message_format(model):
+        return "chat"
+    if "chatqa" in model.lower():
+        return "chatqa"
+    return "open"
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """
+    A prompt mode's layout for one model family, ready to be filled in.
+
+    The system message, instruction, separators, and the static text of the
+    user message or single-string prompt are assembled and run through
+    `fix_text` once, when the template is compiled. Rendering only fixes and
+    splices in the query and the documents.
+    """
+
+    prompt_mode: PromptMode
+    family: str
+    system_message: str | None
+    instruction: str
+    sep: str
+    parts: tuple[str, ...]
+
+    def fill(self, query: str, context: list[str]) -> str:
+        """The user message (or single-string prompt) for a query and documents."""
+        filled_context: str | None = None
+        pieces = []
+        for part in self.parts:
+            if part == _QUERY_SLOT:
+                pieces.append(_fix_segment(query))
+            elif part == _CONTEXT_SLOT:
+                if filled_context is None:
+                    filled_context = self.sep.join(
+                        _fix_segment(document) for document in context
+                    )
+                pieces.append(filled_context)
+            else:
+                pieces.append(part)
+        return "".join(pieces)
+
+    def render(self, query: str, context: list[str], model: str) -> RenderedPrompt:
+        text = self.fill(query, context)
+        if self.system_message is None:
+            return RenderedPrompt(
+                format="single_string",
+                prompt_mode=str(self.prompt_mode),
+                model=model,
+                system_message=None,
+                user_message=None,
+                combined_text=text,
+                messages=None,
+                context_separator=self.sep,
+                instruction=self.instruction,
+            )
+        return RenderedPrompt(
+            format="chat_messages",
+            prompt_mode=str(self.prompt_mode),
+            model=model,
+            system_message=self.system_message,
+            user_message=text,
+            combined_text=None,
+            messages=[
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": text},
+            ],
+            context_separator=self.sep,
+            instruction=self.instruction,
+        )
+
+    def compile_chat_template(
+        self, format_messages: Callable[[list[dict[str, str]]], str]
+    ) -> Callable[[str, list[str]], str]:
+        """
+        Precomputes a tokenizer chat template around the query and documents.
+
+        `format_messages` (e.g. `apply_chat_template(..., tokenize=False)`)
+        runs once on messages that hold the slots; the returned function then
+        splices each query and its documents into the formatted scaffold. If
+        the chat template rewrites the slots, every call formats the messages
+        instead.
+        """
+        if self.system_message is None:
+            raise ValueError(f"{self.family} prompts are not chat messages")
+        system_message = self.system_message
+        scaffold = format_messages(
+            [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": "".join(self.parts)},
+            ]
+        )
+        slots = [part for part in self.parts if _SLOTS.fullmatch(part)]
+        scaffold_parts = tuple(_SLOTS.split(scaffold))
+        if [part for part in scaffold_parts if _SLOTS.fullmatch(part)] != slots:
+
+            def format_each(query: str, context: list[str]) -> str:
+                return format_messages(
+                    [
+                        {"role": "system", "content": system_message},
+                        {"role": "user", "content": self.fill(query, context)},
+                    ]
+                )
+
+            return format_each
+        chat_template = CompiledTemplate(
+            prompt_mode=self.prompt_mode,
+            family=self.family,
+            system_message=None,
+            instruction=self.instruction,
+            sep=self.sep,
+            parts=scaffold_parts,
+        )
+        return chat_template.fill
+
+
+def _layout(prompt_mode: PromptMode, family: str, instruction: str) -> str:
+    """The user message or single-string prompt with slots for the inputs."""
+    sep = "\n\n" if family in ("chat", "chatqa") else "\n"
+    if prompt_mode in _NO_CITE_MODES:
+        user_input = (
+            f"Instruction: {instruction}{sep}Query: {_QUERY_SLOT}"
+            f"{sep}Instruction: {instruction}"
+        )
+    elif family == "chat":
+        user_input = (
+            f"Instruction: {instruction}{sep}Documents: {_CONTEXT_SLOT}"
+            f"{sep}Query: {_QUERY_SLOT}{sep}Instruction: {instruction}\n\nAnswer:"
+        )
+    else:
+        user_input = (
+            f"Instruction: {instruction}\n"
+            "The following are context references from which you can cite the "
+            f"identifier. References: {_CONTEXT_SLOT}\n"
+            f"Query: {_QUERY_SLOT}\nInstruction: {instruction}"
+        )
+    if family == "chatqa":
+        system_message = get_template("chatqa").chatqa_system_message
+        return f"{system_message}{sep}Context: {_CONTEXT_SLOT}{sep}User: {user_input}"
+    return user_input
+
+
+@functools.cache
+def compile_template(prompt_mode: PromptMode, family: str) -> CompiledTemplate:
+    """Build (once per process) the compiled layout for a mode and model family."""
+    template_name = _MODE_TO_TEMPLATE.get(prompt_mode.value, "chatqa")
+    ref = get_template(template_name)
+    instruction = _instructions_by_mode().get(
+        prompt_mode, _instructions_by_mode()[PromptMode.CHATQA]
+    )
+    parts = tuple(
+        part if _SLOTS.fullmatch(part) else fix_text(part)
+        for part in _SLOTS.split(_layout(prompt_mode, family, instruction))
+    )
+    system_message = None
+    if family != "chatqa":
+        system_message = (
+            ref.system_message_no_cite
+            if prompt_mode in _NO_CITE_MODES
+            else ref.system_message
+        )
+    return CompiledTemplate(
+        prompt_mode=prompt_mode,
+        family=family,
+        system_message=system_message,
+        instruction=instruction,
+        sep="\n\n" if family in ("chat", "chatqa") else "\n",
+        parts=parts,
+    )
+
+
 class RagnarokTemplates:
     def __init__(self, prompt_mode: PromptMode):
         self.prompt_mode = prompt_mode
@@ -74,24 +273,7 @@ class RagnarokTemplates:
         self.system_message_chatqa = ref.chatqa_system_message
 
         self.sep = "\n\n"
-        self._instruction_by_mode = {
-            PromptMode.CHATQA: get_template("chatqa").instruction,
-            PromptMode.RAGNAROK_V2: get_template("ragnarok_v2").instruction,
-            PromptMode.RAGNAROK_V3: get_template("ragnarok_v3").instruction,
-            PromptMode.RAGNAROK_V4: get_template("ragnarok_v4").instruction,
-            PromptMode.RAGNAROK_V4_NO_CITE: get_template(
-                "ragnarok_v4_no_cite"
-            ).instruction,
-            PromptMode.RAGNAROK_V4_BIOGEN: get_template(
-                "ragnarok_v4_biogen"
-            ).instruction,
-            PromptMode.RAGNAROK_V5_BIOGEN: get_template(
-                "ragnarok_v5_biogen"
-            ).instruction,
-            PromptMode.RAGNAROK_V5_BIOGEN_NO_CITE: get_template(
-                "ragnarok_v5_biogen_no_cite"
-            ).instruction,
-        }
+        self._instruction_by_mode = _instructions_by_mode()
 
     @property
     def template(self) -> PromptTemplate | None:
@@ -105,120 +287,11 @@ class RagnarokTemplates:
             for name in ("command-r", "chatqa", "llama", "mistral", "qwen")
         )
 
-    def render(self, query: str, context: list[str], model: str) -> RenderedPrompt:
-        sep = self.sep
-        if not (self._uses_chat_message_format(model) or "chatqa" in model.lower()):
-            sep = "\n"
-        str_context = sep.join(context)
-        instruction = self.get_instruction()
-
-        if self.prompt_mode in _NO_CITE_MODES:
-            user_input_context = (
-                f"Instruction: {instruction}"
-                + sep
-                + f"Query: {query}"
-                + sep
-                + f"Instruction: {instruction}"
-            )
-        elif self._uses_chat_message_format(model):
-            user_input_context = (
-                f"Instruction: {instruction}"
-                + sep
-                + f"Documents: {fix_text(str_context)}"
-                + sep
-                + f"Query: {query}"
-                + sep
-                + f"Instruction: {instruction}"
-            )
-            user_input_context += "\n\nAnswer:"
-        else:
-            user_input_context = (
-                f"Instruction: {instruction}"
-                + "\n"
-                + f"The following are context references from which you can cite the identifier. References: {fix_text(str_context)}"
-                + "\n"
-                + f"Query: {query}"
-                + "\n"
-                + f"Instruction: {instruction}"
-            )
+    def compiled(self, model: str) -> CompiledTemplate:
+        return compile_template(self.prompt_mode, model_family(model))
 
-        if self._uses_chat_message_format(model):
-            messages = []
-            system_message = (
-                self.system_message_gpt_no_cite
-                if self.prompt_mode in _NO_CITE_MODES
-                else self.system_message_gpt
-            )
-            messages.append(
-                {
-                    "role": "system",
-                    "content": system_message,
-                }
-            )
-            messages.append(
-                {
-                    "role": "user",
-                    "content": fix_text(user_input_context),
-                }
-            )
-            return RenderedPrompt(
-                format="chat_messages",
-                prompt_mode=str(self.prompt_mode),
-                model=model,
-                system_message=system_message,
-                user_message=fix_text(user_input_context),
-                combined_text=None,
-                messages=messages,
-                context_separator=sep,
-                instruction=instruction,
-            )
-        elif "chatqa" in model.lower():
-            prompt = (
-                f"{self.system_message_chatqa}{sep}Context: {str_context}"
-                f"{sep}User: {user_input_context}"
-            )
-        else:
-            system_message = (
-                self.system_message_gpt_no_cite
-                if self.prompt_mode in _NO_CITE_MODES
-                else self.system_message_gpt
-            )
-            messages = []
-            messages.append(
-                {
-                    "role": "system",
-                    "content": system_message,
-                }
-            )
-            messages.append(
-                {
-                    "role": "user",
-                    "content": fix_text(user_input_context),
-                }
-            )
-            return RenderedPrompt(
-                format="chat_messages",
-                prompt_mode=str(self.prompt_mode),
-                model=model,
-                system_message=system_message,
-                user_message=fix_text(user_input_context),
-                combined_text=None,
-                messages=messages,
-                context_separator=sep,
-                instruction=instruction,
-            )
-        prompt = fix_text(prompt)
-        return RenderedPrompt(
-            format="single_string",
-            prompt_mode=str(self.prompt_mode),
-            model=model,
-            system_message=None,
-            user_message=None,
-            combined_text=prompt,
-            messages=None,
-            context_separator=sep,
-            instruction=instruction,
-        )
+    def render(self, query: str, context: list[str], model: str) -> RenderedPrompt:
+        return self.compiled(model).render(query, context, model)
 
     def __call__(self, query: str, context: list[str], model: str) -> Any:
         return self.render(query, context, model).runtime_prompt()
@@ -0,0 +1,202 @@
+"""Shared, memoized token counting for prompt fitting and accounting.
+
+Prompts are counted piece by piece: message text is split into lines (each
+ranked candidate segment is one line of the rendered context), every line is
+counted once and memoized by content hash, and per-message overheads are
+added on top. Re-counting a prompt during the fitting loop, or for another
+request that shares candidates, then costs a hash and a dict lookup per line
+instead of a full re-encode. tiktoken's pre-tokenizer never merges tokens
+across a newline boundary except for runs of whitespace, so for its encodings
+the sum is the exact count or a slight overestimate, which is the safe
+direction for fitting a context window. SentencePiece and other Hugging Face
+tokenizers make no such promise (a line encoded on its own may gain or lose a
+word-boundary marker), so their counters are built with `per_line=False` and
+count each text whole.
+"""
+
+import hashlib
+import importlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from types import ModuleType
+from typing import Any
+
+DEFAULT_ENCODING = "cl100k_base"
+_CACHE_SIZE = 65536
+
+# Mirrors the cl100k pre-tokenizer; words longer than four characters are
+# assumed to split into several BPE pieces.
+_APPROXIMATE_PIECES = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?\w+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+"""
+)
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate a BPE token count without any encoder files.
+
+    Used when no tokenizer is installed or its encoding cannot be loaded
+    (for example when tiktoken would have to download it while offline).
+    """
+    return sum(
+        max(1, math.ceil(len(piece.strip()) / 4))
+        for piece in _APPROXIMATE_PIECES.findall(text)
+    )
+
+
+class TokenCounter:
+    """Counts prompt tokens with one encoder and an LRU of line counts.
+
+    `count_tokens` encodes a single piece of text, and `truncate_tokens`,
+    when the encoder can decode, cuts a text to its first N tokens. The LRU
+    is keyed by a content hash, so long passages are not kept alive by the
+    cache. With `per_line=False` texts are counted whole rather than line by
+    line, for tokenizers whose per-line counts do not add up to the whole.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        truncate_tokens: Callable[[str, int], str] | None = None,
+        cache_size: int = _CACHE_SIZE,
+        per_line: bool = True,
+    ) -> None:
+        self._count_tokens = count_tokens
+        self._per_line = per_line
+        self._truncate_tokens = truncate_tokens
+        self._cache_size = cache_size
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count_line(self, line: str) -> int:
+        if not line:
+            return 0
+        key = hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+        count = self._count_tokens(line)
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            if len(self._counts) > self._cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def count_text(self, text: str) -> int:
+        """Tokens in `text`; summed line by line unless `per_line` is off."""
+        if not self._per_line:
+            return self._count_line(text)
+        lines = text.split("\n")
+        return sum(self._count_line(line) for line in lines) + len(lines) - 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut `text` to at most `max_tokens` tokens.
+
+        Without a decoder, this keeps the longest word prefix that fits.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self._truncate_tokens is not None:
+            return self._truncate_tokens(text, max_tokens).rstrip()
+        words = text.split(" ")
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._count_tokens(" ".join(words[:middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low])
+
+    def _count_value(self, value: Any) -> int:
+        if isinstance(value, str):
+            return self.count_text(value)
+        if isinstance(value, dict):
+            return sum(self._count_value(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(self._count_value(item) for item in value)
+        return 0
+
+    def count(
+        self,
+        prompt: str | list[dict[str, Any]],
+        *,
+        tokens_per_message: int = 0,
+        tokens_per_name: int = 0,
+    ) -> int:
+        """Count a plain-text prompt or a list of chat messages.
+
+        Every message adds `tokens_per_message`, and a `name` field adds
+        `tokens_per_name`, on top of the tokens of all its values.
+        """
+        if isinstance(prompt, str):
+            return self.count_text(prompt)
+        num_tokens = 0
+        for message in prompt:
+            num_tokens += tokens_per_message + self._count_value(message)
+            if "name" in message:
+                num_tokens += tokens_per_name
+        return num_tokens
+
+
+def _load_tiktoken_encoding(model: str, module: ModuleType | None) -> Any:
+    if module is None:
+        try:
+            module = importlib.import_module("tiktoken")
+        except ImportError:
+            return None
+    for loader, name in (
+        ("encoding_for_model", model),
+        ("get_encoding", DEFAULT_ENCODING),
+    ):
+        try:
+            return getattr(module, loader)(name)
+        except Exception:
+            continue
+    return None
+
+
+def _tiktoken_counter(model: str, module: ModuleType | None) -> TokenCounter:
+    encoding = _load_tiktoken_encoding(model, module)
+    if encoding is None:
+        return TokenCounter(approximate_token_count)
+
+    def truncate(text: str, max_tokens: int) -> str:
+        # A cut inside a multi-byte character decodes to U+FFFD.
+        decoded = encoding.decode(encoding.encode(text)[:max_tokens])
+        return str(decoded).rstrip("\ufffd")
+
+    return TokenCounter(
+        lambda text: len(encoding.encode(text)),
+        truncate if hasattr(encoding, "decode") else None,
+    )
+
+
+_counters: dict[tuple[str, ModuleType | None], TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(
+    model: str, tiktoken_module: ModuleType | None = None
+) -> TokenCounter:
+    """Return the process-wide tiktoken-based counter for `model`.
+
+    The encoding is resolved once per model: the model's own tiktoken
+    encoding, then `cl100k_base`, then `approximate_token_count` when
+    tiktoken is missing or cannot load either. Pass `tiktoken_module` to use
+    an already imported tiktoken module.
+    """
+    key = (model, tiktoken_module)
+    with _counters_lock:
+        counter = _counters.get(key)
+        if counter is None:
+            counter = _counters[key] = _tiktoken_counter(model, tiktoken_module)
+        return counter
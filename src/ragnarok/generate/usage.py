@@ -0,0 +1,179 @@
+"""Provider-reported token usage and its cost.
+
+Backends record what the provider billed for each call in `RAGExecInfo`:
+prompt and completion tokens, the reasoning and cached-prompt tokens inside
+them, and the cost from a per-backend pricing table. When a provider does not
+report usage, the counts fall back to the local tokenizer estimate and
+`usage_source` says so.
+"""
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from ragnarok.data import RAGExecInfo
+
+
+@dataclass(frozen=True)
+class TokenUsage:
+    input_tokens: int
+    output_tokens: int
+    reasoning_tokens: int | None = None
+    cached_tokens: int | None = None
+
+
+@dataclass(frozen=True)
+class ModelPricing:
+    """List prices in USD per million tokens."""
+
+    input: float
+    output: float
+    cached_input: float | None = None
+
+    def cost(self, usage: TokenUsage) -> float:
+        cached = usage.cached_tokens or 0
+        cached_price = self.input if self.cached_input is None else self.cached_input
+        return (
+            (usage.input_tokens - cached) * self.input
+            + cached * cached_price
+            + usage.output_tokens * self.output
+        ) / 1_000_000
+
+
+# Model-name prefixes to list prices, matched longest first. Dated snapshots
+# ("gpt-4o-2024-08-06") and provider prefixes ("openai/gpt-4o") resolve to
+# their base model.
+OPENAI_PRICING = {
+    "gpt-3.5-turbo": ModelPricing(0.5, 1.5),
+    "gpt-4": ModelPricing(30.0, 60.0),
+    "gpt-4-32k": ModelPricing(60.0, 120.0),
+    "gpt-4-turbo": ModelPricing(10.0, 30.0),
+    "gpt-4o": ModelPricing(2.5, 10.0, 1.25),
+    "gpt-4o-mini": ModelPricing(0.15, 0.6, 0.075),
+    "gpt-4.1": ModelPricing(2.0, 8.0, 0.5),
+    "gpt-4.1-mini": ModelPricing(0.4, 1.6, 0.1),
+    "gpt-4.1-nano": ModelPricing(0.1, 0.4, 0.025),
+    "gpt-5": ModelPricing(1.25, 10.0, 0.125),
+    "gpt-5-mini": ModelPricing(0.25, 2.0, 0.025),
+    "gpt-5-nano": ModelPricing(0.05, 0.4, 0.005),
+    "o1": ModelPricing(15.0, 60.0, 7.5),
+    "o1-mini": ModelPricing(1.1, 4.4, 0.55),
+    "o3": ModelPricing(2.0, 8.0, 0.5),
+    "o3-mini": ModelPricing(1.1, 4.4, 0.55),
+    "o4-mini": ModelPricing(1.1, 4.4, 0.275),
+}
+COHERE_PRICING = {
+    "command-r": ModelPricing(0.15, 0.6),
+    "command-r-plus": ModelPricing(2.5, 10.0),
+}
+
+
+def find_pricing(model: str, table: dict[str, ModelPricing]) -> ModelPricing | None:
+    name = model.lower().rsplit("/", 1)[-1]
+    for prefix in sorted(table, key=len, reverse=True):
+        if name == prefix or name.startswith(prefix + "-"):
+            return table[prefix]
+    return None
+
+
+def _field(value: Any, name: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def _first_int(value: Any, *names: str) -> int | None:
+    for name in names:
+        found = _field(value, name)
+        if isinstance(found, (int, float)):
+            return int(found)
+    return None
+
+
+def openai_usage(usage: Any) -> TokenUsage | None:
+    """Parse the `usage` of a chat-completions or responses call (object or dict)."""
+    if usage is None:
+        return None
+    input_tokens = _first_int(usage, "prompt_tokens", "input_tokens")
+    output_tokens = _first_int(usage, "completion_tokens", "output_tokens")
+    if input_tokens is None or output_tokens is None:
+        return None
+    input_details = _field(usage, "prompt_tokens_details") or _field(
+        usage, "input_tokens_details"
+    )
+    output_details = _field(usage, "completion_tokens_details") or _field(
+        usage, "output_tokens_details"
+    )
+    return TokenUsage(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        reasoning_tokens=_first_int(output_details, "reasoning_tokens"),
+        cached_tokens=_first_int(input_details, "cached_tokens"),
+    )
+
+
+def cohere_usage(meta: Any) -> TokenUsage | None:
+    """Parse the billed units (or, failing that, the token counts) of a chat call."""
+    for name in ("billed_units", "tokens"):
+        units = _field(meta, name)
+        input_tokens = _first_int(units, "input_tokens")
+        output_tokens = _first_int(units, "output_tokens")
+        if input_tokens is not None and output_tokens is not None:
+            return TokenUsage(input_tokens, output_tokens)
+    return None
+
+
+def account_usage(
+    rag_exec_info: RAGExecInfo,
+    usage: TokenUsage | None,
+    pricing: ModelPricing | None,
+) -> RAGExecInfo:
+    """Store provider-reported `usage`, if any, and the cost of the call."""
+    if usage is not None:
+        rag_exec_info.input_token_count = usage.input_tokens
+        rag_exec_info.output_token_count = usage.output_tokens
+        rag_exec_info.reasoning_token_count = usage.reasoning_tokens
+        rag_exec_info.cached_token_count = usage.cached_tokens
+        rag_exec_info.usage_source = "provider"
+    if pricing is not None:
+        rag_exec_info.cost_usd = pricing.cost(
+            TokenUsage(
+                rag_exec_info.input_token_count,
+                rag_exec_info.output_token_count,
+                cached_tokens=rag_exec_info.cached_token_count,
+            )
+        )
+    return rag_exec_info
+
+
+def summarize_usage(
+    rag_exec_infos: Iterable[RAGExecInfo | None], elapsed_s: float
+) -> dict[str, Any]:
+    """Totals for one run: tokens, cost, and output tokens per second."""
+    summary: dict[str, Any] = {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "reasoning_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": None,
+        "provider_reported_calls": 0,
+        "estimated_calls": 0,
+    }
+    for info in rag_exec_infos:
+        if info is None:
+            continue
+        summary["input_tokens"] += info.input_token_count
+        summary["output_tokens"] += info.output_token_count
+        summary["reasoning_tokens"] += info.reasoning_token_count or 0
+        summary["cached_tokens"] += info.cached_token_count or 0
+        if info.cost_usd is not None:
+            summary["cost_usd"] = (summary["cost_usd"] or 0.0) + info.cost_usd
+        if info.usage_source == "provider":
+            summary["provider_reported_calls"] += 1
+        else:
+            summary["estimated_calls"] += 1
+    summary["elapsed_s"] = round(elapsed_s, 3)
+    summary["output_tokens_per_second"] = (
+        round(summary["output_tokens"] / elapsed_s, 2) if elapsed_s > 0 else None
+    )
+    return summary
@@ -0,0 +1,351 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+The generation stack records counters and latency histograms here so that
+`ragnarok serve` can expose them on `/metrics` without any external collector
+or client library. Everything is kept in memory and is safe to update from the
+worker threads used by the sync execution path.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from typing import Any
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _label_values(self, label_values: Mapping[str, Any]) -> LabelValues:
+        if set(label_values) != set(self.labels):
+            raise ValueError(
+                f"{self.name} expects labels {list(self.labels)}, "
+                f"got {sorted(label_values)}"
+            )
+        return tuple(str(label_values[name]) for name in self.labels)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...]) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **label_values: Any) -> None:
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        key = self._label_values(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **label_values: Any) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(label_values), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **label_values: Any) -> None:
+        key = self._label_values(label_values)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **label_values: Any) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._label_values(label_values), []))
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted(
+                (key, list(counts), self._sums[key])
+                for key, counts in self._counts.items()
+            )
+        lines = self.header()
+        bucket_labels = (*self.labels, "le")
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                labels = _format_labels(bucket_labels, (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+StatsCollector = Callable[[], Mapping[str, Any]]
+
+
+def render_stats_gauges(prefix: str, stats: Mapping[str, Any]) -> list[str]:
+    """Render the numeric entries of a `stats()` dict as gauges named `prefix_<key>`."""
+    lines: list[str] = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, int | float):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: dict[str, StatsCollector] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != (
+                    metric.labels
+                ):
+                    raise ValueError(f"metric {metric.name} is already registered")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(
+        self, name: str, help_text: str, labels: tuple[str, ...] = ()
+    ) -> Counter:
+        counter: Counter = self._register(Counter(name, help_text, labels))
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        histogram: Histogram = self._register(
+            Histogram(name, help_text, labels, buckets)
+        )
+        return histogram
+
+    def register_collector(self, prefix: str, collector: StatsCollector) -> None:
+        """Export a component's `stats()` as gauges on every scrape.
+
+        Registering the same prefix again replaces the previous collector.
+        """
+        with self._lock:
+            self._collectors[prefix] = collector
+
+    def render(self, extra_stats: Mapping[str, Mapping[str, Any]] | None = None) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = dict(self._collectors)
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, collector in collectors.items():
+            lines.extend(render_stats_gauges(prefix, collector()))
+        for prefix, stats in (extra_stats or {}).items():
+            lines.extend(render_stats_gauges(prefix, stats))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "ragnarok_stage_latency_seconds",
+    "Latency of each generation stage.",
+    labels=("stage",),
+)
+INPUT_TOKENS = REGISTRY.counter(
+    "ragnarok_input_tokens_total",
+    "Prompt tokens sent to the model.",
+    labels=("model",),
+)
+OUTPUT_TOKENS = REGISTRY.counter(
+    "ragnarok_output_tokens_total",
+    "Output tokens reported in RAGExecInfo.",
+    labels=("model",),
+)
+REASONING_TOKENS = REGISTRY.counter(
+    "ragnarok_reasoning_tokens_total",
+    "Provider-reported reasoning tokens included in the output tokens.",
+    labels=("model",),
+)
+CACHED_TOKENS = REGISTRY.counter(
+    "ragnarok_cached_input_tokens_total",
+    "Provider-reported prompt tokens served from the prompt cache.",
+    labels=("model",),
+)
+LLM_COST = REGISTRY.counter(
+    "ragnarok_llm_cost_usd_total",
+    "Estimated spend from the backend pricing tables, in USD.",
+    labels=("model",),
+)
+LLM_CALLS = REGISTRY.counter(
+    "ragnarok_llm_calls_total",
+    "Model calls by where their token counts came from.",
+    labels=("model", "usage_source"),
+)
+OUTPUT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ragnarok_output_tokens_per_second",
+    "Output tokens per second of model call time.",
+    labels=("model",),
+    buckets=(1.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0),
+)
+LLM_RETRIES = REGISTRY.counter(
+    "ragnarok_llm_retries_total",
+    "Provider calls retried after an error.",
+    labels=("reason",),
+)
+KEY_ROTATIONS = REGISTRY.counter(
+    "ragnarok_api_key_rotations_total",
+    "Times a provider client rotated to the next API key.",
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "ragnarok_http_requests_total",
+    "HTTP requests handled by ragnarok serve.",
+    labels=("route", "status"),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "ragnarok_http_request_latency_seconds",
+    "Time to produce the response headers for each route.",
+    labels=("route",),
+)
+
+
+class StageTiming:
+    """The wall time of a `stage_timer` block, set when the block exits."""
+
+    elapsed: float | None = None
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[StageTiming]:
+    """Record the wall time of a generation stage in `STAGE_LATENCY`."""
+    timing = StageTiming()
+    started = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.elapsed = time.perf_counter() - started
+        STAGE_LATENCY.observe(timing.elapsed, stage=stage)
+
+
+def record_token_usage(model: str, rag_exec_info: Any) -> None:
+    if rag_exec_info is None:
+        return
+    output_tokens = max(0, int(rag_exec_info.output_token_count or 0))
+    INPUT_TOKENS.inc(max(0, int(rag_exec_info.input_token_count or 0)), model=model)
+    OUTPUT_TOKENS.inc(output_tokens, model=model)
+    reasoning_tokens = getattr(rag_exec_info, "reasoning_token_count", None)
+    if reasoning_tokens:
+        REASONING_TOKENS.inc(reasoning_tokens, model=model)
+    cached_tokens = getattr(rag_exec_info, "cached_token_count", None)
+    if cached_tokens:
+        CACHED_TOKENS.inc(cached_tokens, model=model)
+    cost = getattr(rag_exec_info, "cost_usd", None)
+    if cost is not None:
+        LLM_COST.inc(max(0.0, cost), model=model)
+    LLM_CALLS.inc(
+        model=model,
+        usage_source=getattr(rag_exec_info, "usage_source", "estimated"),
+    )
+    seconds = getattr(rag_exec_info, "generation_seconds", None)
+    if seconds:
+        OUTPUT_TOKENS_PER_SECOND.observe(output_tokens / seconds, model=model)
+
+
+def record_retry(error: BaseException | str) -> None:
+    """Count one retried provider call, bucketed by a coarse error reason."""
+    message = str(error).lower()
+    if "rate limit" in message or "429" in message:
+        reason = "rate_limit"
+    elif "timeout" in message or "timed out" in message:
+        reason = "timeout"
+    elif "connection" in message:
+        reason = "connection"
+    else:
+        reason = "other"
+    LLM_RETRIES.inc(reason=reason)
@@ -0,0 +1,69 @@
+"""Measure how many prompts per second `RagnarokTemplates` renders.
+
+Renders a synthetic query with `--topk` ranked passages for every template
+prompt mode and model family, e.g.
+
+    python -m ragnarok.scripts.benchmark_prompt_render --topk 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from ragnarok.generate.llm import SUPPORTED_TEMPLATE_PROMPT_MODES
+from ragnarok.generate.templates.ragnarok_templates import RagnarokTemplates
+
+MODELS = ("gpt-4o", "llama-3.1-8b-instruct", "chatqa-1.5-8b")
+PASSAGE = (
+    "The life cycle of a flea can last anywhere from 20 days to an entire "
+    "year, depending on temperature and humidity. Café owners in Zürich "
+    "report that fleas rarely survive the winter indoors. "
+)
+
+
+def benchmark(topk: int, passage_words: int, seconds: float) -> list[dict[str, object]]:
+    words = (PASSAGE * (passage_words // len(PASSAGE.split()) + 1)).split()
+    context = [
+        f"[{rank}] {' '.join(words[:passage_words])}" for rank in range(1, topk + 1)
+    ]
+    rows: list[dict[str, object]] = []
+    for prompt_mode in SUPPORTED_TEMPLATE_PROMPT_MODES:
+        for model in MODELS:
+            renders = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                RagnarokTemplates(prompt_mode)("how long do fleas live", context, model)
+                renders += 1
+            elapsed = time.perf_counter() - started
+            rows.append(
+                {
+                    "prompt_mode": str(prompt_mode),
+                    "model": model,
+                    "renders_per_second": renders / elapsed,
+                }
+            )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topk", type=int, default=20)
+    parser.add_argument("--passage-words", type=int, default=120)
+    parser.add_argument(
+        "--seconds", type=float, default=0.5, help="Time spent per mode and model."
+    )
+    args = parser.parse_args()
+    rows = benchmark(args.topk, args.passage_words, args.seconds)
+    for row in rows:
+        print(
+            f"{row['prompt_mode']:<28} {row['model']:<24} "
+            f"{row['renders_per_second']:>10.1f} renders/s"
+        )
+    total = sum(float(str(row["renders_per_second"])) for row in rows) / len(rows)
+    print(f"{'mean':<53} {total:>10.1f} renders/s")
+
+
+if __name__ == "__main__":
+    main()
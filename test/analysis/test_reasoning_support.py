@@ -494,6 +494,7 @@ class TestReasoningSupport(unittest.TestCase):
         fake_openai.Completion = type(
             "CompletionNamespace", (), {"create": staticmethod(fake_create)}
         )
+        fake_openai.OpenAI = lambda **kwargs: SimpleNamespace(chat=fake_openai.chat)
 
         fake_tiktoken = ModuleType("tiktoken")
         fake_tiktoken.get_encoding = staticmethod(
@@ -606,10 +607,9 @@ class TestReasoningSupport(unittest.TestCase):
                     ]
                 )
 
-            model._async_client = SimpleNamespace(
+            model._key_pool.slots[0].async_client = SimpleNamespace(
                 chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
             )
-            model._async_client_key_id = model._cur_key_id
 
             answers, rag_exec_info = asyncio.run(
                 model.async_run_llm(
@@ -826,10 +826,9 @@ class TestReasoningSupport(unittest.TestCase):
                     ],
                 )
 
-            model._async_client = SimpleNamespace(
+            model._key_pool.slots[0].async_client = SimpleNamespace(
                 responses=SimpleNamespace(create=fake_create)
             )
-            model._async_client_key_id = model._cur_key_id
 
             answers, rag_exec_info = asyncio.run(
                 model.async_run_llm(
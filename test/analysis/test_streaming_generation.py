@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import unittest
+from collections.abc import AsyncIterator
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import CitedSentence, RAGExecInfo, Request
+from ragnarok.generate.llm import LLM, GenerationEvent, PromptMode
+from ragnarok.generate.post_processor import StreamingCitationParser
+
+pytestmark = pytest.mark.core
+
+
+def _parse_in_chunks(text: str, size: int) -> list[CitedSentence]:
+    parser = StreamingCitationParser()
+    sentences: list[CitedSentence] = []
+    for start in range(0, len(text), size):
+        sentences.extend(parser.feed(text[start : start + size]))
+    sentences.extend(parser.flush())
+    return sentences
+
+
+def _request() -> Request:
+    from ragnarok.cli.normalize import normalize_direct_generate_input
+
+    request: Request = normalize_direct_generate_input(
+        {
+            "query": {"text": "capital of france", "qid": "q1"},
+            "candidates": [
+                {"docid": "d1", "doc": {"segment": "Paris is the capital."}},
+                {"docid": "d2", "doc": {"segment": "France is in Europe."}},
+            ],
+        }
+    )
+    return request
+
+
+async def _collect(events: AsyncIterator[GenerationEvent]) -> list[GenerationEvent]:
+    return [event async for event in events]
+
+
+class TestStreamingCitationParser(unittest.TestCase):
+    def test_sentences_are_identical_for_any_chunking(self) -> None:
+        text = (
+            "<think>plan. more</think>Paris is the capital of France [1]. "
+            "It has 2.1 million people [1][2]. It is old\n"
+            "Note: ignore this line.\nLast line [2]."
+        )
+        expected = [
+            ("Paris is the capital of France.", [0]),
+            ("It has 2.1 million people.", [0, 1]),
+            ("It is old", []),
+            ("Last line.", [1]),
+        ]
+        for size in (1, 4, 11, len(text)):
+            sentences = _parse_in_chunks(text, size)
+            self.assertEqual(
+                [(sentence.text, sentence.citations) for sentence in sentences],
+                expected,
+                msg=f"chunk size {size}",
+            )
+
+    def test_sentence_is_held_until_its_citations_close(self) -> None:
+        parser = StreamingCitationParser()
+
+        self.assertEqual(parser.feed("Paris is the capital."), [])
+        self.assertEqual(parser.feed(" [1]"), [])
+        sentences = parser.feed(" Next")
+
+        self.assertEqual(
+            sentences, [CitedSentence(text="Paris is the capital.", citations=[0])]
+        )
+        self.assertEqual(parser.flush(), [CitedSentence(text="Next", citations=[])])
+
+
+class ReplayLLM(LLM):
+    def __init__(self) -> None:
+        super().__init__(
+            model="dummy", context_size=1024, prompt_mode=PromptMode.CHATQA
+        )
+
+    def run_llm(
+        self, prompt: str | list[dict[str, str]], logging: bool = False
+    ) -> tuple[Any, Any]:
+        return (
+            [
+                CitedSentence(text="First.", citations=[1]),
+                CitedSentence(text="Second.", citations=[]),
+            ],
+            RAGExecInfo(
+                prompt=prompt,
+                response="First [2]. Second.",
+                input_token_count=1,
+                output_token_count=2,
+            ),
+        )
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        return "prompt", 1
+
+    def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
+        return 1
+
+    def cost_per_1k_token(self, input_token: bool) -> float:
+        return 0.0
+
+
+class TestAsyncAnswerStream(unittest.TestCase):
+    def test_non_streaming_backends_replay_sentences(self) -> None:
+        events = asyncio.run(_collect(ReplayLLM().async_answer_stream(_request(), 2)))
+
+        self.assertEqual(
+            [event.event for event in events],
+            ["delta", "sentence", "delta", "sentence", "done"],
+        )
+        self.assertEqual(events[1].data.text, "First.")
+        self.assertEqual(events[-1].data.references, ["d2"])
+
+    def test_safe_openai_streams_chat_completions(self) -> None:
+        fake_openai = ModuleType("openai")
+        fake_openai.api_key = None  # type: ignore[attr-defined]
+        fake_openai.chat = SimpleNamespace()  # type: ignore[attr-defined]
+        fake_tiktoken = ModuleType("tiktoken")
+        fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+            encode=lambda text: list(text)
+        )
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+
+        class FakeGPTPostProcessor:
+            def __call__(
+                self, response: str
+            ) -> tuple[list[CitedSentence], dict[str, Any]]:
+                return (
+                    [CitedSentence(text=response, citations=[0])],
+                    {"text": response, "citations": []},
+                )
+
+        fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+        fake_post_processor.StreamingCitationParser = StreamingCitationParser  # type: ignore[attr-defined]
+        chunks = ["Paris is", " the capital [1].", " Lovely city", " [2]."]
+        recorded_kwargs: dict[str, Any] = {}
+        closed: list[bool] = []
+        in_flight: list[int] = []
+
+        class FakeStream:
+            async def __aiter__(self) -> AsyncIterator[Any]:
+                for chunk in chunks:
+                    in_flight.append(model._key_pool.slots[0].in_flight)
+                    yield SimpleNamespace(
+                        choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))]
+                    )
+                usage = SimpleNamespace(
+                    prompt_tokens=7, completion_tokens=5, total_tokens=12
+                )
+                yield SimpleNamespace(choices=[], usage=usage)
+
+            async def close(self) -> None:
+                closed.append(True)
+
+        async def fake_create(**kwargs: Any) -> FakeStream:
+            recorded_kwargs.update(kwargs)
+            return FakeStream()
+
+        async def first_event_then_disconnect() -> GenerationEvent:
+            events = model.async_answer_stream(_request(), 2)
+            event = await anext(events)
+            await events.aclose()  # type: ignore[attr-defined]
+            return event
+
+        with patch.dict(
+            sys.modules,
+            {
+                "openai": fake_openai,
+                "tiktoken": fake_tiktoken,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        ):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            model = SafeOpenai(
+                model="gpt-4o",
+                context_size=1024,
+                prompt_mode=PromptMode.CHATQA,
+                keys=["test-key"],
+            )
+            model._key_pool.slots[0].async_client = SimpleNamespace(
+                chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+            )
+            model.create_prompt = lambda request, topk: (  # type: ignore[method-assign]
+                [{"role": "user", "content": "q"}],
+                1,
+            )
+            events = asyncio.run(_collect(model.async_answer_stream(_request(), 2)))
+            self.assertEqual(closed, [True])
+            self.assertEqual(model._key_pool.slots[0].in_flight, 0)
+            asyncio.run(first_event_then_disconnect())
+            self.assertEqual(model._key_pool.slots[0].in_flight, 0)
+        sys.modules.pop("ragnarok.generate.gpt", None)
+
+        self.assertEqual(closed, [True, True])
+        self.assertEqual(in_flight[:4], [1, 1, 1, 1])
+        self.assertTrue(recorded_kwargs["stream"])
+        self.assertEqual(recorded_kwargs["stream_options"], {"include_usage": True})
+        summary = events[-1].data.rag_exec_summary
+        self.assertEqual(
+            (summary.input_token_count, summary.usage_source), (7, "provider")
+        )
+        self.assertEqual(
+            [event.data for event in events if event.event == "delta"], chunks
+        )
+        self.assertEqual(
+            [
+                (event.data.text, event.data.citations)
+                for event in events
+                if event.event == "sentence"
+            ],
+            [("Paris is the capital.", [0]), ("Lovely city.", [1])],
+        )
+        self.assertEqual(events[-1].event, "done")
+        self.assertEqual(
+            events[-1].data.rag_exec_summary.response["text"],
+            "".join(chunks),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
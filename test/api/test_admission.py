@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.api.admission import AdmissionController, AdmissionRejected
+from ragnarok.api.agent_pool import AgentPool
+from ragnarok.api.runtime import (
+    ServerConfig,
+    acquire_admission,
+    acquire_batch_admission,
+)
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+from ragnarok.generate.llm import LLM, PromptMode
+
+pytestmark = pytest.mark.core
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_queues_beyond_max_in_flight_and_admits_in_order(self) -> None:
+        order: list[str] = []
+
+        async def run() -> list[dict[str, Any]]:
+            controller = AdmissionController(max_in_flight=1, max_queue_depth=4)
+            first = await controller.acquire()
+
+            async def waiter(name: str) -> dict[str, Any]:
+                ticket = await controller.acquire()
+                order.append(name)
+                controller.release(ticket)
+                return ticket.metrics()
+
+            waiters = [asyncio.create_task(waiter(name)) for name in ("a", "b")]
+            await asyncio.sleep(0.02)
+            self.assertEqual(controller.stats()["queued"], 2)
+            controller.release(first)
+            return list(await asyncio.gather(*waiters))
+
+        metrics = asyncio.run(run())
+
+        self.assertEqual(order, ["a", "b"])
+        self.assertEqual([entry["queue_depth"] for entry in metrics], [0, 1])
+        self.assertGreater(metrics[0]["queue_wait_ms"], 10)
+
+    def test_rejects_when_queue_is_full(self) -> None:
+        async def run() -> AdmissionRejected:
+            controller = AdmissionController(
+                max_in_flight=1, max_queue_depth=0, retry_after_s=2.5
+            )
+            await controller.acquire()
+            with self.assertRaises(AdmissionRejected) as raised:
+                await controller.acquire()
+            self.assertEqual(controller.retry_after_header(), "3")
+            self.assertEqual(controller.stats()["rejected"], 1)
+            return raised.exception
+
+        error = asyncio.run(run())
+
+        self.assertEqual(error.retry_after_s, 2.5)
+        self.assertEqual(error.details["in_flight"], 1)
+
+    def test_token_budget_limits_concurrent_prompts(self) -> None:
+        async def run() -> None:
+            controller = AdmissionController(token_budget=100, max_queue_depth=4)
+            big = await controller.acquire(80)
+            pending = asyncio.create_task(controller.acquire(30))
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+            controller.release(big)
+            ticket = await pending
+            self.assertEqual(controller.stats()["tokens_in_flight"], 30)
+            controller.release(ticket)
+            controller.release(ticket)
+            # An oversized request still runs when nothing else is in flight.
+            oversized = await controller.acquire(500)
+            self.assertEqual(controller.stats()["in_flight"], 1)
+            controller.release(oversized)
+
+        asyncio.run(run())
+
+    def test_cancelled_waiter_gives_up_its_place(self) -> None:
+        async def run() -> None:
+            controller = AdmissionController(max_in_flight=1, max_queue_depth=1)
+            first = await controller.acquire()
+            waiting = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            controller.release(first)
+            self.assertEqual(controller.stats()["in_flight"], 0)
+            self.assertEqual(controller.stats()["queued"], 0)
+
+        asyncio.run(run())
+
+    def test_a_multi_slot_ticket_holds_every_slot(self) -> None:
+        async def run() -> None:
+            controller = AdmissionController(max_in_flight=4, max_queue_depth=4)
+            batch = await controller.acquire(slots=3)
+            single = await controller.acquire()
+            pending = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+            self.assertEqual(controller.stats()["in_flight"], 4)
+            controller.release(batch)
+            ticket = await pending
+            self.assertEqual(controller.stats()["in_flight"], 2)
+            controller.release(single)
+            controller.release(ticket)
+            # A batch wider than the server is capped at max_in_flight.
+            wide = await controller.acquire(slots=10)
+            self.assertEqual(wide.slots, 4)
+            controller.release(wide)
+            self.assertEqual(controller.stats()["in_flight"], 0)
+
+        asyncio.run(run())
+
+
+class CountingLLM(LLM):
+    def __init__(self) -> None:
+        super().__init__(
+            model="dummy", context_size=1024, prompt_mode=PromptMode.CHATQA
+        )
+        self.renders = 0
+
+    def run_llm(
+        self, prompt: str | list[dict[str, Any]], logging: bool = False
+    ) -> tuple[Any, int]:
+        return [], 0
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        self.renders += 1
+        return f"prompt for {request.query.text}", 40
+
+    def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
+        return 40
+
+    def cost_per_1k_token(self, input_token: bool) -> float:
+        return 0.0
+
+
+class TestAdmissionEstimates(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = ServerConfig(
+            host="127.0.0.1", port=8084, model="gpt-4o", prompt_mode="chatqa"
+        )
+        self.agent = CountingLLM()
+        self.builds = 0
+
+        def build(_config: ServerConfig) -> CountingLLM:
+            self.builds += 1
+            return self.agent
+
+        self.pool = AgentPool(build)
+        self.payload = {"query": "capital of france", "candidates": ["Paris."]}
+
+    def _admit(self, controller: AdmissionController) -> Any:
+        return acquire_admission(
+            self.payload,
+            config=self.config,
+            admission=controller,
+            agent_pool=self.pool,
+        )
+
+    def test_a_full_queue_rejects_before_estimating(self) -> None:
+        self.pool.get(self.config)
+
+        async def run() -> None:
+            controller = AdmissionController(
+                max_in_flight=1, max_queue_depth=0, token_budget=100
+            )
+            await controller.acquire()
+            with self.assertRaises(AdmissionRejected):
+                await self._admit(controller)
+
+        asyncio.run(run())
+
+        self.assertEqual(self.agent.renders, 0)
+
+    def test_a_cold_agent_is_not_built_to_estimate(self) -> None:
+        controller = AdmissionController(token_budget=100)
+
+        ticket = asyncio.run(self._admit(controller))
+
+        self.assertEqual(self.builds, 0)
+        self.assertGreater(ticket.estimated_tokens, 0)
+
+    def test_the_estimated_prompt_is_reused_for_generation(self) -> None:
+        from ragnarok.cli.normalize import normalize_direct_generate_input
+
+        self.pool.get(self.config)
+        controller = AdmissionController(token_budget=100)
+
+        ticket = asyncio.run(self._admit(controller))
+        request = normalize_direct_generate_input(self.payload)
+        prompt = self.agent.render_prompt(request, 1)
+
+        self.assertEqual(ticket.estimated_tokens, 40)
+        self.assertEqual(prompt, ("prompt for capital of france", 40))
+        self.assertEqual(self.agent.renders, 1)
+        self.agent.render_prompt(request, 1)
+        self.assertEqual(self.agent.renders, 2)
+
+    def test_a_batch_is_admitted_as_its_lines(self) -> None:
+        self.pool.get(self.config)
+        controller = AdmissionController(token_budget=100)
+        payloads = [self.payload, ValueError("invalid JSON line"), self.payload]
+
+        ticket = asyncio.run(
+            acquire_batch_admission(
+                payloads,
+                config=self.config,
+                admission=controller,
+                agent_pool=self.pool,
+            )
+        )
+
+        self.assertEqual(ticket.estimated_tokens, 80)
+        self.assertEqual(ticket.slots, 3)
+        self.assertEqual(controller.stats()["tokens_in_flight"], 80)
+
+
+class SlowAgent:
+    def __init__(self) -> None:
+        self.started = threading.Event()
+
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        self.started.set()
+        await asyncio.sleep(0.3)
+        return Result(
+            query=request.query,
+            references=[],
+            answer=[CitedSentence(text="Done.")],
+            rag_exec_summary=RAGExecInfo(
+                prompt="prompt",
+                response="Done.",
+                input_token_count=1,
+                output_token_count=1,
+            ),
+        )
+
+
+class TestServeAdmission(unittest.TestCase):
+    def test_saturated_server_answers_429_with_retry_after(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+        from ragnarok.api.runtime import ServerConfig
+
+        agent = SlowAgent()
+        config = ServerConfig(
+            host="127.0.0.1",
+            port=8083,
+            model="gpt-4o",
+            prompt_mode="chatqa",
+            execution_mode="async",
+            max_in_flight=1,
+            max_queue_depth=0,
+            retry_after_s=2,
+        )
+        payload = {"query": "q", "candidates": ["passage"]}
+        responses: list[Any] = []
+        with (
+            patch("ragnarok.api.runtime.create_generation_agent", return_value=agent),
+            TestClient(create_app(config)) as client,
+        ):
+            first = threading.Thread(
+                target=lambda: responses.append(
+                    client.post("/v1/generate", json=payload)
+                )
+            )
+            first.start()
+            self.assertTrue(agent.started.wait(timeout=5))
+            rejected = client.post("/v1/generate", json=payload)
+            first.join()
+            after = client.post("/v1/generate", json=payload)
+
+        self.assertEqual(rejected.status_code, 429)
+        self.assertEqual(rejected.headers["Retry-After"], "2")
+        error = rejected.json()["errors"][0]
+        self.assertEqual(error["code"], "overloaded")
+        self.assertTrue(error["retryable"])
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()["metrics"]["admission"]["queue_depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
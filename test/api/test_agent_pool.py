@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import unittest
+from dataclasses import replace
+from typing import Any
+
+import pytest
+
+from ragnarok.api.agent_pool import AgentPool, agent_key
+from ragnarok.api.runtime import ServerConfig
+
+pytestmark = pytest.mark.core
+
+
+def _config(**overrides: Any) -> ServerConfig:
+    base = ServerConfig(
+        host="127.0.0.1", port=8083, model="gpt-4o", prompt_mode="chatqa"
+    )
+    return replace(base, **overrides)
+
+
+class TestAgentPool(unittest.TestCase):
+    def test_reuses_agent_for_equivalent_configs(self) -> None:
+        built: list[str] = []
+
+        def factory(config: ServerConfig) -> object:
+            built.append(config.model)
+            return object()
+
+        pool = AgentPool(factory)
+        first = pool.get(_config())
+        second = pool.get(_config(run_id="other-run", topk=[5]))
+
+        self.assertIs(first, second)
+        self.assertEqual(built, ["gpt-4o"])
+        stats = pool.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_agent_key_splits_on_construction_fields(self) -> None:
+        self.assertNotEqual(
+            agent_key(_config()), agent_key(_config(reasoning_effort="low"))
+        )
+        self.assertEqual(agent_key(_config()), agent_key(_config(include_trace=True)))
+
+    def test_evicts_least_recently_used_agent_over_capacity(self) -> None:
+        pool = AgentPool(lambda config: object(), max_agents=2)
+        first = pool.get(_config(model="a"))
+        pool.get(_config(model="b"))
+        self.assertIs(pool.get(_config(model="a")), first)
+        pool.get(_config(model="c"))
+
+        self.assertEqual(pool.stats()["evictions"], 1)
+        self.assertIs(pool.get(_config(model="a")), first)
+        pool.get(_config(model="b"))
+        self.assertEqual(pool.stats()["misses"], 4)
+
+    def test_evicts_agents_over_memory_budget(self) -> None:
+        readings = iter([0.0, 600.0, 600.0, 1200.0])
+        pool = AgentPool(
+            lambda config: object(),
+            memory_budget_mb=1000.0,
+            memory_probe=lambda: next(readings),
+        )
+        pool.get(_config(model="a"))
+        pool.get(_config(model="b"))
+
+        stats = pool.stats()
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["memory_mb"], 600.0)
+
+    def test_concurrent_misses_build_agent_once(self) -> None:
+        release = threading.Event()
+        build_count = 0
+
+        def factory(config: ServerConfig) -> object:
+            nonlocal build_count
+            build_count += 1
+            release.wait(timeout=1)
+            return object()
+
+        pool = AgentPool(factory)
+        agents: list[object] = []
+        threads = [
+            threading.Thread(target=lambda: agents.append(pool.get(_config())))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(build_count, 1)
+        self.assertEqual(len({id(agent) for agent in agents}), 1)
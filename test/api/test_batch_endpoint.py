@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+
+pytestmark = pytest.mark.core
+
+
+class FakeStreamingAgent:
+    """Answers after a per-query delay so completion order differs from input order."""
+
+    def __init__(self, delays: dict[str, float]) -> None:
+        self.delays = delays
+
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        await asyncio.sleep(self.delays.get(request.query.text, 0.0))
+        if request.query.text == "boom":
+            raise RuntimeError("provider failed")
+        return Result(
+            query=request.query,
+            references=[candidate.docid for candidate in request.candidates[:topk]],
+            answer=[CitedSentence(text=f"Answer for {request.query.text}.")],
+            rag_exec_summary=RAGExecInfo(
+                prompt="prompt",
+                response="response",
+                input_token_count=1,
+                output_token_count=1,
+            ),
+        )
+
+
+def _config(**overrides: Any) -> Any:
+    from ragnarok.api.runtime import ServerConfig
+
+    return ServerConfig(
+        host="127.0.0.1",
+        port=8083,
+        model="gpt-4o",
+        prompt_mode="chatqa",
+        **overrides,
+    )
+
+
+def _line(text: str) -> str:
+    return json.dumps({"query": {"text": text}, "candidates": ["passage"]})
+
+
+class TestGenerateBatchEndpoint(unittest.TestCase):
+    def test_streams_records_in_completion_order(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        agent = FakeStreamingAgent({"slow": 0.2, "fast": 0.0})
+        body = "\n".join([_line("slow"), _line("fast")]) + "\n"
+        with patch("ragnarok.api.runtime.create_generation_agent", return_value=agent):
+            client = TestClient(create_app(_config()))
+            response = client.post("/v1/generate/batch", content=body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response.headers["content-type"].startswith("application/x-ndjson")
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line["index"] for line in lines], [1, 0])
+        self.assertEqual([line["status"] for line in lines], ["success"] * 2)
+        self.assertEqual(lines[0]["record"]["topic"], "fast")
+        self.assertEqual(lines[1]["record"]["answer"][0]["text"], "Answer for slow.")
+
+    def test_reports_bad_lines_without_failing_the_batch(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        agent = FakeStreamingAgent({})
+        body = "\n".join(
+            [
+                _line("ok"),
+                "{not json",
+                json.dumps({"candidates": ["passage"]}),
+                _line("boom"),
+            ]
+        )
+        with patch("ragnarok.api.runtime.create_generation_agent", return_value=agent):
+            client = TestClient(create_app(_config()))
+            response = client.post("/v1/generate/batch", content=body)
+
+        self.assertEqual(response.status_code, 200)
+        statuses = {
+            line["index"]: line["status"]
+            for line in map(json.loads, response.text.splitlines())
+        }
+        self.assertEqual(
+            statuses,
+            {
+                0: "success",
+                1: "validation_error",
+                2: "validation_error",
+                3: "runtime_error",
+            },
+        )
+
+    def test_rejects_empty_body(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        client = TestClient(create_app(_config()))
+        response = client.post("/v1/generate/batch", content="\n\n")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "validation_error")
+
+
+class TestAsyncAnswerStream(unittest.TestCase):
+    def test_respects_max_concurrency(self) -> None:
+        from ragnarok.cli.normalize import normalize_direct_generate_input
+        from ragnarok.generate.generator import RAG
+
+        in_flight = 0
+        peak = 0
+
+        class CountingAgent(FakeStreamingAgent):
+            async def async_answer(
+                self,
+                request: Request,
+                topk: int,
+                shuffle_candidates: bool = False,
+                logging: bool = False,
+            ) -> Result:
+                nonlocal in_flight, peak
+                in_flight += 1
+                peak = max(peak, in_flight)
+                try:
+                    return await super().async_answer(request, topk)
+                finally:
+                    in_flight -= 1
+
+        agent = CountingAgent({f"q{index}": 0.01 for index in range(6)})
+        requests = [
+            normalize_direct_generate_input(json.loads(_line(f"q{index}")))
+            for index in range(6)
+        ]
+
+        async def run() -> list[int]:
+            rag = RAG(agent=agent)  # type: ignore[arg-type]
+            return [
+                index
+                async for index, _ in rag.async_answer_stream(
+                    requests, topk=1, max_concurrency=2
+                )
+            ]
+
+        indices = asyncio.run(run())
+
+        self.assertEqual(sorted(indices), list(range(6)))
+        self.assertEqual(peak, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.api.coalescing import SingleFlight, coalescing_key
+from ragnarok.api.runtime import (
+    ServerConfig,
+    async_run_generate_request,
+    build_agent_pool,
+    build_single_flight,
+)
+from ragnarok.cli.normalize import normalize_direct_generate_input
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+
+pytestmark = pytest.mark.core
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_call_and_get_copies(self) -> None:
+        calls: list[str] = []
+
+        async def call() -> dict[str, list[str]]:
+            calls.append("call")
+            await asyncio.sleep(0.01)
+            return {"answer": ["shared"]}
+
+        async def run() -> list[tuple[Any, bool]]:
+            flights = SingleFlight()
+            outcomes = await asyncio.gather(
+                *(flights.do("key", call) for _ in range(3))
+            )
+            self.assertEqual(flights.stats()["coalesced"], 2)
+            self.assertEqual(flights.stats()["in_flight"], 0)
+            return list(outcomes)
+
+        outcomes = asyncio.run(run())
+
+        self.assertEqual(calls, ["call"])
+        self.assertEqual([shared for _, shared in outcomes], [False, True, True])
+        outcomes[0][0]["answer"].append("mutated")
+        self.assertEqual(outcomes[1][0], {"answer": ["shared"]})
+
+    def test_errors_reach_every_caller_and_are_not_cached(self) -> None:
+        attempts: list[int] = []
+
+        async def failing() -> None:
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        async def run() -> list[Any]:
+            flights = SingleFlight()
+            outcomes: list[Any] = await asyncio.gather(
+                *(flights.do("key", failing) for _ in range(2)),
+                return_exceptions=True,
+            )
+            with self.assertRaises(RuntimeError):
+                await flights.do("key", failing)
+            return outcomes
+
+        outcomes = asyncio.run(run())
+
+        self.assertTrue(all(isinstance(item, RuntimeError) for item in outcomes))
+        self.assertEqual(len(attempts), 2)
+
+    def test_cancelled_leader_does_not_cancel_followers(self) -> None:
+        async def call() -> str:
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def run() -> tuple[Any, bool]:
+            flights = SingleFlight()
+            leader = asyncio.create_task(flights.do("key", call))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flights.do("key", call))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), ("done", True))
+
+    def test_key_covers_docids_and_agent_config(self) -> None:
+        request = normalize_direct_generate_input(
+            {"query": "q", "candidates": [{"docid": "d1", "doc": "text"}]}
+        )
+        other_docids = normalize_direct_generate_input(
+            {"query": "q", "candidates": [{"docid": "d2", "doc": "text"}]}
+        )
+        config = (("model", "gpt-4o"),)
+
+        key = coalescing_key(config, request, 1, "prompt")
+
+        self.assertEqual(key, coalescing_key(config, request, 1, "prompt"))
+        self.assertNotEqual(key, coalescing_key(config, other_docids, 1, "prompt"))
+        self.assertNotEqual(
+            key, coalescing_key((("model", "gpt-4o-mini"),), request, 1, "prompt")
+        )
+
+
+class CountingAgent:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        texts = [candidate.doc["segment"] for candidate in request.candidates[:topk]]
+        return f"{request.query.text}|{'|'.join(texts)}", 1
+
+    async def async_run_llm(
+        self, prompt: str, logging: bool = False
+    ) -> tuple[list[CitedSentence], RAGExecInfo]:
+        self.calls += 1
+        await asyncio.sleep(0.02)
+        return (
+            [CitedSentence(text=f"answer to {prompt}", citations=[0])],
+            RAGExecInfo(
+                prompt=prompt,
+                response="answer [1]",
+                input_token_count=1,
+                output_token_count=1,
+            ),
+        )
+
+    def build_result(
+        self,
+        request: Request,
+        topk: int,
+        answer: list[CitedSentence],
+        rag_exec_summary: RAGExecInfo,
+    ) -> Result:
+        return Result(
+            query=request.query,
+            references=[candidate.docid for candidate in request.candidates[:topk]],
+            answer=answer,
+            rag_exec_summary=rag_exec_summary,
+        )
+
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        prompt, _ = self.create_prompt(request, topk)
+        answer, rag_exec_summary = await self.async_run_llm(prompt, logging)
+        return self.build_result(request, topk, answer, rag_exec_summary)
+
+
+class TestCoalescedServe(unittest.TestCase):
+    def _run(
+        self, config: ServerConfig, payloads: list[dict[str, Any]]
+    ) -> tuple[CountingAgent, list[Any]]:
+        agent = CountingAgent()
+        pool = build_agent_pool(config)
+        flights = build_single_flight(config)
+
+        async def run() -> list[Any]:
+            responses = await asyncio.gather(
+                *(
+                    async_run_generate_request(
+                        payload, config=config, agent_pool=pool, flights=flights
+                    )
+                    for payload in payloads
+                )
+            )
+            return list(responses)
+
+        with patch("ragnarok.api.runtime.create_generation_agent", return_value=agent):
+            return agent, asyncio.run(run())
+
+    def test_identical_requests_share_one_model_call(self) -> None:
+        config = ServerConfig(
+            host="127.0.0.1",
+            port=8083,
+            model="gpt-4o",
+            prompt_mode="chatqa",
+            execution_mode="async",
+        )
+        payload = {"query": "q", "candidates": ["passage"]}
+        different = {"query": "other", "candidates": ["passage"]}
+
+        agent, responses = self._run(config, [payload, payload, payload, different])
+
+        self.assertEqual(agent.calls, 2)
+        self.assertEqual(
+            [response.resolved["coalesced"] for response in responses],
+            [False, True, True, False],
+        )
+        records = [response.artifacts[0]["data"][0] for response in responses]
+        self.assertEqual(records[0]["answer"], records[1]["answer"])
+
+    def test_coalescing_can_be_disabled(self) -> None:
+        config = ServerConfig(
+            host="127.0.0.1",
+            port=8083,
+            model="gpt-4o",
+            prompt_mode="chatqa",
+            execution_mode="async",
+            coalesce_requests=False,
+        )
+        payload = {"query": "q", "candidates": ["passage"]}
+
+        agent, responses = self._run(config, [payload, payload])
+
+        self.assertEqual(agent.calls, 2)
+        self.assertNotIn("coalesced", responses[0].resolved)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.api.batching import (
+    MicroBatchRegistry,
+    MicroBatchScheduler,
+    answer_micro_batched,
+    supports_micro_batching,
+)
+from ragnarok.cli.normalize import normalize_direct_generate_input
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+
+pytestmark = pytest.mark.core
+
+
+class FakeBatchedAgent:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.batches: list[list[str]] = []
+        self.sources: list[tuple[Request, int] | None] = []
+        self._lock = threading.Lock()
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        return f"prompt:{request.query.text}:{topk}", 3
+
+    def run_llm_batched(
+        self,
+        prompts: list[str],
+        logging: bool = False,
+        sources: list[tuple[Request, int] | None] | None = None,
+    ) -> list[tuple[list[CitedSentence], RAGExecInfo]]:
+        with self._lock:
+            self.batches.append(list(prompts))
+            self.sources.extend(sources or [])
+        if self.fail:
+            raise RuntimeError("engine failed")
+        return [
+            (
+                [CitedSentence(text=f"answer to {prompt}", citations=[0])],
+                RAGExecInfo(
+                    prompt=prompt,
+                    response=f"answer to {prompt} [0]",
+                    input_token_count=3,
+                    output_token_count=2,
+                ),
+            )
+            for prompt in prompts
+        ]
+
+    def build_result(
+        self,
+        request: Request,
+        topk: int,
+        answer: list[CitedSentence],
+        rag_exec_summary: RAGExecInfo,
+    ) -> Result:
+        return Result(
+            query=request.query,
+            references=[candidate.docid for candidate in request.candidates[:topk]],
+            answer=answer,
+            rag_exec_summary=rag_exec_summary,
+        )
+
+
+class TestMicroBatchScheduler(unittest.TestCase):
+    def test_concurrent_prompts_share_one_engine_call(self) -> None:
+        agent = FakeBatchedAgent()
+
+        async def run() -> list[tuple[Any, Any]]:
+            scheduler = MicroBatchScheduler(agent, max_batch_size=8, max_wait_ms=50)
+            return await asyncio.gather(
+                *(scheduler.submit(f"p{index}") for index in range(5))
+            )
+
+        outputs = asyncio.run(run())
+
+        self.assertEqual(agent.batches, [["p0", "p1", "p2", "p3", "p4"]])
+        self.assertEqual(
+            [info.prompt for _, info in outputs], ["p0", "p1", "p2", "p3", "p4"]
+        )
+
+    def test_batches_are_capped_at_max_batch_size(self) -> None:
+        agent = FakeBatchedAgent()
+
+        async def run() -> dict[str, Any]:
+            scheduler = MicroBatchScheduler(agent, max_batch_size=2, max_wait_ms=50)
+            await asyncio.gather(*(scheduler.submit(f"p{index}") for index in range(5)))
+            return scheduler.stats()
+
+        stats = asyncio.run(run())
+
+        self.assertEqual([len(batch) for batch in agent.batches], [2, 2, 1])
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(stats["largest_batch"], 2)
+        self.assertEqual(stats["queued"], 0)
+
+    def test_engine_errors_reach_every_waiter(self) -> None:
+        agent = FakeBatchedAgent(fail=True)
+
+        async def run() -> list[Any]:
+            scheduler = MicroBatchScheduler(agent, max_wait_ms=50)
+            outputs: list[Any] = await asyncio.gather(
+                *(scheduler.submit(f"p{index}") for index in range(3)),
+                return_exceptions=True,
+            )
+            return outputs
+
+        outputs = asyncio.run(run())
+
+        self.assertEqual(len(agent.batches), 1)
+        self.assertTrue(all(isinstance(output, RuntimeError) for output in outputs))
+
+    def test_registry_keeps_one_scheduler_per_agent(self) -> None:
+        registry = MicroBatchRegistry(max_batch_size=4)
+        agent = FakeBatchedAgent()
+
+        self.assertIs(registry.scheduler_for(agent), registry.scheduler_for(agent))
+        self.assertIsNot(
+            registry.scheduler_for(agent), registry.scheduler_for(FakeBatchedAgent())
+        )
+        self.assertTrue(supports_micro_batching(agent))
+        self.assertFalse(supports_micro_batching(object()))
+
+    def test_answer_micro_batched_builds_result(self) -> None:
+        agent = FakeBatchedAgent()
+        request = normalize_direct_generate_input(
+            {"query": {"text": "q", "qid": "1"}, "candidates": ["a", "b"]}
+        )
+
+        async def run() -> Result:
+            scheduler = MicroBatchScheduler(agent, max_wait_ms=0)
+            return await answer_micro_batched(agent, scheduler, request, topk=1)
+
+        result = asyncio.run(run())
+
+        self.assertEqual(agent.batches, [["prompt:q:1"]])
+        self.assertEqual(agent.sources, [(request, 1)])
+        self.assertEqual(len(result.references), 1)
+        self.assertEqual(result.answer[0].text, "answer to prompt:q:1")
+
+
+class TestMicroBatchedServe(unittest.TestCase):
+    def test_vllm_batched_serve_requests_use_scheduler(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+        from ragnarok.api.runtime import ServerConfig
+
+        agent = FakeBatchedAgent()
+        config = ServerConfig(
+            host="127.0.0.1",
+            port=8083,
+            model="Qwen/Qwen3-8B",
+            prompt_mode="chatqa",
+            vllm_batched=True,
+            micro_batch_wait_ms=0,
+        )
+        with (
+            patch(
+                "ragnarok.api.runtime.create_generation_agent", return_value=agent
+            ) as create_agent,
+            TestClient(create_app(config)) as client,
+        ):
+            responses = [
+                client.post(
+                    "/v1/generate",
+                    json={"query": {"text": f"q{index}"}, "candidates": ["passage"]},
+                )
+                for index in range(2)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 2)
+        create_agent.assert_called_once()
+        body = responses[-1].json()
+        self.assertTrue(body["resolved"]["micro_batched"])
+        self.assertEqual(body["metrics"]["micro_batch"]["prompts"], 2)
+        self.assertEqual(body["metrics"]["agent_pool"]["hits"], 1)
+        record = body["artifacts"][0]["data"][0]
+        self.assertEqual(record["answer"][0]["text"], "answer to prompt:q1:1")
+
+
+if __name__ == "__main__":
+    unittest.main()
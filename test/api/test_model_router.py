@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from dataclasses import replace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.api.agent_pool import AgentPool
+from ragnarok.api.model_router import (
+    HostedModel,
+    ModelRouter,
+    parse_hosted_model,
+    resolve_model_config,
+)
+from ragnarok.api.runtime import ServerConfig
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+
+pytestmark = pytest.mark.core
+
+HOSTED = (
+    HostedModel(model="gpt-4o", max_concurrency=2),
+    HostedModel(model="command-r-plus", prompt_mode="cohere", preload=True),
+    HostedModel(model="Qwen/Qwen3-8B", num_gpus=2, context_size=4096),
+    HostedModel(model="meta-llama/Llama-3.1-8B"),
+)
+
+
+def _config(**overrides: Any) -> ServerConfig:
+    base = ServerConfig(
+        host="127.0.0.1",
+        port=8083,
+        model="gpt-4o",
+        prompt_mode="chatqa",
+        execution_mode="async",
+        models=HOSTED,
+    )
+    return replace(base, **overrides)
+
+
+class TestHostedModelSpecs(unittest.TestCase):
+    def test_parses_model_name_and_options(self) -> None:
+        hosted = parse_hosted_model(
+            "Qwen/Qwen3-8B,num_gpus=2,max-concurrency=4,preload,vllm_batched=false"
+        )
+
+        self.assertEqual(
+            hosted,
+            HostedModel(
+                model="Qwen/Qwen3-8B",
+                num_gpus=2,
+                max_concurrency=4,
+                preload=True,
+                vllm_batched=False,
+            ),
+        )
+        self.assertTrue(hosted.is_local)
+        self.assertEqual(parse_hosted_model("command-r").backend, "cohere")
+
+    def test_rejects_unknown_or_malformed_options(self) -> None:
+        for spec in ("gpt-4o,colour=red", "gpt-4o,num_gpus", ",preload"):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_hosted_model(spec)
+        with self.assertRaises(ValueError):
+            parse_hosted_model("gpt-4o,max_concurrency=0")
+
+
+class TestResolveModelConfig(unittest.TestCase):
+    def test_applies_pinned_settings_before_request_overrides(self) -> None:
+        resolved = resolve_model_config(_config(), {"model": "command-r-plus"})
+        self.assertEqual(resolved.prompt_mode, "cohere")
+
+        resolved = resolve_model_config(
+            _config(), {"model": "Qwen/Qwen3-8B", "context_size": 2048}
+        )
+        self.assertEqual(resolved.num_gpus, 2)
+        self.assertEqual(resolved.context_size, 2048)
+
+    def test_rejects_models_the_server_does_not_host(self) -> None:
+        with self.assertRaisesRegex(ValueError, "not hosted"):
+            resolve_model_config(_config(), {"model": "gpt-3.5-turbo"})
+        unrestricted = _config(models=())
+        resolved = resolve_model_config(unrestricted, {"model": "gpt-3.5-turbo"})
+        self.assertEqual(resolved.model, "gpt-3.5-turbo")
+
+
+class TestModelRouter(unittest.TestCase):
+    def test_bounds_each_models_concurrency(self) -> None:
+        router = ModelRouter(_config())
+        peak: dict[str, int] = {"gpt-4o": 0, "command-r-plus": 0}
+
+        async def call(model: str) -> None:
+            async with router.slot(model):
+                peak[model] = max(peak[model], router.describe(set())[0]["in_flight"])
+                await asyncio.sleep(0.01)
+
+        async def run() -> None:
+            await asyncio.gather(*(call("gpt-4o") for _ in range(5)))
+            await asyncio.gather(*(call("command-r-plus") for _ in range(3)))
+
+        asyncio.run(run())
+
+        self.assertEqual(peak["gpt-4o"], 2)
+        self.assertTrue(router.is_idle("gpt-4o"))
+
+    def test_rejects_duplicate_models(self) -> None:
+        with self.assertRaises(ValueError):
+            ModelRouter(_config(models=(HostedModel("a"), HostedModel("a"))))
+
+    def test_pool_unloads_only_idle_local_models(self) -> None:
+        router = ModelRouter(_config())
+        pool = AgentPool(
+            lambda config: config.model, max_agents=2, can_evict=router.can_unload
+        )
+        configs = {
+            hosted.model: resolve_model_config(_config(), {"model": hosted.model})
+            for hosted in HOSTED
+        }
+
+        async def run() -> None:
+            pool.get(configs["gpt-4o"])
+            pool.get(configs["command-r-plus"])
+            async with router.slot("Qwen/Qwen3-8B"):
+                pool.get(configs["Qwen/Qwen3-8B"])
+                pool.get(configs["meta-llama/Llama-3.1-8B"])
+                # The busy Qwen agent survives; remote agents are pinned.
+                self.assertEqual(
+                    pool.loaded_models(),
+                    {
+                        "gpt-4o",
+                        "command-r-plus",
+                        "Qwen/Qwen3-8B",
+                        "meta-llama/Llama-3.1-8B",
+                    },
+                )
+            # Once idle, the local agents are unloaded on the next lookup.
+            pool.get(configs["gpt-4o"])
+
+        asyncio.run(run())
+
+        self.assertEqual(pool.loaded_models(), {"gpt-4o", "command-r-plus"})
+        self.assertEqual(pool.stats()["evictions"], 2)
+
+
+class RecordingAgent:
+    def __init__(self, model: str) -> None:
+        self.model = model
+
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        return Result(
+            query=request.query,
+            references=[],
+            answer=[CitedSentence(text=self.model)],
+            rag_exec_summary=RAGExecInfo(
+                prompt="prompt",
+                response=self.model,
+                input_token_count=1,
+                output_token_count=1,
+            ),
+        )
+
+
+class TestServeMultipleModels(unittest.TestCase):
+    def test_routes_requests_to_warm_per_model_agents(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        built: list[tuple[str, str]] = []
+
+        def factory(args: Any) -> RecordingAgent:
+            built.append((args.model, str(args.prompt_mode)))
+            return RecordingAgent(args.model)
+
+        config = _config(models=HOSTED[:2])
+        payload: dict[str, Any] = {"query": "q", "candidates": ["passage"]}
+        with (
+            patch("ragnarok.api.runtime.create_generation_agent", side_effect=factory),
+            TestClient(create_app(config)) as client,
+        ):
+            # command-r-plus is preloaded during startup.
+            self.assertEqual(built, [("command-r-plus", "cohere")])
+            listing = client.get("/v1/models").json()["models"]
+            cohere = client.post(
+                "/v1/generate",
+                json={**payload, "overrides": {"model": "command-r-plus"}},
+            )
+            default = client.post("/v1/generate", json=payload)
+            unknown = client.post(
+                "/v1/generate",
+                json={**payload, "overrides": {"model": "gpt-3.5-turbo"}},
+            )
+
+        self.assertEqual(
+            [(entry["model"], entry["loaded"]) for entry in listing],
+            [("gpt-4o", False), ("command-r-plus", True)],
+        )
+        self.assertEqual(
+            cohere.json()["artifacts"][0]["data"][0]["answer"][0]["text"],
+            "command-r-plus",
+        )
+        self.assertEqual(default.status_code, 200)
+        self.assertEqual(built, [("command-r-plus", "cohere"), ("gpt-4o", "chatqa")])
+        self.assertEqual(unknown.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import json
+import unittest
+from collections.abc import AsyncIterator
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+from ragnarok.generate.llm import GenerationEvent
+
+pytestmark = pytest.mark.core
+
+
+class FakeStreamingAgent:
+    def __init__(self, fail_after_delta: bool = False) -> None:
+        self.fail_after_delta = fail_after_delta
+
+    async def async_answer_stream(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> AsyncIterator[GenerationEvent]:
+        yield GenerationEvent("delta", "Paris [2].")
+        if self.fail_after_delta:
+            raise RuntimeError("stream dropped")
+        sentence = CitedSentence(text="Paris.", citations=[1])
+        yield GenerationEvent("sentence", sentence)
+        yield GenerationEvent(
+            "done",
+            Result(
+                query=request.query,
+                references=[request.candidates[1].docid],
+                answer=[CitedSentence(text="Paris.", citations=[0])],
+                rag_exec_summary=RAGExecInfo(
+                    prompt="prompt",
+                    response="Paris [2].",
+                    input_token_count=3,
+                    output_token_count=1,
+                ),
+            ),
+        )
+
+
+def _parse_sse(text: str) -> list[tuple[str, Any]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _post(agent: FakeStreamingAgent, payload: dict[str, Any]) -> Any:
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    from ragnarok.api.app import create_app
+    from ragnarok.api.runtime import ServerConfig
+
+    config = ServerConfig(
+        host="127.0.0.1", port=8083, model="gpt-4o", prompt_mode="chatqa"
+    )
+    with patch("ragnarok.api.runtime.create_generation_agent", return_value=agent):
+        client = TestClient(create_app(config))
+        return client.post("/v1/generate/stream", json=payload)
+
+
+PAYLOAD = {
+    "query": {"text": "capital of france", "qid": "q1"},
+    "candidates": [
+        {"docid": "d1", "doc": {"segment": "France is in Europe."}},
+        {"docid": "d2", "doc": {"segment": "Paris is the capital."}},
+    ],
+}
+
+
+class TestGenerateStreamEndpoint(unittest.TestCase):
+    def test_streams_deltas_sentences_and_final_trace(self) -> None:
+        response = _post(FakeStreamingAgent(), PAYLOAD)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response.headers["content-type"].startswith("text/event-stream")
+        )
+        events = _parse_sse(response.text)
+        self.assertEqual([name for name, _ in events], ["delta", "sentence", "done"])
+        self.assertEqual(events[0][1], {"text": "Paris [2]."})
+        self.assertEqual(
+            events[1][1], {"index": 0, "text": "Paris.", "references": ["d2"]}
+        )
+        done = events[2][1]
+        self.assertEqual(done["references"], ["d2"])
+        self.assertEqual(done["trace"]["response"], "Paris [2].")
+
+    def test_failures_mid_stream_end_with_error_event(self) -> None:
+        response = _post(FakeStreamingAgent(fail_after_delta=True), PAYLOAD)
+
+        events = _parse_sse(response.text)
+        self.assertEqual([name for name, _ in events], ["delta", "error"])
+        self.assertEqual(events[-1][1]["message"], "stream dropped")
+
+    def test_invalid_payload_is_rejected_before_streaming(self) -> None:
+        response = _post(FakeStreamingAgent(), {"candidates": ["p"]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "validation_error")
+
+
+if __name__ == "__main__":
+    unittest.main()
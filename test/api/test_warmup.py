@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import threading
+import time
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import Request
+from ragnarok.generate.llm import LLM, PromptMode
+
+pytestmark = pytest.mark.core
+
+
+class WarmableAgent:
+    def __init__(self, gate: threading.Event | None = None) -> None:
+        self.gate = gate
+        self.warmed = False
+
+    def warm_up(self) -> None:
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        self.warmed = True
+
+
+def _config(**overrides: Any) -> Any:
+    from ragnarok.api.runtime import ServerConfig
+
+    return ServerConfig(
+        host="127.0.0.1",
+        port=8083,
+        model="gpt-4o",
+        prompt_mode="chatqa",
+        **overrides,
+    )
+
+
+def _wait_for_status(client: Any, status: str) -> Any:
+    deadline = time.monotonic() + 5
+    while True:
+        response = client.get("/readyz")
+        if response.json()["status"] == status or time.monotonic() > deadline:
+            return response
+        time.sleep(0.01)
+
+
+class TestServeWarmUp(unittest.TestCase):
+    def setUp(self) -> None:
+        pytest.importorskip("fastapi")
+
+    def test_readyz_waits_for_warm_up(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        gate = threading.Event()
+        agent = WarmableAgent(gate)
+        with (
+            patch(
+                "ragnarok.api.runtime.create_generation_agent", return_value=agent
+            ) as create_agent,
+            TestClient(create_app(_config(warm_up=True))) as client,
+        ):
+            warming = _wait_for_status(client, "warming")
+            health = client.get("/healthz")
+            gate.set()
+            ready = _wait_for_status(client, "ready")
+
+        self.assertEqual(warming.status_code, 503)
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(
+            [step["step"] for step in ready.json()["steps"]],
+            ["templates", "agent:gpt-4o", "prompt:gpt-4o"],
+        )
+        self.assertTrue(agent.warmed)
+        create_agent.assert_called_once()
+
+    def test_failed_warm_up_stays_unready(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        with (
+            patch(
+                "ragnarok.api.runtime.create_generation_agent",
+                side_effect=RuntimeError("missing API key"),
+            ),
+            TestClient(create_app(_config(warm_up=True))) as client,
+        ):
+            response = _wait_for_status(client, "failed")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("missing API key", response.json()["error"])
+
+    def test_without_warm_up_server_is_ready_after_startup(self) -> None:
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+
+        with TestClient(create_app(_config())) as client:
+            response = client.get("/readyz")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["steps"], [])
+
+
+class RecordingLLM(LLM):
+    def __init__(self) -> None:
+        super().__init__(
+            model="dummy", context_size=1024, prompt_mode=PromptMode.CHATQA
+        )
+        self.prompted: list[Request] = []
+        self.tokenized: list[str] = []
+        self._post_processor = self
+
+    @property
+    def tokenizer(self) -> RecordingLLM:
+        return self
+
+    def tokenize(self, text: str) -> list[str]:
+        self.tokenized.append(text)
+        return [text]
+
+    def run_llm(
+        self, prompt: str | list[dict[str, Any]], logging: bool = False
+    ) -> tuple[Any, Any]:
+        raise AssertionError("warm-up must not call the model")
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        self.prompted.append(request)
+        return "prompt", 1
+
+    def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
+        return 1
+
+    def cost_per_1k_token(self, input_token: bool) -> float:
+        return 0.0
+
+
+class TestLLMWarmUp(unittest.TestCase):
+    def test_builds_a_prompt_and_tokenizes_without_calling_the_model(self) -> None:
+        llm = RecordingLLM()
+
+        llm.warm_up()
+
+        self.assertEqual(len(llm.prompted), 1)
+        self.assertEqual(len(llm.prompted[0].candidates), 1)
+        self.assertEqual(len(llm.tokenized), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
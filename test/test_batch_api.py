@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import email.parser
+import json
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Any, cast
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.cli.main import main
+from ragnarok.data import Candidate, CitedSentence, Query, Request
+from ragnarok.generate.batch_api import BatchAPIClient, BatchRunner
+from ragnarok.generate.llm import PromptMode
+from ragnarok.generate.retry import RetryPolicy
+
+pytestmark = pytest.mark.core
+
+
+class StandInBatchServer:
+    """In-memory stand-in for the OpenAI Files and Batches endpoints.
+
+    A batch completes after `polls_until_done` status checks; every request
+    is answered with the user message echoed back, except custom ids listed
+    in `fail_custom_ids`, which land in the error file.
+    """
+
+    def __init__(
+        self, polls_until_done: int = 1, fail_custom_ids: tuple[str, ...] = ()
+    ) -> None:
+        self.polls_until_done = polls_until_done
+        self.fail_custom_ids = set(fail_custom_ids)
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self.polls: dict[str, int] = {}
+        self.authorizations: list[str] = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _reply(self, payload: Any, status: int = 200) -> None:
+                body = (
+                    payload
+                    if isinstance(payload, bytes)
+                    else json.dumps(payload).encode()
+                )
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                stand_in.authorizations.append(self.headers["Authorization"])
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.path == "/v1/files":
+                    self._reply(stand_in.upload(self.headers["Content-Type"], body))
+                elif self.path == "/v1/batches":
+                    self._reply(stand_in.create(json.loads(body)))
+                else:
+                    self._reply({"error": "not found"}, status=404)
+
+            def do_GET(self) -> None:
+                parts = self.path.strip("/").split("/")
+                if parts[:2] == ["v1", "batches"]:
+                    self._reply(stand_in.retrieve(parts[2]))
+                elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+                    self._reply(stand_in.files[parts[2]])
+                else:
+                    self._reply({"error": "not found"}, status=404)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self._server.serve_forever)
+
+    def __enter__(self) -> StandInBatchServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def upload(self, content_type: str, body: bytes) -> dict[str, Any]:
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        parts: dict[str, bytes] = {}
+        for part in message.walk():
+            name = part.get_param("name", header="content-disposition")
+            if isinstance(name, str):
+                parts[name] = cast(bytes, part.get_payload(decode=True))
+        assert parts["purpose"] == b"batch"
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = parts["file"]
+        return {"id": file_id, "purpose": "batch"}
+
+    def create(self, payload: dict[str, Any]) -> dict[str, Any]:
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "status": "validating",
+            "endpoint": payload["endpoint"],
+            "input_file_id": payload["input_file_id"],
+            "output_file_id": None,
+            "error_file_id": None,
+        }
+        self.polls[batch_id] = 0
+        return self.batches[batch_id]
+
+    def retrieve(self, batch_id: str) -> dict[str, Any]:
+        batch = self.batches[batch_id]
+        self.polls[batch_id] += 1
+        if batch["status"] == "completed":
+            return batch
+        batch["status"] = "in_progress"
+        if self.polls[batch_id] >= self.polls_until_done:
+            self._complete(batch)
+        return batch
+
+    def _complete(self, batch: dict[str, Any]) -> None:
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]].decode().splitlines():
+            request = json.loads(line)
+            if request["custom_id"] in self.fail_custom_ids:
+                errors.append(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"code": "server_error", "message": "boom"},
+                    }
+                )
+                continue
+            question = request["body"]["messages"][-1]["content"]
+            message = {"role": "assistant", "content": f"Echo: {question}"}
+            outputs.append(
+                {
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": message}]},
+                    },
+                    "error": None,
+                }
+            )
+        for kind, lines in (("output", outputs), ("error", errors)):
+            if lines:
+                file_id = f"file-{len(self.files)}"
+                self.files[file_id] = "".join(
+                    json.dumps(line) + "\n" for line in lines
+                ).encode()
+                batch[f"{kind}_file_id"] = file_id
+        batch["status"] = "completed"
+
+
+def _fake_modules() -> dict[str, ModuleType]:
+    fake_openai = ModuleType("openai")
+    fake_openai.proxy = None  # type: ignore[attr-defined]
+    fake_tiktoken = ModuleType("tiktoken")
+    fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+        encode=lambda text: list(text)
+    )
+    fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+
+    class FakeGPTPostProcessor:
+        def __call__(self, response: str) -> tuple[list[Any], dict[str, Any]]:
+            return [CitedSentence(text=response, citations=[0])], {"text": response}
+
+    fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+    return {
+        "openai": fake_openai,
+        "tiktoken": fake_tiktoken,
+        "ragnarok.generate.post_processor": fake_post_processor,
+    }
+
+
+def _agent() -> Any:
+    with patch.dict(sys.modules, _fake_modules()):
+        sys.modules.pop("ragnarok.generate.gpt", None)
+        from ragnarok.generate.gpt import SafeOpenai
+
+        agent = SafeOpenai(
+            model="gpt-4o",
+            context_size=4096,
+            prompt_mode=PromptMode.RAGNAROK_V4,
+            keys="test-key",
+        )
+    sys.modules.pop("ragnarok.generate.gpt", None)
+    return agent
+
+
+def _requests(count: int = 3) -> list[Request]:
+    return [
+        Request(
+            query=Query(text=f"question {index}", qid=f"q{index}"),
+            candidates=[
+                Candidate(docid=f"d{index}-{rank}", score=1.0, doc={"segment": "text"})
+                for rank in range(2)
+            ],
+        )
+        for index in range(count)
+    ]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _interrupt(_seconds: float) -> None:
+    raise Interrupted
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.state_path = Path(self._tmp.name) / "run.batch.json"
+        self.agent = _agent()
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _runner(self, server: StandInBatchServer, **kwargs: Any) -> BatchRunner:
+        client = BatchAPIClient(
+            "test-key",
+            server.base_url,
+            retry_policy=RetryPolicy(max_attempts=1),
+        )
+        return BatchRunner(
+            self.agent,
+            client,
+            self.state_path,
+            model="gpt-4o",
+            poll_interval_s=0.0,
+            **kwargs,
+        )
+
+    def test_submits_polls_and_maps_outputs_back_to_results(self) -> None:
+        with StandInBatchServer(polls_until_done=2, fail_custom_ids=("1-q1",)) as (
+            server
+        ):
+            outcome = self._runner(server).run(_requests(), topk=2)
+
+        self.assertEqual((outcome.status, outcome.failed), ("completed", ["1-q1"]))
+        self.assertEqual([result.query.qid for result in outcome.results], ["q0", "q2"])
+        result = outcome.results[0]
+        self.assertTrue(result.answer[0].text.startswith("Echo: "))
+        self.assertEqual(result.references, ["d0-0"])
+        assert result.rag_exec_summary is not None
+        self.assertEqual(result.rag_exec_summary.prompt[0]["role"], "system")
+        self.assertEqual(set(server.authorizations), {"Bearer test-key"})
+
+        lines = [
+            json.loads(line)
+            for line in (Path(self._tmp.name) / "run.batch.json.input.jsonl")
+            .read_text()
+            .splitlines()
+        ]
+        self.assertEqual(lines[0]["url"], "/v1/chat/completions")
+        self.assertEqual(lines[0]["body"]["model"], "gpt-4o")
+        state = json.loads(self.state_path.read_text())
+        self.assertEqual((state["batch_id"], state["status"]), ("batch-0", "completed"))
+
+    def test_resumes_the_submitted_batch_after_an_interruption(self) -> None:
+        requests = _requests()
+        with StandInBatchServer(polls_until_done=3) as server:
+            with self.assertRaises(Interrupted):
+                self._runner(server, sleep=_interrupt).run(requests, topk=2)
+            self.assertEqual(
+                json.loads(self.state_path.read_text())["status"], "in_progress"
+            )
+
+            outcome = self._runner(server).run(requests, topk=2)
+
+        self.assertEqual(len(server.batches), 1)
+        self.assertEqual(len(outcome.results), 3)
+
+    def test_shuffled_candidates_keep_their_order_across_resume(self) -> None:
+        with StandInBatchServer(polls_until_done=3) as server:
+            with self.assertRaises(Interrupted):
+                self._runner(server, sleep=_interrupt).run(
+                    _requests(1), topk=2, shuffle_candidates=True
+                )
+            order = json.loads(self.state_path.read_text())["candidate_order"]["0-q0"]
+
+            outcome = self._runner(server).run(_requests(1), topk=2)
+
+        cited = outcome.results[0].references
+        self.assertEqual(cited, order[:1])
+
+    def test_rejects_a_state_file_from_another_run(self) -> None:
+        with StandInBatchServer() as server:
+            self._runner(server).run(_requests(2), topk=2)
+            with self.assertRaises(ValueError):
+                self._runner(server).run(_requests(3), topk=2)
+
+
+class TestBatchExecutionMode(unittest.TestCase):
+    def test_generate_runs_input_file_through_the_batch_api(self) -> None:
+        with (
+            tempfile.TemporaryDirectory() as tmp,
+            StandInBatchServer() as server,
+        ):
+            input_path = Path(tmp) / "requests.jsonl"
+            input_path.write_text(
+                "".join(
+                    json.dumps(
+                        {
+                            "query": {"qid": request.query.qid, "text": "q"},
+                            "candidates": [
+                                {"docid": c.docid, "score": c.score, "doc": c.doc}
+                                for c in request.candidates
+                            ],
+                        }
+                    )
+                    + "\n"
+                    for request in _requests(2)
+                )
+            )
+            stdout = StringIO()
+            with (
+                redirect_stdout(stdout),
+                patch(
+                    "ragnarok.cli.operations.create_generation_agent",
+                    return_value=_agent(),
+                ),
+            ):
+                exit_code = main(
+                    [
+                        "generate",
+                        "--model",
+                        "gpt-4o",
+                        "--input-file",
+                        str(input_path),
+                        "--prompt-mode",
+                        "ragnarok_v4",
+                        "--topk",
+                        "2",
+                        "--execution-mode",
+                        "batch",
+                        "--batch-api-base",
+                        server.base_url,
+                        "--batch-state-file",
+                        str(Path(tmp) / "state.json"),
+                        "--batch-poll-interval",
+                        "0",
+                        "--output",
+                        "json",
+                    ]
+                )
+
+        self.assertEqual(exit_code, 0)
+        output = json.loads(stdout.getvalue())
+        self.assertEqual(len(output["artifacts"][0]["data"]), 2)
+        self.assertEqual(output["metrics"]["batch"]["status"], "completed")
+
+    def test_batch_mode_requires_an_openai_compatible_model(self) -> None:
+        stdout = StringIO()
+        with tempfile.TemporaryDirectory() as tmp, redirect_stdout(stdout):
+            input_path = Path(tmp) / "requests.jsonl"
+            input_path.write_text(
+                json.dumps({"query": "q", "candidates": ["passage"]}) + "\n"
+            )
+            exit_code = main(
+                [
+                    "generate",
+                    "--model",
+                    "command-r",
+                    "--input-file",
+                    str(input_path),
+                    "--prompt-mode",
+                    "cohere",
+                    "--execution-mode",
+                    "batch",
+                    "--output",
+                    "json",
+                ]
+            )
+
+        self.assertNotEqual(exit_code, 0)
+        self.assertEqual(
+            json.loads(stdout.getvalue())["errors"][0]["code"],
+            "unsupported_execution_mode",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import Candidate, Query, Request, result_to_dict
+from ragnarok.generate.failures import bisect_failures
+
+pytestmark = pytest.mark.core
+
+
+class TestBisectFailures(unittest.TestCase):
+    def test_bad_items_are_isolated_in_logarithmic_calls(self) -> None:
+        calls: list[list[int]] = []
+
+        def run(batch: list[int]) -> list[int]:
+            calls.append(batch)
+            if 5 in batch:
+                raise RuntimeError("engine failed")
+            return [item * 10 for item in batch]
+
+        outcomes = bisect_failures(run, list(range(16)))
+
+        self.assertEqual(
+            [item for item in outcomes if not isinstance(item, Exception)],
+            [item * 10 for item in range(16) if item != 5],
+        )
+        self.assertIsInstance(outcomes[5], RuntimeError)
+        # One failed call per level down to the bad item, plus its sibling.
+        self.assertEqual(len(calls), 1 + 2 * 4)
+
+    def test_on_failure_can_recover_an_item(self) -> None:
+        def run(batch: list[str]) -> list[str]:
+            if "bad" in batch:
+                raise RuntimeError("engine failed")
+            return [item.upper() for item in batch]
+
+        outcomes = bisect_failures(
+            run, ["a", "bad", "b"], lambda item, error: f"{item}:{error}"
+        )
+
+        self.assertEqual(outcomes, ["A", "bad:engine failed", "B"])
+
+    def test_a_batch_that_always_fails_is_not_split_per_item(self) -> None:
+        calls: list[list[int]] = []
+        recovered: list[int] = []
+
+        def run(batch: list[int]) -> list[int]:
+            calls.append(batch)
+            raise RuntimeError("engine failed")
+
+        def on_failure(item: int, error: Exception) -> int:
+            recovered.append(item)
+            return item
+
+        outcomes = bisect_failures(run, list(range(16)), on_failure)
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(recovered, [])
+        self.assertEqual(len(outcomes), 16)
+        self.assertTrue(all(isinstance(item, RuntimeError) for item in outcomes))
+
+    def test_batch_failures_stop_the_split(self) -> None:
+        calls: list[list[int]] = []
+
+        def run(batch: list[int]) -> list[int]:
+            calls.append(batch)
+            raise MemoryError("out of memory")
+
+        outcomes = bisect_failures(
+            run,
+            list(range(8)),
+            is_batch_failure=lambda error: isinstance(error, MemoryError),
+        )
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 8)
+
+    def test_an_empty_batch_is_not_run(self) -> None:
+        def run(batch: list[int]) -> list[int]:
+            raise AssertionError("should not run")
+
+        self.assertEqual(bisect_failures(run, []), [])
+
+
+class FakeTokenizer:
+    """One token per whitespace-separated word."""
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> list[str]:
+        return text.split()
+
+    def decode(self, token_ids: list[str]) -> str:
+        return " ".join(token_ids) + " "
+
+    def apply_chat_template(self, messages: list[dict[str, str]], **kwargs: Any) -> str:
+        return (
+            "".join(f"<{m['role']}> {m['content']} " for m in messages) + "<assistant>"
+        )
+
+
+class FakeVLLM:
+    """Fails any batch containing a prompt of more than `max_words` words."""
+
+    max_words = 8
+
+    def __init__(self, model: str, **kwargs: Any) -> None:
+        self.batches: list[list[str]] = []
+        self.dead = False
+
+    def get_tokenizer(self) -> FakeTokenizer:
+        return FakeTokenizer()
+
+    def generate(self, prompts: list[str], sampling_params: Any) -> list[Any]:
+        self.batches.append(prompts)
+        if self.dead:
+            raise RuntimeError("CUDA error: out of memory")
+        if any(len(prompt.split()) > self.max_words for prompt in prompts):
+            raise ValueError("prompt is longer than the model context")
+        return [
+            SimpleNamespace(
+                outputs=[SimpleNamespace(text=f"answer to {prompt.split()[0]}")]
+            )
+            for prompt in prompts
+        ]
+
+
+class FakeGPTPostProcessor:
+    def __call__(self, response: str) -> tuple[list[Any], str]:
+        return [], response
+
+
+class TestOSLLMBisection(unittest.TestCase):
+    def setUp(self) -> None:
+        fake_torch = ModuleType("torch")
+        fake_torch.cuda = SimpleNamespace(is_available=lambda: False)  # type: ignore[attr-defined]
+        fake_fastchat = ModuleType("fastchat.model")
+        fake_fastchat.load_model = None  # type: ignore[attr-defined]
+        fake_vllm = ModuleType("vllm")
+        fake_vllm.LLM = FakeVLLM  # type: ignore[attr-defined]
+        fake_vllm.SamplingParams = lambda **kwargs: kwargs  # type: ignore[attr-defined]
+        fake_generation = ModuleType("transformers.generation")
+        fake_generation.GenerationConfig = None  # type: ignore[attr-defined]
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+        fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+        modules = patch.dict(
+            sys.modules,
+            {
+                "torch": fake_torch,
+                "fastchat": ModuleType("fastchat"),
+                "fastchat.model": fake_fastchat,
+                "vllm": fake_vllm,
+                "transformers": ModuleType("transformers"),
+                "transformers.generation": fake_generation,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        )
+        modules.start()
+        self.addCleanup(modules.stop)
+        sys.modules.pop("ragnarok.generate.os_llm", None)
+        self.addCleanup(sys.modules.pop, "ragnarok.generate.os_llm", None)
+        from ragnarok.generate.os_llm import OSLLM
+
+        self.agent = OSLLM(model="meta-llama/Llama-3.1-8B-Instruct", device="cpu")
+
+    def test_only_the_failing_prompt_is_lost(self) -> None:
+        prompts = ["p0 ok", "p1 ok", "p2 " + "word " * 20, "p3 ok"]
+
+        outcomes = self.agent.run_llm_batched(prompts, return_exceptions=True)
+
+        self.assertEqual(
+            [
+                outcome[1].response if not isinstance(outcome, Exception) else None
+                for outcome in outcomes
+            ],
+            ["answer to p0", "answer to p1", None, "answer to p3"],
+        )
+        self.assertEqual(type(outcomes[2]).__name__, "PromptRejectedError")
+        self.assertIsInstance(outcomes[2], ValueError)
+        with self.assertRaisesRegex(RuntimeError, "Failed run_llm_batched"):
+            self.agent.run_llm_batched(prompts)
+
+    def test_a_dead_engine_fails_the_batch_in_one_call(self) -> None:
+        self.agent._llm.dead = True
+        prompts = [f"p{index} ok" for index in range(16)]
+
+        outcomes = self.agent.run_llm_batched(prompts, return_exceptions=True)
+
+        self.assertEqual(len(self.agent._llm.batches), 1)
+        self.assertEqual(len(outcomes), 16)
+        self.assertTrue(all(isinstance(item, RuntimeError) for item in outcomes))
+
+    def test_all_failing_prompts_cost_a_bounded_number_of_calls(self) -> None:
+        prompts = [f"p{index} " + "word " * 20 for index in range(16)]
+
+        outcomes = self.agent.run_llm_batched(prompts, return_exceptions=True)
+
+        self.assertEqual(len(self.agent._llm.batches), 3)
+        self.assertTrue(all(isinstance(item, ValueError) for item in outcomes))
+
+    def test_a_slightly_long_prompt_is_refitted_without_its_last_passages(
+        self,
+    ) -> None:
+        request = Request(
+            query=Query(text="capital of france", qid="q1"),
+            candidates=[
+                Candidate(docid=f"d{rank}", score=1.0, doc={"segment": text})
+                for rank, text in enumerate(
+                    ["first " * 60, "second " * 60, "third " * 60, "fourth " * 60]
+                )
+            ],
+        )
+        full_prompt, full_tokens = self.agent.create_prompt(request, 4)
+        self.agent._llm.max_words = len(full_prompt.split()) - 1
+
+        result = self.agent.answer_batch([request], topk=4, vllm=True)[0]
+
+        self.assertEqual(len(self.agent._llm.batches), 2)
+        sent = self.agent._llm.batches[-1][0]
+        self.assertLessEqual(self.agent.get_num_tokens(sent), full_tokens * 0.75)
+        # The prompt is re-rendered through the template, so its chat
+        # scaffold and the top passage survive whole.
+        self.assertTrue(sent.startswith("<system>"))
+        self.assertTrue(sent.endswith("<assistant>"))
+        self.assertIn("[1] " + "first " * 59 + "first", sent)
+        self.assertIn("[2] " + "second " * 59 + "second", sent)
+        self.assertNotIn("third", sent)
+        self.assertNotIn("fourth", sent)
+        self.assertEqual(result.rag_exec_summary.prompt, sent)
+        self.assertTrue(result.rag_exec_summary.prompt_truncated)
+
+        record = result_to_dict(result, "run", include_trace=True)
+        self.assertTrue(record["prompt_truncated"])
+        self.assertTrue(record["trace"]["prompt_truncated"])
+
+    def test_a_failing_prompt_without_its_request_is_rejected(self) -> None:
+        prompt = "head " + "passage " * 7 + "tail"
+
+        outcomes = self.agent.run_llm_batched(["p0 ok", prompt], return_exceptions=True)
+
+        self.assertFalse(outcomes[0][1].prompt_truncated)
+        self.assertEqual(type(outcomes[1]).__name__, "PromptRejectedError")
+        self.assertEqual(len(self.agent._llm.batches), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
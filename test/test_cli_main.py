@@ -1287,6 +1287,92 @@ class TestRagnarokCLI(unittest.TestCase):
         self.assertEqual(envelope["command"], "generate")
         self.assertEqual(envelope["artifacts"][0]["name"], "generation-results")
 
+    def test_serve_app_reuses_pooled_agent_across_requests(self):
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+        from ragnarok.api.runtime import ServerConfig
+
+        with patch(
+            "ragnarok.api.runtime.create_generation_agent",
+            return_value=FakeAgent(),
+        ) as create_agent:
+            client = TestClient(
+                create_app(
+                    ServerConfig(
+                        host="127.0.0.1",
+                        port=8083,
+                        model="gpt-4o",
+                        prompt_mode="chatqa",
+                    )
+                )
+            )
+            responses = [
+                client.post(
+                    "/v1/generate",
+                    json={"query": {"text": f"q{index}"}, "candidates": ["passage"]},
+                )
+                for index in range(3)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        create_agent.assert_called_once()
+        pool_metrics = responses[-1].json()["metrics"]["agent_pool"]
+        self.assertEqual(pool_metrics["misses"], 1)
+        self.assertEqual(pool_metrics["hits"], 2)
+
+    def test_serve_app_runs_async_generation_on_server_loop(self):
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+        from ragnarok.api.runtime import ServerConfig
+
+        loops: list[asyncio.AbstractEventLoop] = []
+
+        class LoopRecordingAgent(FakeAgent):
+            async def async_answer(
+                self, request, topk, shuffle_candidates=False, logging=False
+            ):
+                loops.append(asyncio.get_running_loop())
+                return await super().async_answer(request, topk)
+
+        with (
+            patch(
+                "ragnarok.api.runtime.create_generation_agent",
+                return_value=LoopRecordingAgent(),
+            ) as create_agent,
+            patch(
+                "ragnarok.api.runtime.asyncio.run",
+                side_effect=AssertionError("server must not start nested loops"),
+            ),
+            TestClient(
+                create_app(
+                    ServerConfig(
+                        host="127.0.0.1",
+                        port=8083,
+                        model="gpt-4o",
+                        prompt_mode="chatqa",
+                        execution_mode="async",
+                    )
+                )
+            ) as client,
+        ):
+            responses = [
+                client.post(
+                    "/v1/generate",
+                    json={"query": {"text": f"q{index}"}, "candidates": ["passage"]},
+                )
+                for index in range(2)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 2)
+        self.assertEqual(responses[0].json()["resolved"]["execution_mode"], "async")
+        create_agent.assert_called_once()
+        self.assertEqual(len(loops), 2)
+        self.assertIs(loops[0], loops[1])
+
     def test_serve_app_rejects_invalid_payload(self):
         pytest.importorskip("fastapi")
         from fastapi.testclient import TestClient
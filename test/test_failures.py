@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.cli.main import main
+from ragnarok.cli.operations import convert_generate_records_to_requests
+from ragnarok.data import Candidate, Query, Request, Result
+from ragnarok.generate.failures import (
+    FailurePolicy,
+    answer_isolated,
+    async_answer_isolated,
+    write_dead_letters,
+)
+from ragnarok.generate.generator import RAG
+from ragnarok.generate.retry import CircuitOpenError
+
+pytestmark = pytest.mark.core
+
+
+def _request(qid: str) -> Request:
+    return Request(
+        query=Query(text=f"question {qid}", qid=qid),
+        candidates=[Candidate(docid=f"{qid}-d", score=1.0, doc={"segment": "text"})],
+    )
+
+
+class FlakyAnswerer:
+    """Fails `flaky*` requests once with a timeout and `bad*` ones for good."""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    def answer(self, request: Request) -> Result:
+        qid = str(request.query.qid)
+        self.calls.append(qid)
+        if qid.startswith("bad"):
+            raise ValueError("prompt is malformed")
+        if qid.startswith("flaky") and self.calls.count(qid) == 1:
+            raise TimeoutError("request timed out")
+        return Result(query=request.query, references=[qid], answer=[])
+
+    def answer_many(self, requests: list[Request]) -> list[Result | BaseException]:
+        outcomes: list[Result | BaseException] = []
+        for request in requests:
+            try:
+                outcomes.append(self.answer(request))
+            except Exception as error:
+                outcomes.append(error)
+        return outcomes
+
+
+class TestAnswerIsolated(unittest.TestCase):
+    def test_failures_are_isolated_and_retried(self) -> None:
+        answerer = FlakyAnswerer()
+        requests = [_request(qid) for qid in ("ok", "flaky", "bad", "ok2")]
+
+        batch = answer_isolated(answerer.answer_many, requests, sleep=lambda _: None)
+
+        self.assertEqual(
+            [result.query.qid if result else None for result in batch.results],
+            ["ok", "flaky", None, "ok2"],
+        )
+        self.assertEqual(answerer.calls, ["ok", "flaky", "bad", "ok2", "flaky"])
+        self.assertEqual(
+            batch.stats(), {"failed": 1, "retried": 1, "recovered": 1, "retryable": 0}
+        )
+        failure = batch.failures[0]
+        self.assertEqual(
+            (failure.index, failure.qid, failure.kind, failure.retryable),
+            (2, "bad", "fatal", False),
+        )
+        self.assertEqual(failure.to_dict()["error_type"], "ValueError")
+
+    def test_retries_and_queue_are_bounded(self) -> None:
+        def always_times_out(requests: list[Request]) -> list[Result | BaseException]:
+            return [TimeoutError("request timed out") for _ in requests]
+
+        requests = [_request("a"), _request("b")]
+        sleeps: list[float] = []
+        batch = answer_isolated(
+            always_times_out,
+            requests,
+            FailurePolicy(max_retries=3, max_queue_size=1),
+            sleep=sleeps.append,
+        )
+
+        self.assertEqual([failure.attempts for failure in batch.failures], [4, 1])
+        self.assertTrue(all(failure.retryable for failure in batch.failures))
+        self.assertEqual(batch.retried, 3)
+        self.assertEqual(sleeps, [1.0, 2.0, 4.0])
+
+    def test_passes_wait_out_an_open_circuit(self) -> None:
+        now = 0.0
+        sleeps: list[float] = []
+
+        def sleep(seconds: float) -> None:
+            nonlocal now
+            sleeps.append(seconds)
+            now += seconds
+
+        def briefly_unavailable(
+            requests: list[Request],
+        ) -> list[Result | BaseException]:
+            # The backend is down for 45 seconds behind a 30-second breaker.
+            if now < 45.0:
+                error = CircuitOpenError(
+                    "circuit open", retry_after_s=30.0, reset_timeout_s=30.0
+                )
+                return [error for _ in requests]
+            return [Result(query=r.query, references=[], answer=[]) for r in requests]
+
+        batch = answer_isolated(
+            briefly_unavailable, [_request("a"), _request("b")], sleep=sleep
+        )
+
+        self.assertEqual(sleeps, [30.0, 30.0])
+        self.assertEqual(batch.failures, [])
+        self.assertEqual(batch.recovered, 2)
+
+    def test_async_batches_keep_completed_work(self) -> None:
+        answerer = FlakyAnswerer()
+
+        async def answer_many(
+            requests: list[Request],
+        ) -> list[Result | BaseException]:
+            await asyncio.sleep(0)
+            return answerer.answer_many(requests)
+
+        batch = asyncio.run(
+            async_answer_isolated(
+                answer_many, [_request("flaky"), _request("bad")], FailurePolicy(0)
+            )
+        )
+
+        self.assertEqual(batch.results, [None, None])
+        self.assertEqual([failure.qid for failure in batch.failures], ["flaky", "bad"])
+        self.assertEqual(batch.failures[0].kind, "retryable")
+
+    def test_dead_letters_can_be_fed_back_in(self) -> None:
+        requests = [_request("ok"), _request("bad")]
+        batch = answer_isolated(
+            FlakyAnswerer().answer_many, requests, sleep=lambda _: None
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "nested" / "failed.jsonl"
+            write_dead_letters(path, requests, batch.failures)
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+
+        self.assertEqual(records[0]["error"]["message"], "prompt is malformed")
+        self.assertEqual(convert_generate_records_to_requests(records), [requests[1]])
+
+
+class FailingAgent:
+    _model = "gpt-4o"
+
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        if request.query.qid == "bad":
+            raise ValueError("prompt is malformed")
+        return Result(query=request.query, references=[], answer=[])
+
+
+class TestRequestFileFailures(unittest.TestCase):
+    def test_rag_returns_exceptions_in_place(self) -> None:
+        rag = RAG(agent=FailingAgent())  # type: ignore[arg-type]
+        requests = [_request("ok"), _request("bad")]
+
+        outcomes = asyncio.run(rag.async_answer_batch(requests, return_exceptions=True))
+
+        self.assertIsInstance(outcomes[0], Result)
+        self.assertIsInstance(outcomes[1], ValueError)
+        with self.assertRaisesRegex(ValueError, "malformed"):
+            asyncio.run(rag.async_answer_batch(requests))
+
+    def _generate(self, tmpdir: str, *extra: str) -> tuple[int, dict[str, Any]]:
+        input_file = Path(tmpdir) / "requests.jsonl"
+        input_file.write_text(
+            "".join(
+                json.dumps(
+                    {
+                        "query": {"qid": qid, "text": "q"},
+                        "candidates": [
+                            {"docid": "d", "score": 1.0, "doc": {"segment": "p"}}
+                        ],
+                    }
+                )
+                + "\n"
+                for qid in ("ok", "bad", "ok2")
+            )
+        )
+        stdout = StringIO()
+        with (
+            redirect_stdout(stdout),
+            redirect_stderr(StringIO()),
+            patch(
+                "ragnarok.cli.operations.create_generation_agent",
+                return_value=FailingAgent(),
+            ),
+        ):
+            exit_code = main(
+                [
+                    "generate",
+                    "--model",
+                    "gpt-4o",
+                    "--input-file",
+                    str(input_file),
+                    "--prompt-mode",
+                    "chatqa",
+                    "--execution-mode",
+                    "async",
+                    "--output",
+                    "json",
+                    *extra,
+                ]
+            )
+        return exit_code, json.loads(stdout.getvalue())
+
+    def test_failed_requests_are_dead_lettered(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dead_letters = Path(tmpdir) / "failed.jsonl"
+            exit_code, output = self._generate(
+                tmpdir, "--dead-letter-file", str(dead_letters)
+            )
+            failed: list[dict[str, Any]] = [
+                json.loads(line) for line in dead_letters.read_text().splitlines()
+            ]
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(
+            [record["topic_id"] for record in output["artifacts"][0]["data"]],
+            ["ok", "ok2"],
+        )
+        self.assertEqual(output["metrics"]["failures"]["failed"], 1)
+        self.assertEqual(
+            output["metrics"]["failures"]["dead_letter_file"], str(dead_letters)
+        )
+        self.assertEqual([record["query"]["qid"] for record in failed], ["bad"])
+
+    def test_without_an_output_file_failures_are_returned_inline(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cwd = os.getcwd()
+            os.chdir(tmpdir)
+            try:
+                exit_code, output = self._generate(tmpdir)
+            finally:
+                os.chdir(cwd)
+            written = sorted(path.name for path in Path(tmpdir).iterdir())
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(written, ["requests.jsonl"])
+        failures = output["metrics"]["failures"]
+        self.assertIsNone(failures["dead_letter_file"])
+        self.assertEqual(
+            [record["query"]["qid"] for record in failures["dead_letters"]], ["bad"]
+        )
+        self.assertEqual(
+            failures["dead_letters"][0]["error"]["message"], "prompt is malformed"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.generate.hedging import HedgePolicy, Hedger
+from ragnarok.generate.llm import PromptMode
+
+pytestmark = pytest.mark.core
+
+
+def _warm_hedger(max_hedge_ratio: float = 1.0) -> Hedger:
+    hedger = Hedger(
+        "test",
+        HedgePolicy(
+            percentile=0.9,
+            max_hedge_ratio=max_hedge_ratio,
+            min_samples=3,
+            min_delay_s=0.01,
+        ),
+    )
+    for _ in range(3):
+        hedger.observe(0.01)
+    return hedger
+
+
+class SlowThenFast:
+    """The first call hangs (or fails late); later calls answer at once."""
+
+    def __init__(self, first_error: Exception | None = None) -> None:
+        self.started = 0
+        self.cancelled = 0
+        self.first_error = first_error
+
+    async def __call__(self) -> str:
+        self.started += 1
+        call = self.started
+        try:
+            if call == 1:
+                await asyncio.sleep(0.05 if self.first_error else 5)
+                if self.first_error:
+                    raise self.first_error
+            return f"call-{call}"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class TestHedger(unittest.TestCase):
+    def test_no_hedge_until_enough_latencies_are_known(self) -> None:
+        hedger = Hedger("test", HedgePolicy(min_samples=3))
+
+        async def quick() -> str:
+            return "done"
+
+        self.assertEqual(asyncio.run(hedger.run(quick)), "done")
+        self.assertIsNone(hedger.hedge_delay())
+        self.assertEqual(hedger.hedges, 0)
+
+    def test_straggler_is_hedged_and_cancelled(self) -> None:
+        hedger = _warm_hedger()
+        call = SlowThenFast()
+
+        self.assertEqual(asyncio.run(hedger.run(call)), "call-2")
+        self.assertEqual(call.cancelled, 1)
+        self.assertEqual((hedger.calls, hedger.hedges, hedger.hedge_wins), (1, 1, 1))
+        self.assertEqual(hedger.stats()["hedge_rate"], 1.0)
+
+    def test_hedges_are_capped_at_the_ratio(self) -> None:
+        hedger = _warm_hedger(max_hedge_ratio=0.0)
+
+        async def slow() -> str:
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        self.assertEqual(asyncio.run(hedger.run(slow)), "primary")
+        self.assertEqual(hedger.hedges, 0)
+
+    def test_hedge_answers_when_the_primary_fails(self) -> None:
+        hedger = _warm_hedger()
+
+        self.assertEqual(
+            asyncio.run(hedger.run(SlowThenFast(RuntimeError("boom")))), "call-2"
+        )
+
+    def test_primary_error_is_raised_when_both_fail(self) -> None:
+        hedger = _warm_hedger()
+        started = 0
+
+        async def failing() -> str:
+            nonlocal started
+            started += 1
+            call = started
+            await asyncio.sleep(0.05 if call == 1 else 0.0)
+            raise RuntimeError(f"failure {call}")
+
+        with self.assertRaisesRegex(RuntimeError, "failure 1"):
+            asyncio.run(hedger.run(failing))
+
+
+class RecordingRateLimiter:
+    def __init__(self) -> None:
+        self.settled: list[tuple[int, int | None]] = []
+
+    async def async_acquire(self, key: str, model: str, tokens: int) -> float:
+        return 0.0
+
+    def settle(self, key: str, model: str, reserved: int, used: int | None) -> None:
+        self.settled.append((reserved, used))
+
+
+class TestSafeOpenaiHedging(unittest.TestCase):
+    def test_hedge_goes_to_another_key(self) -> None:
+        keys_called: list[str] = []
+
+        def async_client(**kwargs: Any) -> Any:
+            async def create(**_: Any) -> Any:
+                keys_called.append(kwargs["api_key"])
+                if len(keys_called) == 1:
+                    await asyncio.sleep(5)
+                message = SimpleNamespace(content=f"answer from {kwargs['api_key']}")
+                return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+            completions = SimpleNamespace(create=create)
+            return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        fake_openai = ModuleType("openai")
+        fake_openai.proxy = None  # type: ignore[attr-defined]
+        fake_openai.AsyncOpenAI = async_client  # type: ignore[attr-defined]
+        fake_tiktoken = ModuleType("tiktoken")
+        fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+            encode=lambda text: text.split()
+        )
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+        fake_post_processor.GPTPostProcessor = lambda: None  # type: ignore[attr-defined]
+        with patch.dict(
+            sys.modules,
+            {
+                "openai": fake_openai,
+                "tiktoken": fake_tiktoken,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        ):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            limiter = RecordingRateLimiter()
+            agent = SafeOpenai(
+                model="gpt-4o",
+                context_size=8192,
+                prompt_mode=PromptMode.RAGNAROK_V4,
+                keys=["key-a", "key-b"],
+                api_base="https://hedge.example.com/v1",
+                rate_limiter=limiter,  # type: ignore[arg-type]
+                hedge_policy=HedgePolicy(
+                    max_hedge_ratio=1.0, min_samples=1, min_delay_s=0.01
+                ),
+            )
+            assert agent._hedger is not None
+            agent._hedger.observe(0.01)
+            response = asyncio.run(
+                agent._call_completion_async(
+                    messages=[{"role": "user", "content": "q"}],
+                    completion_mode=SafeOpenai.CompletionMode.CHAT,
+                    model="gpt-4o",
+                    rate_limit_tokens=100,
+                )
+            )
+        sys.modules.pop("ragnarok.generate.gpt", None)
+
+        self.assertEqual(keys_called, ["key-a", "key-b"])
+        self.assertEqual(response.choices[0].message.content, "answer from key-b")
+        # The cancelled primary gives its whole reservation back.
+        self.assertEqual(sorted(limiter.settled, key=str), [(100, 0), (100, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
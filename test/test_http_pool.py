@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.cli.main import main
+from ragnarok.generate.http_pool import (
+    HTTPPoolConfig,
+    get_async_http_client,
+    get_http_client,
+    http2_available,
+)
+from ragnarok.generate.llm import PromptMode
+
+pytestmark = pytest.mark.core
+
+httpx = pytest.importorskip("httpx")
+
+
+class TestSharedPools(unittest.TestCase):
+    def test_clients_are_shared_per_origin_and_settings(self) -> None:
+        client = get_http_client("https://api.example.com/v1")
+
+        self.assertIsInstance(client, httpx.Client)
+        self.assertIs(get_http_client("https://API.example.com/v2/"), client)
+        self.assertIsNot(get_http_client("https://other.example.com/v1"), client)
+        self.assertIsNot(
+            get_http_client(
+                "https://api.example.com/v1", HTTPPoolConfig(max_connections=4)
+            ),
+            client,
+        )
+        self.assertIs(get_http_client(None), get_http_client("https://api.openai.com"))
+
+    def test_closed_clients_are_replaced(self) -> None:
+        client = get_http_client("https://closed.example.com")
+        client.close()
+
+        self.assertIsNot(get_http_client("https://closed.example.com"), client)
+
+    def test_async_clients_are_shared_within_an_event_loop(self) -> None:
+        async def two_lookups() -> tuple[Any, Any]:
+            return (
+                get_async_http_client("https://api.example.com/v1"),
+                get_async_http_client("https://api.example.com/v1"),
+            )
+
+        first, second = asyncio.run(two_lookups())
+        third, _ = asyncio.run(two_lookups())
+
+        self.assertIsInstance(first, httpx.AsyncClient)
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+
+    @unittest.skipIf(http2_available(), "h2 is installed")
+    def test_http2_without_h2_is_reported(self) -> None:
+        with self.assertRaisesRegex(ImportError, "h2"):
+            get_http_client("https://h2.example.com", HTTPPoolConfig(http2=True))
+
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            exit_code = main(
+                [
+                    "generate",
+                    "--model",
+                    "gpt-4o",
+                    "--prompt-mode",
+                    "chatqa",
+                    "--http2",
+                    "--input-json",
+                    json.dumps({"query": "q", "candidates": ["p"]}),
+                    "--output",
+                    "json",
+                ]
+            )
+        self.assertNotEqual(exit_code, 0)
+        output = json.loads(stdout.getvalue())
+        self.assertEqual(output["errors"][0]["code"], "missing_http2_dependencies")
+
+
+class TestSafeOpenaiClients(unittest.TestCase):
+    def test_every_key_and_instance_reuses_the_pool(self) -> None:
+        created: list[dict[str, Any]] = []
+        fake_openai = ModuleType("openai")
+        fake_openai.proxy = None  # type: ignore[attr-defined]
+        fake_openai.OpenAI = lambda **kwargs: created.append(kwargs)  # type: ignore[attr-defined]
+        fake_tiktoken = ModuleType("tiktoken")
+        fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+            encode=lambda text: text.split()
+        )
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+        fake_post_processor.GPTPostProcessor = lambda: None  # type: ignore[attr-defined]
+        with patch.dict(
+            sys.modules,
+            {
+                "openai": fake_openai,
+                "tiktoken": fake_tiktoken,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        ):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            agents = [
+                SafeOpenai(
+                    model="gpt-4o",
+                    context_size=8192,
+                    prompt_mode=PromptMode.RAGNAROK_V4,
+                    keys=["key-a", "key-b"],
+                    api_base="https://pool.example.com/v1",
+                )
+                for _ in range(2)
+            ]
+            for agent in agents:
+                agent._create_sync_client(0)
+                agent._create_sync_client(1)
+        sys.modules.pop("ragnarok.generate.gpt", None)
+
+        self.assertEqual(
+            [kwargs["api_key"] for kwargs in created],
+            ["key-a", "key-b", "key-a", "key-b"],
+        )
+        shared = get_http_client("https://pool.example.com/v1")
+        for kwargs in created:
+            self.assertIs(kwargs["http_client"], shared)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.generate.key_pool import (
+    QUOTA_QUARANTINE_S,
+    KeyPool,
+    quarantine_seconds,
+)
+from ragnarok.generate.llm import PromptMode
+from ragnarok.generate.retry import RetryPolicy
+
+pytestmark = pytest.mark.core
+
+
+class TestKeyPool(unittest.TestCase):
+    def test_dispatches_to_the_least_loaded_key(self) -> None:
+        pool = KeyPool(["a", "b", "c"])
+
+        with pool.lease() as first, pool.lease() as second:
+            with pool.lease() as third:
+                self.assertEqual([first.index, second.index, third.index], [0, 1, 2])
+            with pool.lease() as fourth:
+                self.assertEqual(fourth.index, 2)
+
+        self.assertEqual([slot["in_flight"] for slot in pool.stats()], [0, 0, 0])
+
+    def test_quarantined_key_is_skipped_until_it_recovers(self) -> None:
+        pool = KeyPool(["a", "b"])
+        pool.quarantine(pool.slots[0], 0.05)
+
+        with pool.lease() as slot:
+            self.assertEqual(slot.index, 1)
+        with pool.lease() as slot:
+            self.assertEqual(slot.index, 1)
+        self.assertFalse(pool.stats()[0]["healthy"])
+
+        pool.quarantine(pool.slots[1], 0.05)
+        started = time.monotonic()
+        with pool.lease():
+            waited = time.monotonic() - started
+
+        self.assertGreaterEqual(waited, 0.03)
+
+    def test_async_leases_respect_the_per_key_limit(self) -> None:
+        pool = KeyPool(["a", "b"], max_concurrency_per_key=1)
+        peaks: dict[int, int] = {0: 0, 1: 0}
+
+        async def call() -> None:
+            async with pool.async_lease() as slot:
+                peaks[slot.index] = max(peaks[slot.index], slot.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def run() -> None:
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+
+        self.assertEqual(peaks, {0: 1, 1: 1})
+        self.assertEqual([slot["requests"] for slot in pool.stats()], [3, 3])
+
+    def test_rate_limit_and_quota_errors_quarantine(self) -> None:
+        self.assertEqual(quarantine_seconds(RuntimeError("429 Too Many")), 1.0)
+        self.assertEqual(
+            quarantine_seconds(RuntimeError("insufficient_quota")),
+            QUOTA_QUARANTINE_S,
+        )
+        self.assertIsNone(quarantine_seconds(RuntimeError("timed out")))
+
+
+def _fake_modules() -> dict[str, ModuleType]:
+    fake_openai = ModuleType("openai")
+    fake_openai.proxy = None  # type: ignore[attr-defined]
+    fake_tiktoken = ModuleType("tiktoken")
+    fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+        encode=lambda text: list(text)
+    )
+    fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+
+    class FakeGPTPostProcessor:
+        def __call__(self, response: str) -> tuple[list[Any], dict[str, Any]]:
+            return [], {"text": response, "citations": []}
+
+    fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+    return {
+        "openai": fake_openai,
+        "tiktoken": fake_tiktoken,
+        "ragnarok.generate.post_processor": fake_post_processor,
+    }
+
+
+class FakeAsyncClient:
+    def __init__(self, key: str, calls: list[str], fail_first: bool = False) -> None:
+        self.key = key
+        self.calls = calls
+        self.fail_first = fail_first
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs: Any) -> Any:
+        self.calls.append(self.key)
+        if self.fail_first:
+            self.fail_first = False
+            raise RuntimeError("Error code: 429 - rate limit reached")
+        await asyncio.sleep(0.01)
+        message = SimpleNamespace(content="Answer.", model_extra=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class TestSafeOpenaiKeyPool(unittest.TestCase):
+    def _run(self, fail_first: bool, calls_made: int) -> tuple[Any, list[str]]:
+        calls: list[str] = []
+        with patch.dict(sys.modules, _fake_modules()):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            model = SafeOpenai(
+                model="gpt-4o",
+                context_size=1024,
+                prompt_mode=PromptMode.CHATQA,
+                keys=["key-a", "key-b"],
+                max_concurrency_per_key=2,
+                retry_policy=RetryPolicy(base_delay_s=0.001),
+            )
+            model._key_pool.slots[0].async_client = FakeAsyncClient(
+                "a", calls, fail_first=fail_first
+            )
+            model._key_pool.slots[1].async_client = FakeAsyncClient("b", calls)
+            prompt = [{"role": "user", "content": "question"}]
+
+            async def run() -> None:
+                await asyncio.gather(
+                    *(model.async_run_llm(prompt) for _ in range(calls_made))
+                )
+
+            asyncio.run(run())
+        sys.modules.pop("ragnarok.generate.gpt", None)
+        return model, calls
+
+    def test_concurrent_calls_use_every_key(self) -> None:
+        model, calls = self._run(fail_first=False, calls_made=4)
+
+        self.assertEqual(sorted(calls), ["a", "a", "b", "b"])
+        self.assertEqual([slot["requests"] for slot in model.key_stats()], [2, 2])
+
+    def test_rate_limited_key_is_quarantined_and_retried_elsewhere(self) -> None:
+        model, calls = self._run(fail_first=True, calls_made=1)
+
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual(model.key_stats()[0]["quarantines"], 1)
+        self.assertFalse(model.key_stats()[0]["healthy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import CitedSentence, RAGExecInfo, Request, Result
+from ragnarok.metrics import (
+    LLM_RETRIES,
+    STAGE_LATENCY,
+    MetricsRegistry,
+    record_retry,
+    render_stats_gauges,
+    stage_timer,
+)
+
+pytestmark = pytest.mark.core
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_counter_renders_labelled_samples(self) -> None:
+        registry = MetricsRegistry()
+        counter = registry.counter("demo_total", "Demo counter.", labels=("kind",))
+        counter.inc(kind="a")
+        counter.inc(2, kind="b")
+
+        text = registry.render()
+
+        self.assertIn("# TYPE demo_total counter", text)
+        self.assertIn('demo_total{kind="a"} 1', text)
+        self.assertIn('demo_total{kind="b"} 2', text)
+        with self.assertRaises(ValueError):
+            counter.inc(-1, kind="a")
+        with self.assertRaises(ValueError):
+            counter.inc(other="x")
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        registry = MetricsRegistry()
+        histogram = registry.histogram(
+            "demo_seconds", "Demo histogram.", buckets=(0.1, 1.0)
+        )
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+
+        self.assertIn('demo_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('demo_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('demo_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("demo_seconds_sum 3.65", lines)
+        self.assertIn("demo_seconds_count 4", lines)
+
+    def test_reregistering_returns_same_metric(self) -> None:
+        registry = MetricsRegistry()
+        first = registry.counter("demo_total", "Demo.")
+
+        self.assertIs(registry.counter("demo_total", "Demo."), first)
+        with self.assertRaises(ValueError):
+            registry.histogram("demo_total", "Demo.")
+
+    def test_stats_gauges_skip_non_numeric_values(self) -> None:
+        lines = render_stats_gauges(
+            "pool", {"size": 2, "hit_rate": 0.5, "budget": None, "warm": True}
+        )
+
+        self.assertEqual(
+            lines,
+            [
+                "# TYPE pool_size gauge",
+                "pool_size 2",
+                "# TYPE pool_hit_rate gauge",
+                "pool_hit_rate 0.5",
+            ],
+        )
+
+    def test_stage_timer_and_retry_helpers(self) -> None:
+        before = STAGE_LATENCY.count(stage="unit_test")
+        retries = LLM_RETRIES.value(reason="rate_limit")
+
+        with stage_timer("unit_test"):
+            pass
+        record_retry(RuntimeError("Error code: 429 - rate limit reached"))
+
+        self.assertEqual(STAGE_LATENCY.count(stage="unit_test"), before + 1)
+        self.assertEqual(LLM_RETRIES.value(reason="rate_limit"), retries + 1)
+
+
+class FakeAgent:
+    async def async_answer(
+        self,
+        request: Request,
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+    ) -> Result:
+        return Result(
+            query=request.query,
+            references=[],
+            answer=[CitedSentence(text="Done.")],
+            rag_exec_summary=RAGExecInfo(
+                prompt="prompt",
+                response="Done.",
+                input_token_count=1,
+                output_token_count=1,
+            ),
+        )
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def test_metrics_route_reports_requests_and_component_gauges(self) -> None:
+        pytest.importorskip("fastapi")
+        from fastapi.testclient import TestClient
+
+        from ragnarok.api.app import create_app
+        from ragnarok.api.runtime import ServerConfig
+
+        config = ServerConfig(
+            host="127.0.0.1",
+            port=8083,
+            model="gpt-4o",
+            prompt_mode="chatqa",
+            execution_mode="async",
+        )
+        payload: dict[str, Any] = {"query": "q", "candidates": ["passage"]}
+        with (
+            patch(
+                "ragnarok.api.runtime.create_generation_agent",
+                return_value=FakeAgent(),
+            ),
+            TestClient(create_app(config)) as client,
+        ):
+            self.assertEqual(client.post("/v1/generate", json=payload).status_code, 200)
+            self.assertEqual(client.post("/v1/generate", json={}).status_code, 400)
+            response = client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        text = response.text
+        self.assertRegex(
+            text,
+            r'ragnarok_http_requests_total\{route="/v1/generate",status="200"\} \d+',
+        )
+        self.assertRegex(
+            text,
+            r'ragnarok_http_requests_total\{route="/v1/generate",status="400"\} \d+',
+        )
+        self.assertIn("# TYPE ragnarok_stage_latency_seconds histogram", text)
+        self.assertIn("ragnarok_agent_pool_size 1", text)
+        self.assertIn("ragnarok_admission_admitted 2", text)
+        self.assertIn("ragnarok_micro_batch_batches 0", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
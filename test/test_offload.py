@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import Candidate, CitedSentence, Query, RAGExecInfo, Request
+from ragnarok.generate.llm import LLM, PromptMode
+from ragnarok.generate.offload import LoopLagMonitor, run_cpu_bound
+
+pytestmark = pytest.mark.core
+
+
+def _request(qid: str) -> Request:
+    return Request(
+        query=Query(text="capital of france", qid=qid),
+        candidates=[Candidate(docid="d1", score=1.0, doc={"segment": "Paris."})],
+    )
+
+
+class ThreadRecordingLLM(LLM):
+    def __init__(self) -> None:
+        super().__init__(
+            model="dummy", context_size=1024, prompt_mode=PromptMode.CHATQA
+        )
+        self.prompt_threads: list[str] = []
+
+    def run_llm(
+        self, prompt: str | list[dict[str, str]], logging: bool = False
+    ) -> tuple[Any, Any]:
+        return [CitedSentence(text="Paris.", citations=[0])], RAGExecInfo(
+            prompt=prompt,
+            response="Paris [1].",
+            input_token_count=1,
+            output_token_count=1,
+        )
+
+    def create_prompt(self, request: Request, topk: int) -> tuple[str, int]:
+        self.prompt_threads.append(threading.current_thread().name)
+        return "prompt", 1
+
+    def get_num_tokens(self, prompt: str | list[dict[str, str]]) -> int:
+        return 1
+
+    def cost_per_1k_token(self, input_token: bool) -> float:
+        return 0.0
+
+
+class TestRunCpuBound(unittest.TestCase):
+    def test_runs_on_the_cpu_pool(self) -> None:
+        name = asyncio.run(run_cpu_bound(lambda: threading.current_thread().name))
+
+        self.assertTrue(name.startswith("ragnarok-cpu"))
+
+    def test_prompts_are_built_off_the_event_loop(self) -> None:
+        agent = ThreadRecordingLLM()
+
+        results = asyncio.run(
+            agent.async_answer_batch([_request("q1"), _request("q2")], topk=1)
+        )
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(agent.prompt_threads), 2)
+        for name in agent.prompt_threads:
+            self.assertTrue(name.startswith("ragnarok-cpu"))
+
+    def test_safe_openai_post_processes_off_the_event_loop(self) -> None:
+        post_processor_threads: list[str] = []
+
+        class FakeGPTPostProcessor:
+            def __call__(self, response: str) -> tuple[list[Any], str]:
+                post_processor_threads.append(threading.current_thread().name)
+                return [], response
+
+        def async_client(**_kwargs: Any) -> Any:
+            async def create(**_: Any) -> Any:
+                message = SimpleNamespace(content="Paris [1].")
+                return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+            completions = SimpleNamespace(create=create)
+            return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        fake_openai = ModuleType("openai")
+        fake_openai.proxy = None  # type: ignore[attr-defined]
+        fake_openai.AsyncOpenAI = async_client  # type: ignore[attr-defined]
+        fake_tiktoken = ModuleType("tiktoken")
+        fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+            encode=lambda text: text.split()
+        )
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+        fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+        with patch.dict(
+            sys.modules,
+            {
+                "openai": fake_openai,
+                "tiktoken": fake_tiktoken,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        ):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            agent = SafeOpenai(
+                model="gpt-4o",
+                context_size=8192,
+                prompt_mode=PromptMode.RAGNAROK_V4,
+                keys="test-key",
+                api_base="https://offload.example.com/v1",
+            )
+            asyncio.run(agent.async_run_llm([{"role": "user", "content": "capital?"}]))
+        sys.modules.pop("ragnarok.generate.gpt", None)
+
+        self.assertEqual(len(post_processor_threads), 1)
+        self.assertTrue(post_processor_threads[0].startswith("ragnarok-cpu"))
+
+
+class TestLoopLagMonitor(unittest.TestCase):
+    def test_blocking_the_loop_is_reported(self) -> None:
+        async def block_the_loop() -> LoopLagMonitor:
+            async with LoopLagMonitor(interval_s=0.01) as monitor:
+                await asyncio.sleep(0.03)
+                time.sleep(0.1)
+                await asyncio.sleep(0.03)
+            return monitor
+
+        stats = asyncio.run(block_the_loop()).stats()
+
+        self.assertGreaterEqual(stats["stalls"], 1)
+        self.assertGreater(stats["blocked_s"], 0.05)
+        self.assertGreater(stats["max_lag_s"], 0.05)
+
+    def test_an_idle_loop_is_not_blocked(self) -> None:
+        monitor = LoopLagMonitor(threshold_s=0.01)
+        for lag in (0.0, 0.002, 0.001):
+            monitor.record(lag)
+
+        self.assertEqual(monitor.stats()["stalls"], 0)
+        self.assertEqual(monitor.stats()["blocked_s"], 0.0)
+        self.assertAlmostEqual(monitor.stats()["mean_lag_s"], 0.001)
+
+
+if __name__ == "__main__":
+    unittest.main()
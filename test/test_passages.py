@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import unittest
+
+import pytest
+
+from ragnarok.generate.passages import PassageNormalizer, replace_number
+
+pytestmark = pytest.mark.core
+
+
+class TestPassageNormalizer(unittest.TestCase):
+    def test_documents_are_fixed_collapsed_and_number_escaped(self) -> None:
+        normalize = PassageNormalizer()
+        doc = {"segment": "  CafÃ©  menu [1]\n see [[23]]&amp; more ", "title": "T"}
+
+        normalized = normalize.document(doc)
+
+        self.assertEqual(
+            normalized.text, "Title: T Content: Café menu (1) see [(23)]& more"
+        )
+        self.assertEqual(normalized.truncate(4), "Title: T Content: Café")
+        self.assertIs(normalized.truncate(100), normalized.text)
+        self.assertEqual(
+            normalize.document({"text": "a [2]", "title": ""}).text, "a (2)"
+        )
+        self.assertEqual(replace_number("[7] and [x]"), "(7) and [x]")
+
+    def test_shared_passages_are_normalized_once(self) -> None:
+        normalize = PassageNormalizer(cache_size=2)
+        first = normalize.document({"segment": "shared passage"})
+
+        self.assertIs(normalize.document({"contents": "shared passage"}), first)
+        normalize("b")
+        normalize("c")
+        self.assertIsNot(normalize("shared passage"), first)
+        self.assertEqual((normalize.hits, normalize.misses), (1, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
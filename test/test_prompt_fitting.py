@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import sys
+import unittest
+from types import ModuleType
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import Candidate, Query, Request
+from ragnarok.generate.llm import PromptMode, allocate_token_budget
+
+pytestmark = pytest.mark.core
+
+
+class TestAllocateTokenBudget(unittest.TestCase):
+    def test_short_passages_leave_their_share_to_long_ones(self) -> None:
+        self.assertEqual(allocate_token_budget([10, 100, 100], 110), 50)
+        self.assertEqual(allocate_token_budget([10, 20], 100), 20)
+        self.assertEqual(allocate_token_budget([30, 30, 30], 60), 20)
+        self.assertEqual(allocate_token_budget([30], 0), 0)
+        self.assertEqual(allocate_token_budget([], 10), 0)
+
+
+class WordEncoding:
+    """Fake tiktoken encoding with one token per space-separated word."""
+
+    def __init__(self) -> None:
+        self.encoded = 0
+
+    def encode(self, text: str) -> list[str]:
+        self.encoded += 1
+        return [word for word in text.split(" ") if word]
+
+    def decode(self, tokens: list[str]) -> str:
+        return " ".join(tokens)
+
+
+def _safe_openai(encoding: WordEncoding, context_size: int) -> Any:
+    fake_openai = ModuleType("openai")
+    fake_openai.proxy = None  # type: ignore[attr-defined]
+    fake_tiktoken = ModuleType("tiktoken")
+    fake_tiktoken.get_encoding = lambda _name: encoding  # type: ignore[attr-defined]
+    fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+    fake_post_processor.GPTPostProcessor = lambda: None  # type: ignore[attr-defined]
+    with patch.dict(
+        sys.modules,
+        {
+            "openai": fake_openai,
+            "tiktoken": fake_tiktoken,
+            "ragnarok.generate.post_processor": fake_post_processor,
+        },
+    ):
+        sys.modules.pop("ragnarok.generate.gpt", None)
+        from ragnarok.generate.gpt import SafeOpenai
+
+        model = SafeOpenai(
+            model="gpt-4o",
+            context_size=context_size,
+            prompt_mode=PromptMode.RAGNAROK_V4,
+            max_output_tokens=100,
+            keys="test-key",
+        )
+    sys.modules.pop("ragnarok.generate.gpt", None)
+    return model
+
+
+def _request() -> Request:
+    lengths = [5, 400, 400, 400]
+    return Request(
+        query=Query(text="what is a flea", qid="q1"),
+        candidates=[
+            Candidate(
+                docid=f"d{index}",
+                score=1.0,
+                doc={"segment": " ".join(f"w{index}x{n}" for n in range(length))},
+            )
+            for index, length in enumerate(lengths)
+        ],
+    )
+
+
+class TestSafeOpenaiPromptFitting(unittest.TestCase):
+    def test_truncates_long_passages_to_fit_in_one_pass(self) -> None:
+        encoding = WordEncoding()
+        model = _safe_openai(encoding, context_size=1000)
+
+        messages, num_tokens = model.create_prompt(_request(), topk=4)
+
+        self.assertLessEqual(num_tokens, 1000 - 100)
+        self.assertGreater(num_tokens, 1000 - 100 - 10)
+        user_message = messages[-1]["content"]
+        self.assertIn("w0x4", user_message)
+        for index in (1, 2, 3):
+            self.assertIn(f"w{index}x100", user_message)
+            self.assertNotIn(f"w{index}x399", user_message)
+
+    def test_prompts_that_fit_are_not_truncated(self) -> None:
+        model = _safe_openai(WordEncoding(), context_size=4000)
+
+        messages, _ = model.create_prompt(_request(), topk=4)
+
+        self.assertIn("w3x399", messages[-1]["content"])
+
+    def test_recounting_a_prompt_reuses_cached_line_counts(self) -> None:
+        encoding = WordEncoding()
+        model = _safe_openai(encoding, context_size=4000)
+        request = _request()
+
+        model.create_prompt(request, topk=4)
+        encoded = encoding.encoded
+        model.create_prompt(request, topk=4)
+
+        self.assertEqual(encoding.encoded, encoded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import json
+import unittest
+
+import pytest
+
+from ragnarok.generate.llm import PromptMode
+from ragnarok.generate.templates.ragnarok_templates import (
+    RagnarokTemplates,
+    compile_template,
+    model_family,
+)
+
+pytestmark = pytest.mark.core
+
+CONTEXT = ["[1] CafÃ© passage one", "[2] second &amp; passage"]
+
+
+def _format_messages(messages: list[dict[str, str]]) -> str:
+    """Fake tokenizer chat template."""
+    return (
+        "".join(
+            f"<|{message['role']}|>\n{message['content']}<|end|>\n"
+            for message in messages
+        )
+        + "<|assistant|>\n"
+    )
+
+
+class TestCompiledTemplates(unittest.TestCase):
+    def test_model_families(self) -> None:
+        self.assertEqual(model_family("gpt-4o"), "chat")
+        self.assertEqual(model_family("nvidia/Llama3-ChatQA-1.5-8B"), "chatqa")
+        self.assertEqual(model_family("meta-llama/Llama-3.1-8B-Instruct"), "open")
+        self.assertEqual(model_family("command-r"), "open")
+
+    def test_chat_render_fixes_the_inputs_and_keeps_the_layout(self) -> None:
+        rendered = RagnarokTemplates(PromptMode.RAGNAROK_V4).render(
+            "what is a cafÃ©", CONTEXT, "gpt-4o"
+        )
+
+        assert rendered.user_message is not None
+        self.assertEqual(rendered.format, "chat_messages")
+        self.assertIn(
+            "Documents: [1] Café passage one\n\n[2] second & passage\n\n"
+            "Query: what is a café\n\nInstruction: ",
+            rendered.user_message,
+        )
+        self.assertTrue(rendered.user_message.endswith("\n\nAnswer:"))
+        self.assertNotIn("\ue000", json.dumps(rendered.metadata(), ensure_ascii=False))
+
+    def test_chatqa_renders_a_single_string(self) -> None:
+        rendered = RagnarokTemplates(PromptMode.CHATQA).render(
+            "q", CONTEXT, "chatqa-1.5-8b"
+        )
+
+        assert rendered.combined_text is not None
+        self.assertEqual(rendered.format, "single_string")
+        self.assertIn(
+            "Context: [1] Café passage one\n\n[2] second & passage\n\nUser: ",
+            rendered.combined_text,
+        )
+        self.assertIs(
+            compile_template(PromptMode.CHATQA, "chatqa"),
+            compile_template(PromptMode.CHATQA, "chatqa"),
+        )
+
+    def test_chat_template_scaffold_matches_formatting_each_prompt(self) -> None:
+        calls: list[list[dict[str, str]]] = []
+
+        def format_messages(messages: list[dict[str, str]]) -> str:
+            calls.append(messages)
+            return _format_messages(messages)
+
+        for prompt_mode in (PromptMode.RAGNAROK_V4, PromptMode.RAGNAROK_V4_NO_CITE):
+            calls.clear()
+            compiled = compile_template(prompt_mode, "open")
+            fill = compiled.compile_chat_template(format_messages)
+            rendered = RagnarokTemplates(prompt_mode).render("q?", CONTEXT, "llama-3")
+
+            self.assertEqual(
+                fill("q?", CONTEXT), _format_messages(rendered.messages or [])
+            )
+            self.assertEqual(fill("q?", CONTEXT[:1]), fill("q?", CONTEXT[:1]))
+            self.assertEqual(len(calls), 1)
+
+    def test_chat_templates_that_rewrite_the_slots_format_every_prompt(self) -> None:
+        def format_messages(messages: list[dict[str, str]]) -> str:
+            return _format_messages(messages).upper()
+
+        compiled = compile_template(PromptMode.RAGNAROK_V4, "open")
+        fill = compiled.compile_chat_template(format_messages)
+        rendered = RagnarokTemplates(PromptMode.RAGNAROK_V4).render(
+            "q?", CONTEXT, "llama-3"
+        )
+
+        self.assertEqual(
+            fill("q?", CONTEXT), _format_messages(rendered.messages or []).upper()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
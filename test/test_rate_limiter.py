@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.generate.llm import PromptMode
+from ragnarok.generate.rate_limiter import (
+    RateLimiter,
+    RateLimits,
+    TokenBucket,
+    get_rate_limiter,
+    rate_limit_penalty,
+)
+
+pytestmark = pytest.mark.core
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limiter(clock: FakeClock, rpm: int | None, tpm: int | None) -> RateLimiter:
+    return RateLimiter(RateLimits(rpm, tpm), clock=clock, sleep=clock.sleep)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refills_continuously_up_to_capacity(self) -> None:
+        clock = FakeClock()
+        bucket = TokenBucket(60, 1.0, clock)
+
+        bucket.take(60)
+        self.assertEqual(bucket.wait_time(30), 30.0)
+        clock.now = 10.0
+        self.assertEqual(bucket.wait_time(30), 20.0)
+        clock.now = 1000.0
+        self.assertEqual(bucket.wait_time(60), 0.0)
+
+    def test_oversized_amount_waits_for_a_full_bucket(self) -> None:
+        clock = FakeClock()
+        bucket = TokenBucket(10, 1.0, clock)
+
+        bucket.take(5)
+
+        self.assertEqual(bucket.wait_time(1000), 5.0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_waits_for_the_scarcer_of_request_and_token_budgets(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=60, tpm=600)
+
+        self.assertEqual(limiter.acquire("key", "gpt-4o", 600), 0.0)
+        waited = limiter.acquire("key", "gpt-4o", 300)
+
+        self.assertEqual(waited, 30.0)
+        self.assertEqual(clock.sleeps, [30.0])
+
+    def test_keys_and_models_have_separate_buckets(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=1, tpm=None)
+
+        limiter.acquire("key-a", "gpt-4o", 0)
+        limiter.acquire("key-b", "gpt-4o", 0)
+        limiter.acquire("key-a", "gpt-4o-mini", 0)
+
+        self.assertEqual(clock.sleeps, [])
+
+    def test_settle_refunds_unused_tokens(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=None, tpm=1000)
+
+        limiter.acquire("key", "gpt-4o", 1000)
+        limiter.settle("key", "gpt-4o", reserved=1000, used=400)
+
+        self.assertEqual(limiter.acquire("key", "gpt-4o", 600), 0.0)
+
+    def test_penalize_blocks_the_pair_for_the_retry_after(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, rpm=6000, tpm=None)
+
+        limiter.penalize("key", "gpt-4o", 2.0)
+
+        self.assertGreaterEqual(limiter.acquire("key", "gpt-4o", 0), 2.0)
+        self.assertEqual(limiter.acquire("other", "gpt-4o", 0), 0.0)
+
+    def test_async_acquire_sleeps_without_blocking_the_loop(self) -> None:
+        limiter = RateLimiter(RateLimits(requests_per_minute=600))
+
+        async def run() -> float:
+            for _ in range(600):
+                await limiter.async_acquire("key", "gpt-4o", 0)
+            return await limiter.async_acquire("key", "gpt-4o", 0)
+
+        waited = asyncio.run(run())
+
+        self.assertGreater(waited, 0.0)
+        self.assertLess(waited, 0.5)
+
+    def test_shared_limiter_is_reused_and_disabled_without_limits(self) -> None:
+        self.assertIsNone(get_rate_limiter(None, None))
+        self.assertIs(get_rate_limiter(100, 1000), get_rate_limiter(100, 1000))
+
+    def test_penalty_honors_retry_after_and_ignores_other_errors(self) -> None:
+        error = RuntimeError("Error code: 429 - rate limit reached")
+        error.response = SimpleNamespace(  # type: ignore[attr-defined]
+            headers={"retry-after": "7"}
+        )
+
+        self.assertEqual(rate_limit_penalty(error), 7.0)
+        self.assertEqual(rate_limit_penalty(RuntimeError("Rate limit hit")), 1.0)
+        self.assertIsNone(rate_limit_penalty(RuntimeError("connection reset")))
+
+
+class RecordingLimiter(RateLimiter):
+    def __init__(self) -> None:
+        super().__init__(RateLimits(requests_per_minute=1000))
+        self.events: list[tuple[Any, ...]] = []
+
+    def acquire(self, key: str, model: str, tokens: int) -> float:
+        self.events.append(("acquire", key, model, tokens))
+        return 0.0
+
+    def settle(self, key: str, model: str, reserved: int, used: int | None) -> None:
+        self.events.append(("settle", key, reserved, used))
+
+    def penalize(self, key: str, model: str, seconds: float) -> None:
+        self.events.append(("penalize", key, seconds))
+
+
+def _fake_modules(create: Any) -> dict[str, ModuleType]:
+    fake_openai = ModuleType("openai")
+    fake_openai.proxy = None  # type: ignore[attr-defined]
+    fake_openai.api_key = None  # type: ignore[attr-defined]
+    fake_openai.OpenAI = lambda **kwargs: SimpleNamespace(  # type: ignore[attr-defined]
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    fake_tiktoken = ModuleType("tiktoken")
+    fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+        encode=lambda text: list(text)
+    )
+    fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+
+    class FakeGPTPostProcessor:
+        def __call__(self, response: str) -> tuple[list[Any], dict[str, Any]]:
+            return [], {"text": response, "citations": []}
+
+    fake_post_processor.GPTPostProcessor = FakeGPTPostProcessor  # type: ignore[attr-defined]
+    return {
+        "openai": fake_openai,
+        "tiktoken": fake_tiktoken,
+        "ragnarok.generate.post_processor": fake_post_processor,
+    }
+
+
+class TestSafeOpenaiRateLimiting(unittest.TestCase):
+    def test_reserves_prompt_and_output_tokens_and_settles_usage(self) -> None:
+        attempts: list[str] = []
+
+        def create(**kwargs: Any) -> Any:
+            attempts.append(kwargs["model"])
+            if len(attempts) == 1:
+                raise RuntimeError("Error code: 429 - rate limit reached")
+            message = SimpleNamespace(content="Answer.", model_extra=None)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=message)],
+                usage=SimpleNamespace(total_tokens=120),
+            )
+
+        limiter = RecordingLimiter()
+        with (
+            patch.dict(sys.modules, _fake_modules(create)),
+            patch("time.sleep"),
+        ):
+            sys.modules.pop("ragnarok.generate.gpt", None)
+            from ragnarok.generate.gpt import SafeOpenai
+
+            model = SafeOpenai(
+                model="gpt-4o",
+                context_size=1024,
+                prompt_mode=PromptMode.CHATQA,
+                max_output_tokens=100,
+                keys=["key-a", "key-b"],
+                rate_limiter=limiter,
+            )
+            prompt = [{"role": "user", "content": "question"}]
+            model._remember_prompt_tokens(prompt, 42)
+            model.run_llm(prompt)
+        sys.modules.pop("ragnarok.generate.gpt", None)
+
+        key_a, key_b = (slot.fingerprint for slot in model._key_pool.slots)
+        self.assertEqual(
+            limiter.events,
+            [
+                ("acquire", key_a, "gpt-4o", 142),
+                ("penalize", key_a, 1.0),
+                ("acquire", key_b, "gpt-4o", 142),
+                ("settle", key_b, 142, 120),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.generate.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ErrorKind,
+    RetryPolicy,
+    async_call_with_retry,
+    call_with_retry,
+    classify_error,
+    is_backend_failure,
+)
+
+pytestmark = pytest.mark.core
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+NO_JITTER = RetryPolicy(max_attempts=4, base_delay_s=1.0, jitter=0.0)
+
+
+class StatusError(Exception):
+    def __init__(self, message: str, status_code: int, **headers: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers)
+
+
+class Flaky:
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class TestClassifyError(unittest.TestCase):
+    def test_kinds(self) -> None:
+        self.assertIs(
+            classify_error(RuntimeError("This model's maximum context length is 8k")),
+            ErrorKind.CONTEXT_LENGTH,
+        )
+        self.assertIs(
+            classify_error(RuntimeError("The response was filtered")),
+            ErrorKind.FILTERED,
+        )
+        self.assertIs(
+            classify_error(StatusError("Incorrect API key", 401)), ErrorKind.FATAL
+        )
+        self.assertIs(classify_error(StatusError("slow", 429)), ErrorKind.RETRYABLE)
+        self.assertIs(classify_error(StatusError("down", 503)), ErrorKind.RETRYABLE)
+        self.assertIs(classify_error(TimeoutError("timed out")), ErrorKind.RETRYABLE)
+
+    def test_only_outages_count_as_backend_failures(self) -> None:
+        self.assertTrue(is_backend_failure(StatusError("down", 503)))
+        self.assertTrue(is_backend_failure(TimeoutError("timed out")))
+        self.assertTrue(is_backend_failure(RuntimeError("Connection reset by peer")))
+        self.assertFalse(is_backend_failure(StatusError("Rate limit reached", 429)))
+        self.assertFalse(is_backend_failure(RuntimeError("You exceeded your quota")))
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_backoff_grows_exponentially_up_to_the_cap(self) -> None:
+        policy = RetryPolicy(base_delay_s=1.0, max_delay_s=5.0, jitter=0.0)
+        error = RuntimeError("server error")
+
+        self.assertEqual(
+            [policy.delay(attempt, error) for attempt in range(5)],
+            [1.0, 2.0, 4.0, 5.0, 5.0],
+        )
+
+    def test_full_jitter_stays_below_the_ceiling(self) -> None:
+        policy = RetryPolicy(base_delay_s=1.0)
+        delays = [policy.delay(2, RuntimeError("boom")) for _ in range(50)]
+
+        self.assertTrue(all(0.0 <= delay <= 4.0 for delay in delays))
+
+    def test_retry_after_overrides_backoff(self) -> None:
+        error = StatusError("slow down", 429, **{"retry-after": "3"})
+
+        self.assertEqual(NO_JITTER.delay(0, error), 3.0)
+        self.assertEqual(
+            RetryPolicy(jitter=0.0, honor_retry_after=False).delay(0, error), 0.5
+        )
+
+
+class TestCallWithRetry(unittest.TestCase):
+    def test_retries_transient_errors_with_backoff(self) -> None:
+        call = Flaky(StatusError("busy", 503), StatusError("busy", 503))
+        sleeps: list[float] = []
+
+        result = call_with_retry(call, policy=NO_JITTER, sleep=sleeps.append)
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(sleeps, [1.0, 2.0])
+
+    def test_fatal_errors_are_not_retried(self) -> None:
+        call = Flaky(StatusError("Incorrect API key", 401))
+
+        with self.assertRaises(StatusError):
+            call_with_retry(call, policy=NO_JITTER, sleep=lambda _: None)
+        self.assertEqual(call.calls, 1)
+
+    def test_gives_up_after_the_attempt_budget(self) -> None:
+        call = Flaky(*(StatusError("busy", 503) for _ in range(10)))
+
+        with self.assertRaises(StatusError):
+            call_with_retry(call, policy=NO_JITTER, sleep=lambda _: None)
+        self.assertEqual(call.calls, 4)
+
+    def test_gives_up_before_sleeping_past_the_deadline(self) -> None:
+        call = Flaky(*(StatusError("busy", 503) for _ in range(10)))
+        policy = RetryPolicy(max_attempts=10, deadline_s=2.5, jitter=0.0)
+        clock = FakeClock()
+
+        with self.assertRaises(StatusError):
+            call_with_retry(call, policy=policy, sleep=clock.sleep, clock=clock)
+        self.assertEqual(clock.sleeps, [0.5, 1.0])
+
+    def test_async_retries(self) -> None:
+        call = Flaky(StatusError("busy", 503))
+
+        async def attempt() -> str:
+            return call()
+
+        clock = FakeClock()
+
+        async def sleep(seconds: float) -> None:
+            clock.sleep(seconds)
+
+        result = asyncio.run(
+            async_call_with_retry(attempt, policy=NO_JITTER, sleep=sleep, clock=clock)
+        )
+
+        self.assertEqual((result, call.calls), ("ok", 2))
+        self.assertEqual(clock.sleeps, [1.0])
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_fails_fast_and_recovers_through_a_probe(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            "test", failure_threshold=2, reset_timeout_s=10, clock=clock
+        )
+        failing = Flaky(*(StatusError("down", 503) for _ in range(3)))
+        policy = RetryPolicy(max_attempts=2, jitter=0.0)
+
+        single = RetryPolicy(max_attempts=1)
+
+        with self.assertRaises(StatusError):
+            call_with_retry(
+                failing, policy=policy, breaker=breaker, sleep=clock.sleep, clock=clock
+            )
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            call_with_retry(failing, policy=single, breaker=breaker)
+        self.assertEqual(failing.calls, 2)
+
+        clock.now = 10.5
+        with self.assertRaises(StatusError):
+            call_with_retry(failing, policy=single, breaker=breaker)
+        self.assertEqual((failing.calls, breaker.state), (3, "open"))
+
+        # A caller with budget left waits for the next probe.
+        result = call_with_retry(
+            failing, policy=policy, breaker=breaker, sleep=clock.sleep, clock=clock
+        )
+        self.assertEqual((result, clock.sleeps[-1]), ("ok", 10.0))
+        self.assertEqual(breaker.state, "closed")
+
+    def test_rate_limits_do_not_open_the_circuit(self) -> None:
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        limited = Flaky(*(StatusError("Rate limit reached", 429) for _ in range(6)))
+        policy = RetryPolicy(max_attempts=8, base_delay_s=0.001)
+
+        result = call_with_retry(
+            limited, policy=policy, breaker=breaker, sleep=lambda _: None
+        )
+
+        self.assertEqual((result, limited.calls), ("ok", 7))
+        self.assertEqual(breaker.state, "closed")
+
+    def test_a_cancelled_probe_frees_the_breaker(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout_s=10, clock=clock
+        )
+        breaker.record_failure()
+        clock.now = 10.0
+        single = RetryPolicy(max_attempts=1)
+
+        async def hang() -> str:
+            await asyncio.sleep(10)
+            return "late"
+
+        async def healthy() -> str:
+            return "ok"
+
+        async def cancel_probe_then_call() -> str:
+            probe = asyncio.create_task(
+                async_call_with_retry(hang, policy=single, breaker=breaker)
+            )
+            await asyncio.sleep(0)
+            probe.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await probe
+            return await async_call_with_retry(healthy, policy=single, breaker=breaker)
+
+        self.assertEqual(asyncio.run(cancel_probe_then_call()), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_a_local_error_does_not_close_the_circuit(self) -> None:
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout_s=10, clock=clock
+        )
+        breaker.record_failure()
+        clock.now = 10.0
+        single = RetryPolicy(max_attempts=1)
+
+        with self.assertRaises(TypeError):
+            call_with_retry(
+                Flaky(TypeError("bad argument")), policy=single, breaker=breaker
+            )
+        self.assertEqual(breaker.state, "half_open")
+        with self.assertRaises(StatusError):
+            call_with_retry(
+                Flaky(StatusError("bad request", 400)), policy=single, breaker=breaker
+            )
+        self.assertEqual(breaker.state, "closed")
+
+
+class TestCohereRetries(unittest.TestCase):
+    def _cohere(self, chat: Any) -> Any:
+        fake_cohere = ModuleType("cohere")
+        fake_cohere.Client = lambda key: SimpleNamespace(chat=chat)  # type: ignore[attr-defined]
+        fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+        fake_post_processor.CoherePostProcessor = lambda: (  # type: ignore[attr-defined]
+            lambda response: ([], {"text": response})
+        )
+        with patch.dict(
+            sys.modules,
+            {
+                "cohere": fake_cohere,
+                "ragnarok.generate.post_processor": fake_post_processor,
+            },
+        ):
+            sys.modules.pop("ragnarok.generate.cohere", None)
+            from ragnarok.generate.cohere import Cohere
+
+            model = Cohere(
+                model="command-r",
+                context_size=4096,
+                key="test-key",
+                retry_policy=RetryPolicy(base_delay_s=0.001),
+            )
+        sys.modules.pop("ragnarok.generate.cohere", None)
+        return model
+
+    def test_transient_errors_are_retried_and_blocked_output_is_reported(self) -> None:
+        prompt = [{"query": "q", "context": [{"snippet": "passage"}]}]
+        transient = Flaky(StatusError("service unavailable", 503))
+        model = self._cohere(lambda **kwargs: transient())
+
+        _, info = model.run_llm(prompt)
+
+        self.assertEqual(transient.calls, 2)
+        self.assertEqual(info.response, {"text": "ok"})
+
+        blocked = Flaky(RuntimeError("blocked output"))
+        _, info = self._cohere(lambda **kwargs: blocked()).run_llm(prompt)
+
+        self.assertEqual((blocked.calls, info.response), (1, "Blocked output"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import json
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.cli.main import main
+from ragnarok.data import Candidate, Query, Request, Result
+from ragnarok.generate.generator import RAG
+
+pytestmark = pytest.mark.core
+
+
+def _request(qid: str) -> Request:
+    return Request(
+        query=Query(text=f"question {qid}", qid=qid),
+        candidates=[Candidate(docid=f"{qid}-d", score=1.0, doc={"segment": "text"})],
+    )
+
+
+class ThreadRecordingAgent:
+    """Answers later requests sooner and records how many ran at once."""
+
+    _model = "gpt-4o"
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def answer_batch(
+        self,
+        requests: list[Request],
+        topk: int,
+        shuffle_candidates: bool = False,
+        logging: bool = False,
+        vllm: bool = False,
+    ) -> list[Result]:
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        qid = requests[0].query.qid
+        if qid == "fail":
+            raise RuntimeError("provider down")
+        time.sleep(0.01 * (self.total - int(qid)))
+        with self.lock:
+            self.running -= 1
+        return [Result(query=requests[0].query, references=[qid], answer=[])]
+
+
+class TestThreadedAnswerBatch(unittest.TestCase):
+    def test_results_keep_input_order(self) -> None:
+        agent = ThreadRecordingAgent(total=6)
+        rag = RAG(agent=agent)  # type: ignore[arg-type]
+        requests = [_request(str(index)) for index in range(6)]
+
+        with redirect_stderr(StringIO()):
+            results = rag.answer_batch(requests, topk=5, max_workers=3)
+
+        self.assertEqual(
+            [result.query.qid for result in results if isinstance(result, Result)],
+            [str(i) for i in range(6)],
+        )
+        self.assertGreater(agent.peak, 1)
+        self.assertLessEqual(agent.peak, 3)
+
+    def test_a_failed_request_is_raised(self) -> None:
+        agent = ThreadRecordingAgent(total=2)
+        rag = RAG(agent=agent)  # type: ignore[arg-type]
+
+        with (
+            redirect_stderr(StringIO()),
+            self.assertRaisesRegex(RuntimeError, "provider down"),
+        ):
+            rag.answer_batch([_request("1"), _request("fail")], max_workers=2)
+
+
+class TestThreadExecutionMode(unittest.TestCase):
+    def _run(self, model: str, agent: Any, input_file: Path) -> dict[str, Any]:
+        stdout = StringIO()
+        with (
+            redirect_stdout(stdout),
+            redirect_stderr(StringIO()),
+            patch(
+                "ragnarok.cli.operations.create_generation_agent", return_value=agent
+            ),
+        ):
+            main(
+                [
+                    "generate",
+                    "--model",
+                    model,
+                    "--input-file",
+                    str(input_file),
+                    "--prompt-mode",
+                    "chatqa",
+                    "--execution-mode",
+                    "thread",
+                    "--max-concurrency",
+                    "4",
+                    "--output",
+                    "json",
+                ]
+            )
+        output: dict[str, Any] = json.loads(stdout.getvalue())
+        return output
+
+    def test_generate_with_thread_execution(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = Path(tmpdir) / "requests.jsonl"
+            input_file.write_text(
+                "".join(
+                    json.dumps(
+                        {
+                            "query": {"qid": str(index), "text": "q"},
+                            "candidates": [
+                                {"docid": "d", "score": 1.0, "doc": {"segment": "p"}}
+                            ],
+                        }
+                    )
+                    + "\n"
+                    for index in range(5)
+                )
+            )
+            agent = ThreadRecordingAgent(total=5)
+            output = self._run("gpt-4o", agent, input_file)
+
+        self.assertEqual(output["resolved"]["execution_mode"], "thread")
+        self.assertEqual(
+            [record["topic_id"] for record in output["artifacts"][0]["data"]],
+            ["0", "1", "2", "3", "4"],
+        )
+        self.assertGreater(agent.peak, 1)
+
+    def test_local_models_are_rejected(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = Path(tmpdir) / "requests.jsonl"
+            input_file.write_text(
+                json.dumps(
+                    {
+                        "query": {"qid": "1", "text": "q"},
+                        "candidates": [
+                            {"docid": "d", "score": 1.0, "doc": {"segment": "p"}}
+                        ],
+                    }
+                )
+                + "\n"
+            )
+            output = self._run(
+                "meta-llama/Llama-3.1-8B-Instruct", ThreadRecordingAgent(1), input_file
+            )
+
+        self.assertEqual(output["errors"][0]["code"], "unsupported_execution_mode")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.generate.token_counter import (
+    TokenCounter,
+    approximate_token_count,
+    get_token_counter,
+)
+
+pytestmark = pytest.mark.core
+
+
+class CountingEncoder:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    def __call__(self, text: str) -> int:
+        self.calls.append(text)
+        return len(text.split())
+
+
+class TestTokenCounter(unittest.TestCase):
+    def test_lines_are_counted_once_and_memoized(self) -> None:
+        encoder = CountingEncoder()
+        counter = TokenCounter(encoder)
+        prompt = "Instructions here\n[1] first passage\n[2] second passage"
+
+        self.assertEqual(counter.count_text(prompt), 8 + 2)
+        self.assertEqual(counter.count_text(prompt), 10)
+        self.assertEqual(
+            counter.count_text("Instructions here\n[1] first passage\n[2] second"), 9
+        )
+        self.assertEqual(len(encoder.calls), 4)
+        self.assertEqual((counter.hits, counter.misses), (5, 4))
+
+    def test_whole_text_counting_encodes_the_joined_text(self) -> None:
+        encoder = CountingEncoder()
+        counter = TokenCounter(encoder, per_line=False)
+        prompt = "Instructions here\n[1] first passage\n[2] second passage"
+
+        self.assertEqual(counter.count_text(prompt), 8)
+        self.assertEqual(counter.count_text(prompt), 8)
+        self.assertEqual(encoder.calls, [prompt])
+
+    def test_messages_add_per_message_and_name_overheads(self) -> None:
+        counter = TokenCounter(CountingEncoder())
+        messages = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "name": "alice", "content": "hi there"},
+        ]
+
+        self.assertEqual(counter.count(messages), 3 + 4)
+        self.assertEqual(
+            counter.count(messages, tokens_per_message=3, tokens_per_name=1), 7 + 7
+        )
+        nested = [{"query": "q", "context": [{"snippet": "a b"}, {"snippet": "c"}]}]
+        self.assertEqual(counter.count(nested), 4)
+
+    def test_lru_evicts_the_least_recently_used_line(self) -> None:
+        encoder = CountingEncoder()
+        counter = TokenCounter(encoder, cache_size=2)
+        for text in ("a", "b", "a", "c", "a", "b"):
+            counter.count_text(text)
+
+        self.assertEqual(encoder.calls, ["a", "b", "c", "b"])
+
+    def test_falls_back_to_cl100k_and_then_to_the_approximation(self) -> None:
+        fake_tiktoken = ModuleType("tiktoken")
+        requested: list[str] = []
+
+        def get_encoding(name: str) -> Any:
+            requested.append(name)
+            return SimpleNamespace(encode=lambda text: list(text))
+
+        fake_tiktoken.get_encoding = get_encoding  # type: ignore[attr-defined]
+        counter = get_token_counter("some-model", fake_tiktoken)
+
+        self.assertIs(get_token_counter("some-model", fake_tiktoken), counter)
+        self.assertEqual(counter.count_text("abc"), 3)
+        self.assertEqual(requested, ["cl100k_base"])
+
+        with patch.dict(sys.modules, {"tiktoken": None}):
+            offline = get_token_counter("offline-model")
+        self.assertEqual(
+            offline.count_text("Paris is the capital of France."),
+            approximate_token_count("Paris is the capital of France."),
+        )
+
+    def test_approximation_is_in_the_right_range(self) -> None:
+        text = "The life cycle of a flea can last anywhere from 20 days to a year."
+
+        self.assertGreaterEqual(approximate_token_count(text), len(text.split()))
+        self.assertLessEqual(approximate_token_count(text), len(text) // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import sys
+import unittest
+from types import ModuleType, SimpleNamespace
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from ragnarok.data import RAGExecInfo
+from ragnarok.generate.llm import PromptMode
+from ragnarok.generate.usage import (
+    COHERE_PRICING,
+    OPENAI_PRICING,
+    ModelPricing,
+    TokenUsage,
+    account_usage,
+    cohere_usage,
+    find_pricing,
+    openai_usage,
+    summarize_usage,
+)
+
+pytestmark = pytest.mark.core
+
+
+def _info(input_tokens: int = 10, output_tokens: int = 5) -> RAGExecInfo:
+    return RAGExecInfo(
+        prompt="prompt",
+        response="response",
+        input_token_count=input_tokens,
+        output_token_count=output_tokens,
+    )
+
+
+class TestUsageParsing(unittest.TestCase):
+    def test_chat_completions_usage_object(self) -> None:
+        usage = SimpleNamespace(
+            prompt_tokens=1200,
+            completion_tokens=300,
+            total_tokens=1500,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=1024),
+            completion_tokens_details=SimpleNamespace(reasoning_tokens=120),
+        )
+
+        self.assertEqual(openai_usage(usage), TokenUsage(1200, 300, 120, 1024))
+        self.assertIsNone(openai_usage(None))
+
+    def test_responses_usage_dict(self) -> None:
+        usage = {
+            "input_tokens": 50,
+            "output_tokens": 20,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens_details": {"reasoning_tokens": 8},
+        }
+
+        self.assertEqual(openai_usage(usage), TokenUsage(50, 20, 8, 0))
+        self.assertIsNone(openai_usage({"total_tokens": 70}))
+
+    def test_cohere_meta_prefers_billed_units(self) -> None:
+        meta = SimpleNamespace(
+            billed_units=SimpleNamespace(input_tokens=40, output_tokens=12),
+            tokens=SimpleNamespace(input_tokens=900, output_tokens=12),
+        )
+
+        self.assertEqual(cohere_usage(meta), TokenUsage(40, 12))
+        self.assertEqual(
+            cohere_usage({"tokens": {"input_tokens": 9, "output_tokens": 3}}),
+            TokenUsage(9, 3),
+        )
+        self.assertIsNone(cohere_usage(None))
+
+
+class TestPricing(unittest.TestCase):
+    def test_longest_prefix_and_snapshots_resolve(self) -> None:
+        self.assertIs(
+            find_pricing("gpt-4o-mini-2024-07-18", OPENAI_PRICING),
+            OPENAI_PRICING["gpt-4o-mini"],
+        )
+        self.assertIs(
+            find_pricing("openai/gpt-4o", OPENAI_PRICING), OPENAI_PRICING["gpt-4o"]
+        )
+        self.assertIs(
+            find_pricing("gpt-4-0314", OPENAI_PRICING), OPENAI_PRICING["gpt-4"]
+        )
+        self.assertIs(
+            find_pricing("command-r-plus-08-2024", COHERE_PRICING),
+            COHERE_PRICING["command-r-plus"],
+        )
+        self.assertIsNone(find_pricing("gpt-4oo", OPENAI_PRICING))
+        self.assertIsNone(find_pricing("llama-3.1-8b", OPENAI_PRICING))
+
+    def test_cached_prompt_tokens_are_billed_at_the_cached_price(self) -> None:
+        pricing = ModelPricing(input=2.0, output=10.0, cached_input=0.5)
+
+        cost = pricing.cost(TokenUsage(1_000_000, 100_000, cached_tokens=400_000))
+
+        self.assertAlmostEqual(cost, 0.6 * 2.0 + 0.4 * 0.5 + 0.1 * 10.0)
+
+
+class TestAccountUsage(unittest.TestCase):
+    def test_provider_usage_replaces_estimates(self) -> None:
+        info = account_usage(
+            _info(), TokenUsage(1000, 200, 50, None), ModelPricing(1.0, 2.0)
+        )
+
+        self.assertEqual((info.input_token_count, info.output_token_count), (1000, 200))
+        self.assertEqual(info.reasoning_token_count, 50)
+        self.assertEqual(info.usage_source, "provider")
+        self.assertAlmostEqual(info.cost_usd or 0.0, 0.0014)
+
+    def test_estimates_are_costed_and_marked(self) -> None:
+        info = account_usage(_info(), None, None)
+
+        self.assertEqual(info.usage_source, "estimated")
+        self.assertIsNone(info.cost_usd)
+
+    def test_run_summary(self) -> None:
+        priced = account_usage(_info(), TokenUsage(100, 40, 10, 20), ModelPricing(1, 1))
+        summary = summarize_usage([priced, _info(10, 10), None], elapsed_s=2.0)
+
+        self.assertEqual(summary["input_tokens"], 110)
+        self.assertEqual(summary["output_tokens"], 50)
+        self.assertEqual(summary["reasoning_tokens"], 10)
+        self.assertEqual(summary["cached_tokens"], 20)
+        self.assertAlmostEqual(summary["cost_usd"], 140 / 1_000_000)
+        self.assertEqual(summary["output_tokens_per_second"], 25.0)
+        self.assertEqual(
+            (summary["provider_reported_calls"], summary["estimated_calls"]), (1, 1)
+        )
+
+
+class FakePostProcessor:
+    def __call__(self, response: str) -> tuple[list[Any], str]:
+        return [], response
+
+
+def _safe_openai(model: str) -> Any:
+    fake_openai = ModuleType("openai")
+    fake_openai.proxy = None  # type: ignore[attr-defined]
+    fake_tiktoken = ModuleType("tiktoken")
+    fake_tiktoken.get_encoding = lambda _name: SimpleNamespace(  # type: ignore[attr-defined]
+        encode=lambda text: text.split()
+    )
+    fake_post_processor = ModuleType("ragnarok.generate.post_processor")
+    fake_post_processor.GPTPostProcessor = FakePostProcessor  # type: ignore[attr-defined]
+    with patch.dict(
+        sys.modules,
+        {
+            "openai": fake_openai,
+            "tiktoken": fake_tiktoken,
+            "ragnarok.generate.post_processor": fake_post_processor,
+        },
+    ):
+        sys.modules.pop("ragnarok.generate.gpt", None)
+        from ragnarok.generate.gpt import SafeOpenai
+
+        agent = SafeOpenai(
+            model=model,
+            context_size=8192,
+            prompt_mode=PromptMode.RAGNAROK_V4,
+            keys="test-key",
+        )
+    sys.modules.pop("ragnarok.generate.gpt", None)
+    return agent
+
+
+class TestSafeOpenaiUsage(unittest.TestCase):
+    def test_reported_usage_is_recorded_and_priced(self) -> None:
+        agent = _safe_openai("gpt-4o-2024-08-06")
+        body = {
+            "choices": [{"message": {"content": "Paris is the capital [1]."}}],
+            "usage": {
+                "prompt_tokens": 2000,
+                "completion_tokens": 100,
+                "prompt_tokens_details": {"cached_tokens": 1000},
+            },
+        }
+
+        _, info = agent.parse_batch_response([{"role": "user", "content": "q"}], body)
+
+        self.assertEqual((info.input_token_count, info.output_token_count), (2000, 100))
+        self.assertEqual(info.usage_source, "provider")
+        self.assertAlmostEqual(info.cost_usd, (1000 * 2.5 + 1000 * 1.25 + 1000) / 1e6)
+        self.assertAlmostEqual(agent.cost_per_1k_token(input_token=True), 0.0025)
+
+    def test_missing_usage_falls_back_to_token_estimates(self) -> None:
+        agent = _safe_openai("my-local-model")
+        body = {"choices": [{"message": {"content": "five words in this answer"}}]}
+
+        _, info = agent.parse_batch_response([{"role": "user", "content": "q"}], body)
+
+        self.assertEqual(info.output_token_count, 5)
+        self.assertEqual(info.usage_source, "estimated")
+        self.assertIsNone(info.cost_usd)
+        self.assertEqual(agent.cost_per_1k_token(input_token=False), -1)
+
+
+if __name__ == "__main__":
+    unittest.main()